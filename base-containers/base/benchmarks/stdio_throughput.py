@@ -0,0 +1,103 @@
+# -*- coding: utf-8 -*-
+#
+# This file is part of INGInious. See the LICENSE and the COPYRIGHTS files for
+# more information about the licensing of this file.
+#
+# Measures the throughput of the forwarding of student outputs to the agent, as done by _run_student_intern when
+# both containers do not share a kernel. A producer process writes on its stdout and stderr; the forwarded messages
+# are written on a pipe whose other end is decoded by a thread, playing the role of the agent.
+#
+# Usage: PYTHONPATH=base-containers/base python3 base-containers/base/benchmarks/stdio_throughput.py [size_mb] [write_size]
+
+import os
+import sys
+import time
+import struct
+import asyncio
+import threading
+import subprocess
+import msgpack
+
+from inginious_container_api.utils import handle_outputs, handle_outputs_helper
+
+PRODUCER = """
+import sys
+size, write_size = int(sys.argv[1]), int(sys.argv[2])
+block = b"x" * (write_size - 1) + b"\\n"
+for i in range(size // write_size):
+    (sys.stderr if i % 64 == 0 else sys.stdout).buffer.write(block)
+    if i % 64 == 0:
+        sys.stderr.flush()
+"""
+
+
+def consume(fd, received):
+    """ Decodes the messages written by the forwarder, as the agent would """
+    stream = os.fdopen(fd, 'rb')
+    while True:
+        header = stream.read(4)
+        if len(header) < 4:
+            return
+        msg = msgpack.unpackb(stream.read(struct.unpack('!I', header)[0]), use_list=False)
+        received[msg["type"]] += len(msg["message"])
+        received["messages"] += 1
+
+
+def run(forwarder, size, write_size):
+    read_fd, write_fd = os.pipe()
+    received = {"stdout": 0, "stderr": 0, "messages": 0}
+    errors = []
+    consumer = threading.Thread(target=consume, args=(read_fd, received))
+    consumer.start()
+
+    event_loop = asyncio.new_event_loop()
+    asyncio.set_event_loop(event_loop)
+    transport, protocol = event_loop.run_until_complete(
+        event_loop.connect_write_pipe(asyncio.streams.FlowControlMixin, os.fdopen(write_fd, 'wb')))
+    container_stdout = asyncio.StreamWriter(transport, protocol, None, event_loop)
+
+    start = time.perf_counter()
+    p = subprocess.Popen([sys.executable, "-c", PRODUCER, str(size), str(write_size)], bufsize=0,
+                         stdout=subprocess.PIPE, stderr=subprocess.PIPE)
+    if forwarder == "batched":
+        event_loop.run_until_complete(event_loop.run_in_executor(
+            None, handle_outputs, p.stdout, p.stderr, "bench", event_loop, container_stdout))
+    else:
+        lock = threading.Lock()
+        outputs_loop = asyncio.new_event_loop()
+
+        def legacy_helper(output, output_type):
+            try:
+                handle_outputs_helper(output, "bench", output_type, lock, event_loop, container_stdout, outputs_loop)
+            except Exception as e:  # the stream is drained from another loop, which fails once the pipe is full
+                errors.append(e)
+                p.kill()
+                event_loop.call_soon_threadsafe(event_loop.stop)
+
+        threads = [threading.Thread(target=legacy_helper, args=(output, output_type), daemon=True)
+                   for output, output_type in ((p.stdout, "stdout"), (p.stderr, "stderr"))]
+        for thread in threads:
+            thread.start()
+        event_loop.run_forever()  # stopped by the stdout thread
+        for thread in threads:
+            thread.join(None if not errors else 1)
+    p.wait()
+    transport.close()
+    event_loop.run_until_complete(asyncio.sleep(0))
+    consumer.join()
+    elapsed = time.perf_counter() - start
+    event_loop.close()
+
+    total = received["stdout"] + received["stderr"]
+    if errors:
+        print("{:>9}: failed after {:.1f} MB ({})".format(forwarder, total / 1e6, type(errors[0]).__name__))
+        return
+    print("{:>9}: {:.1f} MB in {:.2f}s ({:.1f} MB/s, {} messages)".format(
+        forwarder, total / 1e6, elapsed, total / 1e6 / elapsed, received["messages"]))
+
+
+if __name__ == "__main__":
+    size = int(float(sys.argv[1]) * 1e6) if len(sys.argv) > 1 else 16 * 10 ** 6
+    write_size = int(sys.argv[2]) if len(sys.argv) > 2 else 4096
+    for forwarder in ["legacy", "batched"]:
+        run(forwarder, size, write_size)
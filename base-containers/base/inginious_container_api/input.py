@@ -6,18 +6,50 @@
 import os
 import re
 import json
+import mmap
 import datetime
 
 import inginious_container_api
 
 _input_file = '/.__input/__inputdata.json' if not inginious_container_api.DEBUG else './__inputdata.json'
 
+# Memoized content of the input file, along with the (mtime, size) it was read at
+_input_cache = None
+_input_cache_key = None
+
+_default_chunk_size = 65536
+
+
 def _load_input():
-    """ Open existing input file """
-    file = open(_input_file, 'r')
-    result = json.loads(file.read().strip('\0').strip())
-    file.close()
-    return result
+    """ Open existing input file. The parsed content is memoized and only re-read when the file changes on disk """
+    global _input_cache, _input_cache_key
+    stat = os.stat(_input_file)
+    key = (stat.st_mtime_ns, stat.st_size)
+    if _input_cache is None or _input_cache_key != key:
+        with open(_input_file, 'r') as file:
+            _input_cache = json.loads(file.read().strip('\0').strip())
+        _input_cache_key = key
+    return _input_cache
+
+
+def invalidate_input_cache():
+    """ Drops the memoized input data. Next accesses will re-read the input file """
+    global _input_cache, _input_cache_key
+    _input_cache = None
+    _input_cache_key = None
+
+
+def _is_file_input(problem_input):
+    """ Returns True if the given problem input is a file answer """
+    return isinstance(problem_input, dict) and "filename" in problem_input and "value" in problem_input
+
+
+def _get_file_input(problem):
+    """ Returns the file answer dict for the given problem id, or raises ValueError if it is not a file answer """
+    problem_input = _load_input()['input'][problem.split(":")[0]]
+    if not _is_file_input(problem_input):
+        raise ValueError("Problem {} is not a file answer".format(problem))
+    return problem_input
 
 
 def get_username():
@@ -43,15 +75,61 @@ def get_input(problem):
     input_data = _load_input()
     pbsplit = problem.split(":")
     problem_input = input_data['input'][pbsplit[0]]
-    if isinstance(problem_input, dict) and "filename" in problem_input and "value" in problem_input:
+    if _is_file_input(problem_input):
         if len(pbsplit) > 1 and pbsplit[1] == 'filename':
             return problem_input["filename"]
         else:
-            return open(problem_input["value"], 'rb').read()
+            with open(problem_input["value"], 'rb') as file:
+                return file.read()
     else:
         return problem_input
 
 
+def get_all_inputs():
+    """ Returns a dict with all the problem answers, keyed by problem id. File answers are returned as
+        ``problem_id`` (content, as bytes) and ``problem_id:filename`` entries, as get_input would.
+    """
+    result = {}
+    for problem, problem_input in _load_input()['input'].items():
+        if _is_file_input(problem_input):
+            result[problem + ":filename"] = problem_input["filename"]
+            result[problem] = get_input(problem)
+        else:
+            result[problem] = problem_input
+    return result
+
+
+def open_input(problem):
+    """ Returns a binary file object opened on the specified file answer, without loading it in memory.
+        The caller is responsible for closing it (it can be used as a context manager).
+        problem: problem id
+    """
+    return open(_get_file_input(problem)["value"], 'rb')
+
+
+def iter_input(problem, chunk_size=_default_chunk_size):
+    """ Yields the content of the specified file answer by chunks of at most chunk_size bytes.
+        Useful to stream large uploads without loading them entirely in memory.
+        problem: problem id
+    """
+    with open_input(problem) as file:
+        chunk = file.read(chunk_size)
+        while chunk:
+            yield chunk
+            chunk = file.read(chunk_size)
+
+
+def map_input(problem):
+    """ Returns a read-only memory map of the specified file answer. Empty files, which cannot be mapped, are
+        returned as empty bytes. The caller is responsible for closing the map.
+        problem: problem id
+    """
+    with open_input(problem) as file:
+        if os.fstat(file.fileno()).st_size == 0:
+            return b''
+        return mmap.mmap(file.fileno(), 0, access=mmap.ACCESS_READ)
+
+
 def parse_template(input_filename, output_filename=''):
     """ Parses a template file
         Replaces all occurences of @@problem_id@@ by the value
@@ -70,13 +148,14 @@ def parse_template(input_filename, output_filename=''):
     
     # Parse template
     for field in data['input']:
-        subs = ["filename", "value"] if isinstance(data['input'][field], dict) and "filename" in data['input'][field] and "value" in data['input'][field] else [""]
+        subs = ["filename", "value"] if _is_file_input(data['input'][field]) else [""]
         for sub in subs:
             displayed_field = field + (":" if sub else "") + sub
             regex = re.compile("@([^@]*)@" + displayed_field + '@([^@]*)@')
             for prefix, postfix in set(regex.findall(template)):
                 if sub == "value":
-                    text = open(data['input'][field][sub], 'rb').read().decode('utf-8')
+                    with open(data['input'][field][sub], 'rb') as file:
+                        text = file.read().decode('utf-8')
                 elif sub:
                     text = data['input'][field][sub]
                 else:
@@ -0,0 +1,269 @@
+# -*- coding: utf-8 -*-
+#
+# This file is part of INGInious. See the LICENSE and the COPYRIGHTS files for
+# more information about the licensing of this file.
+
+""" Multi-call launcher for the container API commands.
+
+    Each command of the container API (feedback-msg, tag-set, getinput, ...) is a Python script that imports
+    inginious_container_api on every run. When a bash grader calls them hundreds of times, most of the grading time
+    is spent starting interpreters and importing modules.
+
+    In the container, the command names are links to the inginious-multicall entry point, which runs without the
+    site module and only imports this module. The first call spawns a worker daemon that imports the container API
+    once and listens on a unix socket. Later calls send their argv, environment, working directory and standard fds
+    to the daemon, which forks an already-warm child to run the command script, and get back its exit code.
+    When the daemon cannot be reached, the command script is simply executed, as before.
+
+    This module must stay cheap to import: only the standard library modules needed by the client are imported at
+    module level.
+"""
+
+import os
+import sys
+import json
+import array
+import socket
+import struct
+
+# Commands that can be run by the worker daemon. Long-running commands that rely on signals or on their own
+# process (run_student, ssh_student, INGInious, ...) are not delegated.
+COMMANDS = ["archive", "feedback", "feedback-custom", "feedback-grade", "feedback-msg", "feedback-msg-tpl",
+            "feedback-result", "feedback-state", "getinput", "parsetemplate", "rst-code", "rst-image", "rst-indent",
+            "rst-msgblock", "tag", "tag-set"]
+
+# Directory where the actual command scripts are installed
+COMMANDS_DIR = os.environ.get("INGINIOUS_COMMANDS_DIR", "/usr/libexec/inginious")
+
+# Modules imported by the daemon before forking workers
+_preloaded_modules = ["argparse", "json", "shlex", "inginious_container_api.input", "inginious_container_api.feedback",
+                      "inginious_container_api.rst", "inginious_container_api.lang"]
+
+_disable_env = "INGINIOUS_MULTICALL"
+_idle_timeout = 600
+
+
+def _socket_path():
+    """ Returns the path of the daemon socket for the current user """
+    return "/tmp/.inginious-multicall-{}.sock".format(os.getuid())
+
+
+def _recv_exactly(sock, length):
+    """ Receives exactly length bytes from the socket, or raises EOFError """
+    buf = bytearray()
+    while len(buf) < length:
+        chunk = sock.recv(length - len(buf))
+        if not chunk:
+            raise EOFError()
+        buf += chunk
+    return bytes(buf)
+
+
+def _spawn_daemon():
+    """ Starts the worker daemon in the background, detached from the current process """
+    import subprocess
+    subprocess.Popen([sys.executable, "-m", "inginious_container_api.multicall", "--serve", COMMANDS_DIR],
+                     stdin=subprocess.DEVNULL, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL,
+                     close_fds=True, start_new_session=True)
+
+
+def call(command, args):
+    """ Runs the given command in the worker daemon, with the current stdio, working directory and environment.
+        Returns the exit code of the command, or None if the daemon is not available.
+    """
+    sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+    try:
+        sock.connect(_socket_path())
+    except OSError:
+        sock.close()
+        return None
+
+    try:
+        payload = json.dumps({"command": command, "args": args, "cwd": os.getcwd(), "env": dict(os.environ)})
+        payload = payload.encode("utf-8", "surrogateescape")
+        sock.sendmsg([struct.pack('!I', len(payload))],
+                     [(socket.SOL_SOCKET, socket.SCM_RIGHTS, array.array("i", [0, 1, 2]))])
+        sock.sendall(payload)
+        return struct.unpack('!i', _recv_exactly(sock, 4))[0]
+    except (OSError, EOFError):
+        return None
+    finally:
+        sock.close()
+
+
+def run(command, args):
+    """ Runs the given command, through the worker daemon if possible. Never returns. """
+    script = os.path.join(COMMANDS_DIR, command)
+    if os.environ.get(_disable_env) != "0":
+        retval = call(command, args)
+        if retval is not None:
+            os._exit(retval)
+        try:
+            _spawn_daemon()
+        except OSError:
+            pass
+    os.execv(script, [script] + args)
+
+
+def main():
+    """ Entry point of inginious-multicall. The command is either given by the name the entry point is called with
+        (through a link named after the command) or as its first argument.
+    """
+    command, args = os.path.basename(sys.argv[0]), sys.argv[1:]
+    if command not in COMMANDS:
+        if not args or args[0] in ["-h", "--help"]:
+            print("usage: inginious-multicall command [args ...]\n"
+                  "       inginious-multicall --benchmark calls command [args ...]\n\n"
+                  "Runs a container API command in the multi-call worker daemon, starting it if needed.\n\n"
+                  "Available commands: " + ", ".join(COMMANDS))
+            sys.exit(0 if args else 2)
+        if args[0] == "--benchmark" and len(args) >= 3:
+            benchmark(args[2], args[3:], int(args[1]))
+            sys.exit(0)
+        command, args = args[0], args[1:]
+
+    if command not in COMMANDS:
+        sys.stderr.write("Unknown command: {}\n".format(command))
+        sys.exit(127)
+    run(command, args)
+
+
+def _run_command(script, argv, cwd, env, fds):
+    """ Runs a command script in the current (forked) process, using the client's fds as stdio.
+        Returns the exit code.
+    """
+    import runpy
+    import traceback
+
+    for target, fd in enumerate(fds):
+        os.dup2(fd, target)
+        os.close(fd)
+    sys.stdin = open(0, 'r', closefd=False)
+    sys.stdout = open(1, 'w', closefd=False)
+    sys.stderr = open(2, 'w', closefd=False)
+
+    os.chdir(cwd)
+    os.environ.clear()
+    os.environ.update(env)
+    sys.argv = argv
+
+    retval = 0
+    try:
+        runpy.run_path(script, run_name="__main__")
+    except SystemExit as e:
+        if e.code is None:
+            retval = 0
+        elif isinstance(e.code, int):
+            retval = e.code
+        else:
+            print(e.code, file=sys.stderr)
+            retval = 1
+    except BaseException:
+        traceback.print_exc()
+        retval = 1
+
+    try:
+        sys.stdout.flush()
+        sys.stderr.flush()
+    except OSError:
+        pass
+    return retval
+
+
+def serve(commands_dir, idle_timeout=_idle_timeout):
+    """ Runs the worker daemon, serving the commands from commands_dir until idle for idle_timeout seconds """
+    import fcntl
+    import importlib
+    import socketserver
+
+    path = _socket_path()
+
+    # Only one daemon per user: concurrent first calls may spawn several of them
+    lock = open(path + ".lock", "w")
+    try:
+        fcntl.flock(lock, fcntl.LOCK_EX | fcntl.LOCK_NB)
+    except OSError:
+        return
+
+    for module in _preloaded_modules:
+        try:
+            importlib.import_module(module)
+        except ImportError:
+            pass
+
+    class _Handler(socketserver.BaseRequestHandler):
+        def handle(self):
+            sock = self.request
+            creds = sock.getsockopt(socket.SOL_SOCKET, socket.SO_PEERCRED, struct.calcsize('3i'))
+            if struct.unpack('3i', creds)[1] != os.getuid():
+                return
+
+            fds = array.array("i")
+            header, ancdata, _, _ = sock.recvmsg(4, socket.CMSG_LEN(3 * fds.itemsize))
+            for cmsg_level, cmsg_type, cmsg_data in ancdata:
+                if cmsg_level == socket.SOL_SOCKET and cmsg_type == socket.SCM_RIGHTS:
+                    fds.frombytes(cmsg_data[:len(cmsg_data) - (len(cmsg_data) % fds.itemsize)])
+            if len(header) != 4 or len(fds) != 3:
+                return
+            message = json.loads(_recv_exactly(sock, struct.unpack('!I', header)[0]).decode("utf-8", "surrogateescape"))
+
+            if message["command"] not in COMMANDS:
+                retval = 127
+            else:
+                script = os.path.join(commands_dir, message["command"])
+                retval = _run_command(script, [script] + message["args"], message["cwd"], message["env"], list(fds))
+            sock.sendall(struct.pack('!i', retval))
+
+    class _Server(socketserver.ForkingMixIn, socketserver.UnixStreamServer):
+        timeout = idle_timeout
+        idle = False
+
+        def handle_timeout(self):
+            self.idle = True
+
+    # Bind to a temporary path and move it in place, so that clients never see a half-initialized socket
+    tmp_path = "{}.{}".format(path, os.getpid())
+    if os.path.exists(tmp_path):
+        os.unlink(tmp_path)
+    server = _Server(tmp_path, _Handler)
+    os.chmod(tmp_path, 0o700)
+    os.rename(tmp_path, path)
+
+    try:
+        while not server.idle:
+            server.handle_request()
+    finally:
+        os.unlink(path)
+        server.server_close()
+        lock.close()
+
+
+def benchmark(command, args, calls=1000):
+    """ Runs the given command calls times, directly and through the multi-call entry point, and prints the timings """
+    import time
+    import subprocess
+
+    entry_point = os.path.realpath(sys.argv[0])
+    script = os.path.join(COMMANDS_DIR, command)
+
+    def timeit(argv):
+        start = time.perf_counter()
+        for _ in range(calls):
+            subprocess.run(argv, stdout=subprocess.DEVNULL, check=True)
+        return time.perf_counter() - start
+
+    # The first call spawns the daemon; give it time to start listening
+    subprocess.run([entry_point, command] + args, stdout=subprocess.DEVNULL, check=True)
+    for _ in range(50):
+        if os.path.exists(_socket_path()):
+            break
+        time.sleep(0.1)
+
+    for name, argv in [("standalone", [script] + args), ("multi-call", [entry_point, command] + args)]:
+        elapsed = timeit(argv)
+        print("{:>10}: {} calls in {:.2f}s ({:.2f}ms/call)".format(name, calls, elapsed, 1000 * elapsed / calls))
+
+
+if __name__ == "__main__":
+    if len(sys.argv) == 3 and sys.argv[1] == "--serve":
+        serve(sys.argv[2])
@@ -112,30 +112,35 @@ def run_student_simple(cmd, cmd_input=None, container=None,
              output is in the form (stdout, retval) is returned.
              The type of the returned strings (stdout, stderr) is dependent of the `text` arg.
     """
-    stdin = None
+    # Temporary files are used instead of pipes: the whole input is written before the command starts and the outputs
+    # are only read once it ends, so pipes would block as soon as their buffer is full. When both containers share a
+    # kernel, the student container writes directly into these files.
+    stdin_file = None
     if cmd_input is not None:
-        r, w = os.pipe()
-        fdo = os.fdopen(w, 'w')
-        fdo.write(cmd_input)
-        fdo.close()
-        stdin = r
-
-    stdout_r, stdout_w = os.pipe()
-    if stdout_err_fuse:
-        stderr_r, stderr_w = stdout_r, stdout_w
-    else:
-        stderr_r, stderr_w = os.pipe()
+        stdin_file = tempfile.TemporaryFile()
+        stdin_file.write(cmd_input.encode("utf-8") if isinstance(cmd_input, str) else cmd_input)
+        stdin_file.seek(0)
+
+    stdout_file = tempfile.TemporaryFile()
+    stderr_file = stdout_file if stdout_err_fuse else tempfile.TemporaryFile()
 
     retval = run_student(cmd, container, time_limit, hard_time_limit, memory_limit,
-                         share_network, working_dir, stdin, stdout_w, stderr_w)
+                         share_network, working_dir, stdin_file.fileno() if stdin_file is not None else None,
+                         stdout_file.fileno(), stderr_file.fileno())
 
     preprocess_out = (lambda x: x.decode(text)) if text is not False else (lambda x: x)
 
-    os.fdopen(stdout_w, 'w').close()
-    stdout = preprocess_out(os.fdopen(stdout_r, 'rb').read())
+    def read_output(output_file):
+        output_file.seek(0)
+        content = output_file.read()
+        output_file.close()
+        return preprocess_out(content)
+
+    if stdin_file is not None:
+        stdin_file.close()
+    stdout = read_output(stdout_file)
     if not stdout_err_fuse:
-        os.fdopen(stderr_w, 'w').close()
-        stderr = preprocess_out(os.fdopen(stderr_r, 'rb').read())
+        stderr = read_output(stderr_file)
         return stdout, stderr, retval
     else:
         return stdout, retval
@@ -281,13 +286,14 @@ def handle_stdin(stdin, student_container_id):
     my_context = zmq.Context()
     my_zmq_socket = my_context.socket(zmq.REQ)
     my_zmq_socket.connect("ipc:///sockets/main.sock")
-    input_file = os.fdopen(stdin, 'rb', buffering=0)
+    input_file = os.fdopen(stdin, 'rb', buffering=0, closefd=False)
     chunk_size = 512000
     while True:
         block = read_block(input_file, chunk_size)
-        if block:
-            my_zmq_socket.send(msgpack.dumps({"type": "stdin", "message": block, "student_container_id": student_container_id}, use_bin_type=True))
-            my_zmq_socket.recv()
+        if not block:  # stdin is closed, nothing more to forward
+            return
+        my_zmq_socket.send(msgpack.dumps({"type": "stdin", "message": block, "student_container_id": student_container_id}, use_bin_type=True))
+        my_zmq_socket.recv()
 
 
 def unlink_unneeded_files(socket_path, path):
@@ -15,9 +15,14 @@ import shlex
 import struct
 import asyncio
 import errno
+import selectors
 import sys
 import msgpack
 
+# Bounds of the adaptive chunk size used to read the student process outputs
+_min_output_chunk_size = 65536
+_max_output_chunk_size = 4194304
+
 def set_limits_user(user):
     if user == "worker":
         os.setgid(4242)
@@ -154,9 +159,15 @@ def recv_fds(sock, msglen, maxfds):
 
 async def write_stdout(msg, container_stdout):
     """ Helper to send messages to the agent on the container stdout stream """
-    msg = msgpack.dumps(msg, use_bin_type=True)
-    container_stdout.write(struct.pack('!I', len(msg)))
-    container_stdout.write(msg)
+    await write_stdout_batch([msg], container_stdout)
+
+
+async def write_stdout_batch(msgs, container_stdout):
+    """ Helper to send several messages to the agent on the container stdout stream, with a single drain """
+    for msg in msgs:
+        msg = msgpack.dumps(msg, use_bin_type=True)
+        container_stdout.write(struct.pack('!I', len(msg)))
+        container_stdout.write(msg)
     await container_stdout.drain()
 
 
@@ -235,9 +246,11 @@ async def handle_stdin(reader: asyncio.StreamReader, proc_input, proc):
     """ Deamon to handle messages from the agent.
     Used only when both containers are not on a shared kernel"""
     try:
+        loop = asyncio.get_event_loop()
         while not reader.at_eof():
             message = await receive_message(reader)
-            status = handle_stdin_message(message, proc_input, proc)
+            # Writing to the student process may block: do not block the loop, which also forwards the outputs
+            status = await loop.run_in_executor(None, handle_stdin_message, message, proc_input, proc)
             if status == "pipe_closed":
                 return
     except:  # This task will raise an exception when the loop stops
@@ -290,6 +303,7 @@ async def stdio():
 
 def handle_outputs_helper(output, socket_id, output_type, lock, event_loop, container_stdout, outputs_loop):
     """ Function launched in its own thread using its own asyncio loop to handle outputs and send them to agent.
+    One thread is needed per output. Superseded by handle_outputs, which batches both outputs from a single thread.
     Used only when both containers are not on a shared kernel """
 
     chunk_size = 512000
@@ -309,6 +323,60 @@ def handle_outputs_helper(output, socket_id, output_type, lock, event_loop, cont
         event_loop.call_soon_threadsafe(event_loop.stop)
 
 
+def handle_outputs(stdout, stderr, socket_id, event_loop, container_stdout, batch_delay=0.002):
+    """ Function launched in its own thread to forward both outputs of the student process to the agent.
+    Both streams are read from this single thread, with a chunk size that grows while the process outputs faster than
+    it is forwarded. The data available within batch_delay seconds (or up to the maximum chunk size) is coalesced
+    and written on the container stdout, through event_loop, with a single drain.
+    Returns when both outputs are closed.
+    Used only when both containers are not on a shared kernel """
+    selector = selectors.DefaultSelector()
+    chunk_sizes = {}
+    for output, output_type in ((stdout, "stdout"), (stderr, "stderr")):
+        os.set_blocking(output.fileno(), False)
+        selector.register(output.fileno(), selectors.EVENT_READ, output_type)
+        chunk_sizes[output_type] = _min_output_chunk_size
+
+    while selector.get_map():
+        pending = []  # list of [output_type, data], consecutive blocks of the same stream are merged
+        pending_size = 0
+        deadline = None
+        while selector.get_map() and pending_size < _max_output_chunk_size:
+            events = selector.select(None if deadline is None else max(0.0, deadline - time.monotonic()))
+            if not events:
+                break
+            for key, _ in events:
+                output_type = key.data
+                try:
+                    block = os.read(key.fd, chunk_sizes[output_type])
+                except BlockingIOError:
+                    continue
+                if not block:  # Only happens when the pipe is closed
+                    selector.unregister(key.fd)
+                    continue
+
+                # Adapt the chunk size to the output rate
+                if len(block) == chunk_sizes[output_type]:
+                    chunk_sizes[output_type] = min(2 * chunk_sizes[output_type], _max_output_chunk_size)
+                elif len(block) < chunk_sizes[output_type] // 4:
+                    chunk_sizes[output_type] = max(chunk_sizes[output_type] // 2, _min_output_chunk_size)
+
+                if pending and pending[-1][0] == output_type:
+                    pending[-1][1] += block
+                else:
+                    pending.append([output_type, bytearray(block)])
+                pending_size += len(block)
+            if deadline is None:
+                deadline = time.monotonic() + batch_delay
+
+        if pending:
+            messages = [{"type": output_type, "socket_id": socket_id, "message": bytes(block)}
+                        for output_type, block in pending]
+            asyncio.run_coroutine_threadsafe(write_stdout_batch(messages, container_stdout), event_loop).result()
+
+    selector.close()
+
+
 def read_block(bin_file, chunk_size):
     """ Returns a chunk of size up to chunk_size bytes """
     chunk = bin_file.read(chunk_size)
@@ -0,0 +1,105 @@
+# -*- coding: utf-8 -*-
+#
+# This file is part of INGInious. See the LICENSE and the COPYRIGHTS files for
+# more information about the licensing of this file.
+#
+# Measures the tag statistics of the course statistics page (compute_statistics) on generated submissions, and
+# compares them with the previous implementation, that built a dict of dicts of lists per tag.
+#
+# Usage: python3 benchmarks/course_statistics.py [nb_submissions] [nb_tags] [nb_users] [nb_tasks]
+
+import random
+import sys
+import time
+
+from inginious.common.tags import Tag
+from inginious.frontend.pages.course_admin.statistics import compute_statistics, fast_stats, safe_div
+
+
+class Course:
+    def __init__(self, nb_tags):
+        self._tags = {"tag{}".format(i): Tag("tag{}".format(i), {"name": "Tag {}".format(i), "type": i % 3}, None)
+                      for i in range(nb_tags)}
+
+    def get_tags(self):
+        return self._tags
+
+
+def previous_compute_statistics(course, tasks, data, ponderation):
+    super_dict = {}
+    for submission in data:
+        task = tasks.get(submission["taskid"], None)
+        if task:
+            username = "".join(submission["username"])
+            tags_of_course = [tag for key, tag in course.get_tags().items() if tag.get_type() in [0,1]]
+            for tag in tags_of_course:
+                super_dict.setdefault(tag, {})
+                super_dict[tag].setdefault(username, {})
+                super_dict[tag][username].setdefault(submission["taskid"], [0,0,0,0])
+                super_dict[tag][username][submission["taskid"]][0] += 1
+                if "tests" in submission and tag.get_id() in submission["tests"] and submission["tests"][tag.get_id()]:
+                    super_dict[tag][username][submission["taskid"]][1] += 1
+
+                if submission["best"]:
+                    super_dict[tag][username][submission["taskid"]][2] += 1
+                    if "tests" in submission and tag.get_id() in submission["tests"] and submission["tests"][tag.get_id()]:
+                        super_dict[tag][username][submission["taskid"]][3] += 1
+
+    output = []
+    for tag in super_dict:
+        if not ponderation:
+            results = [0,0,0,0]
+            for username in super_dict[tag]:
+                for task in super_dict[tag][username]:
+                    for i in range (0,4):
+                        results[i] += super_dict[tag][username][task][i]
+            output.append((tag, 100*safe_div(results[1],results[0]), 100*safe_div(results[3],results[2])))
+        else:
+            results = ([], [])
+            for username in super_dict[tag]:
+                for task in super_dict[tag][username]:
+                    a = super_dict[tag][username][task]
+                    results[0].append(safe_div(a[1],a[0]))
+                    results[1].append(safe_div(a[3],a[2]))
+            output.append((tag, 100*safe_div(sum(results[0]),len(results[0])), 100*safe_div(sum(results[1]),len(results[1]))))
+
+    return (fast_stats(data), output)
+
+
+def generate(nb_submissions, nb_tags, nb_users, nb_tasks):
+    rand = random.Random(42)
+    tasks = {"task{}".format(i): True for i in range(nb_tasks)}
+    data = []
+    for __ in range(nb_submissions):
+        tests = {"tag{}".format(i): rand.random() < 0.3 for i in rand.sample(range(nb_tags), min(nb_tags, 5))}
+        data.append({"taskid": "task{}".format(rand.randrange(nb_tasks)), "username": ["user{}".format(rand.randrange(nb_users))],
+                     "tests": tests, "best": rand.random() < 0.1, "result": rand.choice(["success", "failed"])})
+    return tasks, data
+
+
+def measure(name, function, course, tasks, data, ponderation):
+    start = time.perf_counter()
+    result = function(course, tasks, data, ponderation)
+    print("{:<10} {:<10} {:.3f}s".format(name, "weighted" if ponderation else "unweighted", time.perf_counter() - start))
+    return result
+
+
+def main():
+    nb_submissions = int(sys.argv[1]) if len(sys.argv) > 1 else 100000
+    nb_tags = int(sys.argv[2]) if len(sys.argv) > 2 else 30
+    nb_users = int(sys.argv[3]) if len(sys.argv) > 3 else 500
+    nb_tasks = int(sys.argv[4]) if len(sys.argv) > 4 else 50
+    course = Course(nb_tags)
+    tasks, data = generate(nb_submissions, nb_tags, nb_users, nb_tasks)
+    print("{} submissions, {} tags, {} users, {} tasks".format(nb_submissions, nb_tags, nb_users, nb_tasks))
+
+    for ponderation in [False, True]:
+        previous = measure("previous", previous_compute_statistics, course, tasks, data, ponderation)
+        current = measure("columnar", compute_statistics, course, tasks, data, ponderation)
+        for (tag, total, best), (other_tag, other_total, other_best) in zip(previous[1], current[1]):
+            assert tag == other_tag and abs(total - other_total) < 1e-9 and abs(best - other_best) < 1e-9
+        assert len(previous[1]) == len(current[1])
+
+
+if __name__ == "__main__":
+    main()
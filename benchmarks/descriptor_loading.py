@@ -0,0 +1,113 @@
+# -*- coding: utf-8 -*-
+#
+# This file is part of INGInious. See the LICENSE and the COPYRIGHTS files for
+# more information about the licensing of this file.
+#
+# Measures the loading of the courses and tasks of a large tree by a new webapp process, from the YAML descriptors
+# and from their compiled sidecars. Each measure runs in a new interpreter, that imports the webapp modules, then loads
+# every course with Course.get_all and every task with Course.get_tasks.
+#
+# Usage: python3 benchmarks/descriptor_loading.py [nb_courses] [nb_tasks_per_course]
+
+import os
+import shutil
+import subprocess
+import sys
+import tempfile
+import time
+
+TASK = """author: [Benchmark]
+name: "Task {i}"
+context: |
+{context}
+environment_type: mcq
+environment_id: mcq
+problems:
+{problems}
+"""
+
+PROBLEM = """    q{j}:
+        name: "Question {j}"
+        type: multiple_choice
+        header: |
+{header}
+        multiple: true
+        limit: 3
+        choices:
+{choices}
+"""
+
+LOADER = """
+import sys, time
+start = time.perf_counter()
+from inginious.common.filesystems import init_fs_provider, init_cache
+from inginious.common.filesystems.local import LocalFSProvider
+from inginious.common.tasks_problems import register_problem_types
+from inginious.frontend.environment_types import register_base_env_types
+from inginious.frontend.task_problems import get_default_displayable_problem_types
+from inginious.frontend.task_dispensers import register_task_dispenser
+from inginious.frontend.task_dispensers.toc import TableOfContents
+from inginious.frontend.courses import Course
+register_base_env_types()
+register_problem_types(get_default_displayable_problem_types())
+register_task_dispenser(TableOfContents)
+init_fs_provider(LocalFSProvider(sys.argv[1]))
+init_cache(sidecars=sys.argv[2] or None)
+imported = time.perf_counter()
+courses = Course.get_all()
+loaded_courses = time.perf_counter()
+nb_tasks = sum(len(course.get_tasks()) for course in courses.values())
+end = time.perf_counter()
+print(len(courses), nb_tasks, imported - start, loaded_courses - imported, end - loaded_courses)
+"""
+
+
+def generate(directory, nb_courses, nb_tasks):
+    text = "\n".join("    Lorem ipsum dolor sit amet, consectetur adipiscing elit, line {}.".format(i) for i in range(40))
+    header = "\n".join("            Sed do eiusmod tempor incididunt ut labore, line {}.".format(i) for i in range(10))
+    choices = "".join("          - text: \"Choice {0}\"\n            valid: {1}\n            feedback: \"Feedback {0}\"\n"
+                      .format(k, "true" if k < 2 else "false") for k in range(8))
+    problems = "".join(PROBLEM.format(j=j, header=header, choices=choices) for j in range(5))
+    for c in range(nb_courses):
+        course_dir = os.path.join(directory, "course{}".format(c))
+        os.makedirs(course_dir)
+        with open(os.path.join(course_dir, "course.yaml"), "w") as f:
+            f.write("name: Course {}\nadmins: [admin]\naccessible: true\n".format(c))
+        for t in range(nb_tasks):
+            os.makedirs(os.path.join(course_dir, "task{}".format(t)))
+            with open(os.path.join(course_dir, "task{}".format(t), "task.yaml"), "w") as f:
+                f.write(TASK.format(i=t, context=text, problems=problems))
+
+
+def measure(directory, sidecars=None):
+    output = subprocess.run([sys.executable, "-c", LOADER, directory, sidecars or ""], check=True,
+                            capture_output=True, text=True).stdout.split()
+    courses, tasks, imports, get_all, get_tasks = int(output[0]), int(output[1]), *map(float, output[2:])
+    print("{:<10} {} courses, {} tasks: imports {:.2f}s, Course.get_all {:.2f}s, get_tasks {:.2f}s".format(
+        "sidecars" if sidecars else "yaml", courses, tasks, imports, get_all, get_tasks))
+
+
+def main():
+    nb_courses = int(sys.argv[1]) if len(sys.argv) > 1 else 100
+    nb_tasks = int(sys.argv[2]) if len(sys.argv) > 2 else 100
+    directory = tempfile.mkdtemp()
+    tasks_directory, sidecars_directory = os.path.join(directory, "tasks"), os.path.join(directory, "sidecars")
+    try:
+        generate(tasks_directory, nb_courses, nb_tasks)
+        measure(tasks_directory)
+
+        from inginious.common.filesystems.local import LocalFSProvider
+        from inginious.common.sidecars import write_sidecar
+        from inginious.scripts.compile_descriptors import get_descriptors
+        start = time.perf_counter()
+        for fs, path in get_descriptors(LocalFSProvider(tasks_directory)):
+            write_sidecar(sidecars_directory, fs, path)
+        print("compiled in {:.2f}s".format(time.perf_counter() - start))
+
+        measure(tasks_directory, sidecars_directory)
+    finally:
+        shutil.rmtree(directory)
+
+
+if __name__ == "__main__":
+    main()
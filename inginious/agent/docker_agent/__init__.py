@@ -624,17 +624,21 @@ class DockerAgent(Agent):
         try:
             while not student_reader_stream.at_eof():
                 buffer = await self.read_stream(student_reader_stream, buffer)
-                while self.buffer_has_data(buffer):
-                    buffer, msg_encoded = self.read_buffer(buffer, decode=False)
-                    try:
-                        grading_write_stream.write(
-                            struct.pack('!I', len(msg_encoded)))  # Transfer the message without decoding it
-                        grading_write_stream.write(msg_encoded)
-                        await grading_write_stream.drain()
-                    except Exception as e:
-                        self._logger.info("Student container closed the stream")
-                        self._logger.info(e)
-                        return
+                # Complete messages are transferred as is (length prefix included, without decoding them),
+                # all at once, with a single drain
+                length = 0
+                while len(buffer) >= length + 4 and len(buffer) >= length + 4 + struct.unpack_from('!I', buffer, length)[0]:
+                    length += 4 + struct.unpack_from('!I', buffer, length)[0]
+                if length == 0:
+                    continue
+                try:
+                    grading_write_stream.write(bytes(buffer[:length]))
+                    del buffer[:length]
+                    await grading_write_stream.drain()
+                except Exception as e:
+                    self._logger.info("Student container closed the stream")
+                    self._logger.info(e)
+                    return
         except asyncio.IncompleteReadError:
             self._logger.debug("Container output ended with an IncompleteReadError; It was probably killed.")
             return
@@ -2,17 +2,62 @@
 #
 # This file is part of INGInious. See the LICENSE and the COPYRIGHTS files for
 # more information about the licensing of this file.
-import json
 import logging
 import gettext
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
 
 from inginious.agent import Agent, CannotCreateJobException
-from inginious import get_root_path
+from inginious.common import mcq
+from inginious.common.cache import LRUCache
 from inginious.common.messages import BackendNewJob, BackendKillJob
-from inginious.common.tasks_problems import get_problem_types
-import os.path
+from inginious.common.tasks_problems import get_problem_types, register_problem_types
 import builtins
 
+# State of the grading process. When the agent uses a process pool, each process of the pool has its own copy.
+_fs = None
+_translations = {}
+# (course id, task id, language) => (problems sent by the backend, problem objects built from them)
+_problems_cache = LRUCache(32 * 1024 * 1024)
+
+
+def _init_grader(fs, problem_types):
+    """ Initializes the grading state of the current process """
+    global _fs, _translations
+    _fs = fs
+    _translations = mcq.load_mcq_translations()
+    _problems_cache.clear()
+    register_problem_types(problem_types)
+
+
+def _get_problems(course_id, task_id, task_problems, language):
+    """ Returns the problem objects of a task, built once per (course, task) and language. They are built again when
+        the problems sent by the backend change. The least recently used ones are dropped first. """
+    key = (course_id, task_id, language)
+    cached = _problems_cache.get(key)
+    if cached is not None and cached[0] == task_problems:
+        return cached[1]
+
+    course_fs = _fs.from_subfolder(course_id)
+    task_fs = course_fs.from_subfolder(task_id)
+    translations = mcq.load_task_translations(course_fs, task_fs, language)
+    problems = mcq.create_problems(task_problems, translations, task_fs)
+    _problems_cache.put(key, (task_problems, problems))
+    return problems
+
+
+def grade_job(course_id, task_id, task_problems, inputdata):
+    """ Grades a job. Returns None if the task is not a pure MCQ, or a tuple (result, text, grade, problems, state) """
+    language = inputdata.get("@lang", "")
+    translation = _translations.get(language, gettext.NullTranslations())
+    # TODO: this would probably require a refactor.
+    # This may pose problem with apps that start multiple MCQAgents in the same process...
+    builtins.__dict__['_'] = translation.gettext
+
+    problems = _get_problems(course_id, task_id, task_problems, language)
+    return mcq.grade(problems, inputdata, language, translation.gettext, inputdata.get("@state", ""))
+
 
 class MCQAgent(Agent):
     def __init__(self, context, backend_addr, friendly_name, concurrency):
@@ -20,114 +65,53 @@ class MCQAgent(Agent):
         :param context: ZeroMQ context for this process
         :param backend_addr: address of the backend (for example, "tcp://127.0.0.1:2222")
         :param friendly_name: a string containing a friendly name to identify agent
-        :param problem_types: Problem types dictionary
+        :param concurrency: number of jobs graded simultaneously. If greater than 1, jobs are graded in a pool of
+                            `concurrency` processes, else directly in the event loop.
         """
         super().__init__(context, backend_addr, friendly_name, concurrency)
         self._logger = logging.getLogger("inginious.agent.mcq")
+        self._concurrency = concurrency
+        self._pool = None
+
+        # Init gettext and problem cache
+        _init_grader(self._fs, dict(get_problem_types()))
+        if concurrency > 1:
+            self._pool = self._create_pool()
 
-        # Init gettext
-        self._translations = {"en": gettext.NullTranslations()}
-        available_translations = [x for x in os.listdir(get_root_path() + '/agent/mcq_agent/i18n') if os.path.isdir(os.path.join(get_root_path() + '/agent/mcq_agent/i18n', x))]
-        self._translations.update({
-            lang: gettext.translation('messages', get_root_path() + '/agent/mcq_agent/i18n', [lang]) for lang in available_translations
-        })
+    def _create_pool(self):
+        # Processes are spawned rather than forked, as the agent may run in a multithreaded process (the webapp)
+        return ProcessPoolExecutor(self._concurrency, mp_context=multiprocessing.get_context("spawn"),
+                                   initializer=_init_grader, initargs=(self._fs, dict(get_problem_types())))
 
     @property
     def environments(self):
         return {"mcq": {"mcq": {"id": "mcq", "created": 0}}}
 
     def check_answer(self, problems, task_input, language):
-        """ Verify the answers in task_input. Returns six values:
-
-        1. True the input is **currently** valid. (may become invalid after running the code), False else
-        2. True if the input needs to be run in the VM, False else
-        3. Main message, as a list (that can be join with ``\\n`` or ``<br/>`` for example)
-        4. Problem specific message, as a dictionnary (tuple of result/text)
-        5. Number of subproblems that (already) contain errors. <= Number of subproblems
-        6. Number of errors in MCQ problems. Not linked to the number of subproblems
-
-        """
-        valid = True
-        need_launch = False
-        main_message = []
-        problem_messages = {}
-        error_count = 0
-        multiple_choice_error_count = 0
-        states = {}
-        for problem in problems:
-            problem_is_valid, problem_main_message, problem_s_messages, problem_mc_error_count, state = problem.check_answer(task_input, language)
-            states[problem.get_id()] = state
-            if problem_is_valid is None:
-                need_launch = True
-            elif problem_is_valid == False:
-                error_count += 1
-                valid = False
-            if problem_main_message is not None:
-                main_message.append(problem_main_message)
-            if problem_s_messages is not None:
-                problem_messages[problem.get_id()] = (("success" if problem_is_valid else "failed"), problem_s_messages)
-            multiple_choice_error_count += problem_mc_error_count
-        return valid, need_launch, main_message, problem_messages, error_count, multiple_choice_error_count, json.dumps(states)
+        """ Verify the answers in task_input. See :func:`inginious.common.mcq.check_answer` """
+        return mcq.check_answer(problems, task_input, language)
 
     async def new_job(self, msg: BackendNewJob):
-        language = msg.inputdata.get("@lang", "")
-        previous_state = msg.inputdata.get("@state", "")
-        translation = self._translations.get(language, gettext.NullTranslations())
-        # TODO: this would probably require a refactor.
-        # This may pose problem with apps that start multiple MCQAgents in the same process...
-        builtins.__dict__['_'] = translation.gettext
-
-        course_fs = self._fs.from_subfolder(msg.course_id)
-        task_fs = course_fs.from_subfolder(msg.task_id)
-        translations_fs = task_fs.from_subfolder("$i18n")
-        if not translations_fs.exists():
-            translations_fs = task_fs.from_subfolder("student").from_subfolder("$i18n")
-        if not translations_fs.exists():
-            translations_fs = course_fs.from_subfolder("$common").from_subfolder("$i18n")
-        if not translations_fs.exists():
-            translations_fs = course_fs.from_subfolder("$common").from_subfolder("student")\
-                .from_subfolder("$i18n")
-
-        if translations_fs.exists() and translations_fs.exists(language + ".mo"):
-            translations = {language: gettext.GNUTranslations(translations_fs.get_fd(language + ".mo"))}
+        if self._pool is None:
+            graded = grade_job(msg.course_id, msg.task_id, msg.task_problems, msg.inputdata)
         else:
-            translations = {language: gettext.NullTranslations()}
-
-        task_problems= msg.task_problems
-        problems = []
-        for problemid, problem_content in task_problems.items():
-            problem_class = get_problem_types().get(problem_content.get('type', ""))
-            problems.append(problem_class(problemid, problem_content, translations, task_fs))
-
-        result, need_emul, text, problems, error_count, mcq_error_count, state = self.check_answer(problems, msg.inputdata, language)
-
-        internal_messages = {
-            "_wrong_answer_multiple": _("Wrong answer. Make sure to select all the valid possibilities"),
-            "_wrong_answer": _("Wrong answer"),
-            "_correct_answer": _("Correct answer"),
-        }
-
-        for key, (p_result, messages) in problems.items():
-            messages = [internal_messages[message] if message in internal_messages else message for message in messages]
-            problems[key] = (p_result, "\n\n".join(messages))
-
-        if need_emul:
+            pool = self._pool
+            try:
+                graded = await self._loop.run_in_executor(pool, grade_job, msg.course_id, msg.task_id,
+                                                          msg.task_problems, msg.inputdata)
+            except BrokenProcessPool:
+                if pool is self._pool:  # not yet restarted by another job
+                    self._logger.error("A grading process died unexpectedly, restarting the pool")
+                    self._pool = self._create_pool()
+                    pool.shutdown(wait=False)
+                raise
+
+        if graded is None:
             self._logger.warning("Task %s/%s is not a pure MCQ but has env=MCQ", msg.course_id, msg.task_id)
             raise CannotCreateJobException("Task wrongly configured as a MCQ")
 
-        if error_count != 0:
-            text.append(_("You have {} wrong answer(s).").format(error_count))
-        if mcq_error_count != 0:
-            text.append("\n\n" + _("Among them, you have {} invalid answers in the multiple choice questions").format(mcq_error_count))
-
-        nb_subproblems = len(task_problems)
-        if nb_subproblems == 0:
-            grade = 0.0
-            text.append("No subproblems defined")
-            await self.send_job_result(msg.job_id, "crashed", "\n".join(text), grade, problems, {}, {}, previous_state, None)
-        else:
-            grade = 100.0 * float(nb_subproblems - error_count) / float(nb_subproblems)
-            await self.send_job_result(msg.job_id, ("success" if result else "failed"), "\n".join(text), grade, problems, {}, {}, state, None)
+        result, text, grade, problems, state = graded
+        await self.send_job_result(msg.job_id, result, text, grade, problems, {}, {}, state, None)
 
     async def kill_job(self, message: BackendKillJob):
         pass
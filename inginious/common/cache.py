@@ -0,0 +1,229 @@
+# -*- coding: utf-8 -*-
+#
+# This file is part of INGInious. See the LICENSE and the COPYRIGHTS files for
+# more information about the licensing of this file.
+
+""" Bounded in-memory cache, and on-disk cache shared by the processes of a host """
+
+import hashlib
+import logging
+import os
+import pickle
+import sys
+import tempfile
+import threading
+import types
+from collections import OrderedDict
+
+# Objects shared by all the cached values, that are not counted in their size
+_shared_types = (type, types.ModuleType, types.FunctionType, types.BuiltinFunctionType, types.MethodType,
+                 logging.Logger, threading.Lock().__class__)
+
+
+_atomic_types = {str, bytes, int, float, bool, type(None)}
+
+
+def deep_sizeof(obj):
+    """ Returns an estimation of the memory used by obj and the objects it references, in bytes """
+    size = 0
+    seen = set()
+    stack = [obj]
+    while stack:
+        obj = stack.pop()
+        obj_type = type(obj)
+        if obj_type in _atomic_types:
+            size += sys.getsizeof(obj)
+            continue
+        if id(obj) in seen or isinstance(obj, _shared_types):
+            continue
+        seen.add(id(obj))
+        size += sys.getsizeof(obj)
+
+        if isinstance(obj, dict):
+            stack.extend(obj.keys())
+            stack.extend(obj.values())
+        elif isinstance(obj, (list, tuple, set, frozenset)):
+            stack.extend(obj)
+        else:
+            if hasattr(obj, "__dict__"):
+                stack.append(obj.__dict__)
+            for slot in getattr(obj_type, "__slots__", ()):
+                if hasattr(obj, slot):
+                    stack.append(getattr(obj, slot))
+    return size
+
+
+class LRUCache:
+    """
+    A dict-like cache evicting the least recently used entries once the size of its values exceeds max_size bytes.
+    The sizes are estimated with deep_sizeof.
+    """
+
+    def __init__(self, max_size=256 * 1024 * 1024):
+        """ :param max_size: maximum size of the values, in bytes. None for no limit. """
+        self.max_size = max_size
+        self._entries = OrderedDict()
+        self._size = 0
+        self._lock = threading.Lock()
+        self._hits = 0
+        self._misses = 0
+        self._evictions = 0
+
+    def get(self, key, default=None):
+        """ Returns the value stored under key, or default """
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                self._misses += 1
+                return default
+            self._entries.move_to_end(key)
+            self._hits += 1
+            return entry[0]
+
+    def put(self, key, value, size=None):
+        """ Stores value under key. size is the size of value in bytes, computed with deep_sizeof if None. """
+        if size is None:
+            size = deep_sizeof(value)
+        with self._lock:
+            self._pop(key)
+            self._entries[key] = (value, size)
+            self._size += size
+            # The value just inserted is kept, even if it is larger than the whole cache
+            while self.max_size is not None and self._size > self.max_size and len(self._entries) > 1:
+                __, (__, evicted_size) = self._entries.popitem(last=False)
+                self._size -= evicted_size
+                self._evictions += 1
+
+    def pop(self, key):
+        """ Removes the entry of key, if any """
+        with self._lock:
+            self._pop(key)
+
+    def _pop(self, key):
+        entry = self._entries.pop(key, None)
+        if entry is not None:
+            self._size -= entry[1]
+
+    def items(self):
+        """ Returns a list of the (key, value) pairs, without updating their recency """
+        with self._lock:
+            return [(key, value) for key, (value, __) in self._entries.items()]
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self._size = 0
+
+    def __len__(self):
+        return len(self._entries)
+
+    def __contains__(self, key):
+        return key in self._entries
+
+    def stats(self):
+        """ Returns a dict with the number of hits, misses, evictions and entries, and the size of the cache """
+        with self._lock:
+            return {"hits": self._hits, "misses": self._misses, "evictions": self._evictions,
+                    "entries": len(self._entries), "size": self._size, "max_size": self.max_size}
+
+
+class DiskCache:
+    """
+    Stores pickled values in a directory, with a version each. A value is only returned for the version it was stored
+    with. The directory can be shared by the processes of a host, and should be on a tmpfs (e.g. /dev/shm) to keep the
+    values in memory. Only trusted processes must be able to write in it, as its files are unpickled.
+
+    Once the files exceed max_size bytes, the least recently used ones are deleted. The directory is checked when the
+    process starts, then each time it has written a tenth of max_size, so that it can exceed max_size by a tenth for
+    each process sharing it.
+    """
+
+    def __init__(self, directory, max_size=256 * 1024 * 1024):
+        """ :param max_size: maximum size of the files, in bytes. None for no limit. """
+        self._directory = directory
+        self._max_size = max_size
+        self._written = 0
+        self._lock = threading.Lock()
+        self._logger = logging.getLogger("inginious.cache")
+        os.makedirs(directory, exist_ok=True)
+        if max_size is not None:
+            self.prune()
+
+    def _get_path(self, key):
+        return os.path.join(self._directory, hashlib.sha256(key.encode("utf-8")).hexdigest() + ".pickle")
+
+    def get(self, key, version, default=None):
+        """ Returns the value stored under key with the given version, or default """
+        path = self._get_path(key)
+        try:
+            with open(path, "rb") as f:
+                stored_key, stored_version, value = pickle.load(f)
+        except FileNotFoundError:
+            return default
+        except Exception:
+            self._logger.warning("Cannot read the cached value of %s", key, exc_info=True)
+            return default
+        if (stored_key, stored_version) != (key, version):
+            return default
+        if self._max_size is not None:
+            try:
+                os.utime(path)  # the modification time orders the files to prune
+            except OSError:
+                pass
+        return value
+
+    def put(self, key, version, value):
+        """ Stores value under key, replacing the value of any other version """
+        tmp_path = None
+        try:
+            fd, tmp_path = tempfile.mkstemp(dir=self._directory, suffix=".tmp")
+            with os.fdopen(fd, "wb") as f:
+                pickle.dump((key, version, value), f, protocol=pickle.HIGHEST_PROTOCOL)
+                size = f.tell()
+            os.replace(tmp_path, self._get_path(key))
+        except Exception:
+            self._logger.warning("Cannot cache the value of %s", key, exc_info=True)
+            if tmp_path is not None and os.path.exists(tmp_path):
+                os.remove(tmp_path)
+            return
+
+        if self._max_size is not None:
+            with self._lock:
+                self._written += size
+                prune = self._written > self._max_size // 10
+                if prune:
+                    self._written = 0
+            if prune:
+                self.prune()
+
+    def delete(self, key):
+        try:
+            os.remove(self._get_path(key))
+        except FileNotFoundError:
+            pass
+
+    def prune(self):
+        """ Deletes the least recently used files until they are below 90% of max_size """
+        files = []
+        with os.scandir(self._directory) as entries:
+            for entry in entries:
+                if not entry.name.endswith(".pickle"):
+                    continue
+                try:
+                    stat = entry.stat()
+                except FileNotFoundError:  # deleted by another process
+                    continue
+                files.append((stat.st_mtime, stat.st_size, entry.path))
+
+        size = sum(file_size for __, file_size, __ in files)
+        if size <= self._max_size:
+            return
+        files.sort()
+        for __, file_size, path in files:
+            if size <= self._max_size * 0.9:
+                break
+            try:
+                os.remove(path)
+            except FileNotFoundError:
+                pass
+            size -= file_size
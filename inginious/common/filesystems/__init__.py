@@ -12,7 +12,10 @@ from typing import Callable, TypeVar, Optional
 from abc import ABCMeta, abstractmethod
 from datetime import datetime
 
+from inginious.common.base import loads_json_or_yaml
+from inginious.common.cache import LRUCache, DiskCache
 from inginious.common.exceptions import NotLoadedException
+from inginious.common.sidecars import read_sidecar, write_sidecar
 
 
 class FileSystemProvider(metaclass=ABCMeta):
@@ -145,26 +148,83 @@ class FileSystemProvider(metaclass=ABCMeta):
         """
 
 _fs_provider = None
-_cache = {}
+_cache = LRUCache()
+_shared_cache = None
+_sidecar_directory = None
 T = TypeVar('T')
 
 def fetch_or_cache(course_fs : FileSystemProvider, path : str, get_resource : Callable[[], T]) -> T:
     """ Fetch the cached content for course_fs.prefix + path or put the get_resource() result in cache """
     last_modif = course_fs.get_last_modification_time(path)
-    cached_data = _cache.get(course_fs.prefix + path, (None, 0))
-    if cached_data[1] < last_modif:
-        _cache[course_fs.prefix + path] = get_resource(), last_modif
-    return _cache[course_fs.prefix + path][0]
+    cached_data = _cache.get(course_fs.prefix + path)
+    if cached_data is None or cached_data[1] < last_modif:
+        cached_data = get_resource(), last_modif
+        _cache.put(course_fs.prefix + path, cached_data)
+    return cached_data[0]
+
+
+def fetch_descriptor(course_fs : FileSystemProvider, path : str) -> dict:
+    """ Returns the parsed content of the JSON or YAML file at path. If a shared cache is configured, the parsed
+        content is read from it when the file was not modified since it was stored. If sidecars are enabled, it is
+        then read from the compiled sidecar of the file, which is written if missing or outdated. """
+    if _shared_cache is None and _sidecar_directory is None:
+        return loads_json_or_yaml(path, course_fs.get(path))
+
+    version = course_fs.get_last_modification_time(path)
+    if _shared_cache is not None:
+        descriptor = _shared_cache.get(course_fs.prefix + path, version)
+        if descriptor is not None:
+            return descriptor
+
+    descriptor = read_sidecar(_sidecar_directory, course_fs, path) if _sidecar_directory is not None else None
+    if descriptor is None:
+        content = course_fs.get(path)
+        descriptor = loads_json_or_yaml(path, content)
+        if _sidecar_directory is not None:
+            write_sidecar(_sidecar_directory, course_fs, path, content, descriptor, version)
+
+    if _shared_cache is not None:
+        _shared_cache.put(course_fs.prefix + path, version, descriptor)
+    return descriptor
+
+
+def descriptor_saved(course_fs : FileSystemProvider, path : str) -> None:
+    """ Refreshes the compiled sidecar of the descriptor at path, that was just written, if sidecars are enabled """
+    if _sidecar_directory is not None:
+        write_sidecar(_sidecar_directory, course_fs, path)
 
 
 def invalidate_cache(course_fs : FileSystemProvider, path : Optional[str] = None) -> None:
     """ Removes the cache content for the specified path or the whole prefix """
     if path:
-        del _cache[course_fs.prefix + path]
+        _cache.pop(course_fs.prefix + path)
     else:
-        for key in list(_cache.keys()):
+        for key, __ in _cache.items():
             if key.startswith(course_fs.prefix):
-                del _cache[key]
+                _cache.pop(key)
+
+
+def init_cache(max_size: Optional[int] = None, shared_directory: Optional[str] = None, sidecars: Optional[str] = None,
+               shared_max_size: Optional[int] = 256 * 1024 * 1024) -> None:
+    """
+    Configures the caches of the files loaded from the filesystem.
+    :param max_size: maximum size in bytes of the objects kept in memory by fetch_or_cache. None to keep the default.
+    :param shared_directory: directory where fetch_descriptor stores the parsed descriptors, to share them between
+                             processes, or None to disable it.
+    :param sidecars: directory where the compiled sidecars of the descriptors are read and written, or None to disable
+                     them, see inginious.common.sidecars
+    :param shared_max_size: maximum size in bytes of the files of shared_directory, None for no limit
+    """
+    global _shared_cache, _sidecar_directory
+    if max_size is not None:
+        _cache.max_size = max_size
+    _shared_cache = DiskCache(shared_directory, shared_max_size) if shared_directory else None
+    _sidecar_directory = sidecars or None
+
+
+def get_cache_stats() -> dict:
+    """ Returns the statistics of the in-memory cache of fetch_or_cache, see LRUCache.stats """
+    return _cache.stats()
 
 
 def get_fs_provider() -> FileSystemProvider:
@@ -0,0 +1,124 @@
+# -*- coding: utf-8 -*-
+#
+# This file is part of INGInious. See the LICENSE and the COPYRIGHTS files for
+# more information about the licensing of this file.
+
+""" Grading of tasks whose problems can all be checked without running any code (multiple choice, match, ...).
+    Used by the MCQ agent, and by the webapp to grade such tasks in-process. """
+
+import os
+import json
+import gettext
+
+from inginious import get_root_path
+from inginious.common.tasks_problems import get_problem_types
+
+_translations_dir = os.path.join(get_root_path(), "agent", "mcq_agent", "i18n")
+
+
+def load_mcq_translations():
+    """ Returns a dict of the translations of the grading messages, keyed by language """
+    translations = {"en": gettext.NullTranslations()}
+    available_translations = [x for x in os.listdir(_translations_dir) if os.path.isdir(os.path.join(_translations_dir, x))]
+    translations.update({
+        lang: gettext.translation('messages', _translations_dir, [lang]) for lang in available_translations
+    })
+    return translations
+
+
+def load_task_translations(course_fs, task_fs, language):
+    """ Returns the translations of the task texts (choices, feedback, ...) for the given language, in the form
+        expected by the problem constructors """
+    translations_fs = task_fs.from_subfolder("$i18n")
+    if not translations_fs.exists():
+        translations_fs = task_fs.from_subfolder("student").from_subfolder("$i18n")
+    if not translations_fs.exists():
+        translations_fs = course_fs.from_subfolder("$common").from_subfolder("$i18n")
+    if not translations_fs.exists():
+        translations_fs = course_fs.from_subfolder("$common").from_subfolder("student").from_subfolder("$i18n")
+
+    if translations_fs.exists() and translations_fs.exists(language + ".mo"):
+        return {language: gettext.GNUTranslations(translations_fs.get_fd(language + ".mo"))}
+    return {language: gettext.NullTranslations()}
+
+
+def create_problems(task_problems, translations, task_fs):
+    """ Instantiates the problems of a task from their description (the problems dict of the task) """
+    problems = []
+    for problemid, problem_content in task_problems.items():
+        problem_class = get_problem_types().get(problem_content.get('type', ""))
+        problems.append(problem_class(problemid, problem_content, translations, task_fs))
+    return problems
+
+
+def check_answer(problems, task_input, language):
+    """ Verify the answers in task_input. Returns seven values:
+
+    1. True the input is **currently** valid. (may become invalid after running the code), False else
+    2. True if the input needs to be run in the VM, False else
+    3. Main message, as a list (that can be join with ``\\n`` or ``<br/>`` for example)
+    4. Problem specific message, as a dictionnary (tuple of result/text)
+    5. Number of subproblems that (already) contain errors. <= Number of subproblems
+    6. Number of errors in MCQ problems. Not linked to the number of subproblems
+    7. The state of the problems, as a json string
+
+    """
+    valid = True
+    need_launch = False
+    main_message = []
+    problem_messages = {}
+    error_count = 0
+    multiple_choice_error_count = 0
+    states = {}
+    for problem in problems:
+        problem_is_valid, problem_main_message, problem_s_messages, problem_mc_error_count, state = problem.check_answer(task_input, language)
+        states[problem.get_id()] = state
+        if problem_is_valid is None:
+            need_launch = True
+        elif problem_is_valid == False:
+            error_count += 1
+            valid = False
+        if problem_main_message is not None:
+            main_message.append(problem_main_message)
+        if problem_s_messages is not None:
+            problem_messages[problem.get_id()] = (("success" if problem_is_valid else "failed"), problem_s_messages)
+        multiple_choice_error_count += problem_mc_error_count
+    return valid, need_launch, main_message, problem_messages, error_count, multiple_choice_error_count, json.dumps(states)
+
+
+def grade(problems, task_input, language, gettext_func, previous_state=""):
+    """ Grades the answers in task_input to the given problems.
+
+    :param gettext_func: function used to translate the grading messages, in the language of the submitter
+    :param previous_state: state of the previous submission, kept if the task cannot be graded
+    :return: None if some problems need to be run in the VM, or a tuple (result, text, grade, problems, state), in the
+             form expected by :meth:`inginious.agent.Agent.send_job_result`
+    """
+    _ = gettext_func
+    result, need_emul, text, problem_messages, error_count, mcq_error_count, state = check_answer(problems, task_input, language)
+
+    if need_emul:
+        return None
+
+    internal_messages = {
+        "_wrong_answer_multiple": _("Wrong answer. Make sure to select all the valid possibilities"),
+        "_wrong_answer": _("Wrong answer"),
+        "_correct_answer": _("Correct answer"),
+    }
+
+    for key, (p_result, messages) in problem_messages.items():
+        messages = [internal_messages[message] if message in internal_messages else message for message in messages]
+        problem_messages[key] = (p_result, "\n\n".join(messages))
+
+    if error_count != 0:
+        text.append(_("You have {} wrong answer(s).").format(error_count))
+    if mcq_error_count != 0:
+        text.append("\n\n" + _("Among them, you have {} invalid answers in the multiple choice questions").format(mcq_error_count))
+
+    nb_subproblems = len(problems)
+    if nb_subproblems == 0:
+        text.append("No subproblems defined")
+        return "crashed", "\n".join(text), 0.0, problem_messages, previous_state
+
+    grade = 100.0 * float(nb_subproblems - error_count) / float(nb_subproblems)
+    return ("success" if result else "failed"), "\n".join(text), grade, problem_messages, state
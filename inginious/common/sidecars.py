@@ -0,0 +1,121 @@
+# -*- coding: utf-8 -*-
+#
+# This file is part of INGInious. See the LICENSE and the COPYRIGHTS files for
+# more information about the licensing of this file.
+
+"""
+Compiled descriptors.
+
+Parsing large task.yaml files is slow. A descriptor can be compiled into a msgpack sidecar file, that holds the parsed
+content together with the modification time and the SHA-256 hash of the YAML file. The sidecar is used as long as the
+YAML file has the same modification time, or the same hash if it was only touched.
+
+The sidecars are stored in their own directory, outside of the tasks filesystem, under the hash of the path of their
+descriptor: they are neither seen by the users of the tasks filesystem nor reported as changes of the course.
+"""
+
+import hashlib
+import logging
+import os
+import tempfile
+
+import msgpack
+
+from inginious.common.base import loads_json_or_yaml
+
+_SIDECAR_VERSION = 1
+_logger = logging.getLogger("inginious.sidecars")
+
+# Sidecar path => modification time of the descriptor that could not be compiled, so that it is not tried again
+_failures = {}
+
+
+def get_sidecar_path(directory, fs, path):
+    """ Returns the path of the sidecar of the descriptor at path in fs, in the sidecar directory """
+    key = hashlib.sha256((fs.prefix + path).encode("utf-8")).hexdigest()
+    return os.path.join(directory, key[0:2], key + ".msgpack")
+
+
+def write_sidecar(directory, fs, path, content=None, descriptor=None, mtime=None):
+    """
+    Compiles the descriptor at path in fs into its sidecar, in directory.
+    :param content: the content of the descriptor file, read from fs if None
+    :param descriptor: the parsed content, parsed from content if None
+    :param mtime: the modification time of the descriptor, read before content. Read from fs if None, in which case
+                  content must be None too.
+    :return: True if the sidecar was written. Descriptors containing values that msgpack cannot store (such as dates
+             without time zone) are not compiled. Failing to write the sidecar (read-only or full file system) is
+             logged and does not raise, as sidecars are written while reading the descriptors. A descriptor that
+             could not be compiled is not tried again until it is modified.
+    """
+    if mtime is None:
+        mtime = fs.get_last_modification_time(path)
+    sidecar_path = get_sidecar_path(directory, fs, path)
+    if _failures.get(sidecar_path) == mtime:
+        return False
+    if content is None:
+        content = fs.get(path)
+    if descriptor is None:
+        descriptor = loads_json_or_yaml(path, content)
+
+    try:
+        data = msgpack.packb({"version": _SIDECAR_VERSION, "mtime": mtime, "sha256": hashlib.sha256(content).hexdigest(),
+                              "descriptor": descriptor}, datetime=True)
+    except (TypeError, ValueError) as e:
+        _logger.debug("Cannot compile %s%s: %s", fs.prefix, path, e)
+        _failures[sidecar_path] = mtime
+        return False
+
+    tmp_path = None
+    try:
+        os.makedirs(os.path.dirname(sidecar_path), exist_ok=True)
+        fd, tmp_path = tempfile.mkstemp(dir=os.path.dirname(sidecar_path), suffix=".tmp")
+        with os.fdopen(fd, "wb") as f:
+            f.write(data)
+        os.replace(tmp_path, sidecar_path)
+    except OSError:
+        _logger.warning("Cannot write the sidecar of %s%s", fs.prefix, path, exc_info=True)
+        if tmp_path is not None and os.path.exists(tmp_path):
+            os.remove(tmp_path)
+        _failures[sidecar_path] = mtime
+        return False
+    _failures.pop(sidecar_path, None)
+    return True
+
+
+def read_sidecar(directory, fs, path, refresh=True):
+    """
+    Returns the parsed content of the descriptor at path in fs from its sidecar in directory, or None if the sidecar
+    does not exist or is outdated.
+    :param refresh: update the modification time stored in the sidecar if only the hash of the descriptor matches
+    """
+    try:
+        with open(get_sidecar_path(directory, fs, path), "rb") as f:
+            data = msgpack.unpackb(f.read(), raw=False, strict_map_key=False, timestamp=3)
+    except FileNotFoundError:
+        return None
+    except Exception:
+        _logger.warning("Cannot read the sidecar of %s%s", fs.prefix, path, exc_info=True)
+        return None
+
+    if not isinstance(data, dict) or data.get("version") != _SIDECAR_VERSION:
+        return None
+
+    mtime = fs.get_last_modification_time(path)
+    if data["mtime"] == mtime:
+        return data["descriptor"]
+
+    content = fs.get(path)
+    if data["sha256"] != hashlib.sha256(content).hexdigest():
+        return None
+    if refresh:
+        write_sidecar(directory, fs, path, content, data["descriptor"], mtime)
+    return data["descriptor"]
+
+
+def delete_sidecar(directory, fs, path):
+    """ Deletes the sidecar of the descriptor at path in fs, if any """
+    try:
+        os.remove(get_sidecar_path(directory, fs, path))
+    except FileNotFoundError:
+        pass
@@ -0,0 +1,87 @@
+# -*- coding: utf-8 -*-
+#
+# This file is part of INGInious. See the LICENSE and the COPYRIGHTS files for
+# more information about the licensing of this file.
+
+import os
+import shutil
+import tempfile
+
+import pytest
+
+from inginious.common.cache import LRUCache, DiskCache, deep_sizeof
+from inginious.common.filesystems import fetch_descriptor, init_cache
+from inginious.common.filesystems.local import LocalFSProvider
+
+
+@pytest.fixture()
+def tmp_dir():
+    dir_path = tempfile.mkdtemp()
+    yield dir_path
+    shutil.rmtree(dir_path)
+
+
+class TestLRUCache(object):
+    def test_deep_sizeof(self):
+        assert deep_sizeof({"a": "x" * 1000}) > 1000
+        assert deep_sizeof([b"x" * 1000, b"y" * 1000]) > 2000
+
+    def test_eviction(self):
+        cache = LRUCache(max_size=2500)
+        cache.put("a", None, size=1000)
+        cache.put("b", None, size=1000)
+        cache.get("a")
+        cache.put("c", None, size=1000)
+        assert "a" in cache and "c" in cache and "b" not in cache
+        assert cache.stats()["size"] == 2000
+        assert cache.stats()["evictions"] == 1
+
+    def test_larger_than_cache(self):
+        cache = LRUCache(max_size=100)
+        cache.put("a", None, size=1000)
+        assert "a" in cache
+
+    def test_stats(self):
+        cache = LRUCache()
+        cache.put("a", 1)
+        cache.put("a", 2)
+        assert cache.get("a") == 2
+        assert cache.get("b") is None
+        stats = cache.stats()
+        assert (stats["hits"], stats["misses"], stats["entries"]) == (1, 1, 1)
+        cache.pop("a")
+        assert cache.stats()["size"] == 0
+
+
+class TestDiskCache(object):
+    def test_versions(self, tmp_dir):
+        cache = DiskCache(tmp_dir)
+        cache.put("/tasks/course/course.yaml", 1.0, {"name": "Course"})
+        assert cache.get("/tasks/course/course.yaml", 1.0) == {"name": "Course"}
+        assert cache.get("/tasks/course/course.yaml", 2.0) is None
+        assert cache.get("/tasks/other/course.yaml", 1.0) is None
+
+    def test_prune(self, tmp_dir):
+        cache = DiskCache(tmp_dir, max_size=10000)
+        for i in range(10):
+            cache.put("key%d" % i, 1, b"x" * 900)
+        for name in os.listdir(tmp_dir):
+            os.utime(os.path.join(tmp_dir, name), (0, 0))
+        assert cache.get("key0", 1) == b"x" * 900  # the least recently used files are pruned first
+        cache.put("key10", 1, b"x" * 900)
+        cache.put("key11", 1, b"x" * 900)
+        assert sum(os.path.getsize(os.path.join(tmp_dir, name)) for name in os.listdir(tmp_dir)) <= 10000
+        assert cache.get("key0", 1) == b"x" * 900
+        assert cache.get("key11", 1) == b"x" * 900
+        assert len(os.listdir(tmp_dir)) < 12
+
+    def test_fetch_descriptor(self, tmp_dir):
+        fs = LocalFSProvider(os.path.join(tmp_dir, "tasks"))
+        fs.put("course.yaml", "name: Course\n")
+        init_cache(shared_directory=os.path.join(tmp_dir, "cache"))
+        try:
+            assert fetch_descriptor(fs, "course.yaml") == {"name": "Course"}
+            assert len(os.listdir(os.path.join(tmp_dir, "cache"))) == 1
+            assert fetch_descriptor(fs, "course.yaml") == {"name": "Course"}
+        finally:
+            init_cache()
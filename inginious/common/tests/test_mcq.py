@@ -0,0 +1,97 @@
+# -*- coding: utf-8 -*-
+#
+# This file is part of INGInious. See the LICENSE and the COPYRIGHTS files for
+# more information about the licensing of this file.
+
+import gettext
+import json
+import os
+import shutil
+import tempfile
+
+import pytest
+
+from inginious.agent import mcq_agent
+from inginious.common import mcq
+from inginious.common.filesystems.local import LocalFSProvider
+from inginious.common.tasks_problems import MultipleChoiceProblem, register_problem_types
+
+task_problems = {
+    "single": {"type": "multiple_choice", "header": "Single", "choices": [
+        {"text": "Good", "valid": True}, {"text": "Bad", "feedback": "Not this one"}]},
+    "multiple": {"type": "multiple_choice", "header": "Multiple", "multiple": True, "choices": [
+        {"text": "Good 1", "valid": True}, {"text": "Good 2", "valid": True}, {"text": "Bad"}]}
+}
+
+
+@pytest.fixture()
+def problems():
+    register_problem_types({"multiple_choice": MultipleChoiceProblem})
+    yield mcq.create_problems(task_problems, {"en": gettext.NullTranslations()}, None)
+
+
+class TestMCQGrading(object):
+    def test_all_correct(self, problems):
+        result, text, grade, problem_messages, state = mcq.grade(problems, {"single": "0", "multiple": ["0", "1"]},
+                                                                 "en", gettext.gettext)
+        assert result == "success"
+        assert grade == 100.0
+        assert problem_messages == {}
+        assert json.loads(state) == {"single": "", "multiple": ""}
+
+    def test_errors(self, problems):
+        result, text, grade, problem_messages, state = mcq.grade(problems, {"single": "1", "multiple": ["0", "2"]},
+                                                                 "en", gettext.gettext)
+        assert result == "failed"
+        assert grade == 0.0
+        assert problem_messages["single"] == ("failed", "Wrong answer\n\nNot this one")
+        assert problem_messages["multiple"] == ("failed", "Wrong answer. Make sure to select all the valid possibilities")
+        assert "You have 2 wrong answer(s)." in text
+
+    def test_partial(self, problems):
+        result, _, grade, _, _ = mcq.grade(problems, {"single": "0", "multiple": ["0"]}, "en", gettext.gettext)
+        assert result == "failed"
+        assert grade == 50.0
+
+    def test_no_problems(self):
+        result, text, grade, _, state = mcq.grade([], {}, "en", gettext.gettext, "previous")
+        assert result == "crashed"
+        assert grade == 0.0
+        assert state == "previous"
+
+
+@pytest.fixture()
+def grader():
+    dir_path = tempfile.mkdtemp()
+    os.makedirs(os.path.join(dir_path, "course", "task"))
+    mcq_agent._init_grader(LocalFSProvider(dir_path), {"multiple_choice": MultipleChoiceProblem})
+    yield
+    mcq_agent._init_grader(None, {})
+    shutil.rmtree(dir_path)
+
+
+class TestProblemsCache(object):
+    def test_hit(self, grader):
+        problems = mcq_agent._get_problems("course", "task", task_problems, "en")
+        hits = mcq_agent._problems_cache.stats()["hits"]
+        assert mcq_agent._get_problems("course", "task", dict(task_problems), "en") is problems
+        assert mcq_agent._problems_cache.stats()["hits"] == hits + 1
+
+    def test_changed_problems(self, grader):
+        problems = mcq_agent._get_problems("course", "task", task_problems, "en")
+        changed = dict(task_problems, single=dict(task_problems["single"], header="Changed"))
+        changed_problems = mcq_agent._get_problems("course", "task", changed, "en")
+        assert changed_problems is not problems
+        assert changed_problems[0].gettext("en", changed_problems[0]._header) == "Changed"
+        assert mcq_agent._get_problems("course", "task", changed, "en") is changed_problems
+
+    def test_languages(self, grader):
+        problems = mcq_agent._get_problems("course", "task", task_problems, "en")
+        assert mcq_agent._get_problems("course", "task", task_problems, "fr") is not problems
+        assert mcq_agent._get_problems("course", "task", task_problems, "en") is problems
+        assert len(mcq_agent._problems_cache) == 2
+
+    def test_grade_job(self, grader):
+        result, __, grade, __, __ = mcq_agent.grade_job("course", "task", task_problems,
+                                                        {"@lang": "en", "single": "0", "multiple": ["0", "1"]})
+        assert (result, grade) == ("success", 100.0)
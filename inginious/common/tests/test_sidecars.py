@@ -0,0 +1,71 @@
+# -*- coding: utf-8 -*-
+#
+# This file is part of INGInious. See the LICENSE and the COPYRIGHTS files for
+# more information about the licensing of this file.
+
+import os
+import shutil
+import tempfile
+
+import pytest
+
+from inginious.common import filesystems, sidecars
+from inginious.common.filesystems import fetch_descriptor
+from inginious.common.filesystems.local import LocalFSProvider
+from inginious.common.sidecars import write_sidecar, read_sidecar, get_sidecar_path
+
+
+@pytest.fixture()
+def task_fs():
+    dir_path = tempfile.mkdtemp()
+    fs = LocalFSProvider(os.path.join(dir_path, "task"))
+    fs.put("task.yaml", "name: Task\nproblems:\n  q1:\n    type: code\n    choices: [1, 2]\n")
+    yield fs
+    shutil.rmtree(dir_path)
+
+
+@pytest.fixture()
+def directory(task_fs):
+    return os.path.join(task_fs.prefix, "..", "sidecars")
+
+
+class TestSidecars(object):
+    def test_write_read(self, task_fs, directory):
+        assert read_sidecar(directory, task_fs, "task.yaml") is None
+        assert write_sidecar(directory, task_fs, "task.yaml")
+        assert os.path.exists(get_sidecar_path(directory, task_fs, "task.yaml"))
+        assert task_fs.list() == ["task.yaml"]
+        assert read_sidecar(directory, task_fs, "task.yaml") == {"name": "Task", "problems": {"q1": {
+            "type": "code", "choices": [1, 2]}}}
+
+    def test_touched(self, task_fs, directory):
+        write_sidecar(directory, task_fs, "task.yaml")
+        os.utime(os.path.join(task_fs.prefix, "task.yaml"), (0, 0))
+        assert read_sidecar(directory, task_fs, "task.yaml")["name"] == "Task"
+
+    def test_modified(self, task_fs, directory):
+        write_sidecar(directory, task_fs, "task.yaml")
+        task_fs.put("task.yaml", "name: Other\n")
+        os.utime(os.path.join(task_fs.prefix, "task.yaml"), (0, 0))
+        assert read_sidecar(directory, task_fs, "task.yaml") is None
+
+    def test_not_storable(self, task_fs, directory, monkeypatch):
+        task_fs.put("task.yaml", "name: Task\ndate: 2024-01-01 10:00:00\n")
+        assert not write_sidecar(directory, task_fs, "task.yaml")
+
+        # Not compiled again until the descriptor changes
+        monkeypatch.setattr(sidecars.msgpack, "packb", None)
+        assert not write_sidecar(directory, task_fs, "task.yaml")
+
+    def test_read_only(self, task_fs, directory, monkeypatch):
+        monkeypatch.setattr(filesystems, "_sidecar_directory", directory)
+
+        def mkstemp(*args, **kwargs):
+            raise PermissionError(directory)
+        monkeypatch.setattr(sidecars.tempfile, "mkstemp", mkstemp)
+        assert not write_sidecar(directory, task_fs, "task.yaml")
+        assert fetch_descriptor(task_fs, "task.yaml")["name"] == "Task"
+
+    def test_path(self, task_fs, directory):
+        assert get_sidecar_path(directory, task_fs, "task.yaml").startswith(directory)
+        assert get_sidecar_path(directory, task_fs, "task.yaml") != get_sidecar_path(directory, task_fs, "course.yaml")
@@ -13,17 +13,22 @@ import oauthlib
 from binascii import hexlify
 from werkzeug.exceptions import InternalServerError
 from mongoengine import connect, disconnect
+from mongoengine.connection import get_db
 
 from inginious.frontend.environment_types import register_base_env_types
 from inginious.frontend.arch_helper import create_arch, start_asyncio_and_zmq
 from inginious.frontend.plugins import plugin_manager
 from inginious.frontend.submission_manager import WebAppSubmissionManager
+from inginious.frontend.submission_events import SubmissionEventBroker, MongoSubmissionEventBroker
+from inginious.frontend.audience_import import AudienceImporter
 from inginious.frontend.user_manager import UserManager
 from inginious.frontend.i18n import available_languages, gettext
 from inginious import get_root_path, __version__, DB_VERSION
 from inginious.common.entrypoints import filesystem_from_config_dict
-from inginious.common.filesystems import init_fs_provider
+from inginious.common.filesystems import init_fs_provider, init_cache
 from inginious.common.filesystems.local import LocalFSProvider
+from inginious.frontend.course_registry import CourseRegistry, init_course_registry
+from inginious.frontend.parsable_text import init_render_cache
 from inginious.frontend.lti.v1_1 import LTIOutcomeManager
 from inginious.frontend.lti.v1_3 import LTIGradeManager
 from inginious.common.tasks_problems import register_problem_types
@@ -70,7 +75,9 @@ def _put_configuration_defaults(config):
         "ignore_change_ip": False,
         "httponly": True,
         "secret_key": "fLjUfxqXtfNoIldA0A0G",
-        "secure": False
+        "secure": False,
+        "refresh_threshold": 600,
+        "cache_ttl": 0
     }
     for k, v in default_session_parameters.items():
         if k not in config['session_parameters']:
@@ -111,9 +118,12 @@ def get_path(*path_parts):
     return "/".join(path_parts)
 
 
-def _close_app(client):
+def _close_app(client, submission_events, audience_importer):
     """ Ensures that the app is properly closed """
     client.close()
+    if submission_events is not None:
+        submission_events.close()
+    audience_importer.close()
     disconnect()
 
 
@@ -137,7 +147,9 @@ def get_app(config):
     flask_app.config.from_mapping(**config)
 
     # config.get('SESSION_PERMANENT', True)
-    flask_app.session_interface = MongoDBSessionInterface(config.get('SESSION_USE_SIGNER', False), True)
+    flask_app.session_interface = MongoDBSessionInterface(config.get('SESSION_USE_SIGNER', False), True,
+                                                          config['session_parameters']['refresh_threshold'],
+                                                          config['session_parameters']['cache_ttl'])
 
     # available indentation types
     available_indentation_types = {
@@ -163,6 +175,13 @@ def get_app(config):
         fs_provider = LocalFSProvider(task_directory)
 
     init_fs_provider(fs_provider)
+    tasks_cache_size = config.get("tasks_cache_size", 256) * 1024 * 1024
+    init_cache(tasks_cache_size, config.get("tasks_cache_directory", None), config.get("tasks_sidecars_directory", None),
+               config.get("tasks_cache_directory_size", 256) * 1024 * 1024)
+    init_render_cache(config.get("rst_cache_size", 64) * 1024 * 1024, config.get("rst_cache_directory", None),
+                      config.get("rst_cache_directory_size", 256) * 1024 * 1024)
+    init_course_registry(CourseRegistry(fs_provider, config.get("tasks_watch", True),
+                                        config.get("tasks_poll_interval", 5), tasks_cache_size))
 
     register_task_dispenser(TableOfContents)
     register_task_dispenser(CombinatoryTest)
@@ -176,7 +195,20 @@ def get_app(config):
     lti_score_publishers = {"1.1": LTIOutcomeManager(user_manager),
                             "1.3": LTIGradeManager(user_manager)}
 
-    submission_manager = WebAppSubmissionManager(client, user_manager, lti_score_publishers)
+    # Push of the submission status to the browsers: "local" only notifies the browsers connected to this process,
+    # "mongodb" fans out the notifications to all the processes sharing the database
+    submission_push = config.get("submission_push", False)
+    if submission_push == "mongodb":
+        submission_events = MongoSubmissionEventBroker(get_db())
+    elif submission_push == "local":
+        submission_events = SubmissionEventBroker()
+    else:
+        submission_events = None
+
+    submission_manager = WebAppSubmissionManager(client, user_manager, lti_score_publishers,
+                                                 config.get("mcq_in_process", True), submission_events)
+
+    audience_importer = AudienceImporter()
 
     is_tos_defined = config.get("privacy_page", "") and config.get("terms_page", "")
 
@@ -197,6 +229,7 @@ def get_app(config):
     flask_app.jinja_env.globals["allow_registration"] = config.get("allow_registration", True)
     flask_app.jinja_env.globals["allow_deletion"] = config.get("allow_deletion", True)
     flask_app.jinja_env.globals["sentry_io_url"] = config.get("sentry_io_url")
+    flask_app.jinja_env.globals["submission_push"] = submission_events is not None
     flask_app.jinja_env.globals["user_manager"] = user_manager
     flask_app.jinja_env.globals["default_allowed_file_extensions"] = default_allowed_file_extensions
     flask_app.jinja_env.globals["default_max_file_size"] = default_max_file_size
@@ -230,6 +263,7 @@ def get_app(config):
     flask_app.get_path = get_path
     flask_app.submission_manager = submission_manager
     flask_app.user_manager = user_manager
+    flask_app.audience_importer = audience_importer
     flask_app.client = client
     flask_app.default_allowed_file_extensions = default_allowed_file_extensions
     flask_app.default_max_file_size = default_max_file_size
@@ -257,4 +291,4 @@ def get_app(config):
     # Start the inginious.backend
     client.start()
 
-    return flask_app.wsgi_app, lambda: _close_app(client)
+    return flask_app.wsgi_app, lambda: _close_app(client, submission_events, audience_importer)
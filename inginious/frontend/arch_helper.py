@@ -69,6 +69,7 @@ def create_arch(configuration, context):
 
         local_config = configuration.get("local-config", {})
         concurrency = local_config.get("concurrency", multiprocessing.cpu_count())
+        mcq_concurrency = local_config.get("mcq_concurrency", 1)
         debug_host = local_config.get("debug_host", None)
         debug_ports = local_config.get("debug_ports", None)
         tmp_dir = local_config.get("tmp_dir", "./agent_tmp")
@@ -93,7 +94,7 @@ def create_arch(configuration, context):
         client = Client(context, "inproc://backend_client")
         backend = Backend(context, "inproc://backend_agent", "inproc://backend_client")
         agent_docker = DockerAgent(context, "inproc://backend_agent", "Docker - Local agent", concurrency, debug_host, debug_ports, tmp_dir, ssh_allowed=True)
-        agent_mcq = MCQAgent(context, "inproc://backend_agent", "MCQ - Local agent", 1)
+        agent_mcq = MCQAgent(context, "inproc://backend_agent", "MCQ - Local agent", mcq_concurrency)
 
         asyncio.ensure_future(_restart_on_cancel(logger, agent_docker))
         asyncio.ensure_future(_restart_on_cancel(logger, agent_mcq))
@@ -0,0 +1,146 @@
+# -*- coding: utf-8 -*-
+#
+# This file is part of INGInious. See the LICENSE and the COPYRIGHTS files for
+# more information about the licensing of this file.
+
+""" Import of the audiences of a course from a CSV file """
+
+import logging
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timedelta, timezone
+
+from pymongo import InsertOne, UpdateOne, DeleteMany
+from mongoengine import NotUniqueError, Q
+
+from inginious.frontend.models import Audience, AudienceImport, CourseClass, User
+
+
+def import_audiences(courseid, csv_data):
+    """
+    Replaces the audiences of a course by the ones of a CSV file, and registers their students to the course. Each
+    line of the file is "user identifier, username or email, student or tutor, audience description". Audiences that
+    are already in the course keep their id, and the ones that are not in the file are deleted.
+
+    The identifiers are resolved with a query per field, and the audiences are updated with a single bulk write.
+
+    :param csv_data: the lines of the file, as lists of strings
+    :return: the list of the errors, as [line number, error, value] where error is "format", "field", "role" or "user".
+             Lines with errors are ignored, and nothing is imported if a line is wrongly formatted.
+    """
+    errors = [[number, "format", ""] for number, line in enumerate(csv_data, 1) if len(line) != 4]
+    if errors:
+        return errors
+
+    entries = []
+    for number, line in enumerate(csv_data, 1):
+        user_id, field, role, description = (value.strip() for value in line)
+        if field not in ["username", "email"]:
+            errors.append([number, "field", field])
+        elif role not in ["student", "tutor"]:
+            errors.append([number, "role", role])
+        else:
+            entries.append((number, user_id, field, role, description))
+
+    usernames = {}
+    for field in ["username", "email"]:
+        user_ids = list({user_id for __, user_id, entry_field, __, __ in entries if entry_field == field})
+        if user_ids:
+            for username, user_id in User.objects(**{field + "__in": user_ids}).scalar("username", field):
+                usernames.setdefault((field, user_id), username)
+
+    # {description: {"students": [usernames], "tutors": [usernames]}}, in the order of the file
+    members = OrderedDict()
+    course_students = OrderedDict()
+    for number, user_id, field, role, description in entries:
+        username = usernames.get((field, user_id))
+        if username is None:
+            errors.append([number, "user", user_id])
+            continue
+        audience = members.setdefault(description, {"students": OrderedDict(), "tutors": OrderedDict()})
+        audience["students" if role == "student" else "tutors"][username] = True
+        if role == "student":
+            course_students[username] = True
+
+    operations = []
+    existing = {}
+    removed = []
+    for audience in Audience.objects(courseid=courseid).as_pymongo():
+        if audience["description"] in members and audience["description"] not in existing:
+            existing[audience["description"]] = audience
+        else:
+            removed.append(audience["_id"])
+    for description, audience in members.items():
+        students, tutors = list(audience["students"]), list(audience["tutors"])
+        if description not in existing:
+            operations.append(InsertOne({"description": description, "courseid": courseid, "students": students,
+                                         "tutors": tutors}))
+        elif existing[description].get("students") != students or existing[description].get("tutors") != tutors:
+            operations.append(UpdateOne({"_id": existing[description]["_id"]},
+                                        {"$set": {"students": students, "tutors": tutors}}))
+    if removed:
+        operations.append(DeleteMany({"_id": {"$in": removed}}))
+    if operations:
+        Audience._get_collection().bulk_write(operations, ordered=False)
+
+    if course_students:
+        CourseClass._get_collection().update_one({"_id": courseid},
+                                                 {"$addToSet": {"students": {"$each": list(course_students)}}})
+    return sorted(errors)
+
+
+class AudienceImporter:
+    """
+    Imports audiences files. Files of more than background_lines lines are imported in a background thread: their
+    status and errors are stored in the audience_imports collection until they are read by pop_result.
+    """
+
+    # Running imports older than this are considered interrupted, for example by a restart of the webapp
+    _TIMEOUT = timedelta(hours=1)
+
+    def __init__(self, background_lines=2000):
+        self._logger = logging.getLogger("inginious.webapp.audiences")
+        self._executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="audience-importer")
+        self._background_lines = background_lines
+
+    def import_file(self, courseid, csv_data):
+        """
+        Imports the audiences of a course from the lines of a CSV file, see import_audiences
+        :return: the list of the errors, or None if the file is imported in the background
+        :raise ValueError: if the audiences of the course are already being imported
+        """
+        if len(csv_data) <= self._background_lines:
+            return import_audiences(courseid, csv_data)
+
+        now = datetime.now(tz=timezone.utc)
+        try:
+            AudienceImport.objects(Q(courseid=courseid) & (Q(status__ne="running") | Q(started_on__lt=now - self._TIMEOUT)))\
+                .update_one(set__status="running", set__errors=[], set__started_on=now, upsert=True)
+        except NotUniqueError:
+            raise ValueError("The audiences of course {} are already being imported".format(courseid))
+        self._executor.submit(self._import, courseid, csv_data)
+        return None
+
+    def _import(self, courseid, csv_data):
+        try:
+            errors = import_audiences(courseid, csv_data)
+            AudienceImport.objects(courseid=courseid).update_one(set__status="done", set__errors=errors)
+        except Exception:
+            self._logger.exception("Cannot import the audiences of course %s", courseid)
+            AudienceImport.objects(courseid=courseid).update_one(set__status="failed")
+
+    def pop_result(self, courseid):
+        """
+        Returns the status and the errors of the background import of a course, as a tuple (status, errors) where
+        status is "running", "done" or "failed", or None if there is none. Finished imports are removed.
+        """
+        audience_import = AudienceImport.objects(courseid=courseid).first()
+        if audience_import is None:
+            return None
+        if audience_import.status != "running":
+            AudienceImport.objects(id=audience_import.id, status__ne="running").delete()
+        return audience_import.status, [list(error) for error in audience_import.errors]
+
+    def close(self):
+        """ Waits for the running import """
+        self._executor.shutdown(wait=True)
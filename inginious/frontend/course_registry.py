@@ -0,0 +1,200 @@
+# -*- coding: utf-8 -*-
+#
+# This file is part of INGInious. See the LICENSE and the COPYRIGHTS files for
+# more information about the licensing of this file.
+
+"""
+Registry of the loaded courses and tasks.
+
+Course.get and Task.get check the modification time of the descriptor and list the translations at each call. The
+registry keeps the loaded objects with the paths they were read from, and drops them when one of these paths changes.
+Changes are notified by inotify (through watchdog) when the tasks are on a local filesystem. Otherwise, or if the
+filesystem cannot be watched, the modification times of the paths of an entry are checked again every
+``poll_interval`` seconds. The registry is then the only in-memory cache of the loaded courses and tasks, see
+fetch_unless_registered.
+
+The changes made by the webapp (course and task saves and deletions) also invalidate the registry explicitly, as the
+watcher notifies them asynchronously. The WebDAV server runs in its own process, without the registry of the webapp:
+its writes are only seen through the watcher or the polling.
+"""
+
+import logging
+import os
+import threading
+import time
+
+from inginious.common.cache import LRUCache
+from inginious.common.filesystems import FileSystemProvider, fetch_or_cache
+from inginious.common.filesystems.local import LocalFSProvider
+
+try:
+    from watchdog.events import FileSystemEventHandler
+    from watchdog.observers import Observer
+except ImportError:
+    Observer = None
+    FileSystemEventHandler = object
+
+# Events that do not change the content of the filesystem are ignored (watchdog also reports files being opened)
+_watched_events = {"created", "deleted", "moved", "modified", "closed"}
+
+
+def _affects(changed, dependency):
+    """ Returns True if a change of the path changed affects dependency. Paths ending with a / are folders, and depend
+        on all their content. """
+    changed = changed.rstrip("/")
+    if dependency.rstrip("/") == changed or dependency.startswith(changed + "/"):
+        return True
+    return dependency.endswith("/") and changed.startswith(dependency)
+
+
+class _ChangeHandler(FileSystemEventHandler):
+    """ Forwards the changes under the watched folder to the registry """
+
+    def __init__(self, registry, root, prefix):
+        super(_ChangeHandler, self).__init__()
+        self._registry = registry
+        self._root = root
+        self._prefix = prefix
+
+    def _invalidate(self, path):
+        path = os.fsdecode(path)
+        relpath = os.path.relpath(os.path.abspath(path), self._root)
+        self._registry.invalidate(self._prefix if relpath == "." else self._prefix + relpath)
+
+    def on_any_event(self, event):
+        if event.event_type not in _watched_events or (event.is_directory and event.event_type == "modified"):
+            return
+        self._invalidate(event.src_path)
+        if getattr(event, "dest_path", ""):
+            self._invalidate(event.dest_path)
+
+
+class CourseRegistry:
+    """ Keeps the objects loaded from the tasks filesystem until the files they depend on change """
+
+    def __init__(self, fs_provider: FileSystemProvider, watch=True, poll_interval=5, max_size=256 * 1024 * 1024):
+        """
+        :param fs_provider: the FileSystemProvider containing the courses
+        :param watch: watch the changes of the filesystem, if it is local
+        :param poll_interval: number of seconds during which an entry is kept when the filesystem is not watched
+        :param max_size: maximum size of the objects kept, in bytes. The least recently used ones are dropped first.
+        """
+        self._logger = logging.getLogger("inginious.course")
+        self._fs_provider = fs_provider
+        self._entries = LRUCache(max_size)
+        self._generation = 0
+        self._lock = threading.Lock()
+        self._poll_interval = poll_interval
+        self._observer = None
+
+        if watch and Observer is not None and isinstance(fs_provider, LocalFSProvider):
+            try:
+                root = os.path.abspath(fs_provider.prefix)
+                observer = Observer()
+                observer.schedule(_ChangeHandler(self, root, fs_provider.prefix), root, recursive=True)
+                observer.daemon = True
+                observer.start()
+                self._observer = observer
+            except Exception:
+                self._logger.warning("Cannot watch the tasks directory, checking it every %d seconds", poll_interval,
+                                     exc_info=True)
+
+    @property
+    def watching(self):
+        """ True if the changes of the filesystem are notified """
+        return self._observer is not None
+
+    @property
+    def generation(self):
+        """ A number changing at each invalidation. Read it before loading an object, and give it to put. """
+        return self._generation
+
+    def get(self, key):
+        """ Returns the object stored under key, or None if it is absent or one of its paths changed """
+        entry = self._entries.get(key)
+        if entry is None:
+            return None
+        value, dependencies, stamps, checked_at = entry
+        if self._observer is None and time.monotonic() - checked_at > self._poll_interval:
+            if [self._stamp(dependency) for dependency in dependencies] != stamps:
+                return None
+            entry[3] = time.monotonic()
+        return value
+
+    def put(self, key, value, dependencies, generation):
+        """
+        Stores value under key, unless the registry was invalidated since generation was read: value may then have
+        been loaded from files that were changing.
+        :param dependencies: the paths (prefixed by the one of the FileSystemProvider) value was loaded from. Paths of
+                             folders must end with a /.
+        """
+        dependencies = list(dependencies)
+        stamps = [self._stamp(dependency) for dependency in dependencies] if self._observer is None else None
+        with self._lock:
+            if generation == self._generation:
+                self._entries.put(key, [value, dependencies, stamps, time.monotonic()])
+
+    def invalidate(self, path=None):
+        """ Drops the entries depending on path, that was changed. If path is None, drops everything. """
+        with self._lock:
+            self._generation += 1
+            if path is None:
+                self._entries.clear()
+                return
+            for key, (__, dependencies, __, __) in self._entries.items():
+                if any(_affects(path, dependency) for dependency in dependencies):
+                    self._entries.pop(key)
+
+    def _stamp(self, dependency):
+        """ Returns the modification time of the file dependency, or the names and modification times of the content of
+            the folder dependency. None if it does not exist. """
+        path = dependency[len(self._fs_provider.prefix):]
+        try:
+            if not dependency.endswith("/"):
+                return self._fs_provider.get_last_modification_time(path)
+            folder_fs = self._fs_provider.from_subfolder(path) if path else self._fs_provider
+            if not folder_fs.exists():
+                return None
+            return sorted((name, folder_fs.get_last_modification_time(name)) for name in folder_fs.list())
+        except FileNotFoundError:
+            return None
+
+    def stats(self):
+        """ Returns the statistics of the registry, see LRUCache.stats """
+        return self._entries.stats()
+
+    def stop(self):
+        """ Stops watching the filesystem """
+        if self._observer is not None:
+            self._observer.stop()
+            self._observer = None
+
+
+_registry = None
+
+
+def get_course_registry():
+    """ Returns the global CourseRegistry, or None if there is none """
+    return _registry
+
+
+def init_course_registry(registry):
+    """ Sets the global CourseRegistry. If None, the courses and tasks are loaded at each call. """
+    global _registry
+    if _registry is not None:
+        _registry.stop()
+    _registry = registry
+
+
+def invalidate_course_registry(fs_provider: FileSystemProvider, path=None):
+    """ Drops the entries of the global CourseRegistry depending on path in fs_provider, or on its prefix """
+    if _registry is not None:
+        _registry.invalidate(fs_provider.prefix + path if path else fs_provider.prefix)
+
+
+def fetch_unless_registered(fs_provider: FileSystemProvider, path: str, get_resource):
+    """ Loads a resource of an object kept by the global CourseRegistry. The registry is the only in-memory cache of
+        these objects: the resource is only cached by fetch_or_cache if there is no registry. """
+    if _registry is not None:
+        return get_resource()
+    return fetch_or_cache(fs_provider, path, get_resource)
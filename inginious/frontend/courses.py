@@ -16,9 +16,12 @@ from typing import Iterable, List, Any
 from pylti1p3.tool_config import ToolConfDict
 from datetime import datetime
 
-from inginious.common.filesystems import FileSystemProvider, fetch_or_cache, invalidate_cache, get_fs_provider
+from inginious.common.filesystems import FileSystemProvider, fetch_descriptor, descriptor_saved, \
+    invalidate_cache, get_fs_provider
+from inginious.frontend.course_registry import get_course_registry, invalidate_course_registry, \
+    fetch_unless_registered
 from inginious.common.tags import Tag
-from inginious.common.base import id_checker, get_json_or_yaml, loads_json_or_yaml
+from inginious.common.base import id_checker, get_json_or_yaml
 from inginious.frontend.accessible_time import AccessibleTime
 from inginious.frontend.parsable_text import ParsableText
 from inginious.frontend.user_manager import UserInfo
@@ -33,7 +36,7 @@ def _load_course(course_fs : FileSystemProvider, courseid : str):
     # Try to open the course file
     try:
         logging.getLogger("inginious.course").info("Caching course %s", courseid)
-        task_content = loads_json_or_yaml("course.yaml", course_fs.get("course.yaml"))
+        task_content = fetch_descriptor(course_fs, "course.yaml")
     except Exception as e:
         raise CourseUnreadableException(str(e))
 
@@ -172,12 +175,23 @@ class Course(object):
 
     def get_readable_tasks(self):
         """ Returns the list of all available tasks in a course """
-        return [
+        registry = get_course_registry()
+        if registry is not None:
+            tasks = registry.get(("tasks", self._id))
+            if tasks is not None:
+                return list(tasks)
+            generation = registry.generation
+
+        tasks = [
             task[0:len(task)-1]  # remove trailing /
             for task in self._fs.list(folders=True, files=False, recursive=False)
             if self._fs.from_subfolder(task).exists("task.yaml")
         ] if self._fs.exists() else []
 
+        if registry is not None:
+            registry.put(("tasks", self._id), list(tasks), [self._fs.prefix], generation)
+        return tasks
+
     def get_tasks(self) -> dict[str, Task]:
         """ Returns """
         tasks = self.get_readable_tasks()
@@ -307,6 +321,8 @@ class Course(object):
     def save(self):
         """ Saves the Course into the filesystem """
         self._fs.put("course.yaml", get_json_or_yaml("course.yaml", self._content))
+        descriptor_saved(self._fs, "course.yaml")
+        invalidate_course_registry(self._fs, "course.yaml")
         if self._new_doc:
             logging.getLogger("inginious.course").info("Course %s created in the factory.", self._fs.prefix)
 
@@ -316,11 +332,18 @@ class Course(object):
         if not id_checker(courseid):
             raise InvalidNameException("Course with invalid name: " + courseid)
 
+        registry = get_course_registry()
+        if registry is not None:
+            course = registry.get(("course", courseid))
+            if course is not None:
+                return course
+            generation = registry.generation
+
         course_fs = get_fs_provider().from_subfolder(courseid)
         if not course_fs.exists("course.yaml"):
             raise CourseNotFoundException()
 
-        course = fetch_or_cache(course_fs, "course.yaml", lambda: _load_course(course_fs, courseid))
+        course = fetch_unless_registered(course_fs, "course.yaml", lambda: _load_course(course_fs, courseid))
 
         translations = {}
         i18n_fs = course_fs.from_subfolder("$i18n")
@@ -328,22 +351,34 @@ class Course(object):
             for f in i18n_fs.list(folders=False, files=True, recursive=False):
                 lang, ext = os.path.splitext(f)
                 if ext == ".mo":
-                    translations[lang] = fetch_or_cache(i18n_fs, f, lambda: gettext.GNUTranslations(i18n_fs.get_fd(f)))
+                    translations[lang] = fetch_unless_registered(
+                        i18n_fs, f, lambda: gettext.GNUTranslations(i18n_fs.get_fd(f)))
 
         course.set_translations(translations)
+        if registry is not None:
+            registry.put(("course", courseid), course, [course_fs.prefix + "course.yaml", i18n_fs.prefix], generation)
         return course
 
     def delete(self):
         """ Erase the content of the course folder """
         invalidate_cache(self._fs)
         self._fs.delete()
+        invalidate_course_registry(self._fs)
         logging.getLogger("inginious.course").info("Course %s erased from the factory.", self._fs.prefix)
 
     @classmethod
     def get_all(cls) -> dict[str, Course]:
         """ Returns a dictionnary with courseid=>Course mapping """
+        registry = get_course_registry()
+        courseids = registry.get("courses") if registry is not None else None
+        if courseids is None:
+            generation = registry.generation if registry is not None else None
+            courseids = [f[0:len(f) - 1] for f in get_fs_provider().list(folders=True, files=False, recursive=False)]
+            if registry is not None:
+                registry.put("courses", courseids, [get_fs_provider().prefix], generation)
+
         output = {}
-        for courseid in [f[0:len(f) - 1] for f in get_fs_provider().list(folders=True, files=False, recursive=False)]:
+        for courseid in courseids:
             try:
                 output[courseid] = Course.get(courseid)
             except Exception as e:
@@ -22,7 +22,7 @@ from inginious.frontend.pages.register import RegistrationPage
 from inginious.frontend.pages.social import AuthenticationPage, CallbackPage
 from inginious.frontend.pages.course_register import CourseRegisterPage
 from inginious.frontend.pages.course import CoursePage
-from inginious.frontend.pages.tasks import TaskPage, TaskPageStaticDownload
+from inginious.frontend.pages.tasks import TaskPage, TaskPageStaticDownload, SubmissionEventsPage
 from inginious.frontend.pages.lti.v1_1 import LTI11LaunchPage, LTI11BindPage, LTI11LoginPage
 from inginious.frontend.pages.lti.v1_3 import LTI13LaunchPage, LTI13BindPage, LTI13LoginPage, LTI13OIDCLoginPage, LTI13JWKSPage
 from inginious.frontend.pages.lti import LTITaskPage, LTIAssetPage
@@ -72,6 +72,7 @@ def init_flask_mapping(flask_app):
     flask_app.add_url_rule('/course/<courseid>/<taskid>', view_func=TaskPage.as_view('taskpage'))
     flask_app.add_url_rule('/course/<courseid>/<taskid>/<path:path>',
                            view_func=TaskPageStaticDownload.as_view('taskpagestaticdownload'))
+    flask_app.add_url_rule('/submission_events', view_func=SubmissionEventsPage.as_view('submissioneventspage'))
     flask_app.add_url_rule('/group/<courseid>', view_func=GroupPage.as_view('grouppage'))
     flask_app.add_url_rule('/auth/signin/<auth_id>',
                            view_func=AuthenticationPage.as_view('authenticationpage'))
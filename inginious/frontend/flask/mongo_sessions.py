@@ -6,7 +6,10 @@
 # This code is based on Flask-Session, copyright (c) 2014 by Shipeng Feng.
 # https://flasksession.readthedocs.io/
 
-from datetime import datetime, timezone
+import copy
+import threading
+import time
+from datetime import datetime, timezone, timedelta
 
 from itsdangerous import Signer, BadSignature
 from flask.sessions import SessionInterface
@@ -19,19 +22,62 @@ from inginious.frontend.models import Session
 
 class MongoDBSessionInterface(SessionInterface):
     """A Session interface that uses mongodb as backend.
+
+    Sessions are only written when they were modified, or when their expiration date moved by more than
+    ``refresh_threshold``. Expired sessions are purged by the TTL index of the sessions collection.
+
     :param use_signer: Whether to sign the session id cookie or not.
     :param permanent: Whether to use permanent session or not.
+    :param refresh_threshold: Number of seconds by which the expiration of an unmodified session must move before it
+                              is written again.
+    :param cache_ttl: Number of seconds during which a session read from the database is kept in memory, keyed by the
+                      (signed) session id. 0 disables the cache. Sessions modified by another process are only seen
+                      when the cached copy expires.
     """
 
-    def __init__(self, use_signer=False, permanent=True):
+    def __init__(self, use_signer=False, permanent=True, refresh_threshold=600, cache_ttl=0):
         self.use_signer = use_signer
         self.permanent = permanent
+        self.refresh_threshold = timedelta(seconds=refresh_threshold)
+        self.cache_ttl = cache_ttl
+        self._cache = {}
+        self._cache_lock = threading.Lock()
 
     def _get_signer(self, app):
         if not app.secret_key:
             return None
         return Signer(app.secret_key, salt='flask-session', key_derivation='hmac')
 
+    def _new_session(self, **kwargs):
+        return self._track(Session(permanent=self.permanent, **kwargs))
+
+    def _track(self, session, cache_key=None):
+        """ Records the content of the session when it is opened, to detect its modifications when it is saved """
+        session._initial_content = self._content(session)
+        session._cache_key = cache_key
+        return session
+
+    def _content(self, session):
+        """ Returns the content of the session, without its expiration """
+        content = session.to_mongo().to_dict()
+        content.pop("expiration", None)
+        return copy.deepcopy(content)
+
+    def _cache_get(self, key):
+        with self._cache_lock:
+            entry = self._cache.get(key)
+            if entry is not None and entry[1] < time.monotonic():
+                del self._cache[key]
+                entry = None
+        return copy.deepcopy(entry[0]) if entry is not None else None
+
+    def _cache_put(self, key, document):
+        with self._cache_lock:
+            now = time.monotonic()
+            for expired in [k for k, entry in self._cache.items() if entry[1] < now]:
+                del self._cache[expired]
+            self._cache[key] = (copy.deepcopy(document), now + self.cache_ttl)
+
     def open_session(self, app, request):
         # Check for LTI session in the path
         lti_session = request.args.get('session_id')
@@ -41,15 +87,16 @@ class MongoDBSessionInterface(SessionInterface):
             # request.url_rule is not set yet here.
             endpoint, _ = app.create_url_adapter(request).match()
             if endpoint in [LTI11LaunchPage.endpoint, LTI13LaunchPage.endpoint]:
-                return Session(permanent=self.permanent, is_lti=True)
+                return self._new_session(is_lti=True)
         except HTTPException:
             pass # Could not determine endpoint, continue
 
         sid = lti_session or request.cookies.get(self.get_cookie_name(app))
 
         if not sid:
-            return Session(permanent=self.permanent)
+            return self._new_session()
 
+        cache_key = sid
         if self.use_signer and not lti_session:
             signer = self._get_signer(app)
             if signer is None:
@@ -58,19 +105,34 @@ class MongoDBSessionInterface(SessionInterface):
                 sid_as_bytes = signer.unsign(sid)
                 sid = sid_as_bytes.decode()
             except BadSignature:
-                return Session(permanent=self.permanent)
+                return self._new_session()
+
+        son = self._cache_get(cache_key) if self.cache_ttl > 0 else None
+        if son is None:
+            document = Session.objects(id=sid).first()
+            son = document.to_mongo().to_dict() if document else None
+            if son is not None and self.cache_ttl > 0:
+                self._cache_put(cache_key, son)
 
-        document = Session.objects(id=sid).first()
-        if document and document.expiration <= datetime.now(timezone.utc):
-            # Delete expired session
-            document.delete()
-            document = None
-        return document or Session(permanent=self.permanent)
+        # Expired sessions are deleted by the TTL index of the collection
+        if son is None or (son.get("expiration") and son["expiration"] <= datetime.now(timezone.utc)):
+            return self._new_session()
+        return self._track(Session._from_son(son), cache_key)
 
     def save_session(self, app, session, response):
         expires = self.get_expiration_time(app, session)
+        modified = self._content(session) != getattr(session, "_initial_content", None)
+        needs_refresh = expires is not None and (session.expiration is None or
+                                                 expires - session.expiration >= self.refresh_threshold)
+
+        # New sessions that were not modified do not need to be stored
+        if not modified and (session._created or not needs_refresh):
+            return
+
         session.expiration = expires
         session.save()
+        if self.cache_ttl > 0 and getattr(session, "_cache_key", None):
+            self._cache_put(session._cache_key, session.to_mongo().to_dict())
 
         if not session.is_lti:
             session_id = self._get_signer(app).sign(str(session.id)).decode() if self.use_signer else session.id
@@ -79,4 +141,4 @@ class MongoDBSessionInterface(SessionInterface):
             httponly = self.get_cookie_httponly(app)
             secure = self.get_cookie_secure(app)
             response.set_cookie(self.get_cookie_name(app), session_id, expires=expires, httponly=httponly,
-                                domain=domain, path=path, secure=secure)
\ No newline at end of file
+                                domain=domain, path=path, secure=secure)
@@ -7,6 +7,7 @@ from mongoengine import Document, IntField
 
 from inginious import DB_VERSION
 from inginious.frontend.models.audience import Audience
+from inginious.frontend.models.audience_import import AudienceImport
 from inginious.frontend.models.course_class import CourseClass
 from inginious.frontend.models.group import Group
 from inginious.frontend.models.lti1_1 import LISOutcome, Nonce
@@ -15,6 +16,7 @@ from inginious.frontend.models.session import Session
 from inginious.frontend.models.submission import Submission
 from inginious.frontend.models.user import User
 from inginious.frontend.models.user_task import UserTask
+from inginious.frontend.models.user_course_progress import UserCourseProgress
 
 
 class DBVersion(Document):
@@ -0,0 +1,24 @@
+# -*- coding: utf-8 -*-
+#
+# This file is part of INGInious. See the LICENSE and the COPYRIGHTS files for
+# more information about the licensing of this file.
+
+from mongoengine import Document, StringField, ListField, DateTimeField
+
+
+class AudienceImport(Document):
+    """ Audiences file of a course imported in the background. See inginious.frontend.audience_import """
+    courseid = StringField(required=True)
+    status = StringField(choices=["running", "done", "failed"], required=True)
+    errors = ListField(ListField()) # [line number, error, value], as returned by import_audiences
+    started_on = DateTimeField()
+
+    meta = {
+        "collection": "audience_imports",
+        "indexes": [
+            {
+                "fields": ["courseid"],
+                "unique": True
+            }
+        ]
+    }
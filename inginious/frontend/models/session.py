@@ -50,4 +50,4 @@ class Session(Document):
     username = StringField()
     timezone = StringField(default=lambda: tzlocal.get_localzone_name())
 
-    meta = {"collection": "sessions", "indexes": ["expiration"]}
+    meta = {"collection": "sessions", "indexes": [{"fields": ["expiration"], "expireAfterSeconds": 0}]}
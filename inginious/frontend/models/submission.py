@@ -5,7 +5,10 @@
 
 import bson
 
-from mongoengine import Document, StringField, ListField, MapField, FileField, DateTimeField, FloatField, IntField
+from mongoengine import Document, StringField, ListField, MapField, FileField, DateTimeField, FloatField, IntField, \
+    BooleanField, ObjectIdField, DictField
+
+from inginious.frontend.submission_files import split_input, join_input
 
 
 class Submission(Document):
@@ -13,6 +16,7 @@ class Submission(Document):
     taskid = StringField(required=True)
     username = ListField(StringField(), required=True)
     input = FileField(required=True)
+    input_blobs = ListField(ObjectIdField()) # Content-addressed files holding the uploaded files of the input
     archive = FileField()
     status = StringField(choices=["done", "error", "waiting"], required=True)
     submitted_on = DateTimeField(required=True)
@@ -25,6 +29,7 @@ class Submission(Document):
     stdout  = StringField()
     tests = MapField(StringField())
     text = StringField(default="")
+    feedback_html = DictField() # Rendering of text and problems, see inginious.frontend.submission_feedback
     user_ip = StringField()
     state = StringField()
     jobid = StringField() # Following fields are used during job processing
@@ -33,6 +38,9 @@ class Submission(Document):
     ssh_user = StringField()
     ssh_password = StringField()
     last_replay = DateTimeField()
+    stats_pending = BooleanField() # Set until the user stats are updated with the result of the job
+    stats_newsub = BooleanField() # Whether the pending result is the one of a new submission or of a replay
+    stats_claimed_on = DateTimeField() # Date at which the pending user stats were claimed for recovery
     lti_version = StringField() # This should be refactored in the future to avoid storing data from modules
     message_launch_id = StringField() # LTI1.3 field
     outcome_service_url = StringField() # LTI1.1 field
@@ -42,18 +50,29 @@ class Submission(Document):
     def get_input(self):
         value = bson.BSON.decode(self.input.read())
         self.input.seek(0)
-        return value
+        return join_input(self._get_db(), value)
 
     def set_input(self, value):
+        value, self.input_blobs = split_input(self._get_db(), value)
         self.input.put(bson.BSON.encode(value))
 
+    def get_file_ids(self):
+        """ Returns the ids of the GridFS files referenced by the submission """
+        return [self.input.grid_id, self.archive.grid_id] + list(self.input_blobs)
+
     meta = {
         "collection": "submissions",
         "indexes": [
             "username",
             "courseid",
             ("courseid", "taskid"),
+            ("username", "courseid", "taskid", "-id"),
             "-submitted_on",
-            "status"
+            "status",
+            {"fields": ["stats_pending"], "sparse": True},
+            # Keyset pagination of the submissions of a course, see pages.course_admin.submissions
+            ("courseid", "submitted_on", "id"),
+            ("courseid", "grade", "id"),
+            ("courseid", "taskid", "id")
         ]
     }
\ No newline at end of file
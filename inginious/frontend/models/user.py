@@ -7,6 +7,9 @@ import tzlocal
 
 from mongoengine import Document,  StringField, ListField, MapField, BooleanField, DynamicField
 
+# Case-insensitive collation of the indexes used to search the users by the prefix of their real name or email
+SEARCH_COLLATION = {"locale": "en", "strength": 2}
+
 
 class User(Document):
     username = StringField(required=True)
@@ -23,4 +26,11 @@ class User(Document):
     activate = StringField()
     reset = StringField()
 
-    meta = {"collection": "users", "indexes": ["username"]}
\ No newline at end of file
+    meta = {
+        "collection": "users",
+        "indexes": [
+            "username",
+            {"fields": ["realname"], "collation": SEARCH_COLLATION},
+            {"fields": ["email"], "collation": SEARCH_COLLATION}
+        ]
+    }
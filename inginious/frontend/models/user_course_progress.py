@@ -0,0 +1,31 @@
+# -*- coding: utf-8 -*-
+#
+# This file is part of INGInious. See the LICENSE and the COPYRIGHTS files for
+# more information about the licensing of this file.
+
+from mongoengine import Document, StringField, IntField, DictField, DateTimeField, DynamicField
+
+
+class UserCourseProgress(Document):
+    """ Progress of a user in a course, materialized from its user tasks. See UserManager.get_course_caches """
+    courseid = StringField(required=True)
+    username = StringField(required=True)
+    tasks = DictField() # {taskid: {"tried": 0, "succeeded": False, "grade": 0.0}}, copied from the user tasks
+    task_tried = IntField(default=0)
+    total_tries = IntField(default=0)
+    task_succeeded = IntField(default=0)
+    task_grades = DictField()
+    grade = DynamicField(default=0) # As returned by the task dispenser
+    course_version = StringField() # Task list and dispenser configuration used for the fields above. Unset if stale.
+    valid_until = DateTimeField() # Date at which a task becomes accessible, changing the fields above
+
+    meta = {
+        "collection": "user_course_progress",
+        "indexes": [
+            {
+                "fields": ["courseid", "username"],
+                "unique": True
+            },
+            "username"
+        ]
+    }
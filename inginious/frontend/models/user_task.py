@@ -9,6 +9,25 @@ from mongoengine import Document, EmbeddedDocument, StringField, FloatField, Obj
 from mongoengine import IntField, ListField, DateTimeField, BooleanField, EmbeddedDocumentField
 
 
+# Number of submissions whose ids are kept in UserTask.counted_submissions
+MAX_COUNTED_SUBMISSIONS = 32
+
+
+def count_submission_update(submissionid):
+    """
+    Returns the raw update counting a new submission in the tries and the tokens of a user task. It must be applied
+    with counted_submissions_filter, so that a submission whose result is written again (for example when recovering
+    from a failure) is counted once.
+    """
+    return {"$inc": {"tried": 1, "tokens.amount": 1},
+            "$push": {"counted_submissions": {"$each": [submissionid], "$slice": -MAX_COUNTED_SUBMISSIONS}}}
+
+
+def counted_submissions_filter(submissionid):
+    """ Returns the filter matching the user tasks in which the submission is not counted yet """
+    return {"counted_submissions": {"$ne": submissionid}}
+
+
 class Tokens(EmbeddedDocument):
     amount = IntField(required=True, default=0)
     date = DateTimeField(default=datetime.fromtimestamp(0).astimezone())
@@ -24,6 +43,7 @@ class UserTask(Document):
     random = ListField(FloatField(), default=[])
     tokens = EmbeddedDocumentField(Tokens, default=lambda : Tokens())
     state = StringField(required=True, default="")
+    counted_submissions = ListField(ObjectIdField()) # Last submissions counted in tried, see count_submission_update
 
     def reset_state(self):
         self.state = ""
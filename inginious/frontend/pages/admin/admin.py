@@ -47,7 +47,7 @@ class AdministrationUserActionPage(INGIniousAdministratorPage):
             if not self.user_manager.activate_user(user.activate):
                 feedback = _("User not found")
         elif action == "delete":
-            if not self.user_manager.delete_user(username):
+            if not self.user_manager.delete_user(username, submission_manager=self.submission_manager):
                 feedback = _("Impossible to delete this user")
         elif action == "get_bindings":
             user_info = self.user_manager.get_user_info(username)
@@ -9,7 +9,7 @@ import random
 
 from flask import request, redirect, render_template
 
-from inginious.frontend.models import Submission, Audience, UserTask, Group,  CourseClass
+from inginious.frontend.models import Submission, Audience, UserTask, Group,  CourseClass, UserCourseProgress
 from inginious.frontend.courses import Course
 from inginious.frontend.pages.course_admin.utils import INGIniousAdminPage
 from inginious.frontend.user_manager import UserManager
@@ -21,15 +21,13 @@ class CourseDangerZonePage(INGIniousAdminPage):
     _logger = logging.getLogger("inginious.webapp.danger_zone")
 
     def wipe_course(self, courseid):
-        for submission in Submission.objects(courseid=courseid):
-            submission.input.delete()
-            submission.archive.delete()
-
         CourseClass.objects(id=courseid).update(students=[])
         Audience.objects(courseid=courseid).delete()
         Group.objects(courseid=courseid).delete()
         UserTask.objects(courseid=courseid).delete()
-        Submission.objects(courseid=courseid).delete()
+        UserCourseProgress.objects(courseid=courseid).delete()
+        self.submission_manager.delete_submissions(courseid=courseid)
+        self.user_manager.clear_request_cache(courseid)
 
         self._logger.info("Course %s wiped.", courseid)
 
@@ -62,6 +60,9 @@ class CourseDangerZonePage(INGIniousAdminPage):
         # Update course id in DB
         Submission.objects(courseid=courseid).update(set__courseid=archive_course_id)
         UserTask.objects(courseid=courseid).update(set__courseid=archive_course_id)
+        UserCourseProgress.objects(courseid=courseid).update(set__courseid=archive_course_id)
+        self.submission_manager.get_submission_rollups().rename_course(courseid, archive_course_id)
+        self.submission_manager.get_cold_storage().rename_course(courseid, archive_course_id)
         Group.objects(courseid=courseid).update(set__courseid=archive_course_id)
         Audience.objects(courseid=courseid).update(set__courseid=archive_course_id)
         old_course_class = CourseClass.objects(id=courseid).modify(remove=True)
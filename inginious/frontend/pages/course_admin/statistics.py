@@ -4,26 +4,41 @@
 # more information about the licensing of this file.
 
 """ Utilities for computation of statistics  """
+from array import array
 from collections import OrderedDict
 import zoneinfo
 
 from flask import request, render_template
+from mongoengine.queryset import transform
 
 from inginious.frontend.models import Submission, UserTask
 from inginious.frontend.pages.course_admin.utils import make_csv, INGIniousSubmissionsAdminPage
-from datetime import datetime, date, timedelta
+from datetime import datetime, date, timedelta, timezone
 
 
 class CourseStatisticsPage(INGIniousSubmissionsAdminPage):
+    def _rollup_stats(self, filter, by):
+        """
+        Counts all the submissions matching filter from the submission rollups, grouped by "taskid", "username" or
+        "hour". Returns None if the rollups cannot answer the filter: the statistics are then aggregated on the first
+        submissions only, as the limit of the page caps the submissions scanned.
+        """
+        counts = self.submission_manager.get_submission_rollups().count(transform.query(Submission, **filter), by)
+        if counts is None:
+            return None
+        return [{"_id": key, "submissions": submissions, "validSubmissions": valid}
+                for key, (submissions, valid) in sorted(counts.items(), key=lambda x: -x[1][0])]
+
     def _tasks_stats(self, tasks, filter, limit):
-        stats_tasks = Submission.objects(**filter).aggregate(
-            [{"$match": filter},
-             {"$limit": limit},
-             {"$project": {"taskid": "$taskid", "result": "$result"}},
-             {"$group": {"_id": "$taskid", "submissions": {"$sum": 1}, "validSubmissions":
-                 {"$sum": {"$cond": {"if": {"$eq": ["$result", "success"]}, "then": 1, "else": 0}}}}
-              },
-             {"$sort": {"submissions": -1}}])
+        stats_tasks = self._rollup_stats(filter, "taskid")
+        if stats_tasks is None:
+            stats_tasks = Submission.objects(**filter).aggregate(
+                [{"$limit": limit},
+                 {"$project": {"taskid": "$taskid", "result": "$result"}},
+                 {"$group": {"_id": "$taskid", "submissions": {"$sum": 1}, "validSubmissions":
+                     {"$sum": {"$cond": {"if": {"$eq": ["$result", "success"]}, "then": 1, "else": 0}}}}
+                  },
+                 {"$sort": {"submissions": -1}}])
 
         return [
             {"name": tasks[x["_id"]].get_name(self.user_manager.session_language()) if x["_id"] in tasks else x["_id"],
@@ -33,15 +48,17 @@ class CourseStatisticsPage(INGIniousSubmissionsAdminPage):
         ]
 
     def _users_stats(self, filter, limit):
-        stats_users = Submission.objects(**filter).aggregate([
-            {"$limit": limit},
-            {"$project": {"username": "$username", "result": "$result"}},
-            {"$unwind": "$username"},
-            {"$group": {"_id": "$username", "submissions": {"$sum": 1}, "validSubmissions":
-                {"$sum": {"$cond": {"if": {"$eq": ["$result", "success"]}, "then": 1, "else": 0}}}}
-             },
-            {"$limit": limit},
-            {"$sort": {"submissions": -1}}])
+        stats_users = self._rollup_stats(filter, "username")
+        if stats_users is None:
+            stats_users = Submission.objects(**filter).aggregate([
+                {"$limit": limit},
+                {"$project": {"username": "$username", "result": "$result"}},
+                {"$unwind": "$username"},
+                {"$group": {"_id": "$username", "submissions": {"$sum": 1}, "validSubmissions":
+                    {"$sum": {"$cond": {"if": {"$eq": ["$result", "success"]}, "then": 1, "else": 0}}}}
+                 },
+                {"$limit": limit},
+                {"$sort": {"submissions": -1}}])
 
         return [
             {"name": x["_id"],
@@ -75,15 +92,29 @@ class CourseStatisticsPage(INGIniousSubmissionsAdminPage):
             max_date = max_date.replace(hour=0)
             delta1 = timedelta(days=1)
 
-        filter["submitted_on"] = {"$gte": min_date, "$lt": max_date + delta1}
-
-        stats_graph = Submission.objects(**filter).aggregate(
-            [{"$limit": limit},
-             {"$project": project},
-             {"$group": {"_id": groupby, "submissions": {"$sum": 1}, "validSubmissions":
-                 {"$sum": {"$cond": {"if": {"$eq": ["$result", "success"]}, "then": 1, "else": 0}}}}
-              },
-             {"$sort": {"_id": 1}}])
+        # Do not modify the filter of the caller
+        filter = dict(filter)
+        filter.setdefault("submitted_on__gte", min_date)
+        if "submitted_on__lte" not in filter:
+            filter["submitted_on__lt"] = max_date + delta1
+
+        stats_graph = self._rollup_stats(filter, "hour")
+        if stats_graph is not None:
+            # Group the UTC hours of the rollups by local hour or day
+            for entry in stats_graph:
+                local = entry["_id"].replace(tzinfo=timezone.utc).astimezone(tz)
+                if local.minute != 0:  # time zone offset that is not a whole number of hours
+                    stats_graph = None
+                    break
+                entry["_id"] = {"year": local.year, "month": local.month, "day": local.day, "hour": local.hour}
+        if stats_graph is None:
+            stats_graph = Submission.objects(**filter).aggregate(
+                [{"$limit": limit},
+                 {"$project": project},
+                 {"$group": {"_id": groupby, "submissions": {"$sum": 1}, "validSubmissions":
+                     {"$sum": {"$cond": {"if": {"$eq": ["$result", "success"]}, "then": 1, "else": 0}}}}
+                  },
+                 {"$sort": {"_id": 1}}])
 
         increment = timedelta(days=(1 if method == "day" else 0), hours=(0 if method == "day" else 1))
 
@@ -98,6 +129,8 @@ class CourseStatisticsPage(INGIniousSubmissionsAdminPage):
 
         for entry in stats_graph:
             c = datetime(entry["_id"]["year"], entry["_id"]["month"], entry["_id"]["day"], 0 if method == "day" else entry["_id"]["hour"])
+            if c not in all_submissions:  # range bounds given in another time zone
+                continue
             all_submissions[c] += entry["submissions"]
             valid_submissions[c] += entry["validSubmissions"]
 
@@ -139,9 +172,10 @@ class CourseStatisticsPage(INGIniousSubmissionsAdminPage):
         return result
 
     def _global_stats(self, course, tasks, filter, limit, best_submissions_list, pond_stat):
-        submissions = Submission.objects(**filter)
+        # Only load the fields used by compute_statistics and fast_stats
+        submissions = Submission.objects(**filter).only("taskid", "username", "result", "tests").as_pymongo()
         if limit is not None:
-            submissions.limit(limit)
+            submissions = submissions.limit(limit)
 
         data = list(submissions)
         for d in data:
@@ -229,48 +263,55 @@ def compute_statistics(course, tasks, data, ponderation):
         [('Number of submissions', 13), ('Evaluation submissions', 2), …], 
         [(<tag>, '61%', '50%'), (<tag>, '76%', '100%'), …]
     )
-     """
-    
-    super_dict = {}
-    for submission in data:
-        task = tasks.get(submission["taskid"], None)
-        if task:
-            username = "".join(submission["username"])
-            tags_of_course = [tag for key, tag in course.get_tags().items() if tag.get_type() in [0,1]]
-            for tag in tags_of_course:
-                super_dict.setdefault(tag, {})
-                super_dict[tag].setdefault(username, {})
-                super_dict[tag][username].setdefault(submission["taskid"], [0,0,0,0])
-                super_dict[tag][username][submission["taskid"]][0] += 1
-                if "tests" in submission and tag.get_id() in submission["tests"] and submission["tests"][tag.get_id()]:
-                    super_dict[tag][username][submission["taskid"]][1] += 1
-
-                if submission["best"]:
-                    super_dict[tag][username][submission["taskid"]][2] += 1
-                    if "tests" in submission and tag.get_id() in submission["tests"] and submission["tests"][tag.get_id()]:
-                        super_dict[tag][username][submission["taskid"]][3] += 1
 
-    output = []
-    for tag in super_dict:
+    The submissions are counted in one pass, in columns indexed by (user, task) cell: the number of submissions and of
+    evaluation submissions of each cell, and for each tag, the number of those where the tag is set.
+    If ponderation is True, the tag ratios are averaged over the cells, else they are computed on all the submissions.
+     """
+    tags = [tag for tag in course.get_tags().values() if tag.get_type() in [0, 1]]
+    tag_index = {tag.get_id(): i for i, tag in enumerate(tags)}
 
-        if not ponderation: 
-            results = [0,0,0,0]
-            for username in super_dict[tag]:
-                for task in super_dict[tag][username]:
-                    for i in range (0,4):
-                        results[i] += super_dict[tag][username][task][i] 
-            output.append((tag, 100*safe_div(results[1],results[0]), 100*safe_div(results[3],results[2])))
+    cells = {}
+    totals, best_totals = array("l"), array("l")
+    tagged = [array("l") for _tag in tags]
+    best_tagged = [array("l") for _tag in tags]
 
+    for submission in data:
+        if submission["taskid"] not in tasks:
+            continue
+
+        key = ("".join(submission["username"]), submission["taskid"])
+        cell = cells.get(key)
+        if cell is None:
+            cell = cells[key] = len(cells)
+            for column in [totals, best_totals] + tagged + best_tagged:
+                column.append(0)
+
+        best = submission["best"]
+        totals[cell] += 1
+        if best:
+            best_totals[cell] += 1
+        for tag_id, value in (submission.get("tests", None) or {}).items():
+            i = tag_index.get(tag_id)
+            if i is not None and value:
+                tagged[i][cell] += 1
+                if best:
+                    best_tagged[i][cell] += 1
 
-        #Ponderation by stud and tasks
+    output = []
+    if cells:
+        if not ponderation:
+            nb_submissions, nb_best = sum(totals), sum(best_totals)
+            for i, tag in enumerate(tags):
+                output.append((tag, 100 * safe_div(sum(tagged[i]), nb_submissions),
+                               100 * safe_div(sum(best_tagged[i]), nb_best)))
+
+        # Ponderation by stud and tasks
         else:
-            results = ([], [])
-            for username in super_dict[tag]:
-                for task in super_dict[tag][username]:
-                    a = super_dict[tag][username][task]
-                    results[0].append(safe_div(a[1],a[0]))
-                    results[1].append(safe_div(a[3],a[2]))
-            output.append((tag, 100*safe_div(sum(results[0]),len(results[0])), 100*safe_div(sum(results[1]),len(results[1]))))
+            for i, tag in enumerate(tags):
+                ratios = sum(map(safe_div, tagged[i], totals))
+                best_ratios = sum(map(safe_div, best_tagged[i], best_totals))
+                output.append((tag, 100 * ratios / len(cells), 100 * best_ratios / len(cells)))
 
     return (fast_stats(data), output)
 
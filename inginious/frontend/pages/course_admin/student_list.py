@@ -4,17 +4,28 @@
 # more information about the licensing of this file.
 import io
 import csv
+import itertools
 import json
 import yaml
 
 from collections import OrderedDict
 from bson import ObjectId
-from flask import Response, request, render_template
-from io import StringIO
+from flask import Response, request, render_template, jsonify
 
-from inginious.frontend.models import Audience, Submission, User, Group,  CourseClass
+from inginious.frontend.models import Audience, Submission, User, Group,  CourseClass, UserCourseProgress
+from inginious.frontend.models.user import SEARCH_COLLATION
 from inginious.common import custom_yaml
-from inginious.frontend.pages.course_admin.utils import make_csv, INGIniousAdminPage
+from inginious.frontend.pages.course_admin.utils import flatten_csv_entry, make_csv_response, INGIniousAdminPage
+
+# Columns on which the students table can be sorted. The ones of the progress are read from user_course_progress.
+_USER_SORT_FIELDS = ["realname", "username", "email"]
+_PROGRESS_SORT_FIELDS = ["task_tried", "task_succeeded", "grade"]
+_STUDENTS_PER_PAGE = 50
+
+# Columns of the CSV exports. The one of the students also has a column per task, with the grades of the students.
+_CSV_USER_FIELDS = ["username", "realname", "email", "total_tasks", "task_succeeded", "task_tried", "total_tries",
+                    "grade", "url"]
+_CSV_AUDIENCE_FIELDS = ["id", "courseid", "description", "done", "students", "tried", "tutors", "url"]
 
 
 class CourseStudentListPage(INGIniousAdminPage):
@@ -23,24 +34,24 @@ class CourseStudentListPage(INGIniousAdminPage):
     def GET_AUTH(self, courseid):  # pylint: disable=arguments-differ
         """ GET request """
         course, __ = self.get_course_and_check_rights(courseid)
+        if "students_table" in request.args:
+            return self.students_table(course)
+        if "group_students" in request.args:
+            return self.group_students(course)
+
         if "preferred_field" in request.args and request.args["preferred_field"] in \
                 ['username', 'email']:
             preferred_field = request.args["preferred_field"]
-            audiences = []
-            si = StringIO()
-            cw = csv.writer(si)
-            for audience in self.user_manager.get_course_audiences(course):
-                for student in audience["students"]:
-                    field_value = self.get_requested_field_user_info(student, preferred_field)
-                    audiences.append([field_value, preferred_field, "student", audience["description"]])
-                for tutor in audience["tutors"]:
-                    field_value = self.get_requested_field_user_info(tutor, preferred_field)
-                    audiences.append([field_value, preferred_field, "tutor", audience["description"]])
-            cw.writerows(audiences)
-
-            response = Response(response=si.getvalue(), content_type='text/csv')
-            response.headers['Content-Disposition'] = 'attachment; filename="audiences.csv"'
-            return response
+
+            def rows():
+                for audience in self.iter_audiences(course, "description", "students", "tutors"):
+                    values = self.get_users_field(audience["students"] + audience["tutors"], preferred_field)
+                    for student in audience["students"]:
+                        yield [values.get(student, ""), preferred_field, "student", audience["description"]]
+                    for tutor in audience["tutors"]:
+                        yield [values.get(tutor, ""), preferred_field, "tutor", audience["description"]]
+
+            return make_csv_response(rows(), "audiences.csv", compress="gzip" in request.args)
 
         if "download_groups" in request.args:
             groups = [{"description": group["description"],
@@ -68,6 +79,7 @@ class CourseStudentListPage(INGIniousAdminPage):
         self.post_student_list(course, data)
         active_tab = self.post_audiences(course, data, active_tab, msg, error)
         active_tab = self.post_groups(course, data, active_tab, msg, error)
+        self.user_manager.clear_request_cache(courseid)
 
         return self.page(course, active_tab, msg, error)
 
@@ -86,31 +98,157 @@ class CourseStudentListPage(INGIniousAdminPage):
         if msg is None:
             msg = {}
 
-        split_audiences, audiences = self.get_audiences_params(course)
-        user_data = self.get_student_list_params(course)
-        groups = self.user_manager.get_course_groups(course)
-        student_list, audience_list, other_students, users_info = self.get_user_lists(course)
-
         if "csv_audiences" in request.args:
-            return make_csv(audiences)
+            return make_csv_response(self.get_audience_list_rows(course), compress="gzip" in request.args)
         if "csv_student" in request.args:
-            return make_csv(user_data)
+            return make_csv_response(self.get_student_list_rows(course), compress="gzip" in request.args)
+
+        audiences_import = self.audience_importer.pop_result(course.get_id()) if "audiences" not in msg else None
+        if audiences_import is not None:
+            status, errors = audiences_import
+            if status == "running":
+                msg["audiences"] = _("The audiences are being imported. Reload the page to see the result.")
+            elif status == "failed":
+                msg["audiences"] = _('An error occurred while parsing the data.')
+                error["audiences"] = True
+            else:
+                self.show_audiences_import_errors(errors, msg, error)
+
+        # The students are loaded page by page by the table, see students_table, and by the groups editor when its
+        # tab is opened, see group_students
+        split_audiences, audiences = self.get_audiences_params(course)
+        staff_data = self.get_user_data(course, self.get_sorted_users_info(course.get_staff()))
+        groups = self.user_manager.get_course_groups(course)
+        students_count = len(self.user_manager.get_course_registered_users(course, False))
 
         return render_template("course_admin/student_list.html", course=course,
-                                           user_data=list(user_data.values()), audiences=split_audiences,
-                                           active_tab=active_tab, student_list=student_list,
-                                           audience_list=audience_list,
-                                           other_students=other_students, users_info=users_info, groups=groups,
+                                           staff_data=list(staff_data.values()), students_count=students_count,
+                                           audiences=split_audiences,
+                                           active_tab=active_tab, audience_list=audiences, groups=groups,
                                            error=error, msg=msg)
 
-    def get_student_list_params(self, course):
-        users = sorted(list(
-            self.user_manager.get_users_info(self.user_manager.get_course_registered_users(course, False)).items()),
-            key=lambda k: k[1].realname if k[1] is not None else "")
-
-        users = OrderedDict(sorted(list(self.user_manager.get_users_info(course.get_staff()).items()),
-                                   key=lambda k: k[1].realname if k[1] is not None else "") + users)
-
+    def students_table(self, course):
+        """ Returns a page of the students table as JSON. The page, search string and sort are given as arguments. """
+        try:
+            page = max(int(request.args.get("page", 1)), 1)
+        except ValueError:
+            page = 1
+        sort_by = request.args.get("sort_by", "realname")
+        if sort_by not in _USER_SORT_FIELDS + _PROGRESS_SORT_FIELDS:
+            sort_by = "realname"
+        ascending = request.args.get("order", "asc") != "desc"
+
+        user_data, count = self.get_students_page(course, request.args.get("search", "").strip(), sort_by, ascending,
+                                                  page, _STUDENTS_PER_PAGE)
+        students = [{key: data.get(key) for key in ["username", "realname", "email", "task_tried", "task_succeeded",
+                                                    "grade"]} for data in user_data.values()]
+        pages = max(count // _STUDENTS_PER_PAGE + (count % _STUDENTS_PER_PAGE > 0), 1)
+        return jsonify({"students": students, "count": count, "page": page, "pages": pages})
+
+    def group_students(self, course):
+        """ Returns the registered students as JSON, for the groups editor: the ungrouped ones are listed, and the
+            names of the grouped ones are displayed in their groups. """
+        students = self.user_manager.get_course_registered_users(course, False)
+        users_info = self.user_manager.get_users_info(students)
+        grouped = set(Group.objects(courseid=course.get_id()).distinct("students"))
+        realnames = {username: user.realname for username, user in users_info.items() if user is not None}
+        students = sorted(students, key=lambda username: ("0" + realnames[username]) if username in realnames
+                          else ("1" + username))
+        return jsonify({"students": [{"username": username, "realname": realnames.get(username, ""),
+                                      "grouped": username in grouped} for username in students]})
+
+    def get_students_page(self, course, search="", sort_by="realname", ascending=True, page=1,
+                          per_page=_STUDENTS_PER_PAGE):
+        """
+        Returns a page of the students of a course. They are filtered, sorted and paginated by MongoDB, and only the
+        progress of the students of the page is read. Students without a user document are sorted on their username
+        after the others.
+        :param search: the case-insensitive prefix of the usernames, real names or email addresses of the students
+        :param sort_by: one of "realname", "username", "email", "task_tried", "task_succeeded" and "grade"
+        :return: a tuple (user data of the students of the page, as in get_user_data, number of students)
+        """
+        students = self.user_manager.get_course_registered_users(course, False)
+        if search:
+            # Range queries on the collated indexes of the real names and emails, the usernames are already known
+            prefix = {"$gte": search, "$lt": search + "\uffff"}
+            found = {user["username"] for user in User._get_collection().find(
+                {"$or": [{"realname": prefix}, {"email": prefix}]}, {"username": True}, collation=SEARCH_COLLATION)}
+            students = [username for username in students
+                        if username in found or username.lower().startswith(search.lower())]
+
+        if sort_by in _PROGRESS_SORT_FIELDS:
+            self.user_manager.refresh_stale_course_progress(course, students)
+            query = UserCourseProgress.objects(courseid=course.get_id(), username__in=students)
+        else:
+            query = User.objects(username__in=students)
+
+        direction = "" if ascending else "-"
+        skip = (page - 1) * per_page
+        usernames = list(query.order_by(direction + sort_by, direction + "username")
+                         .skip(skip).limit(per_page).scalar("username"))
+
+        # Fill the end of the page with the students missing from the query
+        count = query.count()
+        if count < len(students) and len(usernames) < per_page:
+            missing = sorted(set(students).difference(query.scalar("username")))
+            start = max(skip - count, 0)
+            usernames += missing[start:start + per_page - len(usernames)]
+
+        users_info = self.user_manager.get_users_info(usernames)
+        users = OrderedDict((username, users_info.get(username)) for username in usernames)
+        return self.get_user_data(course, users), len(students)
+
+    def get_sorted_users_info(self, usernames):
+        """ Returns an OrderedDict {username: UserInfo or None} of the users, sorted on their real names """
+        return OrderedDict(sorted(list(self.user_manager.get_users_info(usernames).items()),
+                                  key=lambda k: k[1].realname if k[1] is not None else ""))
+
+    def get_student_list_rows(self, course, batch_size=1000):
+        """
+        Returns a generator of the CSV rows, header included, of the staff and then of the students of the course,
+        sorted on their real names. The users and their progress are read from cursors, batch_size users at a time,
+        while the rows are generated.
+        """
+        readable_tasks = set(course.get_readable_tasks())
+        columns = sorted(_CSV_USER_FIELDS + ["task_grades[" + taskid + "]" for taskid in readable_tasks])
+
+        def user_rows(usernames):
+            # The users without user document have no real name, and come first
+            found = set(User.objects(username__in=usernames).distinct("username"))
+            users = itertools.chain(
+                ({"username": username} for username in usernames if username not in found),
+                User.objects(username__in=usernames).order_by("realname", "username")
+                .only("username", "realname", "email").as_pymongo().batch_size(batch_size))
+
+            for batch in iter(lambda: list(itertools.islice(users, batch_size)), []):
+                batch_usernames = [user["username"] for user in batch]
+                self.user_manager.refresh_stale_course_progress(course, batch_usernames)
+                progresses = {progress["username"]: progress for progress in UserCourseProgress.objects(
+                    courseid=course.get_id(), username__in=batch_usernames).only(
+                    "username", "tasks", "task_tried", "total_tries", "task_succeeded", "task_grades", "grade"
+                ).as_pymongo()}
+
+                for user in batch:
+                    entry = {"username": user["username"], "realname": user.get("realname", ""),
+                             "email": user.get("email", ""), "total_tasks": 0, "task_succeeded": 0, "task_tried": 0,
+                             "total_tries": 0, "grade": 0, "url": self.submission_url_generator_user(user["username"])}
+                    # As in UserManager.get_course_caches
+                    progress = progresses.get(user["username"])
+                    if progress is not None and readable_tasks.intersection(progress.get("tasks", {})):
+                        entry.update({field: progress.get(field, 0) for field in
+                                      ["task_tried", "total_tries", "task_succeeded", "grade"]})
+                        entry.update(flatten_csv_entry({"task_grades": progress.get("task_grades", {})}))
+                    yield [str(entry[column]) if column in entry else "" for column in columns]
+
+        def rows():
+            yield columns
+            yield from user_rows(course.get_staff())
+            yield from user_rows(self.user_manager.get_course_registered_users(course, False))
+
+        return rows()
+
+    def get_user_data(self, course, users):
+        """ Returns the rows of the users table for users, an OrderedDict {username: UserInfo or None} """
         user_data = OrderedDict([(username, {
             "username": username, "realname": user.realname if user is not None else "",
             "email": user.email if user is not None else "", "total_tasks": 0,
@@ -122,6 +260,52 @@ class CourseStudentListPage(INGIniousAdminPage):
 
         return user_data
 
+    def get_audience_progress(self, course, taskids, students):
+        """ Returns a tuple (number of tasks tried, number of tasks succeeded) by at least one of the students """
+        submissions = Submission.objects(
+            courseid=course.get_id(), taskid__in= taskids, username__in=students
+        )
+
+        data = submissions.aggregate([{
+            "$group": {
+                "_id": "$taskid",
+                "tried": {"$sum": 1},
+                "done": {"$sum": {"$cond": [{"$eq": ["$result", "success"]}, 1, 0]}}
+            }
+        }])
+
+        tried, done = 0, 0
+        for c in data:
+            tried += 1 if c["tried"] else 0
+            done += 1 if c["done"] else 0
+        return tried, done
+
+    def iter_audiences(self, course, *fields, batch_size=100):
+        """ Returns a cursor on the given fields of the audiences of the course, as dicts, sorted on their description """
+        return Audience.objects(courseid=course.get_id()).order_by("description", "id").only(*fields).as_pymongo()\
+            .batch_size(batch_size)
+
+    def get_users_field(self, usernames, field):
+        """ Returns a dict {username: value of field} of the users with a user document. field is username or email. """
+        if field == "username":
+            return {username: username for username in usernames}
+        return {user["username"]: user.get(field, "") for user in
+                User.objects(username__in=usernames).only("username", field).as_pymongo()}
+
+    def get_audience_list_rows(self, course):
+        """ Returns a generator of the CSV rows, header included, of the audiences of the course, read from a cursor
+            while the rows are generated """
+        taskids = list(course.get_tasks().keys())
+
+        def rows():
+            yield _CSV_AUDIENCE_FIELDS
+            for audience in self.iter_audiences(course, "courseid", "description", "students", "tutors"):
+                entry = dict(audience, id=audience["_id"], url=self.submission_url_generator_audience(audience["_id"]))
+                entry["tried"], entry["done"] = self.get_audience_progress(course, taskids, audience["students"])
+                yield [str(entry.get(column, "")) for column in _CSV_AUDIENCE_FIELDS]
+
+        return rows()
+
     def get_audiences_params(self, course):
         audiences = OrderedDict()
         taskids = list(course.get_tasks().keys())
@@ -132,22 +316,8 @@ class CourseStudentListPage(INGIniousAdminPage):
                                                ("done", 0),
                                                ("url", self.submission_url_generator_audience(audience.id))
                                                ])
-
-            submissions = Submission.objects(
-                courseid=course.get_id(), taskid__in= taskids, username__in=audience["students"]
-            )
-
-            data = submissions.aggregate([{
-                "$group": {
-                    "_id": "$taskid",
-                    "tried": {"$sum": 1},
-                    "done": {"$sum": {"$cond": [{"$eq": ["$result", "success"]}, 1, 0]}}
-                }
-            }])
-
-            for c in data:
-                audiences[audience.id]["tried"] += 1 if c["tried"] else 0
-                audiences[audience.id]["done"] += 1 if c["done"] else 0
+            audiences[audience.id]["tried"], audiences[audience.id]["done"] = \
+                self.get_audience_progress(course, taskids, audience["students"])
 
         my_audiences, other_audiences = [], []
         for audience in audiences.values():
@@ -192,81 +362,17 @@ class CourseStudentListPage(INGIniousAdminPage):
                 # get the Werkzeug datastructures.FileStorage object.
                 # The stream of this object is the stream body of the uploaded file.
                 # Furthermore, FileStorage.stream seems to inherit ʻio.BufferedIOBase`, so this stream should be boiled.
-                # As reader return an iterator and that we iterate twice, it is faster to cast into a list.
                 csv_data = list(csv.reader(io.TextIOWrapper(data["audiencefile"], encoding='utf-8')))
-                # Define used variables.
-                students_per_audience = {}
-                tutors_per_audience = {}
-                course_students = []
-                course_tutors = []
-                audiences = []
-                # Check correctness of CSV structure.
-                for line in csv_data:
-                    if len(line) != 4:
-                        msg["audiences"] = _("File wrongly formatted.")
-                        error["audiences"] = True
-                if "audiences" not in error or not error["audiences"]:
-                    stud_list, aud_li, oth_stu, u_info = self.get_user_lists(course)
-                    courseid = course.get_id()
-                    # Fully remove previous audiences.
-                    Audience.objects(courseid=courseid).delete()
-                    # read datas from CSV.
-                    for user_id, field, role, description in csv_data:
-                        user_id = user_id.strip()
-                        field = field.strip()
-                        role = role.strip()
-                        if description != "":
-                            description = description.strip()
-                        if field not in ["username", "email"]:
-                            msg["audiences"] = _("Field was not recognized: ") + field
-                            error["audiences"] = True
-                            continue
-                        if role not in ["student", "tutor"]:
-                            msg["audiences"] = _("Unknown role: ") + role
-                            error["audiences"] = True
-                            continue
-                        user = User.objects(**{field: user_id}).first()
-                        if user is not None:
-                            user_id = user["username"]
-                        else:
-                            msg["audiences"] = _("User was not found: ") + user_id
-                            error["audiences"] = True
-                            continue
-                        # prepare datas to avoid multiple request to database.
-                        if role == "student":
-                            students_per_audience.setdefault(description, []).append(user_id)
-                            course_students.append(user_id)
-                        else:
-                            tutors_per_audience.setdefault(description, []).append(user_id)
-                            course_tutors.append(user_id)
-                    # Creation of audiences.
-                    if len(students_per_audience) > 0:
-                        for key, value in students_per_audience.items():
-                            audiences.append({"description": key, "courseid": courseid,
-                                              "students": value,
-                                              "tutors": tutors_per_audience[key] if key in tutors_per_audience else []})
+                try:
+                    errors = self.audience_importer.import_file(course.get_id(), csv_data)
+                except ValueError:
+                    msg["audiences"] = _("The audiences are already being imported.")
+                    error["audiences"] = True
+                else:
+                    if errors is None:
+                        msg["audiences"] = _("The audiences are being imported. Reload the page to see the result.")
                     else:
-                        for key, value in tutors_per_audience.items():
-                            audiences.append({"description": key, "courseid": courseid,
-                                              "students": [],
-                                              "tutors": value})
-
-                    # update list of students and tutors of the course.
-                    new_students = list(set(stud_list).union(set(course_students)))
-                    CourseClass.objects(id=courseid).update(students=new_students)
-
-                    # this is done to avoid removing the audience id and impact the group audience filter.
-                    for audience in audiences:
-                        existing_audience = Audience.objects(
-                            courseid=courseid, description=audience["description"]
-                        ).first()
-                        if not existing_audience:
-                            Audience(**audience).save()
-                        else:
-                            existing_audience.students = audience["students"]
-                            existing_audience.tutors = audience["tutors"]
-                            existing_audience.save()
-
+                        self.show_audiences_import_errors(errors, msg, error)
             active_tab = "tab_audiences"
         except Exception as e:
             msg["audiences"] = _('An error occurred while parsing the data.')
@@ -274,12 +380,16 @@ class CourseStudentListPage(INGIniousAdminPage):
             active_tab = "tab_audiences"
         return active_tab
 
-    def get_requested_field_user_info(self, username, preferred_field):
-        if preferred_field != "username":
-            # query user
-            username = User.objects.get(username=username)[preferred_field]
-
-        return username
+    def show_audiences_import_errors(self, errors, msg, error):
+        """ Sets the message of the audiences tab with the errors of an audiences import, one line per error """
+        messages = {"format": _("File wrongly formatted."), "field": _("Field was not recognized: "),
+                    "role": _("Unknown role: "), "user": _("User was not found: ")}
+        if errors:
+            msg["audiences"] = [_("Line {}: ").format(number) + messages[kind] + value
+                                for number, kind, value in errors]
+            error["audiences"] = True
+        else:
+            msg["audiences"] = _("Audiences imported.")
 
     def post_groups(self, course, data, active_tab, msg, error):
         if course.is_lti():
@@ -337,26 +447,6 @@ class CourseStudentListPage(INGIniousAdminPage):
             active_tab = "tab_groups"
         return active_tab
 
-    def get_user_lists(self, course):
-        """ Get the available student list for group edition"""
-        audience_list = self.user_manager.get_course_audiences(course)
-        audience_list = {audience.id: audience for audience in audience_list}
-
-        student_list = self.user_manager.get_course_registered_users(course, False)
-        users_info = self.user_manager.get_users_info(student_list)
-
-        groups_list = list(Group.objects(courseid=course.get_id()).aggregate([
-            {"$unwind": "$students"},
-            {"$project": {"group": "$_id", "students": 1}}
-        ]))
-        groups_list = {d["students"]: d["group"] for d in groups_list}
-
-        other_students = [entry for entry in student_list if entry not in groups_list]
-        other_students = sorted(other_students,
-                                key=lambda val: (("0" + users_info[val].realname) if users_info[val] else ("1" + val)))
-
-        return student_list, audience_list, other_students, users_info
-
     def update_group(self, course, groupid, new_data, audience_students):
         """ Update group and returns a list of errored students"""
 
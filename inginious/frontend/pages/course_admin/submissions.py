@@ -2,13 +2,96 @@
 #
 # This file is part of INGInious. See the LICENSE and the COPYRIGHTS files for
 # more information about the licensing of this file.
+import heapq
 import json
 import logging
+from datetime import datetime, timezone
+
 from flask import request, Response, render_template
 from werkzeug.exceptions import NotFound, Forbidden
 
-from inginious.frontend.pages.course_admin.utils import make_csv, INGIniousSubmissionsAdminPage
+from bson import ObjectId, json_util
+from bson.errors import InvalidId
+
+from inginious.frontend.pages.course_admin.utils import make_csv_response, flatten_csv_entry, \
+    INGIniousSubmissionsAdminPage
 from inginious.frontend.models import Submission
+from inginious.frontend.submission_archive import get_archive_formats, get_archive_writer_class
+
+# Fields of the submissions exported in CSV files. The sub-dicts are exported with a column per key.
+_CSV_FIELDS = ["id", "courseid", "taskid", "username", "status", "submitted_on", "grade", "result", "text", "user_ip",
+               "state", "last_replay", "response_type"]
+_CSV_DICT_FIELDS = ["custom", "problems", "tests"]
+
+# Sort columns that are paginated with keyset cursors, with the types of their values. The submissions are sorted on
+# (column, _id), and a page is loaded from the first or last submission of a neighbouring page instead of skipping all
+# the previous ones. Usernames are lists, that MongoDB does not compare like it sorts them: they are paginated by skipping.
+_KEYSET_COLUMNS = {"submitted_on": datetime, "grade": (int, float), "taskid": str}
+
+
+def _sort_value(value, ascending):
+    """ Returns a key comparing value like MongoDB sorts it: missing values first, arrays on their smallest or largest
+        element, and dates in UTC """
+    if isinstance(value, list):
+        value = (min(value) if ascending else max(value)) if value else None
+    if isinstance(value, datetime) and value.tzinfo is not None:
+        value = value.astimezone(timezone.utc).replace(tzinfo=None)
+    return value is not None, value
+
+
+def get_keyset_query(column, ascending, key):
+    """
+    Returns the MongoDB query selecting the submissions that come after key when sorted on (column, _id)
+    :param ascending: the order of the sort
+    :param key: a (value, submission id) pair. Missing values are None, and come first in the ascending order.
+    """
+    value, submissionid = key
+    op = "$gt" if ascending else "$lt"
+    if value is None:
+        if ascending:
+            return {"$or": [{column: {"$ne": None}}, {column: None, "_id": {op: submissionid}}]}
+        return {column: None, "_id": {op: submissionid}}
+    query = [{column: {op: value}}, {column: value, "_id": {op: submissionid}}]
+    if not ascending:
+        query.append({column: None})
+    return {"$or": query}
+
+
+def is_sorted_after(submission, column, ascending, key):
+    """ Returns True if submission comes after key, a (value, submission id) pair, when sorted on (column, _id) """
+    own_key = (_sort_value(submission[column], ascending), submission.id)
+    other_key = (_sort_value(key[0], ascending), key[1])
+    return own_key > other_key if ascending else own_key < other_key
+
+
+def encode_page_cursor(page, submissions, sort_by):
+    """ Returns the cursor of a page of submissions sorted by sort_by, used to load its neighbouring pages, or an empty
+        string if the page cannot be paginated with keys """
+    column, ascending = sort_by
+    if column not in _KEYSET_COLUMNS or not submissions:
+        return ""
+    return json_util.dumps({"page": page, "column": column, "ascending": ascending,
+                            "first": [submissions[0][column], submissions[0].id],
+                            "last": [submissions[-1][column], submissions[-1].id]})
+
+
+def decode_page_cursor(cursor, sort_by):
+    """ Returns the dict encoded by encode_page_cursor, or None if cursor is invalid or was made for another sort """
+    column, ascending = sort_by
+    if not cursor or column not in _KEYSET_COLUMNS:
+        return None
+    try:
+        cursor = json_util.loads(cursor)
+        if cursor["column"] != column or cursor["ascending"] != ascending or type(cursor["page"]) is not int:
+            return None
+        for value, submissionid in (cursor["first"], cursor["last"]):
+            if not (value is None or isinstance(value, _KEYSET_COLUMNS[column])) \
+                    or not isinstance(submissionid, ObjectId):
+                return None
+        return cursor
+    except (ValueError, TypeError, KeyError, InvalidId):
+        return None
+
 
 class CourseSubmissionsPage(INGIniousSubmissionsAdminPage):
     """ Page that allow search, view, replay an download of submisssions done by students """
@@ -37,12 +120,14 @@ class CourseSubmissionsPage(INGIniousSubmissionsAdminPage):
         elif "csv" in user_input or "download" in user_input or "replay" in user_input:
             best_only = "eval_dl" in user_input and "download" in user_input
             params = self.get_input_params(json.loads(user_input.get("displayed_selection", "")), course)
-            data = self.submissions_from_user_input(course, params, msgs, best_only=best_only)
 
             if "csv" in user_input:
-                return make_csv(data)
+                # The rows are written while the submissions are read
+                rows = self.submissions_from_user_input(course, params, msgs, csv_rows=True)
+                return make_csv_response(rows, compress=user_input["csv"] == "gzip")
 
-            elif "download" in user_input:
+            data = self.submissions_from_user_input(course, params, msgs, best_only=best_only)
+            if "download" in user_input:
                 download_type = user_input.get("download_type", "")
                 if download_type not in ["taskid/username", "taskid/audience", "username/taskid", "audience/taskid"]:
                     download_type = "taskid/username"
@@ -50,15 +135,29 @@ class CourseSubmissionsPage(INGIniousSubmissionsAdminPage):
                     sub_folders = list(download_type.split('/'))
                 else:
                     sub_folders = list(download_type.split('/')) + ["submissiondateid"]
-                archive, error = self.submission_manager.get_submission_archive(course, data, sub_folders, simplify="simplify" in user_input)
-                if not error:
-                    response = Response(response=archive, content_type='application/x-gzip')
-                    response.headers['Content-Disposition'] = 'attachment; filename="submissions.tgz"'
-                    return response
-                else:
-                    msgs.append(_("The following submission could not be prepared for download: {}").format(error))
+                archive_format = user_input.get("archive_format", "tgz")
+                if archive_format not in get_archive_formats():
+                    archive_format = "tgz"
+                resume_after = user_input.get("resume_after", "").strip() or None
+                if resume_after is not None and not ObjectId.is_valid(resume_after):
+                    msgs.append(_("Invalid submission id to resume the download from."))
                     return self.page(course, params, msgs=msgs)
 
+                def log_progress(done, total):
+                    if done % 100 == 0 or done == total:
+                        self._logger.info("Downloading submissions of %s: %d/%d", course.get_id(), done, total)
+
+                # The archive is streamed while it is built
+                archive = self.submission_manager.iter_submission_archive(course, data, sub_folders,
+                                                                          simplify="simplify" in user_input,
+                                                                          archive_format=archive_format,
+                                                                          resume_after=resume_after,
+                                                                          progress=log_progress)
+                writer_class = get_archive_writer_class(archive_format)
+                response = Response(response=archive, content_type=writer_class.mimetype)
+                response.headers['Content-Disposition'] = 'attachment; filename="submissions.{}"'.format(writer_class.extension)
+                return response
+
             elif "replay" in user_input:
                 if not self.user_manager.has_admin_rights_on_course(course):
                     raise Forbidden(description=_("You don't have admin rights on this course."))
@@ -73,9 +172,13 @@ class CourseSubmissionsPage(INGIniousSubmissionsAdminPage):
             params = self.get_input_params(json.loads(user_input["displayed_selection"]), course)
             try:
                 page = int(user_input["page"])
-            except TypeError:
+            except (TypeError, ValueError):
                 page = 1
-            return self.page(course, params, page=page, msgs=msgs)
+            try:
+                count = int(user_input.get("sub_count", ""))
+            except ValueError:
+                count = None
+            return self.page(course, params, page=page, msgs=msgs, cursor=user_input.get("cursor"), count=count)
         else:
             params = self.get_input_params(user_input, course)
             return self.page(course, params, msgs=msgs)
@@ -109,22 +212,27 @@ class CourseSubmissionsPage(INGIniousSubmissionsAdminPage):
         params = self.get_input_params(user_input, course)
         return self.page(course, params)
 
-    def page(self, course, params, page=1, msgs=None):
-        """ Get all data and display the page """
+    def page(self, course, params, page=1, msgs=None, cursor=None, count=None):
+        """ Get all data and display the page. cursor and count are the ones of the previously displayed page. """
         msgs = msgs if msgs else []
 
         users, tutored_users, audiences, tutored_audiences, tasks, limit = self.get_course_params(course, params)
 
-        data, sub_count, pages = self.submissions_from_user_input(course, params, msgs, page, limit)
+        data, sub_count, pages, page_cursor = self.submissions_from_user_input(course, params, msgs, page, limit,
+                                                                               cursor=cursor, count=count)
 
         return render_template("course_admin/submissions.html", course=course, users=users,
                                            tutored_users=tutored_users, audiences=audiences,
                                            tutored_audiences=tutored_audiences, tasks=tasks, old_params=params,
                                            data=data, displayed_selection=json.dumps(params),
-                                           number_of_pages=pages, page_number=page, msgs=msgs, sub_count = sub_count)
+                                           number_of_pages=pages, page_number=page, msgs=msgs, sub_count = sub_count,
+                                           page_cursor=page_cursor,
+                                           archive_formats=get_archive_formats())
 
-    def submissions_from_user_input(self, course, user_input, msgs, page=None, limit=None, best_only=False):
-        """ Returns the list of submissions and corresponding aggragations based on inputs """
+    def submissions_from_user_input(self, course, user_input, msgs, page=None, limit=None, best_only=False,
+                                    cursor=None, count=None, csv_rows=False):
+        """ Returns the list of submissions and corresponding aggragations based on inputs, or the generator of their
+            CSV rows if csv_rows is True """
 
         submit_time_between = [None, None]
         try:
@@ -141,20 +249,21 @@ class CourseSubmissionsPage(INGIniousSubmissionsAdminPage):
         if page and limit:
             skip = (page-1) * limit
 
-        return self.get_selected_submissions(course, only_tasks=user_input["tasks"],
-                                             only_tasks_with_categories=user_input["org_categories"],
-                                             only_users=user_input["users"],
-                                             only_audiences=user_input["audiences"],
-                                             grade_between=[
-                                                 float(user_input["grade_min"]) if user_input.get('grade_min', '') else None,
-                                                 float(user_input["grade_max"]) if user_input.get('grade_max', '') else None
-                                             ],
-                                             submit_time_between=submit_time_between,
-                                             keep_only_evaluation_submissions=must_keep_best_submissions_only,
-                                             keep_only_crashes="crashes_only" in user_input,
-                                             sort_by=(user_input.get('sort_by', 'submitted_on'), user_input.get('order', 0) == 1),
-                                             limit=limit,
-                                             skip=skip)
+        criteria = dict(only_tasks=user_input["tasks"],
+                        only_tasks_with_categories=user_input["org_categories"],
+                        only_users=user_input["users"],
+                        only_audiences=user_input["audiences"],
+                        grade_between=[
+                            float(user_input["grade_min"]) if user_input.get('grade_min', '') else None,
+                            float(user_input["grade_max"]) if user_input.get('grade_max', '') else None
+                        ],
+                        submit_time_between=submit_time_between,
+                        keep_only_evaluation_submissions=must_keep_best_submissions_only,
+                        keep_only_crashes="crashes_only" in user_input,
+                        sort_by=(user_input.get('sort_by', 'submitted_on'), user_input.get('order', 0) == 1))
+        if csv_rows:
+            return self.get_selected_submissions_csv(course, **criteria)
+        return self.get_selected_submissions(course, limit=limit, skip=skip, cursor=cursor, count=count, **criteria)
 
     def get_selected_submissions(self, course,
                                  only_tasks=None, only_tasks_with_categories=None,
@@ -164,7 +273,7 @@ class CourseSubmissionsPage(INGIniousSubmissionsAdminPage):
                                  keep_only_evaluation_submissions=False,
                                  keep_only_crashes=False,
                                  sort_by=("submitted_on", True),
-                                 limit=None, skip=None):
+                                 limit=None, skip=None, cursor=None, count=None):
         """
         All the parameters (excluding course, sort_by and keep_only_evaluation_submissions) can be None.
         If that is the case, they are ignored.
@@ -186,7 +295,12 @@ class CourseSubmissionsPage(INGIniousSubmissionsAdminPage):
         :param sort_by: a tuple (sort_column, ascending) where sort_column is in ["submitted_on", "username", "grade", "taskid"]
                and ascending is either True or False.
         :param limit: an integer representing the maximum number of submission to list.
-        :return: a list of submission filling the criterias above.
+        :param skip: the number of submissions to skip, a multiple of limit when limit is given.
+        :param cursor: the page cursor of a previously displayed page, as given by encode_page_cursor. Pages near it
+               are loaded from its first or last submission instead of skipping the previous ones.
+        :param count: the number of submissions filling the criterias, if already known.
+        :return: a list of submission filling the criterias above, or if limit is given, a tuple (submissions, count,
+                 number of pages, page cursor).
         """
 
         filter, best_submissions_list = self.get_submissions_filter(course, only_tasks=only_tasks,
@@ -198,26 +312,121 @@ class CourseSubmissionsPage(INGIniousSubmissionsAdminPage):
                                                                     keep_only_evaluation_submissions=keep_only_evaluation_submissions,
                                                                     keep_only_crashes=keep_only_crashes)
 
-        submissions = Submission.objects(**filter)
-        submissions_count = Submission.objects(**filter).count()
-
         if sort_by[0] not in ["submitted_on", "username", "grade", "taskid"]:
-            sort_by[0] = "submitted_on"
-        submissions = submissions.order_by(("" if sort_by[1] else "-") + sort_by[0])
+            sort_by = ("submitted_on", sort_by[1])
+        column, ascending = sort_by
 
-        if skip is not None and skip < submissions_count:
-            submissions.skip(skip)
+        submissions = Submission.objects(**filter)
+        # Submissions moved to the cold tier are merged with the others
+        cold_submissions = self.submission_manager.get_cold_submissions(submissions._query)
+        submissions_count = count if count is not None else submissions.count() + len(cold_submissions)
 
-        if limit is not None:
-            submissions.limit(limit)
+        if limit is None:
+            out = self._load_submissions(submissions, cold_submissions, column, ascending, skip=skip or 0)
+        else:
+            page = (skip or 0) // limit + 1
+            number_of_pages = max(submissions_count // limit + (submissions_count % limit > 0), 1)
 
-        out = list(submissions)
+            # The ways to load the page: (skipped submissions, loading order, key to start after, page size). They
+            # are loaded in the reverse order when walking back from a key or from the end.
+            plans = [((page - 1) * limit, ascending, None, limit)]
+            cursor = decode_page_cursor(cursor, sort_by)
+            if cursor is not None and page > cursor["page"]:
+                plans.append(((page - cursor["page"] - 1) * limit, ascending, cursor["last"], limit))
+            elif cursor is not None and page < cursor["page"]:
+                plans.append(((cursor["page"] - page - 1) * limit, not ascending, cursor["first"], limit))
+            last_page_size = submissions_count - (page - 1) * limit
+            if column in _KEYSET_COLUMNS and page == number_of_pages > 1 and 0 < last_page_size <= limit:
+                plans.append((0, not ascending, None, last_page_size))
+
+            page_skip, order, after, size = min(plans, key=lambda plan: plan[0])
+            out = self._load_submissions(submissions, cold_submissions, column, order, after, page_skip, size)
+            if order != ascending:
+                out.reverse()
 
         for d in out:
             d.best = d.id in best_submissions_list  # mark best submissions
 
         if limit is not None:
-            number_of_pages = max(submissions_count // limit + (submissions_count % limit > 0), 1)
-            return out, submissions_count, number_of_pages
+            return out, submissions_count, number_of_pages, encode_page_cursor(page, out, sort_by)
         else:
             return out
+
+    def get_selected_submissions_csv(self, course, sort_by=("submitted_on", True), batch_size=1000, **criteria):
+        """
+        Returns a generator of the CSV rows, header included, of the submissions selected by the criteria of
+        get_selected_submissions. The submissions are read from a cursor, batch_size at a time, while the rows are
+        generated: only the submissions of the cold tier are loaded beforehand.
+        """
+        filter, __ = self.get_submissions_filter(course, **criteria)
+        if sort_by[0] not in ["submitted_on", "username", "grade", "taskid"]:
+            sort_by = ("submitted_on", sort_by[1])
+        column, ascending = sort_by
+
+        submissions = Submission.objects(**filter)
+        query = submissions._query
+        cold_submissions = [submission.to_mongo().to_dict()
+                            for submission in self.submission_manager.get_cold_submissions(query)]
+
+        # The columns of the sub-dicts are the keys found in the selected submissions
+        columns = set(_CSV_FIELDS)
+        for entry in Submission._get_collection().aggregate([
+                {"$match": query},
+                {"$project": {"columns": {"$concatArrays": [
+                    {"$map": {"input": {"$objectToArray": {"$ifNull": ["$" + field, {}]}},
+                              "in": {"$concat": [field + "[", "$$this.k", "]"]}}}
+                    for field in _CSV_DICT_FIELDS]}}},
+                {"$unwind": "$columns"},
+                {"$group": {"_id": "$columns"}}], allowDiskUse=True):
+            columns.add(entry["_id"])
+        for submission in cold_submissions:
+            columns.update(flatten_csv_entry({field: submission[field] for field in _CSV_DICT_FIELDS
+                                              if isinstance(submission.get(field), dict)}))
+        columns = sorted(columns)
+
+        direction = "" if ascending else "-"
+        fields = [field for field in _CSV_FIELDS if field != "id"] + _CSV_DICT_FIELDS
+        submissions = submissions.order_by(direction + column, direction + "id").only(*fields).as_pymongo()
+        submissions = submissions.batch_size(batch_size)
+
+        def sort_key(submission):
+            return _sort_value(submission.get(column), ascending), submission["_id"]
+
+        def rows():
+            yield columns
+            for submission in heapq.merge(submissions, sorted(cold_submissions, key=sort_key, reverse=not ascending),
+                                          key=sort_key, reverse=not ascending):
+                entry = flatten_csv_entry(submission)
+                entry["id"] = entry.pop("_id")
+                yield [str(entry[col]) if col in entry else "" for col in columns]
+
+        return rows()
+
+    def _load_submissions(self, submissions, cold_submissions, column, ascending, after=None, skip=0, limit=None):
+        """ Returns the submissions of the queryset and of the cold tier sorted on (column, _id), from the one after the
+            key after, if given, skipping skip submissions and returning at most limit ones """
+        direction = "" if ascending else "-"
+        submissions = submissions.order_by(direction + column, direction + "id")
+        if after is not None:
+            submissions = submissions.filter(__raw__=get_keyset_query(column, ascending, after))
+            cold_submissions = [submission for submission in cold_submissions
+                                if is_sorted_after(submission, column, ascending, after)]
+
+        if cold_submissions:
+            if limit is not None:
+                submissions = submissions.limit(skip + limit)
+            out = self._merge_cold_submissions(list(submissions), cold_submissions, (column, ascending))
+            return out[skip:] if limit is None else out[skip:skip + limit]
+
+        if skip:
+            submissions = submissions.skip(skip)
+        if limit is not None:
+            submissions = submissions.limit(limit)
+        return list(submissions)
+
+    def _merge_cold_submissions(self, submissions, cold_submissions, sort_by):
+        """ Merges submissions with the submissions of the cold tier, keeping the order given by sort_by """
+        def sort_key(submission):
+            return _sort_value(submission[sort_by[0]], sort_by[1]), submission.id
+
+        return sorted(submissions + cold_submissions, key=sort_key, reverse=not sort_by[1])
@@ -11,6 +11,7 @@ from flask import request, redirect, Response, render_template
 from werkzeug.exceptions import  NotFound
 
 from inginious.common.base import id_checker
+from inginious.frontend.course_registry import invalidate_course_registry
 from inginious.frontend.pages.course_admin.utils import INGIniousAdminPage
 
 
@@ -146,6 +147,7 @@ class CourseTaskFiles(INGIniousAdminPage):
             return json.dumps({"error": True})
         try:
             task_fs.put(wanted_path, content.encode("utf-8"))
+            invalidate_course_registry(task_fs)
             return json.dumps({"ok": True})
         except:
             return json.dumps({"error": True})
@@ -162,6 +164,7 @@ class CourseTaskFiles(INGIniousAdminPage):
 
         try:
             task_fs.put(wanted_path, fileobj.read())
+            invalidate_course_registry(task_fs)
         except:
             return self.show_tab_file(course, task, _("An error occurred while writing the file"))
         return self.show_tab_file(course, task)
@@ -183,6 +186,7 @@ class CourseTaskFiles(INGIniousAdminPage):
             task_fs.from_subfolder(wanted_path).ensure_exists()
         else:
             task_fs.put(wanted_path, b"")
+        invalidate_course_registry(task_fs)
         return self.show_tab_file(course, task)
 
     def action_rename(self, task_fs, course, task, path, new_path):
@@ -205,6 +209,7 @@ class CourseTaskFiles(INGIniousAdminPage):
 
         try:
             task_fs.move(old_path, wanted_path)
+            invalidate_course_registry(task_fs)
             return self.show_tab_file(course, task)
         except:
             return self.show_tab_file(course, task, _("An error occurred while moving the files"))
@@ -226,6 +231,7 @@ class CourseTaskFiles(INGIniousAdminPage):
 
         try:
             task_fs.delete(wanted_path)
+            invalidate_course_registry(task_fs)
             return self.show_tab_file(course, task)
         except:
             return self.show_tab_file(course, task, _("An error occurred while deleting the files"))
@@ -14,7 +14,7 @@ from inginious.frontend.tasks import Task
 from inginious.frontend.pages.course_admin.utils import INGIniousAdminPage
 from inginious.common.exceptions import TaskAlreadyExistsException
 from inginious.frontend.task_dispensers import get_task_dispensers
-from inginious.frontend.models import UserTask, Submission
+from inginious.frontend.models import UserTask
 
 
 class CourseTaskListPage(INGIniousAdminPage):
@@ -78,6 +78,9 @@ class CourseTaskListPage(INGIniousAdminPage):
 
         # don't forget to reload the modified course
         course, __ = self.get_course_and_check_rights(courseid, allow_all_staff=False)
+
+        # Weights and accessibilities may have changed
+        self.user_manager.refresh_course_progress(course)
         return self.page(course, errors, not errors)
 
     def update_dispenser(self, course, dispenser_data):
@@ -104,12 +107,9 @@ class CourseTaskListPage(INGIniousAdminPage):
 
     def wipe_task(self, courseid, taskid):
         """ Wipe the data associated to the taskid from DB"""
-        for submission in Submission.objects(courseid=courseid, taskid=taskid):
-            submission.archive.delete()
-            submission.input.delete()
-
         UserTask.objects(courseid=courseid, taskid=taskid).delete()
-        Submission.objects(courseid=courseid, taskid=taskid).delete()
+        self.submission_manager.delete_submissions(courseid=courseid, taskid=taskid)
+        self.user_manager.invalidate_course_progress(courseid)
 
         logging.getLogger("inginious.webapp.task_edit").info("Task %s/%s wiped.", courseid, taskid)
 
@@ -5,13 +5,13 @@
 
 """ Utilities for administration pages """
 
-import codecs
 import csv
 import io
+import zlib
 from collections import OrderedDict
 from datetime import datetime
 
-from flask import redirect, Response
+from flask import redirect, Response, stream_with_context
 from werkzeug.exceptions import Forbidden
 from bson.objectid import ObjectId
 
@@ -241,94 +241,78 @@ class INGIniousSubmissionsAdminPage(INGIniousAdminPage):
         return filter, best_submissions_list
 
 
-class UnicodeWriter(object):
+def flatten_csv_entry(entry):
+    """ Returns the dict entry where the sub-dicts are converted to columns named key[subkey] """
+    flat = {}
+    for key, val in entry.items():
+        if isinstance(val, dict):
+            for key2, val2 in val.items():
+                flat[str(key) + "[" + str(key2) + "]"] = val2
+        else:
+            flat[key] = val
+    return flat
+
+
+def iter_csv(rows, compress=False, chunk_size=65536):
     """
-    A CSV writer which will write rows to CSV file "f",
-    which is encoded in the given encoding.
+    Yields the content of a CSV file, encoded in UTF-8, in chunks of about chunk_size bytes
+    :param rows: an iterable of rows, that are lists of strings. It is only consumed while the chunks are yielded.
+    :param compress: True to compress the file with gzip
     """
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+    compressor = zlib.compressobj(wbits=31) if compress else None  # wbits=31 writes a gzip header
+
+    for row in rows:
+        writer.writerow(row)
+        if buffer.tell() >= chunk_size:
+            chunk = buffer.getvalue().encode("utf-8")
+            buffer.seek(0)
+            buffer.truncate(0)
+            if compressor is not None:
+                chunk = compressor.compress(chunk)
+            if chunk:
+                yield chunk
+
+    chunk = buffer.getvalue().encode("utf-8")
+    if compressor is not None:
+        chunk = compressor.compress(chunk) + compressor.flush()
+    yield chunk
+
+
+def make_csv_response(rows, filename="export.csv", compress=False):
+    """ Returns a response streaming a CSV file with the given rows, lists of strings, while they are generated """
+    if compress:
+        response = Response(response=stream_with_context(iter_csv(rows, True)), content_type='application/gzip')
+        filename += ".gz"
+    else:
+        response = Response(response=stream_with_context(iter_csv(rows)), content_type='text/csv; charset=utf-8')
+    response.headers['Content-disposition'] = 'attachment; filename="{}"'.format(filename)
+    return response
 
-    def __init__(self, f, dialect=csv.excel, encoding="utf-8", **kwds):
-        # Redirect output to a queue
-        self.queue = io.StringIO()
-        self.writer = csv.writer(self.queue, dialect=dialect, **kwds)
-        self.stream = f
-        self.encoder = codecs.getincrementalencoder(encoding)()
-
-    def writerow(self, row):
-        """ Writes a row to the CSV file """
-        self.writer.writerow(row)
-        # Fetch UTF-8 output from the queue ...
-        data = self.queue.getvalue()
-        # write to the target stream
-        self.stream.write(data)
-        # empty queue
-        self.queue.truncate(0)
-        self.queue.seek(0)
-
-    def writerows(self, rows):
-        """ Writes multiple rows to the CSV file """
-        for row in rows:
-            self.writerow(row)
-
-
-def make_csv(data):
-    """ Returns the content of a CSV file with the data of the dict/list data """
-    # Convert sub-dicts to news cols
-    for entry in data:
-        rval = entry
-        if isinstance(data, dict):
-            rval = data[entry]
-        todel = []
-        toadd = {}
-        for key, val in rval.items():
-            if isinstance(val, dict):
-                for key2, val2 in val.items():
-                    toadd[str(key) + "[" + str(key2) + "]"] = val2
-                todel.append(key)
-        for k in todel:
-            del rval[k]
-        for k, v in toadd.items():
-            rval[k] = v
-
-    # Convert everything to CSV
-    columns = set()
-    output = [[]]
+
+def make_csv(data, compress=False):
+    """ Returns a response with a CSV file of the data of the dict/list data. Sub-dicts are converted to columns. """
     if isinstance(data, dict):
-        output[0].append("id")
-        for entry in data:
-            for col in data[entry]:
-                columns.add(col)
+        data = OrderedDict((key, flatten_csv_entry(entry)) for key, entry in data.items())
+        entries = data.values()
     else:
-        for entry in data:
-            for col in entry:
-                columns.add(col)
+        data = [flatten_csv_entry(entry) for entry in data]
+        entries = data
 
-    columns = sorted(columns)
+    columns = sorted({col for entry in entries for col in entry})
 
-    for col in columns:
-        output[0].append(col)
+    def rows():
+        if isinstance(data, dict):
+            yield ["id"] + columns
+            for key, entry in data.items():
+                yield [str(key)] + [str(entry[col]) if col in entry else "" for col in columns]
+        else:
+            yield columns
+            for entry in data:
+                yield [str(entry[col]) if col in entry else "" for col in columns]
 
-    if isinstance(data, dict):
-        for entry in data:
-            new_output = [str(entry)]
-            for col in columns:
-                new_output.append(str(data[entry][col]) if col in data[entry] else "")
-            output.append(new_output)
-    else:
-        for entry in data:
-            new_output = []
-            for col in columns:
-                new_output.append(str(entry[col]) if col in entry else "")
-            output.append(new_output)
-
-    csv_string = io.StringIO()
-    csv_writer = UnicodeWriter(csv_string)
-    for row in output:
-        csv_writer.writerow(row)
-    csv_string.seek(0)
-    response = Response(response=csv_string.read(), content_type='text/csv; charset=utf-8')
-    response.headers['Content-disposition'] = 'attachment; filename=export.csv'
-    return response
+    return make_csv_response(rows(), compress=compress)
 
 
 class CourseRedirectPage(INGIniousAdminPage):
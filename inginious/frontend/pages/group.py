@@ -12,7 +12,7 @@ from werkzeug.exceptions import Forbidden
 
 from inginious.frontend.courses import Course
 from inginious.frontend.pages.utils import INGIniousAuthPage
-from inginious.frontend.models import Group, Audience
+from inginious.frontend.models import Group
 
 class GroupPage(INGIniousAuthPage):
     """ Group page """
@@ -44,6 +44,7 @@ class GroupPage(INGIniousAuthPage):
                 new_group = Group.objects(
                     id=data["register_group"], __raw__={"$where": "this.students.length<this.size"}
                 ).modify(push__students=username, new=True)
+                self.user_manager.clear_request_cache(courseid)
 
                 if new_group is None:
                     error = True
@@ -59,6 +60,7 @@ class GroupPage(INGIniousAuthPage):
                 if group is not None:
                     group.students.remove(username)
                     group.save()
+                    self.user_manager.clear_request_cache(courseid)
                     self._logger.info("User %s unregistered from group %s/%s", username, courseid, group["description"])
                 else:
                     error = True
@@ -73,7 +75,7 @@ class GroupPage(INGIniousAuthPage):
             submission["taskname"] = tasks[submission['taskid']].get_name(self.user_manager.session_language())
 
         user_group = self.user_manager.get_course_user_group(course)
-        user_audiences = [audience.id for audience in Audience.objects(courseid=courseid, students=username)]
+        user_audiences = [audience.id for audience in self.user_manager.get_course_user_audiences(course, username)]
         groups = self.user_manager.get_course_groups(course)
 
         student_allowed_in_group = lambda group: any(set(user_audiences).intersection(group["audiences"])) or not group["audiences"]
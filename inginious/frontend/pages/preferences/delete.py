@@ -18,7 +18,7 @@ class DeletePage(INGIniousAuthPage):
         msg = ""
 
         username = self.user_manager.session_username()
-        result = self.user_manager.delete_user(username, data.get("delete_email", ""))
+        result = self.user_manager.delete_user(username, data.get("delete_email", ""), self.submission_manager)
 
         if not result:
             error = True
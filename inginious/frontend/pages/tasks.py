@@ -17,6 +17,7 @@ import logging
 
 from flask import redirect, Response, render_template
 from werkzeug.exceptions import NotFound, HTTPException
+from mongoengine.errors import DoesNotExist, ValidationError
 
 from inginious.frontend.models import Submission
 from inginious.common.exceptions import TaskNotFoundException, CourseNotFoundException
@@ -24,7 +25,7 @@ from inginious.frontend.pages.course import handle_course_unavailable
 from inginious.frontend.pages.utils import INGIniousPage, INGIniousAuthPage
 from inginious.frontend.plugins import plugin_manager
 from inginious.frontend.courses import Course
-from inginious.frontend.models import UserTask, Group
+from inginious.frontend.models import UserTask
 
 
 class BaseTaskPage(object):
@@ -129,7 +130,7 @@ class BaseTaskPage(object):
 
             students = [self.user_manager.session_username()]
             if course.get_task_dispenser().get_group_submission(taskid) and not self.user_manager.has_admin_rights_on_course(course, username):
-                group = Group.objects(courseid=course.get_id(),students=self.user_manager.session_username()).first()
+                group = self.user_manager.get_course_user_group(course)
                 if group is not None:
                     students = group["students"]
                 # we don't care for the other case, as the student won't be able to submit.
@@ -267,8 +268,11 @@ class BaseTaskPage(object):
                 # user_task always exists as we called user_saw_task before
                 user_task = UserTask.objects.get(courseid=course.get_id(), taskid=task.get_id(), username__in=result["username"])
 
+                # The user stats may not be written yet, see SubmissionResultWriter. The submission is then not shown
+                # as the default one until the page is reloaded.
+                stats_pending = "stats_pending" in result and result["stats_pending"]
                 default_submissionid = user_task.submissionid
-                if default_submissionid is None:
+                if default_submissionid is None and not stats_pending:
                     # This should never happen, as user_manager.update_user_stats is called whenever a submission is done.
                     return Response(content_type='application/json', response=json.dumps({
                         'status': "error",  "title": _("Error"), "text": _("Internal error")
@@ -451,6 +455,56 @@ class TaskPageStaticDownload(INGIniousPage):
             raise error_or_redirect
 
 
+class SubmissionEventsPage(INGIniousAuthPage):
+    """ Pushes the end of a submission to the browser, using server-sent events """
+
+    keepalive_interval = 15
+    stream_timeout = 120
+
+    @property
+    def is_lti_page(self):
+        return True
+
+    def GET_AUTH(self):  # pylint: disable=arguments-differ
+        submission_events = self.submission_manager.get_submission_events()
+        if submission_events is None:
+            raise NotFound()
+
+        submissionid = flask.request.args.get("submissionid", "")
+        try:
+            submission = self.submission_manager.get_submission(submissionid, user_check=False)
+            if not self.submission_manager.user_is_submission_owner(submission) and \
+                    not self.user_manager.has_staff_rights_on_course(Course.get(submission.courseid)):
+                raise NotFound()
+        except (DoesNotExist, ValidationError, CourseNotFoundException):
+            raise NotFound()
+
+        # The response is streamed after the end of the request: it cannot use the application context
+        submission_manager = self.submission_manager
+        keepalive_interval, stream_timeout = self.keepalive_interval, self.stream_timeout
+
+        def stream():
+            event = submission_events.subscribe(submissionid)
+            try:
+                yield "retry: 5000\n\n"
+                deadline = time.time() + stream_timeout
+                while True:
+                    event.clear()
+                    # The database is checked again after each keepalive, in case the notification was missed
+                    if submission_manager.is_done(submissionid, user_check=False):
+                        yield "event: done\ndata: {}\n\n"
+                        return
+                    if time.time() > deadline:
+                        return  # the browser checks the submission again and reconnects
+                    if not event.wait(keepalive_interval):
+                        yield ": keepalive\n\n"
+            finally:
+                submission_events.unsubscribe(submissionid, event)
+
+        return Response(stream(), mimetype="text/event-stream",
+                        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"})
+
+
 class TaskPage(INGIniousAuthPage):
     def GET_AUTH(self, courseid, taskid):
         return BaseTaskPage(self).GET(courseid, taskid, False)
@@ -20,6 +20,7 @@ from inginious.frontend.environment_types import get_all_env_types
 from inginious.frontend.environment_types.env_type import FrontendEnvType
 from inginious.frontend.submission_manager import WebAppSubmissionManager
 from inginious.frontend.user_manager import UserManager
+from inginious.frontend.audience_import import AudienceImporter
 from inginious.frontend.parsable_text import ParsableText
 from inginious.frontend.i18n import available_languages
 
@@ -76,6 +77,11 @@ class INGIniousPage(MethodView):
         """ Returns the user manager singleton """
         return self.app.user_manager
 
+    @property
+    def audience_importer(self) -> AudienceImporter:
+        """ Returns the importer of audiences files """
+        return self.app.audience_importer
+
     @property
     def client(self) -> Client:
         """ Returns the INGInious client """
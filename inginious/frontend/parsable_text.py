@@ -4,7 +4,9 @@
 # more information about the licensing of this file.
 
 """ Tools to parse text """
+import hashlib
 import html
+import json
 import re
 import gettext
 import flask
@@ -19,9 +21,71 @@ from docutils.parsers.rst.directives.body import CodeBlock
 from docutils.statemachine import StringList
 from docutils.writers import html4css1
 
+from inginious.common.cache import LRUCache, DiskCache
 from inginious.frontend.accessible_time import parse_date
 from inginious.frontend.i18n import gettext as _
 
+# Version of the HTML produced by ParsableText.rst. Must be increased when the writer or the directives change, to
+# ignore the renderings stored on disk.
+RENDERER_VERSION = 1
+
+_render_cache = LRUCache(64 * 1024 * 1024)
+_render_disk_cache = None
+
+
+def init_render_cache(max_size=None, directory=None, directory_max_size=256 * 1024 * 1024):
+    """
+    Configures the cache of the reStructuredText renderings
+    :param max_size: maximum size of the renderings kept in memory, in bytes. None to keep the default.
+    :param directory: directory where the renderings are also stored, or None to only keep them in memory
+    :param directory_max_size: maximum size of the files of directory, in bytes. None for no limit.
+    """
+    global _render_disk_cache
+    if max_size is not None:
+        _render_cache.max_size = max_size
+    _render_disk_cache = DiskCache(directory, directory_max_size) if directory else None
+
+
+def get_render_cache_stats():
+    """ Returns the statistics of the in-memory cache of the reStructuredText renderings, see LRUCache.stats """
+    return _render_cache.stats()
+
+
+def depends_on_request(string):
+    """
+    Returns True if the rendering of the reStructuredText string may depend on the current request: the hidden-until
+    directive depends on the date and on the rights of the user, and empty code blocks on the session language.
+    """
+    return "hidden-until" in string or "code-block" in string
+
+
+def _render_cache_key(string, show_everything, initial_header_level):
+    """ Returns the key of the rendering of string with the given options, in the current request """
+    # The session language only appears in the rendering of empty code blocks
+    language = ""
+    if depends_on_request(string) and flask.has_app_context():
+        language = flask.current_app.user_manager.session_language(default="")
+    key = json.dumps([string, show_everything, initial_header_level, language])
+    return hashlib.sha256(key.encode("utf-8")).hexdigest()
+
+
+_lti_link_regex = re.compile(r'(<a\s+(?:[^>]*?\s)?href="|<img\s+(?:[^>]*?\s)?src=")([^"]*)"')
+
+
+def rewrite_lti_links(rendered):
+    """ Rewrites the relative links and images of the HTML rendered by ParsableText to the assets of the task, if the
+        current request is in an LTI session. The renderings are cached and stored without the session. """
+    session_id = flask.request.args.get('session_id') if flask.has_request_context() else None
+    if not session_id:
+        return rendered
+
+    def rewrite(match):
+        url = html.unescape(match.group(2))
+        if urlparse(url).netloc:  # If URL is absolute, don't do anything
+            return match.group(0)
+        return match.group(1) + html.escape('asset/' + url + '?session_id=' + session_id) + '"'
+    return _lti_link_regex.sub(rewrite, rendered)
+
 
 class EmptiableCodeBlock(CodeBlock):
     def run(self):
@@ -139,21 +203,9 @@ class _CustomHTMLWriter(html4css1.Writer, object):
             """ Ensures all links to outside this instance of INGInious have target='_blank' """
             if tagname == 'a' and "href" in attributes and not attributes["href"].startswith('#'):
                 attributes["target"] = "_blank"
-            # Rewrite paths if we are in LTI mode
-            # TODO: this should be an argument passed through all the functions
-            if flask.has_app_context() and flask.request.args.get('session_id'):
-                if tagname == 'a' and 'href' in attributes:
-                    attributes['href'] = self.rewrite_lti_url(attributes['href'])
-                elif tagname == 'img' and 'src' in attributes:
-                    attributes['src'] = self.rewrite_lti_url(attributes['src'])
+            # The paths are rewritten in LTI sessions by rewrite_lti_links, after the cache
             return html4css1.HTMLTranslator.starttag(self, node, tagname, suffix, empty, **attributes)
 
-        @staticmethod
-        def rewrite_lti_url(url):
-            if urlparse(url).netloc: # If URL is absolute, don't do anything
-                return url
-            return 'asset/' + url + '?session_id=' + flask.request.args['session_id']
-
         def visit_table(self, node):
             """ Remove needless borders """
             self.context.append(self.compact_p)
@@ -282,7 +334,26 @@ class ParsableText(object):
 
     @classmethod
     def rst(cls, string, show_everything=False, initial_header_level=3, debug=False):
-        """Parses reStructuredText"""
+        """Parses reStructuredText. The renderings are cached, except the ones depending on the current date."""
+        if debug or "hidden-until" in string:
+            return rewrite_lti_links(cls._rst(string, show_everything, initial_header_level, debug))
+
+        key = _render_cache_key(string, show_everything, initial_header_level)
+        parsed = _render_cache.get(key)
+        if parsed is None and _render_disk_cache is not None:
+            parsed = _render_disk_cache.get(key, RENDERER_VERSION)
+            if parsed is not None:
+                _render_cache.put(key, parsed)
+        if parsed is None:
+            parsed = cls._rst(string, show_everything, initial_header_level, debug)
+            _render_cache.put(key, parsed)
+            if _render_disk_cache is not None:
+                _render_disk_cache.put(key, RENDERER_VERSION, parsed)
+        return rewrite_lti_links(parsed)
+
+    @classmethod
+    def _rst(cls, string, show_everything, initial_header_level, debug):
+        """ Renders reStructuredText with docutils """
         overrides = {
             'initial_header_level': initial_header_level,
             'doctitle_xform': False,
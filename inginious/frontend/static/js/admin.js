@@ -76,4 +76,82 @@ function action_handler(action){
             $('#feedback').show();
         }
     });
-}
\ No newline at end of file
+}
+/**
+ * Loads the students table of the course administration page page by page. The students are filtered, sorted and
+ * paginated by the server at url, the search is sent once the user stops typing and the outdated responses are ignored.
+ * @param url: the url of the students page of the course
+ * @param student_url: the url of the page of a student, without the username
+ * @param can_unregister: true if the unregister button is displayed for each student
+ * @param view_title: the title of the button leading to the submissions of a student
+ */
+function students_table_init(url, student_url, can_unregister, view_title) {
+    var state = {page: 1, sort_by: "realname", order: "asc", search: "", request: 0};
+
+    function load_students(page) {
+        var request = ++state.request;
+        state.page = page;
+        $.getJSON(url, {
+            students_table: 1, page: page, sort_by: state.sort_by, order: state.order, search: state.search
+        }, function (data) {
+            if (request != state.request)
+                return;
+
+            var body = $("#students_table_body").empty();
+            $.each(data.students, function (index, user) {
+                var grade = parseInt(user.grade) || 0;
+                var row = $("<tr>");
+                row.append($("<td>").text(user.realname || user.username));
+                row.append($("<td>").text(user.username));
+                row.append($("<td>").append($("<a>").attr("href", "mailto:" + user.email).text(user.email)));
+                row.append($("<td>").text(user.task_tried));
+                row.append($("<td>").text(user.task_succeeded));
+                row.append($("<td>").append($('<div class="progress">').append(
+                    $('<div class="progress-bar bg-success" role="progressbar" aria-valuemin="0" aria-valuemax="100">')
+                        .attr("aria-valuenow", grade).css("width", grade + "%")
+                        .append($("<span>").text(user.grade + "%")))));
+                var actions = $('<div class="btn-group btn-group-sm" role="group">');
+                actions.append($('<a class="btn btn-secondary"><i class="fa fa-file-code-o fa-fw"></i></a>')
+                    .attr("title", view_title).attr("href", student_url + "/" + encodeURIComponent(user.username)));
+                if (can_unregister)
+                    actions.append($('<button type="button" data-type="single" data-toggle="modal" data-target="#remove_modal" class="btn btn-warning remove_user" title="Unregister"><i class="fa fa-user-times"></i></button>')
+                        .attr("data-username", user.username));
+                row.append($("<td>").append(actions));
+                body.append(row);
+            });
+            body.find("[title]").tooltip({"placement": "bottom"});
+
+            $("#students_pagination").twbsPagination("destroy");
+            $("#students_pagination").twbsPagination({
+                totalPages: data.pages,
+                startPage: data.page,
+                visiblePages: 5,
+                initiateStartPageClick: false,
+                onPageClick: function (event, page) {
+                    if (page != state.page)
+                        load_students(page);
+                }
+            });
+        });
+    }
+
+    var search_timeout = null;
+    $("#students_search").on("input", function () {
+        clearTimeout(search_timeout);
+        search_timeout = setTimeout(function () {
+            var search = $("#students_search").val().trim();
+            if (search != state.search) {
+                state.search = search;
+                load_students(1);
+            }
+        }, 300);
+    });
+    $(".sort_students").click(function (event) {
+        event.preventDefault();
+        var sort_by = $(this).data("sort");
+        state.order = (state.sort_by == sort_by && state.order == "asc") ? "desc" : "asc";
+        state.sort_by = sort_by;
+        load_students(1);
+    });
+    load_students(1);
+}
@@ -241,4 +241,22 @@ function group_update(ref) {
         grp_size_input.val(actual_grp_size);
         grp_size_input.fadeTo('fast', 0.5).fadeTo('fast', 1.0);
     }
-}
\ No newline at end of file
+}
+function group_students_load(url) {
+    // Lists the ungrouped students, and displays the names of the grouped ones
+    $.getJSON(url, {group_students: 1}, function (data) {
+        $("#group_students_loading").remove();
+        $.each(data.students, function (index, student) {
+            var name = student.realname ? student.realname + " (" + student.username + ")" : student.username;
+            if (student.grouped) {
+                $(".group-entry[data-username='" + student.username + "'] span").text(" " + name)
+                    .prepend($('<i class="fa fa-arrows"></i>'));
+            } else {
+                $('<li class="list-group-item group-entry">').attr("data-username", student.username)
+                    .append($("<span>").attr("id", student.username).text(" " + name)
+                        .prepend($('<i class="fa fa-arrows"></i>')))
+                    .appendTo("#group_0");
+            }
+        });
+    });
+}
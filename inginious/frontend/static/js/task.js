@@ -351,71 +351,106 @@ function waitForSubmission(submissionid)
 {
     setTimeout(function()
     {
-        var url = $('form#task').attr("action");
-        jQuery.post(url, {"@action": "check", "submissionid": submissionid}, null, "json")
-            .done(function(data)
+        checkSubmission(submissionid);
+    }, 1000);
+}
+
+//Wait for a job to end, using the events pushed by the server if available. Falls back to polling.
+function waitForSubmissionPush(submissionid)
+{
+    var push_url = $('form#task').attr("data-push-url");
+    if(!push_url || !window.EventSource)
+    {
+        waitForSubmission(submissionid);
+        return;
+    }
+
+    var source = new EventSource(push_url + (push_url.indexOf("?") === -1 ? "?" : "&") +
+                                 "submissionid=" + encodeURIComponent(submissionid));
+    source.addEventListener("done", function()
+    {
+        source.close();
+        checkSubmission(submissionid);
+    });
+    source.onerror = function()
+    {
+        // The stream was closed by the server or cannot be opened
+        source.close();
+        waitForSubmission(submissionid);
+    };
+}
+
+//Check the status of a job, and display its result if it has ended
+function checkSubmission(submissionid)
+{
+    var url = $('form#task').attr("action");
+    jQuery.post(url, {"@action": "check", "submissionid": submissionid}, null, "json")
+        .done(function(data)
+        {
+            if("status" in data && data['status'] === "waiting")
             {
-                if("status" in data && data['status'] === "waiting")
+                if("ssh_host" in data && "ssh_port" in data && "ssh_user" in data && "ssh_password" in data)
                 {
                     waitForSubmission(submissionid);
-                    if("ssh_host" in data && "ssh_port" in data && "ssh_user" in data && "ssh_password" in data)
-                        displayRemoteDebug(submissionid, data);
-                    else
-                        displayTaskLoadingAlert(data, submissionid);
-
-                }
-                else if("status" in data && "result" in data && "grade" in data)
-                {
-                    updateMainTags(data);
-                    if("debug" in data)
-                        displayDebugInfo(data["debug"]);
-
-                    if(data['result'] == "failed")
-                        displayTaskStudentAlertWithProblems(data, "danger", false);
-                    else if(data['result'] == "success")
-                        displayTaskStudentAlertWithProblems(data, "success", false);
-                    else if(data['result'] == "timeout")
-                        displayTaskStudentAlertWithProblems(data, "warning", false);
-                    else if(data['result'] == "overflow")
-                        displayTaskStudentAlertWithProblems(data, "warning", false);
-                    else if(data['result'] == "killed")
-                        displayTaskStudentAlertWithProblems(data, "warning", false);
-                    else // == "error"
-                        displayTaskStudentAlertWithProblems(data, "danger", false);
-
-                    if("tests" in data){
-                        updateSubmission(submissionid, data['result'], data["grade"], data["tests"]);
-                    }else{
-                        updateSubmission(submissionid, data['result'], data["grade"], []);
-                    }
-                    unblurTaskForm();
-
-                    if("replace" in data && data["replace"] && $('#my_submission').length) {
-                        displayEvaluatedSubmission(submissionid, true);
-                    } else if($('#my_submission').length) {
-                        displayEvaluatedSubmission($('#my_submission').attr('data-submission-id'), false);
-                    }
-
-                    if("feedback_script" in data)
-                        eval(data["feedback_script"]);
+                    displayRemoteDebug(submissionid, data);
                 }
                 else
                 {
+                    waitForSubmissionPush(submissionid);
+                    displayTaskLoadingAlert(data, submissionid);
+                }
+            }
+            else if("status" in data && "result" in data && "grade" in data)
+            {
+                updateMainTags(data);
+                if("debug" in data)
+                    displayDebugInfo(data["debug"]);
+
+                if(data['result'] == "failed")
+                    displayTaskStudentAlertWithProblems(data, "danger", false);
+                else if(data['result'] == "success")
+                    displayTaskStudentAlertWithProblems(data, "success", false);
+                else if(data['result'] == "timeout")
+                    displayTaskStudentAlertWithProblems(data, "warning", false);
+                else if(data['result'] == "overflow")
+                    displayTaskStudentAlertWithProblems(data, "warning", false);
+                else if(data['result'] == "killed")
+                    displayTaskStudentAlertWithProblems(data, "warning", false);
+                else // == "error"
                     displayTaskStudentAlertWithProblems(data, "danger", false);
-                    updateSubmission(submissionid, "error", "0.0", []);
-                    updateTaskStatus("Failed", 0);
-                    unblurTaskForm();
+
+                if("tests" in data){
+                    updateSubmission(submissionid, data['result'], data["grade"], data["tests"]);
+                }else{
+                    updateSubmission(submissionid, data['result'], data["grade"], []);
+                }
+                unblurTaskForm();
+
+                if("replace" in data && data["replace"] && $('#my_submission').length) {
+                    displayEvaluatedSubmission(submissionid, true);
+                } else if($('#my_submission').length) {
+                    displayEvaluatedSubmission($('#my_submission').attr('data-submission-id'), false);
                 }
 
-            })
-            .fail(function()
+                if("feedback_script" in data)
+                    eval(data["feedback_script"]);
+            }
+            else
             {
                 displayTaskStudentAlertWithProblems(data, "danger", false);
                 updateSubmission(submissionid, "error", "0.0", []);
                 updateTaskStatus("Failed", 0);
                 unblurTaskForm();
-            });
-    }, 1000);
+            }
+
+        })
+        .fail(function()
+        {
+            displayTaskStudentAlertWithProblems(data, "danger", false);
+            updateSubmission(submissionid, "error", "0.0", []);
+            updateTaskStatus("Failed", 0);
+            unblurTaskForm();
+        });
 }
 
 //Kill a running submission
@@ -0,0 +1,158 @@
+# -*- coding: utf-8 -*-
+#
+# This file is part of INGInious. See the LICENSE and the COPYRIGHTS files for
+# more information about the licensing of this file.
+
+""" Writers producing the archives of submissions as a stream of chunks """
+
+import io
+import tarfile
+import time
+import zipfile
+
+try:
+    import zstandard
+except ImportError:
+    zstandard = None
+
+
+class _StreamBuffer(io.RawIOBase):
+    """ A non-seekable file object accumulating what is written in it until it is popped """
+
+    def __init__(self):
+        super(_StreamBuffer, self).__init__()
+        self._chunks = []
+
+    def writable(self):
+        return True
+
+    def write(self, b):
+        self._chunks.append(bytes(b))
+        return len(b)
+
+    def pop(self):
+        """ Returns the data written since the last call """
+        data = b"".join(self._chunks)
+        self._chunks = []
+        return data
+
+
+class ArchiveWriter:
+    """ Writes an archive in a stream. The data written so far is returned by pop() """
+
+    extension = ""
+    mimetype = ""
+
+    def __init__(self):
+        self._buffer = _StreamBuffer()
+
+    def add_file(self, name, data, mtime):
+        """ Adds a file named name with content data (bytes) and modification time mtime (a timestamp) """
+        raise NotImplementedError()
+
+    def add_tar_member(self, name, member, fileobj):
+        """ Adds a member of a tar archive under the given name. fileobj is the content of the member, or None """
+        raise NotImplementedError()
+
+    def close(self):
+        """ Ends the archive. The remaining data can still be popped. """
+        raise NotImplementedError()
+
+    def pop(self):
+        """ Returns the data written since the last call """
+        return self._buffer.pop()
+
+
+class TarArchiveWriter(ArchiveWriter):
+    """ Writes a gzip-compressed tar archive """
+
+    extension = "tgz"
+    mimetype = "application/x-gzip"
+
+    def __init__(self):
+        super(TarArchiveWriter, self).__init__()
+        self._tar = tarfile.open(fileobj=self._buffer, mode="w|gz")
+
+    def add_file(self, name, data, mtime):
+        info = tarfile.TarInfo(name=name)
+        info.size = len(data)
+        info.mtime = mtime
+        self._tar.addfile(info, fileobj=io.BytesIO(data))
+
+    def add_tar_member(self, name, member, fileobj):
+        member.name = name
+        self._tar.addfile(member, fileobj)
+
+    def close(self):
+        self._tar.close()
+
+
+class ZstdTarArchiveWriter(TarArchiveWriter):
+    """ Writes a zstandard-compressed tar archive. Needs the zstandard package. """
+
+    extension = "tar.zst"
+    mimetype = "application/zstd"
+
+    def __init__(self):
+        ArchiveWriter.__init__(self)
+        self._compressor = zstandard.ZstdCompressor().stream_writer(self._buffer, closefd=False)
+        self._tar = tarfile.open(fileobj=self._compressor, mode="w|")
+
+    def close(self):
+        self._tar.close()
+        self._compressor.close()
+
+
+def _zip_date_time(mtime):
+    """ Returns the zip date_time tuple for a timestamp. Zip archives cannot store dates before 1980. """
+    return time.localtime(max(mtime, 315619200))[:6]
+
+
+class ZipArchiveWriter(ArchiveWriter):
+    """ Writes a zip archive """
+
+    extension = "zip"
+    mimetype = "application/zip"
+
+    def __init__(self):
+        super(ZipArchiveWriter, self).__init__()
+        self._zip = zipfile.ZipFile(self._buffer, mode="w", compression=zipfile.ZIP_DEFLATED)
+
+    def add_file(self, name, data, mtime):
+        info = zipfile.ZipInfo(name, date_time=_zip_date_time(mtime))
+        info.compress_type = zipfile.ZIP_DEFLATED
+        self._zip.writestr(info, data)
+
+    def add_tar_member(self, name, member, fileobj):
+        if member.isdir():
+            info = zipfile.ZipInfo(name.rstrip("/") + "/", date_time=_zip_date_time(member.mtime))
+            self._zip.writestr(info, b"")
+        elif member.isfile():
+            info = zipfile.ZipInfo(name, date_time=_zip_date_time(member.mtime))
+            info.compress_type = zipfile.ZIP_DEFLATED
+            info.external_attr = (member.mode & 0xFFFF) << 16
+            self._zip.writestr(info, fileobj.read())
+        # links and special files cannot be stored in zip archives
+
+    def close(self):
+        self._zip.close()
+
+
+_archive_writers = {"tgz": TarArchiveWriter, "zip": ZipArchiveWriter}
+if zstandard is not None:
+    _archive_writers["tar.zst"] = ZstdTarArchiveWriter
+
+
+def get_archive_formats():
+    """ Returns the list of the available archive formats """
+    return list(_archive_writers.keys())
+
+
+def get_archive_writer_class(archive_format="tgz"):
+    """ Returns the ArchiveWriter subclass for the given format, as returned by get_archive_formats """
+    return _archive_writers[archive_format]
+
+
+def create_archive_writer(archive_format="tgz"):
+    """ Returns a new ArchiveWriter for the given format, as returned by get_archive_formats """
+    return get_archive_writer_class(archive_format)()
@@ -0,0 +1,291 @@
+# -*- coding: utf-8 -*-
+#
+# This file is part of INGInious. See the LICENSE and the COPYRIGHTS files for
+# more information about the licensing of this file.
+
+"""
+Cold tier of the submissions.
+
+Old submissions, and the submissions of archived courses, can be moved out of the submissions collection into
+compressed bundles of the ``submission_bundles`` collection. A bundle holds up to a few hundred submissions of a single
+task. The GridFS files of the submissions (input and archive) are not moved.
+"""
+
+import logging
+import re
+import threading
+import zlib
+from collections import OrderedDict
+
+import bson
+import pymongo
+from bson import Binary, Regex
+
+from inginious.frontend.submission_rollups import SubmissionRollups
+
+_missing = object()
+
+# Operators of the conditions on fields evaluated by matches
+_operators = {"$eq", "$ne", "$in", "$nin", "$gt", "$gte", "$lt", "$lte", "$exists"}
+
+
+def _get_field(doc, path):
+    """ Returns the value of a dotted path in doc, or _missing """
+    for key in path.split("."):
+        if not isinstance(doc, dict) or key not in doc:
+            return _missing
+        doc = doc[key]
+    return doc
+
+
+def _compare(value, operator, operand):
+    """ Evaluates a query operator on a single (non-array) value """
+    if operator == "$eq":
+        return value == operand
+    if operator == "$ne":
+        return value != operand
+    if operator == "$in":
+        return value in operand
+    if value is None or value is _missing:
+        return False
+    try:
+        if operator == "$gt":
+            return value > operand
+        if operator == "$gte":
+            return value >= operand
+        if operator == "$lt":
+            return value < operand
+        if operator == "$lte":
+            return value <= operand
+    except TypeError:
+        return False
+    raise ValueError("Unsupported query operator " + operator)
+
+
+def _match_condition(value, condition):
+    """ Evaluates the condition of a query on a field value. Arrays match if one of their elements matches. """
+    if not isinstance(condition, dict) or not any(key.startswith("$") for key in condition):
+        condition = {"$eq": condition}
+
+    for operator, operand in condition.items():
+        if operator == "$exists":
+            matched = (value is not _missing) == bool(operand)
+        elif operator == "$nin":
+            matched = not _match_condition(value, {"$in": operand})
+        elif operator in ("$eq", "$in") and value is _missing:
+            matched = None in (operand if operator == "$in" else [operand])
+        elif isinstance(value, list):
+            matched = _compare(value, operator, operand) or any(_compare(item, operator, operand) for item in value)
+            if operator == "$ne":
+                matched = all(_compare(item, operator, operand) for item in value)
+        else:
+            matched = _compare(value, operator, operand)
+        if not matched:
+            return False
+    return True
+
+
+def _bundle_fields(submissions):
+    """ Returns the fields of a bundle document holding the given submissions. The usernames and the range of the
+        submission dates allow to select the bundles to read without decompressing them. """
+    dates = [submission["submitted_on"] for submission in submissions if submission.get("submitted_on") is not None]
+    return {
+        "submissionids": [submission["_id"] for submission in submissions],
+        "usernames": sorted({username for submission in submissions for username in submission.get("username", [])}),
+        "min_submitted_on": min(dates) if dates else None,
+        "max_submitted_on": max(dates) if dates else None,
+        "data": Binary(zlib.compress(bson.BSON.encode({"submissions": submissions}), 9))
+    }
+
+
+def get_bundle_query(query):
+    """ Returns the query selecting the bundles that may hold submissions matching query, a MongoDB query on
+        submissions. The conditions on the submissions that cannot be checked on the bundles are ignored. """
+    bundle_query = {field: query[field] for field in ("courseid", "taskid") if field in query}
+    for field, bundle_field in (("username", "usernames"), ("_id", "submissionids")):
+        condition = query.get(field, _missing)
+        # Other operators, like $nin, have another meaning on the lists of the bundles
+        if condition is not _missing and (not isinstance(condition, dict) or set(condition) == {"$in"}):
+            bundle_query[bundle_field] = condition
+
+    submitted_on = query.get("submitted_on")
+    if isinstance(submitted_on, dict):
+        for operator, operand in submitted_on.items():
+            if operator in ("$gt", "$gte"):
+                bundle_query.setdefault("max_submitted_on", {})[operator] = operand
+            elif operator in ("$lt", "$lte"):
+                bundle_query.setdefault("min_submitted_on", {})[operator] = operand
+    return bundle_query
+
+
+def _check_operand(operand):
+    """ Raises a ValueError if operand cannot be compared by matches """
+    if isinstance(operand, (re.Pattern, Regex)):
+        raise ValueError("Regular expressions are not supported in the queries of the cold tier")
+
+
+def check_query(query):
+    """ Raises a ValueError if the MongoDB query cannot be evaluated by matches, instead of silently selecting other
+        submissions than the submissions collection would. """
+    for key, condition in query.items():
+        if key == "$and":
+            if not isinstance(condition, list):
+                raise ValueError("$and expects a list of queries")
+            for subquery in condition:
+                check_query(subquery)
+        elif key.startswith("$"):
+            raise ValueError("Unsupported query operator " + key)
+        elif isinstance(condition, dict) and any(operator.startswith("$") for operator in condition):
+            for operator, operand in condition.items():
+                if operator not in _operators:
+                    raise ValueError("Unsupported query operator " + operator)
+                if operator in ("$in", "$nin"):
+                    if not isinstance(operand, (list, tuple)):
+                        raise ValueError(operator + " expects a list")
+                    for item in operand:
+                        _check_operand(item)
+                else:
+                    _check_operand(operand)
+        else:
+            _check_operand(condition)
+
+
+def matches(doc, query):
+    """ Returns True if the document doc matches the MongoDB query. Only the operators used on submissions are
+        supported: equality, $in, $nin, $ne, $gt(e), $lt(e), $exists and $and, see check_query. """
+    for key, condition in query.items():
+        if key == "$and":
+            if not all(matches(doc, subquery) for subquery in condition):
+                return False
+        elif not _match_condition(_get_field(doc, key), condition):
+            return False
+    return True
+
+
+class SubmissionColdStorage:
+    """ Reads and writes the bundles of the cold tier. The most recently read bundles are kept in memory. """
+
+    def __init__(self, database, collection_name="submission_bundles", cache_size=8):
+        self._collection = database[collection_name]
+        self._submissions = database["submissions"]
+        self._rollups = SubmissionRollups(database)
+        self._cache = OrderedDict()
+        self._cache_size = cache_size
+        self._lock = threading.Lock()
+        self._logger = logging.getLogger("inginious.webapp.submissions")
+
+    def ensure_indexes(self):
+        """ Creates the indexes of the bundles collection """
+        self._collection.create_index([("submissionids", pymongo.ASCENDING)])
+        self._collection.create_index([("courseid", pymongo.ASCENDING), ("taskid", pymongo.ASCENDING)])
+        self._collection.create_index([("courseid", pymongo.ASCENDING), ("usernames", pymongo.ASCENDING)])
+        self._collection.create_index([("courseid", pymongo.ASCENDING), ("max_submitted_on", pymongo.ASCENDING)])
+
+    def _load_bundle(self, bundle):
+        """ Returns the submissions of a bundle document as a dict {submission id: document} """
+        with self._lock:
+            if bundle["_id"] in self._cache:
+                self._cache.move_to_end(bundle["_id"])
+                return self._cache[bundle["_id"]]
+
+        submissions = bson.BSON(zlib.decompress(bundle["data"])).decode()["submissions"]
+        submissions = OrderedDict((submission["_id"], submission) for submission in submissions)
+        with self._lock:
+            self._cache[bundle["_id"]] = submissions
+            while len(self._cache) > self._cache_size:
+                self._cache.popitem(last=False)
+        return submissions
+
+    def get(self, submissionid):
+        """ Returns the document of an archived submission, or None """
+        bundle = self._collection.find_one({"submissionids": submissionid})
+        if bundle is None:
+            return None
+        return self._load_bundle(bundle).get(submissionid)
+
+    def _replace_bundle(self, bundle, submissions, courseid=None):
+        """ Replaces the submissions of a bundle, deleting it if there are none left """
+        with self._lock:
+            self._cache.pop(bundle["_id"], None)
+        if submissions:
+            fields = _bundle_fields(submissions)
+            if courseid is not None:
+                fields["courseid"] = courseid
+            self._collection.update_one({"_id": bundle["_id"]}, {"$set": fields})
+        else:
+            self._collection.delete_one({"_id": bundle["_id"]})
+        with self._lock:
+            self._cache.pop(bundle["_id"], None)
+
+    def delete(self, query):
+        """
+        Deletes the archived submissions matching query, a MongoDB query on submissions. Their GridFS files are not
+        deleted.
+        :raise ValueError: if the query is not supported by matches
+        :return: the documents of the deleted submissions
+        """
+        check_query(query)
+        deleted = []
+        for bundle in self._collection.find(get_bundle_query(query)):
+            submissions = list(self._load_bundle(bundle).values())
+            kept = [submission for submission in submissions if not matches(submission, query)]
+            if len(kept) != len(submissions):
+                deleted += [submission for submission in submissions if matches(submission, query)]
+                self._replace_bundle(bundle, kept)
+        return deleted
+
+    def rename_course(self, courseid, new_courseid):
+        """ Moves the archived submissions of a course to another course id """
+        for bundle in self._collection.find({"courseid": courseid}):
+            submissions = [dict(submission, courseid=new_courseid) for submission in self._load_bundle(bundle).values()]
+            self._replace_bundle(bundle, submissions, new_courseid)
+
+    def find(self, query):
+        """ Returns the documents of the archived submissions matching query, a MongoDB query on submissions. Only the
+            bundles that may hold matching submissions, given their task, users, ids and dates, are read. Raises a
+            ValueError if the query is not supported by matches. """
+        check_query(query)
+        bundle_query = get_bundle_query(query)
+        if not self.has_bundles(bundle_query):
+            return []
+
+        result = []
+        for bundle in self._collection.find(bundle_query, {"data": 0}).sort("_id", pymongo.ASCENDING):
+            bundle = self._collection.find_one({"_id": bundle["_id"]}) if bundle["_id"] not in self._cache else bundle
+            result += [submission for submission in self._load_bundle(bundle).values() if matches(submission, query)]
+        return result
+
+    def has_bundles(self, bundle_query):
+        """ Returns True if there are bundles matching the given query """
+        return self._collection.find_one(bundle_query, {"_id": 1}) is not None
+
+    def archive(self, query, bundle_size=500):
+        """
+        Moves the submissions matching query from the submissions collection to bundles, task by task, in the order of
+        their ids. Submissions that are still waiting for their result are never moved. If the move is interrupted, it
+        can be started again: the submissions already bundled are then only removed from the submissions collection.
+        :return: the number of submissions moved
+        """
+        query = dict(query, status={"$ne": "waiting"})
+        moved = 0
+        tasks = self._submissions.aggregate([{"$match": query}, {"$group": {"_id": {"courseid": "$courseid",
+                                                                                     "taskid": "$taskid"}}}])
+        for task in list(tasks):
+            task_query = dict(query, courseid=task["_id"]["courseid"], taskid=task["_id"]["taskid"])
+            while True:
+                submissions = list(self._submissions.find(task_query).sort("_id", pymongo.ASCENDING).limit(bundle_size))
+                if not submissions:
+                    break
+
+                ids = [submission["_id"] for submission in submissions]
+                bundled = set(self._collection.distinct("submissionids", {"submissionids": {"$in": ids}}))
+                submissions = [submission for submission in submissions if submission["_id"] not in bundled]
+                if submissions:
+                    self._collection.insert_one(dict(_bundle_fields(submissions), courseid=task["_id"]["courseid"],
+                                                     taskid=task["_id"]["taskid"]))
+                with self._rollups.deleting({"_id": {"$in": ids}}):
+                    self._submissions.delete_many({"_id": {"$in": ids}})
+                moved += len(submissions)
+                self._logger.info("%d submissions of %s/%s moved to the cold tier", moved,
+                                  task["_id"]["courseid"], task["_id"]["taskid"])
+        return moved
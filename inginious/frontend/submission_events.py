@@ -0,0 +1,100 @@
+# -*- coding: utf-8 -*-
+#
+# This file is part of INGInious. See the LICENSE and the COPYRIGHTS files for
+# more information about the licensing of this file.
+
+""" Notifications of finished submissions, used to push their status to the browsers waiting for them """
+
+import logging
+import threading
+import time
+from datetime import timedelta
+
+from bson import ObjectId
+from pymongo import CursorType
+from pymongo.errors import CollectionInvalid, PyMongoError
+
+
+class SubmissionEventBroker:
+    """ Fans out the notifications of finished submissions to the threads of this process waiting for them """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._waiters = {}
+
+    def subscribe(self, submissionid):
+        """ Returns an event that is set when the submission is done. Must be released with unsubscribe. """
+        event = threading.Event()
+        with self._lock:
+            self._waiters.setdefault(str(submissionid), set()).add(event)
+        return event
+
+    def unsubscribe(self, submissionid, event):
+        """ Releases an event returned by subscribe """
+        with self._lock:
+            waiters = self._waiters.get(str(submissionid), set())
+            waiters.discard(event)
+            if not waiters:
+                self._waiters.pop(str(submissionid), None)
+
+    def publish(self, submissionids):
+        """ Notifies that the given submissions are done """
+        for submissionid in submissionids:
+            self._notify(str(submissionid))
+
+    def _notify(self, submissionid):
+        with self._lock:
+            waiters = list(self._waiters.get(submissionid, []))
+        for event in waiters:
+            event.set()
+
+    def close(self):
+        """ Stops the broker """
+        pass
+
+
+class MongoSubmissionEventBroker(SubmissionEventBroker):
+    """
+    Fans out the notifications of finished submissions to all the processes of the webapp, through a capped collection
+    of the database. Each process tails the collection in a background thread.
+    """
+
+    def __init__(self, database, collection_name="submission_events", size=1024 * 1024):
+        super(MongoSubmissionEventBroker, self).__init__()
+        self._logger = logging.getLogger("inginious.webapp.submission_events")
+        try:
+            database.create_collection(collection_name, capped=True, size=size)
+        except CollectionInvalid:
+            pass  # already created by another process
+        self._collection = database[collection_name]
+        self._stopped = False
+
+        self._thread = threading.Thread(target=self._tail, daemon=True)
+        self._thread.start()
+
+    def publish(self, submissionids):
+        entries = [{"submissionid": str(submissionid)} for submissionid in submissionids]
+        if entries:
+            self._collection.insert_many(entries)
+
+    def close(self):
+        self._stopped = True
+
+    def _tail(self):
+        """ Tails the capped collection and notifies the local waiters """
+        last = self._collection.find_one(sort=[("$natural", -1)])
+        since = last["_id"].generation_time if last else None
+
+        while not self._stopped:
+            # ObjectIds from different processes are only ordered to the second: when the cursor has to be recreated,
+            # start a bit earlier. Duplicate notifications are harmless.
+            query = {"_id": {"$gte": ObjectId.from_datetime(since - timedelta(seconds=5))}} if since else {}
+            try:
+                cursor = self._collection.find(query, cursor_type=CursorType.TAILABLE_AWAIT)
+                while cursor.alive and not self._stopped:
+                    for entry in cursor:
+                        since = entry["_id"].generation_time
+                        self._notify(entry["submissionid"])
+            except PyMongoError:
+                self._logger.exception("Error while reading the submission events, retrying")
+            time.sleep(1)
@@ -0,0 +1,122 @@
+# -*- coding: utf-8 -*-
+#
+# This file is part of INGInious. See the LICENSE and the COPYRIGHTS files for
+# more information about the licensing of this file.
+
+""" Pre-rendering of the feedback of finished submissions """
+
+import hashlib
+import json
+import logging
+import threading
+
+from concurrent.futures import ThreadPoolExecutor
+
+from inginious.common.cache import LRUCache
+from inginious.frontend.parsable_text import ParsableText, RENDERER_VERSION, depends_on_request
+from inginious.frontend.models import Submission
+
+
+def _get_field(submission, name, default=None):
+    """ Returns a field of a submission, given as a Submission document or as a dict """
+    return submission[name] if name in submission else default
+
+
+def get_feedback_hash(text, problems):
+    """ Returns the hash of the feedback source of a submission, used to check that its stored rendering is current """
+    source = json.dumps([text, problems], sort_keys=True, default=str)
+    return hashlib.sha256(source.encode("utf-8")).hexdigest()
+
+
+def render_feedback(text, problems):
+    """
+    Renders the feedback of a submission.
+    :param text: the global feedback of the submission
+    :param problems: the feedback of each problem, a string (old-style submissions) or a (result, feedback) pair
+    :return: a dict with the renderer version, the hash of the source, and the HTML of the global feedback and of
+             each problem feedback. Texts whose rendering depends on the request (see depends_on_request) or that
+             cannot be rendered are stored as None, and rendered when the submission is viewed.
+    """
+    def render(string):
+        if not isinstance(string, str) or depends_on_request(string):
+            return None
+        try:
+            return ParsableText.rst(string)
+        except Exception:
+            return None  # the error message is translated in the language of the viewer
+
+    rendered = {}
+    for pid, feedback in (problems or {}).items():
+        if isinstance(feedback, str):
+            rendered[pid] = render(feedback)
+        elif isinstance(feedback, (list, tuple)) and len(feedback) == 2:
+            rendered[pid] = render(feedback[1])
+        else:
+            rendered[pid] = None
+
+    return {"version": RENDERER_VERSION, "sha256": get_feedback_hash(text, problems), "text": render(text),
+            "problems": rendered}
+
+
+def get_stored_feedback(submission):
+    """
+    Returns the rendering of the feedback stored with the submission (see render_feedback), or None if there is
+    none or if it is outdated. The links are not rewritten for LTI sessions, see rewrite_lti_links.
+    """
+    stored = _get_field(submission, "feedback_html")
+    if not stored or stored.get("version") != RENDERER_VERSION:
+        return None
+    if stored.get("sha256") != get_feedback_hash(_get_field(submission, "text"), _get_field(submission, "problems")):
+        return None
+    return stored
+
+
+class FeedbackRenderer:
+    """
+    Renders the feedback of finished submissions in a pool of background threads, and stores the HTML in the
+    ``feedback_html`` field of the submissions. The source of the feedback is kept in the ``text`` and ``problems``
+    fields, so that it can be rendered again when RENDERER_VERSION changes.
+
+    The feedback of the submissions that are not in the submissions collection, such as the ones of the cold tier, is
+    rendered when they are viewed: the submissions whose rendering could not be stored are not queued again.
+    """
+
+    def __init__(self, max_workers=2):
+        self._logger = logging.getLogger("inginious.webapp.submissions")
+        self._executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="feedback-renderer")
+        self._lock = threading.Lock()
+        self._pending = set()
+        self._unstored = LRUCache(1024 * 1024)  # submission id => hash of the feedback whose rendering was not stored
+
+    def add(self, submissionid, text, problems):
+        """ Queues the rendering of the feedback of a submission. Ignored if the submission is already queued, or if
+            its rendering could not be stored. """
+        with self._lock:
+            if submissionid in self._pending or self._unstored.get(submissionid) == get_feedback_hash(text, problems):
+                return
+            self._pending.add(submissionid)
+        self._executor.submit(self._render, submissionid, text, problems)
+
+    def add_submission(self, submission):
+        """ Queues the rendering of the feedback of a finished submission, given as a document or as a dict """
+        submissionid = _get_field(submission, "_id") or _get_field(submission, "id")
+        if submissionid is not None and _get_field(submission, "status") in ("done", "error"):
+            self.add(submissionid, _get_field(submission, "text"), _get_field(submission, "problems"))
+
+    def _render(self, submissionid, text, problems):
+        try:
+            feedback_html = render_feedback(text, problems)
+            # Do not overwrite the rendering of a newer feedback, in case the submission was replayed meanwhile
+            result = Submission._get_collection().update_one({"_id": submissionid, "text": text, "problems": problems},
+                                                             {"$set": {"feedback_html": feedback_html}})
+            if not result.matched_count:
+                self._unstored.put(submissionid, feedback_html["sha256"])
+        except Exception:
+            self._logger.exception("Cannot render the feedback of submission %s", submissionid)
+        finally:
+            with self._lock:
+                self._pending.discard(submissionid)
+
+    def close(self):
+        """ Waits for the queued renderings """
+        self._executor.shutdown(wait=True)
@@ -0,0 +1,192 @@
+# -*- coding: utf-8 -*-
+#
+# This file is part of INGInious. See the LICENSE and the COPYRIGHTS files for
+# more information about the licensing of this file.
+
+"""
+Storage of the GridFS files of submissions.
+
+The archives and the contents of the files uploaded by the students are stored in content-addressed GridFS files:
+a file is stored once per distinct content, with a count of the submissions referencing it. The files that are no
+longer referenced are deleted in the background by SubmissionFileCollector.
+"""
+
+import hashlib
+import logging
+import queue
+import threading
+import time
+from collections import Counter
+from datetime import datetime, timedelta
+
+import gridfs
+import pymongo
+from bson import ObjectId
+from pymongo import UpdateOne
+
+# Uploaded files smaller than this are kept in the input of the submission
+BLOB_MIN_SIZE = 4096
+
+
+def ensure_blob_index(database, bucket="fs"):
+    """ Creates the unique index on the content hashes of the content-addressed files """
+    database[bucket + ".files"].create_index([("sha256", pymongo.ASCENDING)], unique=True,
+                                             partialFilterExpression={"sha256": {"$exists": True}})
+
+
+def put_blob(database, data, bucket="fs"):
+    """
+    Stores data in a content-addressed GridFS file, shared by all the references to the same content. Each call adds
+    a reference, that is removed by SubmissionFileCollector.delete.
+    :return: the id of the GridFS file
+    """
+    sha256 = hashlib.sha256(data).hexdigest()
+    files = database[bucket + ".files"]
+    fs = gridfs.GridFS(database, bucket)
+    for __ in range(5):
+        blob = files.find_one_and_update({"sha256": sha256}, {"$inc": {"refcount": 1}, "$unset": {"released_on": ""}},
+                                         projection={"_id": 1})
+        if blob is not None:
+            return blob["_id"]
+
+        file_id = ObjectId()
+        try:
+            fs.put(data, _id=file_id, sha256=sha256, refcount=1)
+            return file_id
+        except gridfs.errors.FileExists:
+            # The same content was stored concurrently: drop the chunks written and reference the other file
+            fs.delete(file_id)
+    raise Exception("Cannot store the content-addressed file " + sha256)
+
+
+def release_blobs(database, file_ids, bucket="fs"):
+    """ Removes a reference from each of the content-addressed GridFS files, stored by put_blob, with the given ids.
+        They are deleted by SubmissionFileCollector once they have not been referenced for its grace period. """
+    for file_id in file_ids:
+        database[bucket + ".files"].update_one({"_id": file_id, "sha256": {"$exists": True}},
+                                               {"$inc": {"refcount": -1}, "$currentDate": {"released_on": True}})
+
+
+def split_input(database, inputdata):
+    """
+    Stores the contents of the files uploaded in inputdata in content-addressed files.
+    :return: a tuple (inputdata where the file contents are replaced by a reference, list of the referenced file ids)
+    """
+    stored, blob_ids = {}, []
+    for key, value in inputdata.items():
+        if isinstance(value, dict) and isinstance(value.get("value"), bytes) and len(value["value"]) >= BLOB_MIN_SIZE:
+            blob_id = put_blob(database, value["value"])
+            value = {k: v for k, v in value.items() if k != "value"}
+            value["value_blob"] = blob_id
+            blob_ids.append(blob_id)
+        stored[key] = value
+    return stored, blob_ids
+
+
+def join_input(database, inputdata):
+    """ Reverts split_input: returns inputdata with the file contents read from their content-addressed files """
+    fs = None
+    for key, value in inputdata.items():
+        if isinstance(value, dict) and "value_blob" in value:
+            fs = fs or gridfs.GridFS(database)
+            value["value"] = fs.get(value.pop("value_blob")).read()
+    return inputdata
+
+
+class SubmissionFileCollector(threading.Thread):
+    """
+    Deletes GridFS files in the background. File ids queued within ``batch_delay`` seconds of each other are deleted
+    together, with one delete on the chunks and one on the files of the bucket per batch. Content-addressed files lose
+    a reference instead, and are deleted once they have not been referenced for ``grace_period``.
+    """
+
+    def __init__(self, database, bucket="fs", batch_delay=1.0, max_batch_size=1000,
+                 grace_period=timedelta(hours=1), gc_interval=600):
+        """
+        :param database: the pymongo database containing the GridFS bucket
+        :param bucket: the name of the GridFS bucket. FileFields of the models use the default "fs" bucket.
+        :param grace_period: time during which a content-addressed file without reference is kept, as it can be
+                             referenced again
+        :param gc_interval: number of seconds between two deletions of the unreferenced content-addressed files
+        """
+        super(SubmissionFileCollector, self).__init__()
+        self.daemon = True
+        self._logger = logging.getLogger("inginious.webapp.submissions")
+        self._queue = queue.Queue()
+        self._files = database[bucket + ".files"]
+        self._chunks = database[bucket + ".chunks"]
+        self._batch_delay = batch_delay
+        self._max_batch_size = max_batch_size
+        self._grace_period = grace_period
+        self._gc_interval = gc_interval
+        ensure_blob_index(database, bucket)
+        self.start()
+
+    def delete(self, file_ids):
+        """ Queues the deletion of the GridFS files with the given ids, or the removal of a reference for the
+            content-addressed files. None values are ignored. """
+        for file_id in file_ids:
+            if file_id is not None:
+                self._queue.put(file_id)
+
+    def stop(self):
+        """ Stops the collector once the files already queued are deleted """
+        self._queue.put(None)
+
+    def run(self):
+        stopped = False
+        next_gc = time.monotonic()
+        while not stopped:
+            if time.monotonic() >= next_gc:
+                try:
+                    self._collect()
+                except Exception:
+                    self._logger.exception("Cannot delete the unreferenced submission files")
+                next_gc = time.monotonic() + self._gc_interval
+
+            try:
+                file_ids = [self._queue.get(timeout=max(0.0, next_gc - time.monotonic()))]
+            except queue.Empty:
+                continue
+            deadline = time.monotonic() + self._batch_delay
+            while file_ids[-1] is not None and len(file_ids) < self._max_batch_size:
+                try:
+                    file_ids.append(self._queue.get(timeout=max(0.0, deadline - time.monotonic())))
+                except queue.Empty:
+                    break
+
+            if file_ids[-1] is None:
+                stopped = True
+                file_ids.pop()
+
+            if file_ids:
+                try:
+                    self._delete_files(file_ids)
+                except Exception:
+                    self._logger.exception("Cannot delete %d submission files", len(file_ids))
+
+    def _delete_files(self, file_ids):
+        """ Deletes a batch of files. Chunks are deleted first, so that an interrupted deletion leaves no orphan chunk
+            but a file entry, that can be deleted again. """
+        references = Counter(file_ids)
+        shared = {entry["_id"] for entry in self._files.find({"_id": {"$in": list(references)}, "sha256": {"$exists": True}},
+                                                              {"_id": 1})}
+        if shared:
+            self._files.bulk_write([UpdateOne({"_id": file_id}, [{"$set": {
+                "refcount": {"$subtract": ["$refcount", references[file_id]]},
+                "released_on": "$$NOW"
+            }}]) for file_id in shared], ordered=False)
+
+        owned = [file_id for file_id in references if file_id not in shared]
+        if owned:
+            self._chunks.delete_many({"files_id": {"$in": owned}})
+            self._files.delete_many({"_id": {"$in": owned}})
+
+    def _collect(self):
+        """ Deletes the content-addressed files that have not been referenced during the grace period """
+        cutoff = datetime.utcnow() - self._grace_period
+        unreferenced = {"sha256": {"$exists": True}, "refcount": {"$lte": 0}, "released_on": {"$lt": cutoff}}
+        for entry in self._files.find(unreferenced, {"_id": 1}):
+            # The file may have been referenced again in the meantime
+            if self._files.find_one_and_delete(dict(unreferenced, _id=entry["_id"]), projection={"_id": 1}):
+                self._chunks.delete_many({"files_id": entry["_id"]})
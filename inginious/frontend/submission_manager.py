@@ -5,6 +5,8 @@
 
 """ Manages submissions """
 import io
+import gettext
+import itertools
 import logging
 import os.path
 import tarfile
@@ -12,83 +14,70 @@ import tempfile
 import time
 import flask
 
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+
 from typing import Dict, List
 from datetime import datetime, timezone
-from pymongo.errors import DocumentTooLarge
+from bson import ObjectId
+from mongoengine.queryset import transform
 
-from inginious.common import custom_yaml
-from inginious.frontend.parsable_text import ParsableText
+from inginious.common import custom_yaml, mcq
+from inginious.frontend.parsable_text import ParsableText, rewrite_lti_links
 from inginious.frontend.plugins import plugin_manager
+from inginious.frontend.submission_writer import SubmissionResultWriter
+from inginious.frontend.submission_feedback import FeedbackRenderer, get_stored_feedback
+from inginious.frontend.submission_archive import create_archive_writer
+from inginious.frontend.submission_files import SubmissionFileCollector
+from inginious.frontend.submission_cold_storage import SubmissionColdStorage
+from inginious.frontend.submission_rollups import SubmissionRollups
 from inginious.frontend.models import UserTask, User, Submission, Group
 
 
 class WebAppSubmissionManager:
     """ Manages submissions. Communicates with the database and the client. """
 
-    def __init__(self, client, user_manager, lti_score_publishers):
+    def __init__(self, client, user_manager, lti_score_publishers, mcq_in_process=True, submission_events=None):
         """
         :type client: inginious.client.client.AbstractClient
         :type user_manager: inginious.frontend.user_manager.UserManager
+        :param mcq_in_process: whether tasks running in the mcq environment are graded directly in the webapp
+        :param submission_events: SubmissionEventBroker notified when submissions are done, or None
         :return:
         """
         self._client = client
         self._user_manager = user_manager
         self._logger = logging.getLogger("inginious.webapp.submissions")
         self._lti_score_publishers = lti_score_publishers
+        self._mcq_in_process = mcq_in_process
+        self._mcq_translations = mcq.load_mcq_translations() if mcq_in_process else {}
 
         # Updates the submissions that are waiting with the status error, as the server restarted
         Submission.objects(status="waiting").update(
             status='error', grade=0.0, text='Internal error. Server restarted', unset__jobid=True
         )
 
-    def _job_done_callback(self, submissionid, course, task, result, grade, problems, tests, custom, state, archive, stdout,
-                           stderr, task_dispenser,  newsub=True):
-        """ Callback called by Client when a job is done. Updates the submission in the database with the data returned after the completion of the
-        job """
-        submission = self.get_submission(submissionid, False)
-
-        if archive:
-            submission.archive.put(archive)
-            submission.save()
-
-        update_query = {
-            "status": ("done" if result[0] == "success" or result[0] == "failed" else "error"),
-            # error only if error was made by INGInious
-            "result": result[0],
-            "grade": grade,
-            "text": result[1],
-            "tests": tests,
-            "problems": problems,
-            "custom": custom,
-            "state": state,
-            "stdout": stdout,
-            "stderr": stderr
-        }
+        # Results of finished jobs are written in batches by a background thread
+        self._submission_events = submission_events
+        self._rollups = SubmissionRollups(Submission._get_db())
+        self._rollups.ensure_indexes()
+        # The feedback of finished jobs is rendered once in the background, and stored with the submissions
+        self._feedback_renderer = FeedbackRenderer()
+        self._result_writer = SubmissionResultWriter(user_manager, lti_score_publishers, submission_events,
+                                                     feedback_renderer=self._feedback_renderer, rollups=self._rollups)
 
-        unset_obj = {
-            "unset__jobid": "",  "unset__ssh_host": "", "unset__ssh_port": "",
-            "unset__ssh_user": "", "unset__ssh_password": ""
-        }
+        # GridFS files of deleted submissions are deleted in the background
+        self._file_collector = SubmissionFileCollector(Submission._get_db())
 
-        update_query.update(unset_obj)
+        # Old submissions can be moved to compressed bundles, see inginious-archive-submissions
+        self._cold_storage = SubmissionColdStorage(Submission._get_db())
 
-        # Save submission to database
-        try:
-            submission = Submission.objects(id=submissionid).modify(**update_query, new=True)
-            for username in submission["username"]:
-                self._user_manager.update_user_stats(username, course, task, submission, result[0], grade, state, newsub, task_dispenser)
-        # Check for size as it also takes the MongoDB command into consideration
-        except DocumentTooLarge:
-            update_query = {"status": "error", "text": _("Maximum submission size exceeded. Check feedback, stdout, stderr and state."), "grade": 0.0}
-            update_query.update(unset_obj)
-            submission = Submission.objects(id=submissionid).modify(**update_query, new=True)
-
-        plugin_manager.call_hook("submission_done", submission=submission, archive=archive, newsub=newsub)
-
-        if "lti_version" in submission:
-            lti_score_publisher = self._lti_score_publishers.get(submission["lti_version"], None)
-            if lti_score_publisher:
-                lti_score_publisher.add(submission)
+    def _job_done_callback(self, submissionid, course, task, result, grade, problems, tests, custom, state, archive, stdout,
+                           stderr, task_dispenser,  newsub=True):
+        """ Callback called by Client when a job is done. Queues the data returned after the completion of the job, to be
+        written in the database by the result writer """
+        self._result_writer.add(submissionid, course, task, result, grade, problems, tests, custom, state, archive, stdout,
+                                stderr, task_dispenser, newsub)
 
     def _before_submission_insertion(self, course, task, inputdata, debug, obj):
         """
@@ -137,6 +126,24 @@ class WebAppSubmissionManager:
 
         return self._delete_exceeding_submissions(self._user_manager.session_username(), course, task, task_dispenser)
 
+    def _grade_in_process(self, task, inputdata):
+        """
+        Grades a submission to a task running in the mcq environment without sending it to the backend.
+        :return: None if the task cannot be graded in the webapp, or a tuple (result, text, grade, problems, state)
+        """
+        if not self._mcq_in_process or task.get_environment_type() != "mcq":
+            return None
+
+        language = inputdata.get("@lang", "")
+        translation = self._mcq_translations.get(language, gettext.NullTranslations())
+        try:
+            problems = mcq.create_problems(task.get_problems_dict(), {language: task.get_translation_obj(language)},
+                                           task.get_fs())
+            return mcq.grade(problems, inputdata, language, translation.gettext, inputdata.get("@state", ""))
+        except Exception:
+            self._logger.exception("Cannot grade task %s in the webapp, sending it to the backend", task.get_id())
+            return None
+
     def replay_job(self, course, task, submission, task_dispenser, copy=False, debug=False):
         """
         Replay a submission: add the same job in the queue, keeping submission id, submission date and input data
@@ -154,9 +161,7 @@ class WebAppSubmissionManager:
             submissionid = submission.id
 
             # Clean the submission document in db
-            if submission.archive is not None:
-                submission.archive.delete()
-                submission.save()
+            self._file_collector.delete([submission.archive.grid_id])
 
             unset_query = {
                 "unset__result": True, "unset__grade": True, "unset__text": True, "unset__tests": True,
@@ -181,18 +186,26 @@ class WebAppSubmissionManager:
 
             submission.set_input(inputdata)
             submissionid = submission.save().id
+            self._add_to_rollups(submission)
+
+        graded = self._grade_in_process(task, inputdata) if not debug else None
+        if graded is not None:
+            result, text, grade, problems, state = graded
+            Submission.objects(id=submissionid).update(last_replay=datetime.now().astimezone())
+            self._job_done_callback(submissionid, course, task, (result, text), round(grade, 2), problems, {}, {},
+                                    state, None, "", "", task_dispenser, copy)
+        else:
+            # Don't enable ssh debug
+            ssh_callback = lambda host, port, user, password: self._handle_ssh_callback(submissionid, host, port, user, password)
 
-        # Don't enable ssh debug
-        ssh_callback = lambda host, port, user, password: self._handle_ssh_callback(submissionid, host, port, user, password)
-
-        jobid = self._client.new_job(1, course, task, inputdata,
-                                     (lambda result, grade, problems, tests, custom, state, archive, stdout, stderr:
-                                      self._job_done_callback(submissionid, course, task, result, grade, problems, tests,
-                                                              custom, state, archive, stdout, stderr, task_dispenser, copy)),
-                                     "Frontend - {}".format(submission["username"]), debug, ssh_callback)
+            jobid = self._client.new_job(1, course, task, inputdata,
+                                         (lambda result, grade, problems, tests, custom, state, archive, stdout, stderr:
+                                          self._job_done_callback(submissionid, course, task, result, grade, problems, tests,
+                                                                  custom, state, archive, stdout, stderr, task_dispenser, copy)),
+                                         "Frontend - {}".format(submission["username"]), debug, ssh_callback)
 
-        # Callback may have been received, perform atomic operation
-        Submission.objects(id=submissionid).update(jobid=jobid, last_replay=datetime.now().astimezone())
+            # Callback may have been received, perform atomic operation
+            Submission.objects(id=submissionid).update(jobid=jobid, last_replay=datetime.now().astimezone())
 
         if not copy:
             self._logger.info("Replaying submission %s - %s - %s - %s", submission["username"], submission["courseid"],
@@ -202,13 +215,54 @@ class WebAppSubmissionManager:
                               submission["courseid"],
                               submission["taskid"], submissionid, self._user_manager.session_username())
 
+    def get_cold_submissions(self, query):
+        """ Returns the submissions of the cold tier matching query, a MongoDB query on the submissions collection """
+        return [Submission._from_son(sub) for sub in self._cold_storage.find(query)]
+
+    def delete_submissions(self, **query):
+        """ Deletes the submissions matching the query, including the ones of the cold tier. Their files are deleted in
+            the background. """
+        submissions = Submission.objects(**query).only("input", "archive", "input_blobs")
+        self._file_collector.delete([file_id for submission in submissions for file_id in submission.get_file_ids()])
+        raw_query = transform.query(Submission, **query)
+        with self._rollups.deleting(raw_query):
+            submissions.delete()
+        cold_submissions = [Submission._from_son(sub) for sub in self._cold_storage.delete(raw_query)]
+        self._file_collector.delete([file_id for submission in cold_submissions
+                                     for file_id in submission.get_file_ids()])
+
+    def get_cold_storage(self):
+        """ Returns the SubmissionColdStorage holding the submissions moved to the cold tier """
+        return self._cold_storage
+
+    def get_submission_rollups(self):
+        """ Returns the SubmissionRollups counting the submissions per task, user and hour """
+        return self._rollups
+
+    def _add_to_rollups(self, submission):
+        """ Counts a new submission in the rollups """
+        try:
+            self._rollups.add_submission(submission)
+        except Exception:
+            self._logger.exception("Cannot count submission %s in the statistics", submission.id)
+
+    def get_submission_events(self):
+        """ Returns the SubmissionEventBroker notified when submissions are done, or None if push is disabled """
+        return self._submission_events
+
     def get_available_environments(self) -> Dict[str, List[str]]:
         """:return a list of available environments """
         return self._client.get_available_environments()
 
     def get_submission(self, submissionid, user_check=True):
-        """ Get a submission from the database """
-        sub = Submission.objects.get(id=submissionid)
+        """ Get a submission from the database. Submissions moved to the cold tier are read from their bundle. """
+        try:
+            sub = Submission.objects.get(id=submissionid)
+        except Submission.DoesNotExist:
+            cold_sub = self._cold_storage.get(ObjectId(submissionid)) if ObjectId.is_valid(submissionid) else None
+            if cold_sub is None:
+                raise
+            sub = Submission._from_son(cold_sub)
         if user_check and not self.user_is_submission_owner(sub):
             return None
         return sub
@@ -278,18 +332,26 @@ class WebAppSubmissionManager:
         submission = Submission(**obj)
         submission.set_input(inputdata)
         submissionid = submission.save().id
+        self._add_to_rollups(submission)
         to_remove = self._after_submission_insertion(course, task, inputdata, debug, obj, submissionid, task_dispenser)
 
-        ssh_callback = lambda host, port, user, password: self._handle_ssh_callback(submissionid, host, port, user, password)
+        # Pure MCQ tasks do not need to go through the backend queue
+        graded = self._grade_in_process(task, inputdata) if not debug else None
+        if graded is not None:
+            result, text, grade, problems, state = graded
+            self._job_done_callback(submissionid, course, task, (result, text), round(grade, 2), problems, {}, {},
+                                    state, None, "", "", task_dispenser, True)
+        else:
+            ssh_callback = lambda host, port, user, password: self._handle_ssh_callback(submissionid, host, port, user, password)
 
-        jobid = self._client.new_job(0, course, task, inputdata,
-                                     (lambda result, grade, problems, tests, custom, state, archive, stdout, stderr:
-                                      self._job_done_callback(submissionid, course, task, result, grade, problems, tests,
-                                                              custom, state, archive, stdout, stderr, task_dispenser, True)),
-                                     "Frontend - {}".format(username), debug, ssh_callback)
+            jobid = self._client.new_job(0, course, task, inputdata,
+                                         (lambda result, grade, problems, tests, custom, state, archive, stdout, stderr:
+                                          self._job_done_callback(submissionid, course, task, result, grade, problems, tests,
+                                                                  custom, state, archive, stdout, stderr, task_dispenser, True)),
+                                         "Frontend - {}".format(username), debug, ssh_callback)
 
-        # Submission may already have been modified by callback,
-        Submission.objects(id=submissionid).update(jobid=jobid)
+            # Submission may already have been modified by callback,
+            Submission.objects(id=submissionid).update(jobid=jobid)
 
         self._logger.info("New submission from %s - %s - %s/%s - %s", self._user_manager.session_username(),
                           self._user_manager.session_email(), course.get_id(), task.get_id(),
@@ -298,37 +360,43 @@ class WebAppSubmissionManager:
         return submissionid, to_remove
 
     def _delete_exceeding_submissions(self, username, course, task, task_dispenser):
-        """ Deletes exceeding submissions from the database, to keep the database relatively small """
+        """
+        Deletes exceeding submissions from the database, to keep the database relatively small. The current evaluation
+        submission and the running submissions are kept, and the remaining slots are filled with the most recent
+        submissions. Only the most recent submissions are read, using the (username, courseid, taskid, _id) index: the
+        cost does not depend on the number of submissions of the user. The GridFS files of the deleted submissions are
+        deleted in the background.
+        """
         max_submissions = task_dispenser.get_no_stored_submissions(task.get_id())
         if max_submissions <= 0:
             return []
 
-        tasks = list(Submission.objects(
-            username=username, courseid=course.get_id(), taskid=task.get_id()
-        ).only( "id", "status", "result", "grade", "submitted_on").order_by("-submitted_on"))
-
-        # List the entries to keep
-        to_keep = set([])
-
-        # Keep the current evaluation submission
-        user_task = UserTask.objects.get(courseid=course.get_id(), taskid=task.get_id(), username=username)
-        if user_task.submissionid:
-            to_keep.add(user_task.submissionid)
-
-        # Keep running submissions
-        for val in tasks:
-            if val.status == "waiting":
-                to_keep.add(val.id)
+        match_filter = {"username": username, "courseid": course.get_id(), "taskid": task.get_id()}
+        collection = Submission._get_collection()
+        recent = [sub["_id"] for sub in collection.find(match_filter, {"_id": 1}).sort("_id", -1).limit(max_submissions)]
+        if len(recent) < max_submissions:
+            return []
 
-        # Fill the remaining slots with most recent submissions
-        for val in tasks:
-            if len(to_keep) < max_submissions:
-                to_keep.add(val.id)
+        # Keep the current evaluation submission. If it is not among the most recent ones, it takes one of their slots.
+        user_task = UserTask.objects(courseid=course.get_id(), taskid=task.get_id(), username=username)\
+            .only("submissionid").first()
+        protected = user_task.submissionid if user_task else None
+        keep_recent = max_submissions if protected is None or protected in recent else max(max_submissions - 1, 1)
+
+        # Delete everything older than the kept submissions, except the evaluation and the running submissions
+        delete_filter = dict(match_filter, _id={"$lt": recent[keep_recent - 1], "$ne": protected},
+                             status={"$ne": "waiting"})
+        to_delete = list(collection.find(delete_filter, {"_id": 1, "input": 1, "archive": 1, "input_blobs": 1}))
+        if not to_delete:
+            return []
 
-        to_delete = {val.id for val in tasks}.difference(to_keep)
-        Submission.objects(id__in=to_delete).delete()
+        delete_query = {"_id": {"$in": [sub["_id"] for sub in to_delete]}}
+        with self._rollups.deleting(delete_query):
+            collection.delete_many(delete_query)
+        self._file_collector.delete([file_id for sub in to_delete
+                                     for file_id in [sub.get("input"), sub.get("archive")] + sub.get("input_blobs", [])])
 
-        return list(map(str, to_delete))
+        return [str(sub["_id"]) for sub in to_delete]
 
     def get_input_from_submission(self, submission, only_input=False):
         """
@@ -353,13 +421,29 @@ class WebAppSubmissionManager:
 
             If show_everything is True, feedback normally hidden is shown.
         """
+        stored = get_stored_feedback(submission)
+        if stored is None:
+            # Not rendered yet, or rendered before the last renderer update or replay
+            self._feedback_renderer.add_submission(submission)
+        stored_problems = stored["problems"] if stored is not None else {}
+
         if only_feedback:
             submission = {"text": submission.get("text", None), "problems": dict(submission.get("problems", {}))}
         if "text" in submission:
-            submission["text"] = ParsableText(submission["text"], "rst", show_everything).parse()
+            if stored is not None and stored["text"] is not None:
+                submission["text"] = rewrite_lti_links(stored["text"])
+            else:
+                submission["text"] = ParsableText(submission["text"], "rst", show_everything).parse()
         if "problems" in submission:
             for problem in submission["problems"]:
-                if isinstance(submission["problems"][problem], str):  # fallback for old-style submissions
+                if stored_problems.get(problem) is not None:
+                    result = submission["problems"][problem]
+                    if isinstance(result, str):  # old-style submissions
+                        result = submission["result"] if "result" in submission else 'crash'
+                    else:
+                        result = result[0]
+                    submission["problems"][problem] = (result, rewrite_lti_links(stored_problems[problem]))
+                elif isinstance(submission["problems"][problem], str):  # fallback for old-style submissions
                     submission["problems"][problem] = (
                     submission.get('result', 'crash'), ParsableText(submission["problems"][problem],"rst",
                                                                     show_everything).parse())
@@ -476,7 +560,7 @@ class WebAppSubmissionManager:
 
         return [item["submissions"][0] for item in data]
 
-    def get_submission_archive(self, course, submissions, sub_folders, archive_file=None, simplify=False):
+    def get_submission_archive_entries(self, course, submissions, sub_folders, resume_after=None):
         """
         :param course: the course object linked to the submission
         :param submissions: a list of submissions
@@ -495,7 +579,8 @@ class WebAppSubmissionManager:
             ["username", "submissionid"], the archive will contain two folders:
             - a/9083081/
             - b/9083081/
-        :return: a file-like object containing a tgz archive of all the submissions
+        :param resume_after: if not None, only submissions whose id is greater than this one are returned
+        :return: a list of tuples (submission, list of folders where it is placed), in the order of the submission ids
         """
 
         if "audience" in sub_folders:
@@ -538,76 +623,121 @@ class WebAppSubmissionManager:
                     i += 1
                 file_to_put[path] = submission
 
+        # Group the paths per submission, in the order of the submission ids, so that exports can be resumed
+        paths_per_submission = {}
+        for base_path, submission in file_to_put.items():
+            paths_per_submission.setdefault(submission.id, (submission, []))[1].append(base_path)
+        entries = sorted(paths_per_submission.items(), key=lambda entry: entry[0])
+        if resume_after is not None:
+            entries = [entry for entry in entries if entry[0] > ObjectId(resume_after)]
+        return [entry[1] for entry in entries]
+
+    def get_submission_archive(self, course, submissions, sub_folders, archive_file=None, simplify=False):
+        """
+        Builds an archive of the submissions in a file. See iter_submission_archive for the parameters.
+        :return: a tuple (file-like object containing a tgz archive of all the submissions, id of the submission that
+                 could not be added or "")
+        """
         tmpfile = archive_file if archive_file is not None else tempfile.TemporaryFile()
-        tar = tarfile.open(fileobj=tmpfile, mode='w:gz')
-        error = ""
+        errors = []
+        for chunk in self.iter_submission_archive(course, submissions, sub_folders, simplify=simplify, errors=errors):
+            tmpfile.write(chunk)
 
-        # NOTE there is a bit of redundancy here: if a submission is in multiple folder, the file will be reprocessed
-        # each time. Not sure optimizing this is necessary.
-        for base_path, submission in file_to_put.items():
-            try:
-                submission_yaml = io.BytesIO(custom_yaml.dump(submission.to_mongo().to_dict()).encode('utf-8'))
-                submission_yaml_fname = base_path + '/submission.test'
-
-                # Avoid putting two times the same submission on the same place
-                if submission_yaml_fname not in tar.getnames():
-
-                    info = tarfile.TarInfo(name=submission_yaml_fname)
-                    info.size = submission_yaml.getbuffer().nbytes
-                    info.mtime = time.mktime(submission["submitted_on"].timetuple())
-
-                    # Add file in tar archive
-                    tar.addfile(info, fileobj=submission_yaml)
-
-                    # If there is an archive, add it too
-                    if 'archive' in submission and submission['archive'] is not None and submission['archive'] != "":
-                        subfile = submission['archive']
-                        subtar = tarfile.open(fileobj=subfile, mode="r:gz")
-
-                        for member in subtar.getmembers():
-                            subtarfile = subtar.extractfile(member)
-                            member.name = base_path + "/archive/" + member.name
-                            tar.addfile(member, subtarfile)
-
-                        subtar.close()
-                        subfile.close()
-
-                    # If there files that were uploaded by the student, add them
-                    if submission['input'] is not None:
-                        for pid, problem in submission.get_input().items():
-                            if isinstance(problem, dict) and "filename" in problem:
-                                # Get the extension (match extensions with more than one dot too)
-                                DOUBLE_EXTENSIONS = ['.tar.gz', '.tar.bz2', '.tar.bz', '.tar.xz']
-                                ext = ""
-                                if not problem['filename'].endswith(tuple(DOUBLE_EXTENSIONS)):
-                                    _, ext = os.path.splitext(problem['filename'])
-                                else:
-                                    for t_ext in DOUBLE_EXTENSIONS:
-                                        if problem['filename'].endswith(t_ext):
-                                            ext = t_ext
-
-                                subfile = io.BytesIO(problem['value'])
-                                if simplify and (pid + ext) != "submission.test":
-                                    taskfname = base_path + '/' + pid + ext
-                                else:
-                                    taskfname = base_path + '/uploaded_files/' + pid + ext
-
-                                # Generate file info
-                                info = tarfile.TarInfo(name=taskfname)
-                                info.size = subfile.getbuffer().nbytes
-                                info.mtime = time.mktime(submission["submitted_on"].timetuple())
-
-                                # Add file in tar archive
-                                tar.addfile(info, fileobj=subfile)
-
-            except Exception as e:
-                error = str(submission.id)
-                break
-
-        # Close tarfile and put tempfile cursor at 0
-        tar.close()
+        # Put tempfile cursor at 0
         tmpfile.seek(0)
-        return tmpfile, error
+        return tmpfile, errors[0] if errors else ""
+
+    def iter_submission_archive(self, course, submissions, sub_folders, simplify=False, archive_format="tgz",
+                                resume_after=None, progress=None, errors=None, prefetch=8):
+        """
+        Generates an archive of the submissions, as a stream of chunks of bytes. The files of the next submissions are
+        fetched concurrently while the archive is built.
+        :param archive_format: one of inginious.frontend.submission_archive.get_archive_formats()
+        :param resume_after: if not None, only submissions whose id is greater than this one are exported. The
+            submissions are exported in the order of their ids: an interrupted export can be resumed from the id of the
+            last submission it contains.
+        :param progress: if not None, a function called with (number of submissions exported, total number) after
+            each submission
+        :param errors: if not None, a list to which the id of a submission that cannot be exported is appended. The
+            archive then ends, with an errors.txt file describing the error.
+        :param prefetch: number of submissions whose files are fetched in advance
+        See get_submission_archive_entries for the other parameters.
+        """
+        entries = self.get_submission_archive_entries(course, submissions, sub_folders, resume_after)
+        writer = create_archive_writer(archive_format)
+
+        def load_files(submission):
+            archive = None
+            if 'archive' in submission and submission['archive'] is not None and submission['archive'] != "":
+                archive = submission['archive'].read()
+            inputdata = submission.get_input() if submission['input'] is not None else {}
+            return archive, inputdata
+
+        with ThreadPoolExecutor(max_workers=max(1, min(prefetch, 4))) as executor:
+            futures = deque()
+            pending = iter(entries)
+            for submission, __ in itertools.islice(pending, prefetch):
+                futures.append(executor.submit(load_files, submission))
+
+            for done, (submission, paths) in enumerate(entries):
+                try:
+                    archive, inputdata = futures.popleft().result()
+                    for submission_next, __ in itertools.islice(pending, 1):
+                        futures.append(executor.submit(load_files, submission_next))
+
+                    for base_path in paths:
+                        self._add_submission_to_archive(writer, base_path, submission, archive, inputdata, simplify)
+                except Exception:
+                    self._logger.exception("Cannot add submission %s to the archive", submission.id)
+                    if errors is not None:
+                        errors.append(str(submission.id))
+                    writer.add_file("errors.txt", ("Submission {} could not be exported. The export can be resumed "
+                                                   "after submission {}.\n").format(
+                        submission.id, entries[done - 1][0].id if done else "-").encode("utf-8"), time.time())
+                    for future in futures:
+                        future.cancel()
+                    break
+
+                yield writer.pop()
+                if progress is not None:
+                    progress(done + 1, len(entries))
+
+        writer.close()
+        yield writer.pop()
+
+    def _add_submission_to_archive(self, writer, base_path, submission, archive, inputdata, simplify):
+        """ Adds the files of a submission to an archive, in the folder base_path """
+        mtime = time.mktime(submission["submitted_on"].timetuple())
+        content = submission.to_mongo().to_dict()
+        content.pop("feedback_html", None)  # derived from text and problems
+        writer.add_file(base_path + '/submission.test', custom_yaml.dump(content).encode('utf-8'), mtime)
+
+        # If there is an archive, add it too
+        if archive is not None:
+            with tarfile.open(fileobj=io.BytesIO(archive), mode="r:gz") as subtar:
+                for member in subtar.getmembers():
+                    subtarfile = subtar.extractfile(member)
+                    writer.add_tar_member(base_path + "/archive/" + member.name, member, subtarfile)
+
+        # If there files that were uploaded by the student, add them
+        for pid, problem in inputdata.items():
+            if isinstance(problem, dict) and "filename" in problem:
+                # Get the extension (match extensions with more than one dot too)
+                DOUBLE_EXTENSIONS = ['.tar.gz', '.tar.bz2', '.tar.bz', '.tar.xz']
+                ext = ""
+                if not problem['filename'].endswith(tuple(DOUBLE_EXTENSIONS)):
+                    _, ext = os.path.splitext(problem['filename'])
+                else:
+                    for t_ext in DOUBLE_EXTENSIONS:
+                        if problem['filename'].endswith(t_ext):
+                            ext = t_ext
+
+                if simplify and (pid + ext) != "submission.test":
+                    taskfname = base_path + '/' + pid + ext
+                else:
+                    taskfname = base_path + '/uploaded_files/' + pid + ext
+
+                writer.add_file(taskfname, problem['value'], mtime)
 
     def _handle_ssh_callback(self, submission_id, host, port, user, password):
         """ Handles the creation of a remote ssh server """
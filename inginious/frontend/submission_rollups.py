@@ -0,0 +1,196 @@
+# -*- coding: utf-8 -*-
+#
+# This file is part of INGInious. See the LICENSE and the COPYRIGHTS files for
+# more information about the licensing of this file.
+
+""" Hourly rollups of the submissions, used by the course statistics """
+
+from contextlib import contextmanager
+from datetime import timedelta, timezone
+
+import pymongo
+from pymongo import UpdateOne
+
+_HOUR = timedelta(hours=1)
+_VALID = {"$sum": {"$cond": [{"$eq": ["$result", "success"]}, 1, 0]}}
+_SUBMITTED_HOUR = {"$dateFromParts": {"year": {"$year": "$submitted_on"}, "month": {"$month": "$submitted_on"},
+                                      "day": {"$dayOfMonth": "$submitted_on"}, "hour": {"$hour": "$submitted_on"}}}
+
+# Fields of the submissions that are also stored in the rollups
+_ROLLUP_FIELDS = {"courseid", "taskid", "username"}
+
+
+def _naive_utc(date):
+    """ Returns date as a naive UTC datetime. Naive dates are already in UTC, as in the database. """
+    return date.astimezone(timezone.utc).replace(tzinfo=None) if date.tzinfo is not None else date
+
+
+def _hour(date):
+    """ Returns the start of the hour of date, as a naive UTC datetime """
+    return _naive_utc(date).replace(minute=0, second=0, microsecond=0)
+
+
+def get_bucket(submission):
+    """ Returns the (courseid, taskid, usernames, hour) rollup bucket of a submission document """
+    return submission["courseid"], submission["taskid"], tuple(submission["username"]), _hour(submission["submitted_on"])
+
+
+class SubmissionRollups:
+    """
+    Counts the submissions, and the successful ones, per task, user (or group) and hour. The rollups follow the
+    submissions collection: new submissions are counted when they are created, successful results when they are
+    written, and the buckets of replayed or deleted submissions are recomputed from the submissions.
+
+    Several documents may exist for the same bucket, when concurrent processes create it: the counts are summed.
+    """
+
+    def __init__(self, database, collection_name="submission_rollups"):
+        self._collection = database[collection_name]
+        self._submissions = database["submissions"]
+
+    def ensure_indexes(self):
+        """ Creates the indexes of the rollups collection """
+        self._collection.create_index([("courseid", pymongo.ASCENDING), ("hour", pymongo.ASCENDING)])
+        self._collection.create_index([("username", pymongo.ASCENDING)])
+
+    def _bucket_filter(self, bucket):
+        courseid, taskid, usernames, hour = bucket
+        return {"courseid": courseid, "taskid": taskid, "username": list(usernames), "hour": hour}
+
+    def add_submission(self, submission):
+        """ Counts a new submission document """
+        self._collection.update_one(self._bucket_filter(get_bucket(submission)),
+                                    {"$inc": {"submissions": 1, "valid": 0}}, upsert=True)
+
+    def add_results(self, submissions):
+        """ Counts the successful results of new submission documents, already counted by add_submission """
+        updates = [UpdateOne(self._bucket_filter(get_bucket(submission)), {"$inc": {"submissions": 0, "valid": 1}},
+                             upsert=True)
+                   for submission in submissions if submission["result"] == "success"]
+        if updates:
+            self._collection.bulk_write(updates, ordered=False)
+
+    def get_buckets(self, query):
+        """ Returns the buckets of the submissions matching query, a MongoDB query on the submissions """
+        return {get_bucket(submission) for submission in
+                self._submissions.find(query, {"courseid": 1, "taskid": 1, "username": 1, "submitted_on": 1})}
+
+    def refresh(self, buckets):
+        """ Recomputes the given buckets from the submissions collection """
+        for bucket in buckets:
+            courseid, taskid, usernames, hour = bucket
+            counts = list(self._submissions.aggregate([
+                {"$match": {"courseid": courseid, "taskid": taskid, "username": list(usernames),
+                            "submitted_on": {"$gte": hour, "$lt": hour + _HOUR}}},
+                {"$group": {"_id": None, "submissions": {"$sum": 1}, "valid": _VALID}}
+            ]))
+            self._collection.delete_many(self._bucket_filter(bucket))
+            if counts:
+                self._collection.insert_one(dict(self._bucket_filter(bucket), submissions=counts[0]["submissions"],
+                                                 valid=counts[0]["valid"]))
+
+    @contextmanager
+    def deleting(self, query):
+        """
+        Updates the rollups around the deletion of the submissions matching query, a MongoDB query on the submissions:
+
+            with rollups.deleting(query):
+                submissions.delete_many(query)
+        """
+        if set(query) <= _ROLLUP_FIELDS:
+            # Whole courses, tasks or users: their buckets only contain the deleted submissions
+            yield
+            self._collection.delete_many(query)
+        else:
+            buckets = self.get_buckets(query)
+            yield
+            self.refresh(buckets)
+
+    def rename_course(self, courseid, new_courseid):
+        """ Moves the rollups of a course to another course id """
+        self._collection.update_many({"courseid": courseid}, {"$set": {"courseid": new_courseid}})
+
+    def rebuild(self, courseid=None):
+        """ Recomputes all the rollups, or the ones of a course, from the submissions collection """
+        query = {"courseid": courseid} if courseid is not None else {}
+        self._collection.delete_many(query)
+        rollups = self._submissions.aggregate([
+            {"$match": query},
+            {"$group": {"_id": {"courseid": "$courseid", "taskid": "$taskid", "username": "$username",
+                                "hour": _SUBMITTED_HOUR},
+                        "submissions": {"$sum": 1}, "valid": _VALID}}
+        ], allowDiskUse=True)
+
+        count = 0
+        batch = []
+        for rollup in rollups:
+            batch.append(dict(rollup.pop("_id"), **rollup))
+            if len(batch) == 1000:
+                self._collection.insert_many(batch)
+                count += len(batch)
+                batch = []
+        if batch:
+            self._collection.insert_many(batch)
+            count += len(batch)
+        return count
+
+    def count(self, query, by):
+        """
+        Counts the submissions matching query, a MongoDB query on the submissions.
+        :param by: "taskid", "username" or "hour", the field the submissions are grouped by. Submissions of groups are
+                   counted for each of their users, and hours are naive UTC datetimes.
+        :return: a dict {value: [submissions, valid submissions]}, or None if the rollups cannot answer the query. The
+                 parts of the date range that do not cover whole hours are counted on the submissions.
+        """
+        if not set(query) <= _ROLLUP_FIELDS | {"submitted_on"}:
+            return None
+        rollup_query = {field: query[field] for field in _ROLLUP_FIELDS if field in query}
+        fringes = []
+
+        date_range = query.get("submitted_on", {})
+        if not isinstance(date_range, dict) or not set(date_range) <= {"$gte", "$gt", "$lte", "$lt"}:
+            return None
+        lower = [(op, date_range[op]) for op in ("$gte", "$gt") if op in date_range]
+        upper = [(op, date_range[op]) for op in ("$lte", "$lt") if op in date_range]
+        if len(lower) > 1 or len(upper) > 1:
+            return None
+
+        hours = {}
+        if lower:
+            op, start = lower[0]
+            first_hour = _hour(start)
+            if op == "$gt" or _naive_utc(start) != first_hour:
+                first_hour += _HOUR
+                fringes.append({op: start, "$lt": first_hour})
+            hours["$gte"] = first_hour
+        if upper:
+            op, end = upper[0]
+            last_hour = _hour(end)
+            if op == "$lte" or _naive_utc(end) != last_hour:
+                fringes.append({"$gte": last_hour, op: end})
+            hours["$lt"] = last_hour
+        if "$gte" in hours and "$lt" in hours and hours["$gte"] >= hours["$lt"]:
+            return None  # less than an hour
+        if hours:
+            rollup_query["hour"] = hours
+
+        result = {}
+        normalize = _naive_utc if by == "hour" else (lambda value: value)
+        pipeline = [{"$unwind": "$username"}] if by == "username" else []
+        key = "$" + by
+        for rollup in self._collection.aggregate([{"$match": rollup_query}] + pipeline + [
+                {"$group": {"_id": key, "submissions": {"$sum": "$submissions"}, "valid": {"$sum": "$valid"}}}]):
+            counts = result.setdefault(normalize(rollup["_id"]), [0, 0])
+            counts[0] += rollup["submissions"]
+            counts[1] += rollup["valid"]
+
+        if by == "hour":
+            key = _SUBMITTED_HOUR
+        for fringe in fringes:
+            for entry in self._submissions.aggregate([{"$match": dict(query, submitted_on=fringe)}] + pipeline + [
+                    {"$group": {"_id": key, "submissions": {"$sum": 1}, "valid": _VALID}}]):
+                counts = result.setdefault(normalize(entry["_id"]), [0, 0])
+                counts[0] += entry["submissions"]
+                counts[1] += entry["valid"]
+        return result
+
@@ -0,0 +1,320 @@
+# -*- coding: utf-8 -*-
+#
+# This file is part of INGInious. See the LICENSE and the COPYRIGHTS files for
+# more information about the licensing of this file.
+
+""" Write-behind stage for the results of finished jobs """
+
+import logging
+import queue
+import threading
+import time
+
+from collections import namedtuple
+from datetime import datetime, timedelta, timezone
+from pymongo import UpdateOne, ReturnDocument
+from pymongo.errors import DocumentTooLarge, BulkWriteError, WriteError
+
+from inginious.frontend.plugins import plugin_manager
+from inginious.frontend.submission_files import put_blob, release_blobs
+from inginious.frontend.submission_rollups import get_bucket
+from inginious.frontend.models import Submission, UserTask
+from inginious.frontend.models.user_task import count_submission_update, counted_submissions_filter
+
+JobResult = namedtuple("JobResult", ["submissionid", "course", "task", "result", "grade", "problems", "tests", "custom",
+                                     "state", "archive", "stdout", "stderr", "task_dispenser", "newsub"])
+
+_unset_fields = {"jobid": "", "ssh_host": "", "ssh_port": "", "ssh_user": "", "ssh_password": ""}
+_stats_fields = {"stats_pending": "", "stats_newsub": "", "stats_claimed_on": ""}
+
+
+class SubmissionResultWriter(threading.Thread):
+    """
+    Writes the results of finished jobs in the database. Results queued within ``batch_delay`` seconds of each other
+    are written together: one bulk write on the submissions, one on the user tasks, then the ``submission_done`` hooks
+    are called in the order the results were received.
+
+    Submissions are marked with ``stats_pending`` (and ``stats_newsub``) until the user tasks are updated. Submissions
+    still marked when the writer starts (the webapp stopped in between, or the update of their user tasks failed) have
+    their user tasks updated again. The updates of the user tasks are idempotent: a submission is counted once in the
+    tries of a user, even if its user tasks are updated several times.
+    """
+
+    # Submissions claimed for recovery for longer than this are claimed again, their recovery was interrupted
+    _CLAIM_TIMEOUT = timedelta(minutes=10)
+
+    def __init__(self, user_manager, lti_score_publishers, submission_events=None, batch_delay=0.005, max_batch_size=256,
+                 feedback_renderer=None, rollups=None):
+        """
+        :param submission_events: a SubmissionEventBroker notified when the results are written, or None
+        :param feedback_renderer: a FeedbackRenderer rendering the feedback of the written results, or None
+        :param rollups: the SubmissionRollups counting the written results, or None
+        """
+        super(SubmissionResultWriter, self).__init__()
+        self.daemon = True
+        self._logger = logging.getLogger("inginious.webapp.submissions")
+        self._queue = queue.Queue()
+        self._user_manager = user_manager
+        self._lti_score_publishers = lti_score_publishers
+        self._submission_events = submission_events
+        self._feedback_renderer = feedback_renderer
+        self._rollups = rollups
+        self._batch_delay = batch_delay
+        self._max_batch_size = max_batch_size
+        self.start()
+
+    def add(self, submissionid, course, task, result, grade, problems, tests, custom, state, archive, stdout, stderr,
+            task_dispenser, newsub):
+        """ Queues the result of a finished job. See WebAppSubmissionManager._job_done_callback """
+        self._queue.put(JobResult(submissionid, course, task, result, grade, problems, tests, custom, state, archive,
+                                  stdout, stderr, task_dispenser, newsub))
+
+    def stop(self):
+        """ Stops the writer once the results already queued are written """
+        self._queue.put(None)
+
+    def run(self):
+        try:
+            self._recover()
+        except Exception:
+            self._logger.exception("Cannot recover the submissions with pending user stats")
+
+        stopped = False
+        while not stopped:
+            jobs = [self._queue.get()]
+            deadline = time.monotonic() + self._batch_delay
+            while jobs[-1] is not None and len(jobs) < self._max_batch_size:
+                try:
+                    jobs.append(self._queue.get(timeout=max(0.0, deadline - time.monotonic())))
+                except queue.Empty:
+                    break
+
+            if jobs[-1] is None:
+                stopped = True
+                jobs.pop()
+
+            if jobs:
+                try:
+                    self._write(jobs)
+                except Exception:
+                    self._logger.exception("Cannot write the results of %d jobs", len(jobs))
+
+    def _recover(self):
+        """
+        Recomputes the user tasks of submissions whose results were written but not their user stats. Each submission
+        is claimed before being recovered, so that the writers of several webapps do not recover the same ones.
+        """
+        from inginious.frontend.courses import Course
+
+        collection = Submission._get_collection()
+        started_on = datetime.now(tz=timezone.utc)
+        while True:
+            document = collection.find_one_and_update(
+                {"stats_pending": True, "$or": [{"stats_claimed_on": {"$exists": False}},
+                                                {"stats_claimed_on": {"$lt": started_on - self._CLAIM_TIMEOUT}}]},
+                {"$set": {"stats_claimed_on": datetime.now(tz=timezone.utc)}}, return_document=ReturnDocument.AFTER)
+            if document is None:
+                break
+
+            submission = Submission._from_son(document)
+            try:
+                course = Course.get(submission.courseid)
+                task = course.get_task(submission.taskid)
+                for username in submission.username:
+                    self._user_manager.update_user_stats(username, course, task, submission, submission.result,
+                                                         submission.grade, submission.state,
+                                                         bool(submission.stats_newsub), course.get_task_dispenser())
+            except Exception:
+                self._logger.exception("Cannot recover the user stats of submission %s", submission.id)
+            collection.update_one({"_id": submission.id}, {"$unset": _stats_fields})
+
+    def _write(self, jobs):
+        """ Writes a batch of results """
+        collection = Submission._get_collection()
+
+        # Archives must be stored before the submissions referencing them
+        archives = {}
+        for job in jobs:
+            if job.archive:
+                archives[job.submissionid] = put_blob(Submission._get_db(), job.archive)
+
+        updates = [self._submission_update(job, archives.get(job.submissionid)) for job in jobs]
+        failed = set()
+        try:
+            collection.bulk_write([UpdateOne(*update) for update in updates], ordered=False)
+        except DocumentTooLarge:
+            failed = set(range(len(jobs)))
+        except BulkWriteError as e:
+            failed = {error["index"] for error in e.details.get("writeErrors", [])}
+
+        # Retry the failing updates one by one, to find and flag the ones that are too large
+        too_large = set()
+        for index in sorted(failed):
+            try:
+                collection.update_one(*updates[index])
+            except (DocumentTooLarge, WriteError):
+                too_large.add(jobs[index].submissionid)
+                collection.update_one({"_id": jobs[index].submissionid}, {
+                    "$set": {"status": "error", "grade": 0.0,
+                             "text": _("Maximum submission size exceeded. Check feedback, stdout, stderr and state.")},
+                    "$unset": _unset_fields
+                })
+
+        submissions = {sub.id: sub for sub in Submission.objects(id__in=[job.submissionid for job in jobs])}
+
+        # Release the archives that are not referenced, as their submission was deleted meanwhile or was too large
+        unreferenced = [archive_id for submissionid, archive_id in archives.items()
+                        if submissionid not in submissions or submissions[submissionid].archive.grid_id != archive_id]
+        if unreferenced:
+            release_blobs(Submission._get_db(), unreferenced)
+
+        stats_jobs = [job for job in jobs if job.submissionid in submissions and job.submissionid not in too_large]
+
+        if self._feedback_renderer is not None:
+            for job in stats_jobs:
+                self._feedback_renderer.add(job.submissionid, job.result[1], job.problems)
+
+        # New submissions are already counted in the rollups, replays may change the number of successful submissions
+        if self._rollups is not None:
+            try:
+                written = [job for job in jobs if job.submissionid in submissions]
+                self._rollups.add_results([submissions[job.submissionid] for job in written if job.newsub])
+                self._rollups.refresh({get_bucket(submissions[job.submissionid]) for job in written if not job.newsub})
+            except Exception:
+                self._logger.exception("Cannot update the submission rollups")
+
+        # Update user stats. New submissions are handled in one ordered bulk write, replays need to look for the
+        # default submission of the user and are handled one by one. Jobs whose user tasks cannot be updated keep
+        # their stats_pending flag and are recovered when the writer restarts.
+        stats_failed = self._write_user_tasks([job for job in stats_jobs if job.newsub], submissions)
+
+        for job in stats_jobs:
+            if not job.newsub:
+                submission = submissions[job.submissionid]
+                try:
+                    for username in submission.username:
+                        self._user_manager.update_user_stats(username, job.course, job.task, submission, job.result[0],
+                                                             job.grade, job.state, False, job.task_dispenser)
+                except Exception:
+                    self._logger.exception("Cannot update the user stats of submission %s", job.submissionid)
+                    stats_failed.add(job.submissionid)
+
+        stats_done = [job.submissionid for job in stats_jobs if job.submissionid not in stats_failed]
+        if stats_done:
+            try:
+                collection.update_many({"_id": {"$in": stats_done}}, {"$unset": _stats_fields})
+            except Exception:
+                self._logger.exception("Cannot clear the pending user stats of %d submissions", len(stats_done))
+
+        # Browsers waiting for these submissions can now fetch their results
+        if self._submission_events is not None:
+            try:
+                self._submission_events.publish([job.submissionid for job in jobs if job.submissionid in submissions])
+            except Exception:
+                self._logger.exception("Cannot publish the submission events")
+
+        for job in jobs:
+            submission = submissions.get(job.submissionid)
+            if submission is None:  # deleted in the meantime
+                continue
+            try:
+                plugin_manager.call_hook("submission_done", submission=submission, archive=job.archive, newsub=job.newsub)
+            except Exception:
+                self._logger.exception("Exception in the submission_done hook of submission %s", job.submissionid)
+
+            if "lti_version" in submission:
+                lti_score_publisher = self._lti_score_publishers.get(submission["lti_version"], None)
+                if lti_score_publisher:
+                    lti_score_publisher.add(submission)
+
+    def _write_user_tasks(self, jobs, submissions):
+        """ Updates the user tasks and the course progress for the results of new submissions. Returns the ids of the
+            submissions whose user tasks could not be updated. """
+        operations = []
+        ranges = []
+        for job in jobs:
+            start = len(operations)
+            for username in submissions[job.submissionid].username:
+                operations += self._user_task_updates(username, job, submissions[job.submissionid])
+            ranges.append((start, len(operations)))
+        if not operations:
+            return set()
+
+        # The operations of a job must be applied in order, but the failure of a job must not prevent the others
+        # from being applied. After an error in the batch, the jobs written before it are done, and the others are
+        # retried one by one: the job that failed may be partially written, but its operations can be applied again.
+        failed = set()
+        retry = []
+        collection = UserTask._get_collection()
+        try:
+            collection.bulk_write(operations, ordered=True)
+        except BulkWriteError as e:
+            error_index = min(error["index"] for error in e.details.get("writeErrors") or [{"index": 0}])
+            self._logger.exception("Cannot write the user tasks of %d jobs, retrying one by one", len(jobs))
+            retry = [(job, operations[start:end]) for job, (start, end) in zip(jobs, ranges) if end > error_index]
+        except Exception:
+            self._logger.exception("Cannot write the user tasks of %d jobs", len(jobs))
+            failed = {job.submissionid for job in jobs}
+
+        for job, job_operations in retry:
+            try:
+                collection.bulk_write(job_operations, ordered=True)
+            except Exception:
+                self._logger.exception("Cannot write the user tasks of submission %s", job.submissionid)
+                failed.add(job.submissionid)
+
+        # Update the materialized course progress of the users, course by course
+        users_per_course = {}
+        for job in jobs:
+            if job.submissionid not in failed:
+                course_users = users_per_course.setdefault(job.course.get_id(), (job.course, set()))[1]
+                course_users.update(submissions[job.submissionid].username)
+        for course, usernames in users_per_course.values():
+            try:
+                self._user_manager.refresh_course_progress(course, list(usernames))
+            except Exception:
+                self._logger.exception("Cannot refresh the course progress of course %s", course.get_id())
+        return failed
+
+    def _submission_update(self, job, archive_id):
+        """ Returns the filter and the update of the submission document for the given result """
+        update_set = {
+            "status": ("done" if job.result[0] == "success" or job.result[0] == "failed" else "error"),
+            # error only if error was made by INGInious
+            "result": job.result[0],
+            "grade": float(job.grade),
+            "text": job.result[1],
+            "tests": job.tests,
+            "problems": job.problems,
+            "custom": job.custom,
+            "state": job.state,
+            "stdout": job.stdout,
+            "stderr": job.stderr,
+            "stats_pending": True,
+            "stats_newsub": job.newsub
+        }
+        if archive_id is not None:
+            update_set["archive"] = archive_id
+        return {"_id": job.submissionid}, {"$set": update_set, "$unset": _unset_fields}
+
+    def _user_task_updates(self, username, job, submission):
+        """ Returns the updates of the user task of username for a new submission. Equivalent to
+            UserManager.user_saw_task followed by UserManager.update_user_stats. """
+        match_filter = {"username": username, "courseid": submission.courseid, "taskid": submission.taskid}
+        updates = [
+            UpdateOne(match_filter, {"$setOnInsert": {"tried": 0, "succeeded": False, "grade": 0.0, "submissionid": None,
+                                                      "state": ""}}, upsert=True),
+            # Applied once per submission, so that the updates can be written again after a failure
+            UpdateOne(dict(match_filter, **counted_submissions_filter(submission.id)),
+                      count_submission_update(submission.id))
+        ]
+
+        # Update if the submission should be the default one
+        eval_mode = job.task_dispenser.get_evaluation_mode(job.task.get_id())
+        update_set = {"$set": {"succeeded": job.result[0] == "success", "grade": float(job.grade),
+                               "state": job.state, "submissionid": submission.id}}
+        if eval_mode == "last":
+            updates.append(UpdateOne(match_filter, update_set))
+        elif eval_mode == "best":
+            updates.append(UpdateOne(dict(match_filter, grade={"$lte": float(job.grade)}), update_set))
+        return updates
@@ -52,6 +52,11 @@ class DisplayableProblem(Problem, metaclass=ABCMeta):
         """ get the html for this problem """
         pass
 
+    def get_rst_texts(self, language):
+        """ Returns the reStructuredText strings displayed by show_input, to render them in advance """
+        header = getattr(self, "_header", "")
+        return [self.gettext(language, header)] if header else []
+
     @classmethod
     @abstractmethod
     def show_editbox(cls, key, language):
@@ -209,6 +214,10 @@ class DisplayableMultipleChoiceProblem(MultipleChoiceProblem, DisplayableProblem
             func=lambda text: ParsableText(self.gettext(language, text) if text else "", "rst")
         )
 
+    def get_rst_texts(self, language):
+        texts = super(DisplayableMultipleChoiceProblem, self).get_rst_texts(language)
+        return texts + [self.gettext(language, choice["text"]) for choice in self._choices if choice["text"]]
+
     @classmethod
     def show_editbox(cls, key, language):
         return render_template("course_admin/subproblems/multiple_choice.html", key=key)
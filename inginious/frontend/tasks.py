@@ -11,8 +11,11 @@ import logging
 
 from typing import Any
 
-from inginious.common.base import id_checker, get_json_or_yaml, loads_json_or_yaml
-from inginious.common.filesystems import FileSystemProvider, fetch_or_cache, invalidate_cache, get_fs_provider
+from inginious.common.base import id_checker, get_json_or_yaml
+from inginious.common.filesystems import FileSystemProvider, fetch_descriptor, descriptor_saved, \
+    invalidate_cache, get_fs_provider
+from inginious.frontend.course_registry import get_course_registry, invalidate_course_registry, \
+    fetch_unless_registered
 from inginious.common.tasks_problems import get_problem_types
 from inginious.frontend.environment_types import get_env_type
 from inginious.frontend.parsable_text import ParsableText
@@ -24,7 +27,7 @@ from inginious.common.exceptions import InvalidNameException, TaskNotFoundExcept
 def _load_task(task_fs : FileSystemProvider, courseid : str, taskid : str):
     # Try to open the task file
     try:
-        task_content = loads_json_or_yaml("task.yaml", task_fs.get("task.yaml"))
+        task_content = fetch_descriptor(task_fs, "task.yaml")
     except Exception as e:
         raise TaskUnreadableException(str(e))
 
@@ -57,6 +60,7 @@ class Task(object):
 
         content = _migrate_from_v_0_6(content)
 
+        self._courseid = courseid
         self._taskid = taskid
         self._data = content
 
@@ -175,6 +179,14 @@ class Task(object):
         vals = plugin_manager.call_hook('task_context', task=self, default=context)
         return ParsableText(vals[0], "rst") if len(vals) else ParsableText(context, "rst")
 
+    def prerender(self):
+        """ Renders the context and the problem texts of the task in all its languages, to fill the render cache """
+        for language in ["en"] + [language for language in self._translations if language != "en"]:
+            self.get_context(language).parse()
+            for problem in self._problems:
+                for text in problem.get_rst_texts(language):
+                    ParsableText(text, "rst").parse()
+
     def get_authors(self, language):
         """ Return the list of this task's authors """
         return self.gettext(language, self._author) if self._author else ""
@@ -209,6 +221,14 @@ class Task(object):
     def save(self):
         """ Saves the Task into the filesystem """
         self._task_fs.put("task.yaml", get_json_or_yaml("task.yaml", self._data))
+        descriptor_saved(self._task_fs, "task.yaml")
+        invalidate_course_registry(self._task_fs, "task.yaml")
+        try:
+            # Reload the task with its translations
+            Task.get(self._courseid, self._taskid).prerender()
+        except Exception:
+            logging.getLogger("inginious.task").warning("Cannot render the texts of task %s in advance",
+                                                        self._task_fs.prefix, exc_info=True)
         if self._new_doc:
             logging.getLogger("inginious.task").info("Task %s created in the factory.", self._task_fs.prefix)
 
@@ -218,12 +238,19 @@ class Task(object):
         if not id_checker(courseid) or not id_checker(taskid):
             raise InvalidNameException(f"Task with invalid name: {courseid}/{taskid}")
 
+        registry = get_course_registry()
+        if registry is not None:
+            task = registry.get(("task", courseid, taskid))
+            if task is not None:
+                return task
+            generation = registry.generation
+
         course_fs = get_fs_provider().from_subfolder(courseid)
         task_fs = course_fs.from_subfolder(taskid)
         if not task_fs.exists("task.yaml"):
             raise TaskNotFoundException()
 
-        task = fetch_or_cache(task_fs, "task.yaml", lambda: _load_task(task_fs, courseid, taskid))
+        task = fetch_unless_registered(task_fs, "task.yaml", lambda: _load_task(task_fs, courseid, taskid))
 
         translations = {}
         i18n_paths = [
@@ -238,14 +265,19 @@ class Task(object):
                 for f in i18n_fs.list(folders=False, files=True, recursive=False):
                     lang, ext = os.path.splitext(f)
                     if ext == ".mo":
-                        translations[lang] = fetch_or_cache(i18n_fs, f, lambda: gettext.GNUTranslations(i18n_fs.get_fd(f)))
+                        translations[lang] = fetch_unless_registered(
+                            i18n_fs, f, lambda: gettext.GNUTranslations(i18n_fs.get_fd(f)))
                 break
 
         task.set_translations(translations)
+        if registry is not None:
+            registry.put(("task", courseid, taskid), task,
+                         [task_fs.prefix + "task.yaml"] + [i18n_fs.prefix for i18n_fs in i18n_paths], generation)
         return task
 
     def delete(self):
         """ Erase the content of the task folder """
         invalidate_cache(self._task_fs)
         self._task_fs.delete()
+        invalidate_course_registry(self._task_fs)
         logging.getLogger("inginious.task").info("Task %s erased from the factory.", self._task_fs.prefix)
\ No newline at end of file
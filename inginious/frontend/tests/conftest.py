@@ -0,0 +1,150 @@
+# -*- coding: utf-8 -*-
+#
+# This file is part of INGInious. See the LICENSE and the COPYRIGHTS files for
+# more information about the licensing of this file.
+
+"""
+Fixtures of the webapp tests.
+
+The tests using the ``database`` fixture run against the MongoDB server given by the INGINIOUS_TEST_MONGO_HOST
+environment variable (localhost by default, as started by the CI), in the INGInious_tests database that is emptied
+after each test. They are skipped if the server cannot be reached. With INGINIOUS_TEST_MONGO_HOST=mongomock://localhost
+they run against mongomock instead, except the ones that need the behaviour of a real server, using the
+``mongodb_server`` fixture, such as the ones counting the queries.
+"""
+
+import os
+
+import pytest
+from mongoengine import connect, disconnect
+from mongoengine.connection import get_db
+from pymongo import MongoClient
+from pymongo.errors import PyMongoError
+
+from inginious.frontend.accessible_time import AccessibleTime
+from inginious.frontend.models import UserTask
+from inginious.frontend.tests import query_counter
+
+
+@pytest.fixture(scope="session")
+def _mongo_server():
+    """ Connects mongoengine to the test database. Returns True if it is a real MongoDB server. """
+    host = os.environ.get("INGINIOUS_TEST_MONGO_HOST", "localhost")
+    query_counter.install()  # before the client is created, see query_counter
+    real = not host.startswith("mongomock://")
+    if real:
+        try:
+            MongoClient(host, serverSelectionTimeoutMS=1000).admin.command("ping")
+        except PyMongoError as e:
+            pytest.skip("MongoDB cannot be reached: {}".format(e))
+        connect("INGInious_tests", host=host, tz_aware=True)
+    else:
+        mongomock = pytest.importorskip("mongomock")
+        connect("INGInious_tests", host=host.replace("mongomock://", "mongodb://"), tz_aware=True,
+                mongo_client_class=mongomock.MongoClient)
+    yield real
+    get_db().client.drop_database("INGInious_tests")
+    disconnect()
+
+
+@pytest.fixture()
+def database(_mongo_server):
+    """ The test database, emptied after the test. The collections are kept, with their indexes. """
+    db = get_db()
+    yield db
+    for name in db.list_collection_names():
+        db[name].delete_many({})
+
+
+@pytest.fixture()
+def mongodb_server(database, _mongo_server):
+    """ The test database, skipping the test if it is not on a real MongoDB server """
+    if not _mongo_server:
+        pytest.skip("needs a MongoDB server")
+    return database
+
+
+@pytest.fixture()
+def assert_max_queries(mongodb_server):
+    """ query_counter.assert_max_queries, to count the queries sent to the MongoDB server """
+    return query_counter.assert_max_queries
+
+
+class FakeTaskDispenser(object):
+    """ A task dispenser giving all the tasks of a FakeCourse to the users, with the same weight """
+
+    def __init__(self, course):
+        self._course = course
+
+    def get_user_task_list(self, usernames):
+        return {username: list(self._course.tasks) for username in usernames}
+
+    def get_course_grades(self, user_tasks, usernames):
+        grades = {username: 0.0 for username in usernames}
+        for user_task in user_tasks:
+            grades[user_task.username] += user_task.grade / len(self._course.tasks)
+        return grades
+
+    def get_accessibilities(self, taskids, usernames):
+        return {username: {taskid: self._course.accessibilities.get(taskid, AccessibleTime(True))
+                           for taskid in taskids} for username in usernames}
+
+    def get_evaluation_mode(self, taskid):
+        return "best"
+
+    def get_no_stored_submissions(self, taskid):
+        return self._course.no_stored_submissions
+
+
+class FakeTask(object):
+    def __init__(self, taskid):
+        self._id = taskid
+
+    def get_id(self):
+        return self._id
+
+
+class FakeCourse(object):
+    """ A course "test" whose tasks, descriptor, task accessibilities and number of stored submissions can be changed
+    by the tests """
+
+    def __init__(self):
+        self.tasks = ["task1", "task2"]
+        self.descriptor = {"task_dispenser": "toc", "dispenser_data": {}}
+        self.accessibilities = {}
+        self.no_stored_submissions = 0
+
+    def get_id(self):
+        return "test"
+
+    def get_staff(self):
+        return []
+
+    def get_readable_tasks(self):
+        return list(self.tasks)
+
+    def get_tasks(self):
+        return {taskid: FakeTask(taskid) for taskid in self.tasks}
+
+    def get_task(self, taskid):
+        return FakeTask(taskid)
+
+    def get_descriptor(self):
+        return self.descriptor
+
+    def get_task_dispenser(self):
+        return FakeTaskDispenser(self)
+
+
+@pytest.fixture()
+def course():
+    return FakeCourse()
+
+
+@pytest.fixture()
+def add_user_task(database):
+    """ Returns a function saving the user task of a user in the course "test" """
+    def add(username, taskid, grade, tried=1):
+        return UserTask(username=username, courseid="test", taskid=taskid, tried=tried, succeeded=grade == 100.0,
+                        grade=grade).save()
+    return add
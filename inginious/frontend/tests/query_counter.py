@@ -0,0 +1,81 @@
+# -*- coding: utf-8 -*-
+#
+# This file is part of INGInious. See the LICENSE and the COPYRIGHTS files for
+# more information about the licensing of this file.
+
+"""
+Counts the MongoDB commands sent by a block of code, to check that a page does not run more queries than expected.
+
+install() must be called before the connection to the database is opened (pymongo only notifies the listeners that
+were registered when a client is created), which is done by the conftest. Tests get assert_max_queries from the
+``assert_max_queries`` fixture, that needs a MongoDB server::
+
+    def test_queries(assert_max_queries):
+        with assert_max_queries(3):
+            user_manager.course_is_user_registered(course, "test")
+"""
+
+import threading
+from contextlib import contextmanager
+
+from pymongo import monitoring
+
+# Commands that are not queries of the application
+_ignored_commands = {"hello", "ismaster", "isMaster", "ping", "endSessions", "saslStart", "saslContinue"}
+
+
+class QueryCounter(monitoring.CommandListener):
+    """ Records the commands started by the current thread while counting is enabled """
+
+    def __init__(self):
+        self._local = threading.local()
+
+    @property
+    def commands(self):
+        """ The list of (command name, database name) recorded by the current thread, or None if not counting """
+        return getattr(self._local, "commands", None)
+
+    def start_counting(self):
+        self._local.commands = []
+
+    def stop_counting(self):
+        commands = self.commands or []
+        self._local.commands = None
+        return commands
+
+    def started(self, event):
+        commands = self.commands
+        if commands is not None and event.command_name not in _ignored_commands:
+            commands.append((event.command_name, event.database_name))
+
+    def succeeded(self, event):
+        pass
+
+    def failed(self, event):
+        pass
+
+
+_counter = None
+
+
+def install():
+    """ Registers the query counter for the clients created afterwards. Can be called several times. """
+    global _counter
+    if _counter is None:
+        _counter = QueryCounter()
+        monitoring.register(_counter)
+    return _counter
+
+
+@contextmanager
+def assert_max_queries(maximum):
+    """ Fails with an AssertionError if the block sends more than maximum commands to the database """
+    counter = install()
+    counter.start_counting()
+    try:
+        yield counter
+    finally:
+        commands = counter.stop_counting()
+    if len(commands) > maximum:
+        raise AssertionError("{} queries were run, {} expected at most: {}".format(
+            len(commands), maximum, ", ".join(name for name, __ in commands)))
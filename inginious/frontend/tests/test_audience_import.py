@@ -0,0 +1,96 @@
+# -*- coding: utf-8 -*-
+#
+# This file is part of INGInious. See the LICENSE and the COPYRIGHTS files for
+# more information about the licensing of this file.
+
+from datetime import datetime, timezone
+
+import pytest
+
+from inginious.frontend.audience_import import import_audiences, AudienceImporter
+from inginious.frontend.models import Audience, AudienceImport, CourseClass, User
+
+
+class TestAudienceImport(object):
+    @pytest.fixture(autouse=True)
+    def setup(self, database):
+        for name in ["alice", "bob", "carol", "tutor"]:
+            User(username=name, realname=name.title(), email=name + "@example.com").save()
+        self.kept_id = Audience(courseid="test", description="Group A", students=["alice"], tutors=[]).save().id
+        self.unchanged_id = Audience(courseid="test", description="Group B", students=["carol"], tutors=[]).save().id
+        self.removed_id = Audience(courseid="test", description="Old group", students=["bob"], tutors=[]).save().id
+        Audience(courseid="other", description="Group A", students=["bob"], tutors=[]).save()
+        CourseClass(id="test", students=["carol"]).save()
+
+    def get_audiences(self, courseid="test"):
+        return {audience.description: audience for audience in Audience.objects(courseid=courseid)}
+
+    def get_students(self):
+        return CourseClass.objects.get(id="test").students
+
+    def test_format_error(self):
+        assert import_audiences("test", [["alice", "username", "student", "Group A"], ["bob", "username"]]) == \
+               [[2, "format", ""]]
+        assert sorted(self.get_audiences()) == ["Group A", "Group B", "Old group"]
+        assert self.get_audiences()["Group A"].students == ["alice"]
+
+    def test_line_errors(self):
+        errors = import_audiences("test", [["alice", "username", "student", "Group A"],
+                                           ["bob", "phone", "student", "Group A"],
+                                           ["bob", "username", "teacher", "Group A"],
+                                           ["nobody", "username", "student", "Group A"],
+                                           ["bob@example.com", "email", "student", "Group A"]])
+        assert errors == [[2, "field", "phone"], [3, "role", "teacher"], [4, "user", "nobody"]]
+        assert self.get_audiences()["Group A"].students == ["alice", "bob"]
+
+    def test_diff(self):
+        assert import_audiences("test", [[" alice ", "username", "student", "Group A"],
+                                         ["bob", "username", "student", "Group A"],
+                                         ["carol", "username", "student", "Group B"],
+                                         ["tutor@example.com", "email", "tutor", "Group C"]]) == []
+
+        # Audiences of the file keep their id, the others are deleted
+        audiences = self.get_audiences()
+        assert sorted(audiences) == ["Group A", "Group B", "Group C"]
+        assert audiences["Group A"].id == self.kept_id and audiences["Group A"].students == ["alice", "bob"]
+        assert audiences["Group B"].id == self.unchanged_id and audiences["Group B"].students == ["carol"]
+        assert audiences["Group C"].students == [] and audiences["Group C"].tutors == ["tutor"]
+        assert Audience.objects(id=self.removed_id).first() is None
+        assert self.get_audiences("other")["Group A"].students == ["bob"]
+
+    def test_tutor_only(self):
+        import_audiences("test", [["tutor", "username", "tutor", "Group C"]])
+        assert self.get_audiences()["Group C"].students == [] and self.get_audiences()["Group C"].tutors == ["tutor"]
+
+        # Tutors are not registered as students
+        assert self.get_students() == ["carol"]
+
+    def test_registration(self):
+        import_audiences("test", [["alice", "username", "student", "Group A"],
+                                  ["carol", "username", "student", "Group A"]])
+        assert self.get_students() == ["carol", "alice"]
+
+    # The import status is upserted with a $and query, whose equality fields mongomock does not insert
+    def test_background_import(self, mongodb_server):
+        importer = AudienceImporter(background_lines=1)
+        lines = [["alice", "username", "student", "Group A"], ["nobody", "username", "student", "Group A"]]
+        assert importer.import_file("test", lines[:1]) == []
+        assert importer.import_file("test", lines) is None
+        importer.close()
+
+        assert importer.pop_result("test") == ("done", [[2, "user", "nobody"]])
+        assert importer.pop_result("test") is None
+
+    def test_already_running(self, mongodb_server):
+        AudienceImport(courseid="test", status="running", errors=[], started_on=datetime.now(tz=timezone.utc)).save()
+        importer = AudienceImporter(background_lines=0)
+        with pytest.raises(ValueError):
+            importer.import_file("test", [["alice", "username", "student", "Group A"]])
+        assert importer.pop_result("test") == ("running", [])
+
+        # Imports running for too long were interrupted
+        AudienceImport.objects(courseid="test").update(
+            set__started_on=datetime.now(tz=timezone.utc) - 2 * AudienceImporter._TIMEOUT)
+        assert importer.import_file("test", [["alice", "username", "student", "Group A"]]) is None
+        importer.close()
+        assert importer.pop_result("test") == ("done", [])
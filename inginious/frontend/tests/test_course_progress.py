@@ -0,0 +1,114 @@
+# -*- coding: utf-8 -*-
+#
+# This file is part of INGInious. See the LICENSE and the COPYRIGHTS files for
+# more information about the licensing of this file.
+
+from datetime import datetime, timedelta, timezone
+
+import pytest
+from bson import ObjectId
+
+from inginious.frontend.accessible_time import AccessibleTime
+from inginious.frontend.models import Submission, UserTask, UserCourseProgress
+from inginious.frontend.user_manager import UserManager
+
+
+class FakeTask(object):
+    def get_id(self):
+        return "task2"
+
+
+class TestCourseProgress(object):
+    @pytest.fixture(autouse=True)
+    def setup(self, add_user_task, course, monkeypatch):
+        add_user_task("alice", "task1", 100.0)
+        add_user_task("bob", "task1", 50.0)
+        add_user_task("bob", "task3", 100.0)
+        self.user_manager = UserManager([])
+        self.course = course
+
+        # The usernames whose progress was recomputed, for each refresh
+        self.refreshed = []
+        refresh = self.user_manager.refresh_course_progress
+        monkeypatch.setattr(self.user_manager, "refresh_course_progress", lambda course, usernames=None: (
+            self.refreshed.append(list(usernames)), refresh(course, usernames))[1])
+
+    def get_progress(self, username):
+        return UserCourseProgress.objects.get(courseid="test", username=username)
+
+    def test_computed_once(self):
+        caches = self.user_manager.get_course_caches(["alice", "bob", "carol"], self.course)
+        assert caches["alice"] == {"_id": "alice", "task_tried": 1, "total_tries": 1, "task_succeeded": 1,
+                                   "task_grades": {"task1": 100.0}, "grade": 50.0}
+        assert caches["bob"]["task_grades"] == {"task1": 50.0} and caches["bob"]["grade"] == 25.0
+        assert caches["carol"] == {"task_succeeded": 0, "task_grades": [], "grade": 0}
+
+        assert self.user_manager.get_course_caches(["alice", "bob", "carol"], self.course) == caches
+        assert self.refreshed == [["alice", "bob", "carol"]]
+
+    def test_queries(self, assert_max_queries):
+        # The progress, the user tasks of the stale progress, and the bulk write of the recomputed progress
+        with assert_max_queries(3):
+            self.user_manager.get_course_caches(["alice", "bob", "carol"], self.course)
+        with assert_max_queries(1):
+            self.user_manager.get_course_caches(["alice", "bob", "carol"], self.course)
+
+    def test_course_version(self):
+        self.user_manager.get_course_caches(["alice", "bob"], self.course)
+        version = self.get_progress("bob").course_version
+
+        # Reordering the tasks does not change the version, adding one or changing the dispenser does
+        self.course.tasks = ["task2", "task1"]
+        self.user_manager.get_course_caches(["alice", "bob"], self.course)
+        assert len(self.refreshed) == 1
+
+        self.course.tasks = ["task1", "task2", "task3"]
+        assert self.user_manager.get_course_cache("bob", self.course)["task_grades"] == {"task1": 50.0, "task3": 100.0}
+        assert self.get_progress("bob").course_version != version
+
+        self.course.descriptor = {"task_dispenser": "toc", "dispenser_data": {"config": {"task1": {"weight": 2}}}}
+        self.user_manager.get_course_caches(["alice", "bob"], self.course)
+        assert self.refreshed == [["alice", "bob"], ["bob"], ["alice", "bob"]]
+
+    def test_valid_until(self):
+        start = datetime.now(tz=timezone.utc).replace(microsecond=0) + timedelta(days=1)
+        self.course.accessibilities = {"task2": AccessibleTime(start.strftime("%Y-%m-%d %H:%M:%S"))}
+        self.user_manager.get_course_caches(["alice"], self.course)
+        valid_until = self.get_progress("alice").valid_until
+        assert valid_until.replace(tzinfo=None) == start.astimezone(valid_until.tzinfo).replace(tzinfo=None)
+
+        self.user_manager.get_course_caches(["alice"], self.course)
+        assert len(self.refreshed) == 1
+
+        # The progress changes once the task is accessible
+        UserCourseProgress.objects(username="alice").update(
+            set__valid_until=datetime.now(tz=timezone.utc) - timedelta(seconds=1))
+        self.course.accessibilities = {}
+        self.user_manager.get_course_caches(["alice"], self.course)
+        assert len(self.refreshed) == 2
+        assert self.get_progress("alice").valid_until is None
+
+    def test_invalidate(self):
+        self.user_manager.get_course_caches(["alice", "bob"], self.course)
+        self.user_manager.invalidate_course_progress("test", ["alice"])
+        self.user_manager.get_course_caches(["alice", "bob"], self.course)
+        self.user_manager.invalidate_course_progress("other")
+        self.user_manager.get_course_caches(["alice", "bob"], self.course)
+        self.user_manager.invalidate_course_progress("test")
+        self.user_manager.get_course_caches(["alice", "bob"], self.course)
+        assert self.refreshed == [["alice", "bob"], ["alice"], ["alice", "bob"]]
+
+    def test_submission_result(self):
+        assert self.user_manager.get_course_cache("alice", self.course)["task_tried"] == 1
+
+        submission = Submission(id=ObjectId(), courseid="test", taskid="task2")
+        self.user_manager.update_user_stats("alice", self.course, FakeTask(), submission, "success", 100.0, "", True,
+                                            self.course.get_task_dispenser())
+        user_task = UserTask.objects.get(username="alice", taskid="task2")
+        assert user_task.tried == 1 and user_task.grade == 100.0 and user_task.submissionid == submission.id
+
+        # The progress is refreshed with the result, and stays valid
+        assert self.user_manager.get_course_cache("alice", self.course) == {
+            "_id": "alice", "task_tried": 2, "total_tries": 2, "task_succeeded": 2,
+            "task_grades": {"task1": 100.0, "task2": 100.0}, "grade": 100.0}
+        assert self.refreshed == [["alice"], ["alice"]]
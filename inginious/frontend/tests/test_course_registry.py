@@ -0,0 +1,99 @@
+# -*- coding: utf-8 -*-
+#
+# This file is part of INGInious. See the LICENSE and the COPYRIGHTS files for
+# more information about the licensing of this file.
+
+import os
+import shutil
+import tempfile
+import time
+
+import pytest
+
+from inginious.common.filesystems import init_fs_provider
+from inginious.common.filesystems.local import LocalFSProvider
+from inginious.frontend.course_registry import CourseRegistry, init_course_registry, _affects
+from inginious.frontend.courses import Course
+
+
+@pytest.fixture()
+def tasks_dir():
+    dir_path = tempfile.mkdtemp()
+    os.makedirs(os.path.join(dir_path, "course", "task"))
+    with open(os.path.join(dir_path, "course", "course.yaml"), "w") as f:
+        f.write("name: Course\n")
+    init_fs_provider(LocalFSProvider(dir_path))
+    yield dir_path
+    init_course_registry(None)
+    shutil.rmtree(dir_path)
+
+
+def wait_for(condition, timeout=5.0):
+    deadline = time.monotonic() + timeout
+    while not condition() and time.monotonic() < deadline:
+        time.sleep(0.01)
+    return condition()
+
+
+class TestCourseRegistry(object):
+    def test_affects(self):
+        assert _affects("/tasks/course/course.yaml", "/tasks/course/course.yaml")
+        assert _affects("/tasks/course", "/tasks/course/course.yaml")
+        assert _affects("/tasks/course/$i18n/fr.mo", "/tasks/course/$i18n/")
+        assert not _affects("/tasks/course2", "/tasks/course/course.yaml")
+        assert not _affects("/tasks/course/task/task.yaml", "/tasks/course/course.yaml")
+
+    def test_invalidated_generation(self):
+        registry = CourseRegistry(LocalFSProvider("/nonexistent"), watch=False)
+        generation = registry.generation
+        registry.invalidate("/nonexistent/course")
+        registry.put("key", "value", ["/nonexistent/course/course.yaml"], generation)
+        assert registry.get("key") is None
+
+    def test_polling(self, tasks_dir):
+        registry = CourseRegistry(LocalFSProvider(tasks_dir), watch=False, poll_interval=0.05)
+        init_course_registry(registry)
+        course = Course.get("course")
+        assert Course.get("course") is course
+        time.sleep(0.1)
+        assert Course.get("course") is course
+
+        path = os.path.join(tasks_dir, "course", "course.yaml")
+        os.utime(path, (time.time() + 10, time.time() + 10))
+        assert wait_for(lambda: registry.get(("course", "course")) is None)
+        assert Course.get("course") is not course
+
+    def test_polling_folder(self, tasks_dir):
+        registry = CourseRegistry(LocalFSProvider(tasks_dir), watch=False, poll_interval=0.05)
+        init_course_registry(registry)
+        assert Course.get("course").get_readable_tasks() == []
+        with open(os.path.join(tasks_dir, "course", "task", "task.yaml"), "w") as f:
+            f.write("name: Task\n")
+        os.utime(os.path.join(tasks_dir, "course", "task"), (time.time() + 10, time.time() + 10))
+        assert wait_for(lambda: Course.get("course").get_readable_tasks() == ["task"])
+
+    def test_explicit_invalidation(self, tasks_dir):
+        init_course_registry(CourseRegistry(LocalFSProvider(tasks_dir), watch=False, poll_interval=3600))
+        course = Course.get("course")
+        course.set_descriptor_element("name", "Renamed")
+        course.save()
+        assert Course.get("course").get_name("en") == "Renamed"
+        assert list(Course.get_all().keys()) == ["course"]
+
+    def test_watch(self, tasks_dir):
+        registry = CourseRegistry(LocalFSProvider(tasks_dir), watch=True)
+        init_course_registry(registry)
+        if not registry.watching:
+            pytest.skip("The tasks directory cannot be watched")
+
+        assert Course.get("course").get_readable_tasks() == []
+        assert registry.get(("tasks", "course")) == []
+        with open(os.path.join(tasks_dir, "course", "task", "task.yaml"), "w") as f:
+            f.write("name: Task\n")
+        assert wait_for(lambda: registry.get(("tasks", "course")) is None)
+        assert Course.get("course").get_readable_tasks() == ["task"]
+
+        with open(os.path.join(tasks_dir, "course", "course.yaml"), "w") as f:
+            f.write("name: Changed\n")
+        assert wait_for(lambda: registry.get(("course", "course")) is None)
+        assert Course.get("course").get_name("en") == "Changed"
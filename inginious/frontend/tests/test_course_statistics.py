@@ -0,0 +1,89 @@
+# -*- coding: utf-8 -*-
+#
+# This file is part of INGInious. See the LICENSE and the COPYRIGHTS files for
+# more information about the licensing of this file.
+
+import pytest
+
+from inginious.common.tags import Tag
+from inginious.frontend.pages.course_admin.statistics import compute_statistics, CourseStatisticsPage
+
+
+class FakeRollups(object):
+    """ Rollups answering every filter with the same counts """
+
+    def __init__(self, counts):
+        self._counts = counts
+
+    def count(self, query, by):
+        return dict(self._counts)
+
+
+class FakeSubmissionManager(object):
+    def __init__(self, counts):
+        self._rollups = FakeRollups(counts)
+
+    def get_submission_rollups(self):
+        return self._rollups
+
+
+class FakeCourse(object):
+    def get_tags(self):
+        return {tag_id: Tag(tag_id, {"name": tag_id, "type": tag_type}, None)
+                for tag_id, tag_type in [("skill", 0), ("misconception", 1), ("category", 2)]}
+
+
+def submission(username, taskid, best=False, result="failed", **tests):
+    return {"taskid": taskid, "username": username, "tests": tests, "best": best, "result": result}
+
+
+data = [
+    submission(["a"], "task1", skill=True),
+    submission(["a"], "task1", best=True, result="success", skill=True, misconception=False),
+    submission(["a"], "task2", misconception=True),
+    submission(["b"], "task1", skill=True),
+    submission(["b"], "task1"),
+    submission(["b"], "task1"),
+    submission(["b"], "task1", best=True, skill=True, misconception=True),
+    submission(["c"], "other", skill=True),
+]
+
+
+class TestComputeStatistics(object):
+    def test_general(self):
+        general, __ = compute_statistics(FakeCourse(), {"task1": None, "task2": None}, data, False)
+        assert dict(general)["Number of submissions"] == 8
+        assert dict(general)["Evaluation submissions (Total)"] == 2
+        assert dict(general)["Evaluation submissions (Succeeded)"] == 1
+
+    def test_unweighted(self):
+        __, tags = compute_statistics(FakeCourse(), {"task1": None, "task2": None}, data, False)
+        assert [tag.get_id() for tag, __, __ in tags] == ["skill", "misconception"]
+        assert tags[0][1:] == pytest.approx((100 * 4 / 7, 100.0))
+        assert tags[1][1:] == pytest.approx((100 * 2 / 7, 50.0))
+
+    def test_weighted(self):
+        __, tags = compute_statistics(FakeCourse(), {"task1": None, "task2": None}, data, True)
+        # Cells: (a, task1), (a, task2), (b, task1)
+        assert tags[0][1:] == pytest.approx((100 * (1 + 0 + 0.5) / 3, 100 * (1 + 0 + 1) / 3))
+        assert tags[1][1:] == pytest.approx((100 * (0 + 1 + 0.25) / 3, 100 * (0 + 0 + 1) / 3))
+
+    def test_no_submissions(self):
+        __, tags = compute_statistics(FakeCourse(), {"task1": None}, data[-1:], False)
+        assert tags == []
+
+
+class TestRollupStatistics(object):
+    def page(self, counts):
+        return type("Page", (CourseStatisticsPage,), {"submission_manager": FakeSubmissionManager(counts)})()
+
+    def test_above_limit(self):
+        # The limit only caps the submissions scanned without the rollups
+        page = self.page({"task1": [3, 1], "task2": [5, 2]})
+        assert page._tasks_stats({}, {"courseid": "test"}, 1) == [
+            {"name": "task2", "submissions": 5, "validSubmissions": 2},
+            {"name": "task1", "submissions": 3, "validSubmissions": 1}]
+
+        page = self.page({"alice": [4, 4]})
+        assert page._users_stats({"courseid": "test"}, 1) == [
+            {"name": "alice", "submissions": 4, "validSubmissions": 4}]
@@ -0,0 +1,56 @@
+# -*- coding: utf-8 -*-
+#
+# This file is part of INGInious. See the LICENSE and the COPYRIGHTS files for
+# more information about the licensing of this file.
+
+import csv
+import gzip
+import io
+from collections import OrderedDict
+
+from flask import Flask
+
+from inginious.frontend.pages.course_admin.utils import iter_csv, make_csv, flatten_csv_entry
+
+
+def read_csv(content):
+    return list(csv.reader(io.StringIO(content.decode("utf-8"))))
+
+
+class TestCSVExport(object):
+    def test_chunks(self):
+        rows = (["row{}".format(i), "é"] for i in range(1000))
+        chunks = list(iter_csv(rows, chunk_size=100))
+        assert len(chunks) > 10
+        assert read_csv(b"".join(chunks))[999] == ["row999", "é"]
+
+    def test_lazy(self):
+        consumed = []
+
+        def rows():
+            for i in range(100):
+                consumed.append(i)
+                yield [str(i)]
+
+        chunks = iter_csv(rows(), chunk_size=10)
+        next(chunks)
+        assert len(consumed) < 100
+
+    def test_gzip(self):
+        rows = [["a", "b"], ["1", "2"]] * 1000
+        content = gzip.decompress(b"".join(iter_csv(iter(rows), compress=True, chunk_size=100)))
+        assert read_csv(content) == rows
+
+    def test_flatten(self):
+        assert flatten_csv_entry({"a": 1, "tests": {"x": True}}) == {"a": 1, "tests[x]": True}
+
+    def test_make_csv(self):
+        app = Flask(__name__)
+        data = OrderedDict([("u1", {"grade": 5, "tasks": {"t1": 1}}), ("u2", {"grade": 7})])
+        with app.test_request_context():
+            response = make_csv(data)
+            assert read_csv(b"".join(response.response)) == [["id", "grade", "tasks[t1]"], ["u1", "5", "1"],
+                                                            ["u2", "7", ""]]
+            response = make_csv([{"a": 1}, {"b": 2}], compress=True)
+            assert response.headers["Content-disposition"] == 'attachment; filename="export.csv.gz"'
+            assert read_csv(gzip.decompress(b"".join(response.response))) == [["a", "b"], ["1", ""], ["", "2"]]
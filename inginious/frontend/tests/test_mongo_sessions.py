@@ -0,0 +1,93 @@
+# -*- coding: utf-8 -*-
+#
+# This file is part of INGInious. See the LICENSE and the COPYRIGHTS files for
+# more information about the licensing of this file.
+
+from datetime import timedelta
+
+import flask
+import pytest
+
+from inginious.frontend.flask.mongo_sessions import MongoDBSessionInterface
+from inginious.frontend.models import Session
+
+
+@pytest.fixture()
+def saves(monkeypatch):
+    """ The list of the sessions saved in the database """
+    saved = []
+    save = Session.save
+
+    def counting_save(session, *args, **kwargs):
+        saved.append(session.id)
+        return save(session, *args, **kwargs)
+    monkeypatch.setattr(Session, "save", counting_save)
+    return saved
+
+
+def make_client(cache_ttl=0):
+    app = flask.Flask(__name__)
+    app.secret_key = "secret"
+    app.session_interface = MongoDBSessionInterface(use_signer=True, cache_ttl=cache_ttl)
+
+    @app.route("/")
+    def index():
+        return flask.session.username if flask.session.loggedin else "anonymous"
+
+    @app.route("/login")
+    def login():
+        flask.session.loggedin = True
+        flask.session.username = "alice"
+        return "ok"
+
+    @app.route("/logout")
+    def logout():
+        flask.session.loggedin = False
+        return "ok"
+
+    return app.test_client()
+
+
+class TestMongoDBSessionInterface(object):
+    def test_unmodified(self, database, saves):
+        client = make_client()
+        assert client.get("/").text == "anonymous"
+        assert saves == [] and Session.objects.count() == 0
+
+        client.get("/login")
+        assert len(saves) == 1
+        assert client.get("/").text == "alice"
+        assert len(saves) == 1
+
+    def test_modified(self, database, saves):
+        client = make_client()
+        client.get("/login")
+        client.get("/logout")
+        assert len(saves) == 2
+        assert not Session.objects.get(id=saves[0]).loggedin
+
+    def test_refresh_threshold(self, database, saves):
+        client = make_client()
+        client.get("/login")
+        session = Session.objects.get(id=saves[0])
+
+        # The expiration only moved by a few seconds
+        Session.objects(id=session.id).update(expiration=session.expiration - timedelta(seconds=60))
+        client.get("/")
+        assert len(saves) == 1
+
+        Session.objects(id=session.id).update(expiration=session.expiration - timedelta(seconds=700))
+        client.get("/")
+        assert len(saves) == 2
+        assert Session.objects.get(id=session.id).expiration >= session.expiration
+
+    def test_cache_logout(self, database, saves):
+        client = make_client(cache_ttl=60)
+        client.get("/login")
+        assert client.get("/").text == "alice"
+
+        # The cached copy is replaced when the session is saved
+        client.get("/logout")
+        assert client.get("/").text == "anonymous"
+        assert not Session.objects.get(id=saves[0]).loggedin
+        assert len(saves) == 2
@@ -3,7 +3,12 @@
 # This file is part of INGInious. See the LICENSE and the COPYRIGHTS files for
 # more information about the licensing of this file.
 
-from inginious.frontend.parsable_text import ParsableText
+import shutil
+import tempfile
+
+import flask
+
+from inginious.frontend.parsable_text import ParsableText, get_render_cache_stats, init_render_cache
 
 
 class TestParsableText(object):
@@ -86,4 +91,50 @@ class TestParsableText(object):
             .. hidden-until:: 22/05/2102
 
                 Something
-            """, show_everything=True)
\ No newline at end of file
+            """, show_everything=True)
+
+    def test_render_cache(self):
+        ParsableText.rst("""Cached *text*""")
+        hits = get_render_cache_stats()["hits"]
+        assert "<em>text</em>" in ParsableText.rst("""Cached *text*""")
+        assert get_render_cache_stats()["hits"] == hits + 1
+        assert "<h2" in ParsableText.rst("""Cached\n======\n\n*text*""", initial_header_level=2)
+
+    def test_render_cache_hidden_until(self):
+        hits = get_render_cache_stats()["hits"]
+        for __ in range(2):
+            ParsableText.rst("""
+            .. hidden-until:: 22/05/2002
+
+                Something
+            """)
+        assert get_render_cache_stats()["hits"] == hits
+
+    def test_render_disk_cache(self):
+        directory = tempfile.mkdtemp()
+        try:
+            init_render_cache(directory=directory)
+            rendered = ParsableText.rst("""Stored *on disk*""")
+            init_render_cache(directory=None)
+            init_render_cache(directory=directory)
+            from inginious.frontend import parsable_text
+            parsable_text._render_cache.clear()
+            hits = get_render_cache_stats()["hits"]
+            assert ParsableText.rst("""Stored *on disk*""") == rendered
+            assert get_render_cache_stats()["hits"] == hits
+        finally:
+            init_render_cache(directory=None)
+            shutil.rmtree(directory)
+
+    def test_lti_links(self):
+        string = """`Link <file.txt>`_, `Site <https://inginious.org>`_\n\n.. image:: image.png"""
+        rendered = ParsableText.rst(string)
+        app = flask.Flask(__name__)
+        with app.test_request_context("/?session_id=abc"):
+            hits = get_render_cache_stats()["hits"]
+            lti_rendered = ParsableText.rst(string)
+            assert get_render_cache_stats()["hits"] == hits + 1
+        assert 'href="file.txt"' in rendered and 'src="image.png"' in rendered
+        assert 'href="asset/file.txt?session_id=abc"' in lti_rendered
+        assert 'src="asset/image.png?session_id=abc"' in lti_rendered
+        assert 'href="https://inginious.org"' in lti_rendered
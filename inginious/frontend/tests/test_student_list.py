@@ -0,0 +1,139 @@
+# -*- coding: utf-8 -*-
+#
+# This file is part of INGInious. See the LICENSE and the COPYRIGHTS files for
+# more information about the licensing of this file.
+
+import flask
+import pytest
+
+from inginious.frontend.models import User, CourseClass, UserCourseProgress, Group, Audience
+from inginious.frontend.pages.course_admin.student_list import CourseStudentListPage
+from inginious.frontend.user_manager import UserManager
+
+
+@pytest.fixture()
+def students(database, add_user_task):
+    # "ghost" is registered but has no user document, "outsider" is not registered
+    for username, realname, email in [("bob", "Bob Martin", "bob@example.com"),
+                                      ("alice", "Alice Smith", "alice@test.org"),
+                                      ("carol", "Carol Jones", "carol@example.com"),
+                                      ("outsider", "Alice Other", "other@example.com")]:
+        User(username=username, realname=realname, email=email).save()
+    CourseClass(id="test", students=["bob", "alice", "carol", "ghost"]).save()
+    add_user_task("alice", "task1", 100.0)
+    add_user_task("alice", "task2", 50.0)
+    add_user_task("bob", "task1", 20.0)
+    add_user_task("ghost", "task1", 100.0)
+
+
+class TestStudentList(object):
+    @pytest.fixture(autouse=True)
+    def setup(self, students, course, monkeypatch):
+        self.app = flask.Flask(__name__)
+        self.app.user_manager = UserManager([])
+        self.page = CourseStudentListPage()
+        self.course = course
+        self.refreshed = []
+        refresh = self.app.user_manager.refresh_course_progress
+        monkeypatch.setattr(self.app.user_manager, "refresh_course_progress", lambda course, usernames=None: (
+            self.refreshed.append(list(usernames)), refresh(course, usernames))[1])
+
+    def get_page(self, **kwargs):
+        with self.app.app_context():
+            user_data, count = self.page.get_students_page(self.course, **kwargs)
+        return list(user_data), count
+
+    def test_name_sort(self):
+        assert self.get_page() == (["alice", "bob", "carol", "ghost"], 4)
+        assert self.get_page(ascending=False) == (["carol", "bob", "alice", "ghost"], 4)
+        assert self.get_page(sort_by="email") == (["alice", "bob", "carol", "ghost"], 4)
+
+    def test_pagination(self):
+        assert self.get_page(per_page=3) == (["alice", "bob", "carol"], 4)
+        assert self.get_page(page=2, per_page=3) == (["ghost"], 4)
+        assert self.get_page(page=2, per_page=2) == (["carol", "ghost"], 4)
+        assert self.get_page(page=3, per_page=2) == ([], 4)
+
+    def test_queries(self, assert_max_queries):
+        self.get_page(sort_by="grade")
+
+        # The students, the page, the count, the students without user document, the users of the page and their
+        # progress. The number of queries does not depend on the number of students.
+        with assert_max_queries(6):
+            self.get_page(per_page=2, page=2)
+        with assert_max_queries(7):
+            self.get_page(sort_by="grade", per_page=2)
+
+    def test_search(self):
+        assert self.get_page(search="alice") == (["alice"], 1)
+        assert self.get_page(search="Carol J") == (["carol"], 1)
+        assert self.get_page(search="bob@") == (["bob"], 1)
+        assert self.get_page(search="gho") == (["ghost"], 1)
+        # Only the prefixes are searched
+        assert self.get_page(search="example.com") == ([], 0)
+
+    def test_search_case(self, mongodb_server):
+        # The case-insensitive collation of the indexes is ignored by mongomock
+        assert self.get_page(search="ALICE S") == (["alice"], 1)
+        assert self.get_page(search="CAROL@EXAMPLE") == (["carol"], 1)
+        assert self.get_page(search="GHO") == (["ghost"], 1)
+
+    def test_progress_sort(self):
+        assert self.get_page(sort_by="grade", ascending=False) == (["alice", "ghost", "bob", "carol"], 4)
+        assert self.get_page(sort_by="task_tried") == (["carol", "bob", "ghost", "alice"], 4)
+        assert UserCourseProgress.objects(courseid="test").count() == 4
+
+    def test_refresh_stale_course_progress(self):
+        user_manager = self.app.user_manager
+        user_manager.refresh_stale_course_progress(self.course, ["alice", "bob"])
+        assert self.refreshed == [["alice", "bob"]]
+
+        # Fresh progress is not recomputed, only the invalidated one
+        user_manager.refresh_stale_course_progress(self.course, ["alice", "bob"])
+        user_manager.invalidate_course_progress("test", ["bob"])
+        user_manager.refresh_stale_course_progress(self.course, ["alice", "bob"])
+        assert self.refreshed == [["alice", "bob"], ["bob"]]
+
+    def test_students_table(self):
+        with self.app.test_request_context("/?students_table&sort_by=grade&order=desc&search=bob"):
+            data = self.page.students_table(self.course).get_json()
+        assert data["count"] == 1 and data["page"] == 1 and data["pages"] == 1
+        assert data["students"] == [
+            {"username": "bob", "realname": "Bob Martin", "email": "bob@example.com", "task_tried": 1,
+             "task_succeeded": 0, "grade": 10.0}]
+
+        with self.app.test_request_context("/?students_table&sort_by=password&page=x"):
+            data = self.page.students_table(self.course).get_json()
+        assert data["page"] == 1 and [student["username"] for student in data["students"]] == \
+               ["alice", "bob", "carol", "ghost"]
+
+    def test_group_students(self):
+        Group(description="group", courseid="test", size=2, students=["carol", "ghost"]).save()
+        with self.app.test_request_context("/?group_students"):
+            data = self.page.group_students(self.course).get_json()
+        assert data["students"] == [
+            {"username": "alice", "realname": "Alice Smith", "grouped": False},
+            {"username": "bob", "realname": "Bob Martin", "grouped": False},
+            {"username": "carol", "realname": "Carol Jones", "grouped": True},
+            {"username": "ghost", "realname": "", "grouped": True}]
+
+    def test_csv_students(self):
+        with self.app.app_context():
+            rows = list(self.page.get_student_list_rows(self.course, batch_size=2))
+        assert rows[0] == ["email", "grade", "realname", "task_grades[task1]", "task_grades[task2]", "task_succeeded",
+                           "task_tried", "total_tasks", "total_tries", "url", "username"]
+        assert [row[-1] for row in rows[1:]] == ["ghost", "alice", "bob", "carol"]
+        assert rows[2] == ["alice@test.org", "75.0", "Alice Smith", "100.0", "50.0", "1", "2", "0", "2",
+                           "?format=taskid%2Fusername&users=alice", "alice"]
+        assert rows[1][:5] == ["", "50.0", "", "100.0", ""]
+        assert rows[4][:5] == ["carol@example.com", "0", "Carol Jones", "", ""]
+
+    def test_csv_audiences(self):
+        audience = Audience(courseid="test", description="audience", students=["alice", "ghost"], tutors=["bob"]).save()
+        with self.app.app_context():
+            rows = list(self.page.get_audience_list_rows(self.course))
+            emails = self.page.get_users_field(["alice", "bob", "ghost"], "email")
+        assert rows == [["id", "courseid", "description", "done", "students", "tried", "tutors", "url"],
+                        [str(audience.id), "test", "audience", "0", "['alice', 'ghost']", "0", "['bob']",
+                         "?audiences=" + str(audience.id)]]
+        assert emails == {"alice": "alice@test.org", "bob": "bob@example.com"}
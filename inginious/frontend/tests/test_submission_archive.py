@@ -0,0 +1,43 @@
+# -*- coding: utf-8 -*-
+#
+# This file is part of INGInious. See the LICENSE and the COPYRIGHTS files for
+# more information about the licensing of this file.
+
+import io
+import tarfile
+import zipfile
+
+from inginious.frontend.submission_archive import create_archive_writer, get_archive_formats
+
+
+def _write(archive_format):
+    writer = create_archive_writer(archive_format)
+    chunks = []
+    writer.add_file("sub/submission.test", b"hello", 0)
+    chunks.append(writer.pop())
+
+    member = tarfile.TarInfo("student.py")
+    member.size = 3
+    member.mtime = 1600000000
+    writer.add_tar_member("sub/archive/student.py", member, io.BytesIO(b"abc"))
+    chunks.append(writer.pop())
+
+    writer.close()
+    chunks.append(writer.pop())
+    return b"".join(chunks)
+
+
+class TestSubmissionArchive(object):
+    def test_formats(self):
+        assert "tgz" in get_archive_formats()
+        assert "zip" in get_archive_formats()
+
+    def test_tgz(self):
+        with tarfile.open(fileobj=io.BytesIO(_write("tgz")), mode="r:gz") as tar:
+            assert tar.getnames() == ["sub/submission.test", "sub/archive/student.py"]
+            assert tar.extractfile("sub/archive/student.py").read() == b"abc"
+
+    def test_zip(self):
+        with zipfile.ZipFile(io.BytesIO(_write("zip"))) as archive:
+            assert archive.namelist() == ["sub/submission.test", "sub/archive/student.py"]
+            assert archive.read("sub/submission.test") == b"hello"
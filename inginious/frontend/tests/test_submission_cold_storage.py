@@ -0,0 +1,140 @@
+# -*- coding: utf-8 -*-
+#
+# This file is part of INGInious. See the LICENSE and the COPYRIGHTS files for
+# more information about the licensing of this file.
+
+import re
+from datetime import datetime
+
+import pytest
+from bson import ObjectId
+
+from inginious.frontend.submission_cold_storage import matches, check_query, get_bundle_query, _bundle_fields, \
+    SubmissionColdStorage
+
+submission = {"_id": ObjectId(), "courseid": "test", "taskid": "task1", "username": ["a", "b"], "grade": 50.0,
+              "result": "failed", "submitted_on": datetime(2024, 1, 1), "tests": {"tag": True}}
+
+
+class TestColdStorageQueries(object):
+    def test_equality(self):
+        assert matches(submission, {"courseid": "test", "taskid": "task1"})
+        assert not matches(submission, {"courseid": "other"})
+
+    def test_arrays(self):
+        assert matches(submission, {"username": "a"})
+        assert matches(submission, {"username": {"$in": ["b", "c"]}})
+        assert not matches(submission, {"username": {"$in": ["c"]}})
+
+    def test_ranges(self):
+        assert matches(submission, {"grade": {"$gte": 50.0, "$lte": 60.0}})
+        assert not matches(submission, {"grade": {"$gt": 50.0}})
+        assert matches(submission, {"submitted_on": {"$lt": datetime(2025, 1, 1)}})
+
+    def test_missing_fields(self):
+        assert matches(submission, {"tests.other": {"$in": [None, False]}})
+        assert not matches(submission, {"tests.tag": {"$in": [None, False]}})
+        assert matches(submission, {"tests.tag": {"$in": [True]}})
+        assert not matches(submission, {"stdout": {"$exists": True}})
+
+    def test_ids(self):
+        assert matches(submission, {"_id": {"$in": [submission["_id"]]}})
+        assert not matches(submission, {"_id": {"$in": [ObjectId()]}})
+
+    def test_check_query(self):
+        check_query({"courseid": "test", "username": {"$in": ["a"]}, "tests.tag": {"$in": [None, False]},
+                     "$and": [{"grade": {"$gte": 50.0}}, {"stdout": {"$exists": False}}]})
+        for query in [{"$or": [{"courseid": "test"}]}, {"username": {"$all": ["a", "b"]}},
+                      {"username": {"$elemMatch": {"$eq": "a"}}}, {"username": re.compile("^a")},
+                      {"username": {"$in": [re.compile("^a")]}}, {"username": {"$in": "a"}}, {"$and": {"grade": 1}}]:
+            with pytest.raises(ValueError):
+                check_query(query)
+
+
+class FakeCursor(list):
+    def sort(self, *args, **kwargs):
+        return self
+
+
+class FakeBundles(object):
+    """ Collection of bundles, queried with the matcher of the cold tier """
+
+    def __init__(self):
+        self.documents = []
+
+    def find(self, query, projection=None):
+        return FakeCursor(dict(document) for document in self.documents if matches(document, query))
+
+    def find_one(self, query, projection=None):
+        found = self.find(query)
+        return found[0] if found else None
+
+    def insert_one(self, document):
+        self.documents.append(dict(document, _id=document.get("_id", ObjectId())))
+
+    def update_one(self, query, update):
+        for document in self.documents:
+            if matches(document, query):
+                document.update(update["$set"])
+                return
+
+    def delete_one(self, query):
+        self.documents = [document for document in self.documents if not matches(document, query)]
+
+
+def make_submission(username, taskid="task1", day=1):
+    return {"_id": ObjectId(), "courseid": "test", "taskid": taskid, "username": [username],
+            "submitted_on": datetime(2024, 1, day), "input": ObjectId()}
+
+
+class TestColdStorage(object):
+    def setup_method(self):
+        self.bundles = FakeBundles()
+        self.storage = SubmissionColdStorage({"submission_bundles": self.bundles, "submissions": None,
+                                              "submission_rollups": None})
+        self.first = [make_submission("a", day=1), make_submission("b", day=2)]
+        self.second = [make_submission("c", day=10), make_submission("a", day=12)]
+        for submissions in (self.first, self.second):
+            self.bundles.insert_one(dict(_bundle_fields(submissions), courseid="test", taskid="task1"))
+
+    def test_bundle_query(self):
+        start = datetime(2024, 1, 5)
+        assert get_bundle_query({"courseid": "test", "username": {"$in": ["a"]}, "submitted_on": {"$gte": start},
+                                 "grade": {"$gte": 50.0}}) == {
+            "courseid": "test", "usernames": {"$in": ["a"]}, "max_submitted_on": {"$gte": start}}
+        assert get_bundle_query({"courseid": "test", "username": {"$nin": ["a"]}}) == {"courseid": "test"}
+
+    def test_narrowed_find(self):
+        loaded = []
+        load_bundle = self.storage._load_bundle
+        self.storage._load_bundle = lambda bundle: loaded.append(bundle["_id"]) or load_bundle(bundle)
+        found = self.storage.find({"courseid": "test", "username": {"$in": ["b", "c"]},
+                                   "submitted_on": {"$gte": datetime(2024, 1, 5)}})
+        assert [submission["_id"] for submission in found] == [self.second[0]["_id"]]
+        assert loaded == [self.bundles.documents[1]["_id"]]
+
+    def test_delete(self):
+        deleted = self.storage.delete({"courseid": "test", "username": "a"})
+        assert {submission["_id"] for submission in deleted} == {self.first[0]["_id"], self.second[1]["_id"]}
+        assert self.storage.find({"courseid": "test", "username": "a"}) == []
+        assert self.bundles.documents[0]["usernames"] == ["b"]
+        assert self.storage.get(self.first[0]["_id"]) is None
+        assert self.storage.get(self.first[1]["_id"]) is not None
+
+        self.storage.delete({"courseid": "test"})
+        assert self.bundles.documents == []
+
+    def test_unsupported_query(self):
+        with pytest.raises(ValueError):
+            self.storage.find({"courseid": "test", "$or": [{"username": "a"}, {"grade": 100.0}]})
+        with pytest.raises(ValueError):
+            self.storage.delete({"courseid": "test", "username": {"$regex": "^a"}})
+        assert len(self.bundles.documents) == 2 and self.bundles.documents[0]["usernames"] == ["a", "b"]
+
+    def test_rename_course(self):
+        self.storage.find({"courseid": "test"})  # fills the cache
+        self.storage.rename_course("test", "test_archive")
+        assert self.storage.find({"courseid": "test"}) == []
+        found = self.storage.find({"courseid": "test_archive"})
+        assert len(found) == 4 and all(submission["courseid"] == "test_archive" for submission in found)
+        assert self.storage.get(self.first[0]["_id"])["courseid"] == "test_archive"
@@ -0,0 +1,57 @@
+# -*- coding: utf-8 -*-
+#
+# This file is part of INGInious. See the LICENSE and the COPYRIGHTS files for
+# more information about the licensing of this file.
+
+import threading
+
+import flask
+
+from inginious.frontend.pages.tasks import SubmissionEventsPage
+from inginious.frontend.submission_events import SubmissionEventBroker
+
+
+class FakeSubmissionManager(object):
+    """ A submission manager whose submission is done after done_after checks """
+
+    def __init__(self, submission_events, done_after):
+        self._submission_events = submission_events
+        self._done_after = done_after
+        self.checks = 0
+
+    def get_submission_events(self):
+        return self._submission_events
+
+    def get_submission(self, submissionid, user_check=True):
+        return {"_id": submissionid, "courseid": "test"}
+
+    def user_is_submission_owner(self, submission):
+        return True
+
+    def is_done(self, submissionid, user_check=True):
+        self.checks += 1
+        return self.checks > self._done_after
+
+
+class TestSubmissionEventsPage(object):
+    def setup_method(self):
+        self.submission_events = SubmissionEventBroker()
+        self.app = flask.Flask(__name__)
+
+    def get_body(self, done_after):
+        """ Returns the events sent by the page, read after the end of the request like the WSGI server does """
+        self.app.submission_manager = FakeSubmissionManager(self.submission_events, done_after)
+        with self.app.test_request_context("/submission_events?submissionid=abc"):
+            response = SubmissionEventsPage().GET_AUTH()
+        return list(response.response)
+
+    def test_done(self):
+        assert self.get_body(0) == ["retry: 5000\n\n", "event: done\ndata: {}\n\n"]
+
+    def test_notified(self):
+        timer = threading.Timer(0.1, self.submission_events.publish, [["abc"]])
+        timer.start()
+        assert self.get_body(1) == ["retry: 5000\n\n", "event: done\ndata: {}\n\n"]
+        timer.join()
+        assert self.app.submission_manager.checks == 2
+        assert self.submission_events._waiters == {}
@@ -0,0 +1,80 @@
+# -*- coding: utf-8 -*-
+#
+# This file is part of INGInious. See the LICENSE and the COPYRIGHTS files for
+# more information about the licensing of this file.
+
+from unittest.mock import patch
+
+import flask
+from bson import ObjectId
+
+from inginious.frontend.models import Submission
+from inginious.frontend.parsable_text import rewrite_lti_links
+from inginious.frontend.submission_feedback import render_feedback, get_stored_feedback, FeedbackRenderer
+
+
+class TestSubmissionFeedback(object):
+    def test_render(self):
+        problems = {"q1": ["success", "*Well done*"], "q2": "Old-style", "q3": ["failed", None]}
+        rendered = render_feedback("Global *feedback*", problems)
+        assert "<em>feedback</em>" in rendered["text"]
+        assert "<em>Well done</em>" in rendered["problems"]["q1"]
+        assert "Old-style" in rendered["problems"]["q2"]
+        assert rendered["problems"]["q3"] is None
+
+    def test_depends_on_request(self):
+        rendered = render_feedback(".. hidden-until:: 22/05/2102\n\n    Later", {"q1": ["failed", ".. code-block::"]})
+        assert rendered["text"] is None
+        assert rendered["problems"]["q1"] is None
+
+    def test_stored(self):
+        submission = {"text": "Feedback", "problems": {"q1": ["success", "Good"]}, "status": "done"}
+        assert get_stored_feedback(submission) is None
+        submission["feedback_html"] = render_feedback(submission["text"], submission["problems"])
+        assert get_stored_feedback(submission) is submission["feedback_html"]
+
+        submission["text"] = "Replayed"
+        assert get_stored_feedback(submission) is None
+
+    def test_stored_document(self):
+        submission = Submission(text="Feedback", problems={"q1": ["success", "Good"]}, status="done")
+        submission.feedback_html = render_feedback("Feedback", {"q1": ("success", "Good")})
+        assert get_stored_feedback(submission)["problems"]["q1"] is not None
+
+    def test_render_error(self):
+        with patch("inginious.frontend.parsable_text.ParsableText._rst", side_effect=ValueError):
+            assert render_feedback("Cannot be *rendered*", {})["text"] is None
+
+    def test_lti_session(self):
+        submission = {"text": "`Link <file.txt>`_", "problems": {}, "status": "done"}
+        submission["feedback_html"] = render_feedback(submission["text"], submission["problems"])
+        with flask.Flask(__name__).test_request_context("/?session_id=abc"):
+            stored = get_stored_feedback(submission)
+            assert stored is submission["feedback_html"]
+            assert 'href="asset/file.txt?session_id=abc"' in rewrite_lti_links(stored["text"])
+
+    def test_renderer_version(self):
+        submission = {"text": "Feedback", "problems": {}}
+        submission["feedback_html"] = dict(render_feedback("Feedback", {}), version=0)
+        assert get_stored_feedback(submission) is None
+
+
+class TestFeedbackRenderer(object):
+    def test_store(self, database):
+        submission = {"_id": ObjectId(), "text": "*Feedback*", "problems": {"q1": ["success", "Good"]}, "status": "done"}
+        database.submissions.insert_one(submission)
+        renderer = FeedbackRenderer()
+        renderer.add_submission(submission)
+        renderer.close()
+        submission = database.submissions.find_one({"_id": submission["_id"]})
+        assert "<em>Feedback</em>" in get_stored_feedback(submission)["text"]
+
+    def test_unstored(self, database):
+        """ The submissions that are not in the collection, such as the ones of the cold tier, are rendered once """
+        submission = {"_id": ObjectId(), "text": "Feedback", "problems": {}, "status": "done"}
+        renderer = FeedbackRenderer()
+        with patch("inginious.frontend.submission_feedback.render_feedback", wraps=render_feedback) as render:
+            renderer.add_submission(submission)
+            renderer._executor.shutdown(wait=True)
+            renderer.add_submission(submission)
+            assert render.call_count == 1
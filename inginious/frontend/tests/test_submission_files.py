@@ -0,0 +1,123 @@
+# -*- coding: utf-8 -*-
+#
+# This file is part of INGInious. See the LICENSE and the COPYRIGHTS files for
+# more information about the licensing of this file.
+
+from datetime import datetime, timedelta, timezone
+
+import bson
+import pytest
+from gridfs import GridFS
+
+from inginious.frontend.models import Submission
+from inginious.frontend.submission_files import BLOB_MIN_SIZE, put_blob, release_blobs, SubmissionFileCollector
+from inginious.scripts.database_update import update_submission_files
+
+inputdata = {"question": "answer", "small": {"filename": "small.py", "value": b"small"},
+             "large": {"filename": "large.py", "value": b"a" * BLOB_MIN_SIZE}}
+
+
+def add_file(database, file_id, **fields):
+    """ Inserts the entry and a chunk of a GridFS file """
+    database["fs.files"].insert_one(dict(_id=file_id, length=1, chunkSize=1, **fields))
+    database["fs.chunks"].insert_one({"files_id": file_id, "n": 0, "data": b"x"})
+
+
+def has_file(database, file_id):
+    return database["fs.files"].find_one({"_id": file_id}) is not None and \
+        database["fs.chunks"].find_one({"files_id": file_id}) is not None
+
+
+class TestBlobs(object):
+    """ Content-addressed files, stored in GridFS, that is not supported by mongomock """
+
+    def test_refcount(self, mongodb_server):
+        blob_id = put_blob(mongodb_server, b"content")
+        assert put_blob(mongodb_server, b"content") == blob_id
+        assert put_blob(mongodb_server, b"other") != blob_id
+        assert mongodb_server["fs.files"].find_one({"_id": blob_id})["refcount"] == 2
+        assert GridFS(mongodb_server).get(blob_id).read() == b"content"
+
+    def test_release(self, mongodb_server):
+        blob_id = put_blob(mongodb_server, b"content")
+        owned_id = GridFS(mongodb_server).put(b"content")
+        release_blobs(mongodb_server, [blob_id, owned_id])
+
+        blob = mongodb_server["fs.files"].find_one({"_id": blob_id})
+        assert blob["refcount"] == 0 and "released_on" in blob
+        assert "refcount" not in mongodb_server["fs.files"].find_one({"_id": owned_id})
+
+        # Referenced again during the grace period
+        assert put_blob(mongodb_server, b"content") == blob_id
+        assert "released_on" not in mongodb_server["fs.files"].find_one({"_id": blob_id})
+
+    def test_input(self, mongodb_server):
+        submission = Submission(courseid="test", taskid="task1", username=["alice"], status="done",
+                                submitted_on=datetime.now(tz=timezone.utc))
+        submission.set_input(dict(inputdata))
+        submission.save()
+
+        submission = Submission.objects.get(id=submission.id)
+        assert len(submission.input_blobs) == 1
+        stored = bson.BSON(submission.input.read()).decode()
+        submission.input.seek(0)
+        assert stored["large"] == {"filename": "large.py", "value_blob": submission.input_blobs[0]}
+        assert stored["small"] == inputdata["small"]
+        assert submission.get_input() == inputdata
+
+
+class TestSubmissionFileCollector(object):
+    @pytest.fixture()
+    def collector(self, database):
+        collector = SubmissionFileCollector(database, grace_period=timedelta(hours=1), gc_interval=3600)
+        collector.stop()
+        collector.join(5)
+        assert not collector.is_alive()
+        return collector
+
+    def test_delete(self, database, collector):
+        add_file(database, "shared", sha256="shared", refcount=3)
+        add_file(database, "owned")
+        collector._delete_files(["shared", "owned", "shared"])
+
+        # The shared file loses the two references, the file owned by the submission is deleted
+        assert database["fs.files"].find_one({"_id": "shared"})["refcount"] == 1
+        assert has_file(database, "shared")
+        assert not has_file(database, "owned")
+        assert database["fs.chunks"].find_one({"files_id": "owned"}) is None
+
+    def test_collect(self, database, collector):
+        now = datetime.utcnow()
+        add_file(database, "expired", sha256="expired", refcount=0, released_on=now - timedelta(hours=2))
+        add_file(database, "recent", sha256="recent", refcount=0, released_on=now - timedelta(minutes=1))
+        add_file(database, "referenced", sha256="referenced", refcount=1, released_on=now - timedelta(hours=2))
+        add_file(database, "owned")
+        collector._collect()
+
+        assert not has_file(database, "expired")
+        assert database["fs.chunks"].find_one({"files_id": "expired"}) is None
+        assert has_file(database, "recent") and has_file(database, "referenced") and has_file(database, "owned")
+
+
+class TestDatabaseUpdate(object):
+    def test_submission_files(self, mongodb_server):
+        gridfs = GridFS(mongodb_server)
+        submissionids = [mongodb_server.submissions.insert_one({
+            "courseid": "test", "taskid": "task1", "username": ["alice"], "status": "done",
+            "submitted_on": datetime.now(tz=timezone.utc), "input": gridfs.put(bson.BSON.encode(inputdata)),
+            "archive": gridfs.put(b"archive")}).inserted_id for __ in range(2)]
+        old_files = [file["_id"] for file in mongodb_server["fs.files"].find()]
+
+        update_submission_files(mongodb_server, gridfs)
+        update_submission_files(mongodb_server, gridfs)  # nothing left to convert
+
+        submissions = [Submission.objects.get(id=submissionid) for submissionid in submissionids]
+        assert all(submission.get_input() == inputdata for submission in submissions)
+        assert submissions[0].input_blobs == submissions[1].input_blobs
+        assert submissions[0].archive.grid_id == submissions[1].archive.grid_id
+        assert submissions[0].archive.read() == b"archive"
+        for blob_id in [submissions[0].archive.grid_id] + submissions[0].input_blobs:
+            assert mongodb_server["fs.files"].find_one({"_id": blob_id})["refcount"] == 2
+
+        # The inputs were rewritten without the large file, the old files are deleted
+        assert mongodb_server["fs.files"].count_documents({"_id": {"$in": old_files}}) == 0
@@ -0,0 +1,106 @@
+# -*- coding: utf-8 -*-
+#
+# This file is part of INGInious. See the LICENSE and the COPYRIGHTS files for
+# more information about the licensing of this file.
+
+import logging
+from datetime import datetime, timedelta, timezone
+
+import pytest
+from bson import ObjectId
+
+from inginious.frontend.models import User, Submission, UserTask
+from inginious.frontend.submission_cold_storage import SubmissionColdStorage
+from inginious.frontend.submission_manager import WebAppSubmissionManager
+from inginious.frontend.submission_rollups import SubmissionRollups
+from inginious.frontend.user_manager import UserManager
+
+
+class FakeFileCollector(object):
+    """ Records the ids of the files queued for deletion """
+
+    def __init__(self):
+        self.deleted = []
+
+    def delete(self, file_ids):
+        self.deleted += [file_id for file_id in file_ids if file_id is not None]
+
+
+@pytest.fixture()
+def manager(database):
+    """ A WebAppSubmissionManager without client nor background threads, deleting the submissions of the database """
+    manager = WebAppSubmissionManager.__new__(WebAppSubmissionManager)
+    manager._user_manager = UserManager([])
+    manager._logger = logging.getLogger("inginious.webapp.submissions")
+    manager._rollups = SubmissionRollups(database)
+    manager._cold_storage = SubmissionColdStorage(database)
+    manager._file_collector = FakeFileCollector()
+    return manager
+
+
+def add_submission(username, status="done", age=0, **fields):
+    """ Inserts a submission of the task task1 of the course test, submitted age days ago """
+    document = dict(courseid="test", taskid="task1", username=[username], status=status, result="success",
+                    grade=100.0, input=ObjectId(), submitted_on=datetime.now(tz=timezone.utc) - timedelta(days=age))
+    document.update(fields)
+    return Submission._get_collection().insert_one(document).inserted_id
+
+
+class TestDeleteUser(object):
+    def test_cold_submissions(self, manager):
+        User(username="alice", realname="Alice", email="alice@test.org").save()
+        cold = [add_submission("alice", age=100), add_submission("bob", age=100)]
+        manager.get_cold_storage().archive({"courseid": "test"})
+        hot = add_submission("alice")
+        inputs = {manager.get_cold_storage().get(cold[0])["input"], Submission.objects.get(id=hot).input.grid_id}
+
+        assert UserManager([]).delete_user("alice", submission_manager=manager)
+        assert manager.get_cold_storage().get(cold[0]) is None
+        assert manager.get_cold_storage().get(cold[1]) is not None
+        assert Submission.objects(id=hot).first() is None
+
+        assert set(manager._file_collector.deleted) == inputs
+
+
+class TestDeleteExceedingSubmissions(object):
+    def delete(self, manager, course):
+        course.no_stored_submissions = 2
+        return manager._delete_exceeding_submissions("alice", course, course.get_task("task1"),
+                                                     course.get_task_dispenser())
+
+    def remaining(self):
+        return [sub.id for sub in Submission.objects(username="alice").order_by("id")]
+
+    def test_max_submissions(self, manager, course):
+        submissions = [add_submission("alice", age=age) for age in [3, 2, 1, 0]]
+        add_submission("bob", age=4)
+        assert self.delete(manager, course) == [str(submissionid) for submissionid in submissions[:2]]
+        assert self.remaining() == submissions[2:]
+        assert Submission.objects(username="bob").count() == 1
+
+    def test_not_exceeding(self, manager, course):
+        submissions = [add_submission("alice", age=age) for age in [1, 0]]
+        assert self.delete(manager, course) == []
+        assert self.remaining() == submissions
+        assert manager._file_collector.deleted == []
+
+    def test_evaluation_submission(self, manager, course):
+        submissions = [add_submission("alice", age=age) for age in [3, 2, 1, 0]]
+        UserTask(username="alice", courseid="test", taskid="task1", submissionid=submissions[0]).save()
+        self.delete(manager, course)
+        # The evaluation submission takes the slot of the oldest of the recent submissions
+        assert self.remaining() == [submissions[0], submissions[3]]
+
+    def test_waiting(self, manager, course):
+        submissions = [add_submission("alice", status="waiting", age=3)] + \
+                      [add_submission("alice", age=age) for age in [2, 1, 0]]
+        self.delete(manager, course)
+        assert self.remaining() == [submissions[0]] + submissions[2:]
+
+    def test_files(self, manager, course):
+        files = dict(input=ObjectId(), archive=ObjectId(), input_blobs=[ObjectId(), ObjectId()])
+        add_submission("alice", age=2, **files)
+        kept = [add_submission("alice", age=age) for age in [1, 0]]
+        self.delete(manager, course)
+        assert self.remaining() == kept
+        assert manager._file_collector.deleted == [files["input"], files["archive"]] + files["input_blobs"]
@@ -0,0 +1,65 @@
+# -*- coding: utf-8 -*-
+#
+# This file is part of INGInious. See the LICENSE and the COPYRIGHTS files for
+# more information about the licensing of this file.
+
+from datetime import datetime, timezone
+
+from inginious.frontend.submission_rollups import SubmissionRollups, get_bucket
+
+
+class FakeCollection(object):
+    """ Records the aggregation pipelines, and returns the given results """
+
+    def __init__(self, results=None):
+        self.pipelines = []
+        self._results = results or []
+
+    def aggregate(self, pipeline, **kwargs):
+        self.pipelines.append(pipeline)
+        return list(self._results)
+
+
+class TestSubmissionRollups(object):
+    def setup_method(self):
+        self.rollups_collection = FakeCollection([{"_id": "task1", "submissions": 3, "valid": 1}])
+        self.submissions_collection = FakeCollection([{"_id": "task1", "submissions": 1, "valid": 1}])
+        self.rollups = SubmissionRollups({"submission_rollups": self.rollups_collection,
+                                          "submissions": self.submissions_collection})
+
+    def test_bucket(self):
+        submission = {"courseid": "test", "taskid": "task1", "username": ["a", "b"],
+                      "submitted_on": datetime(2024, 1, 1, 10, 42, tzinfo=timezone.utc)}
+        assert get_bucket(submission) == ("test", "task1", ("a", "b"), datetime(2024, 1, 1, 10))
+
+    def test_not_answerable(self):
+        assert self.rollups.count({"courseid": "test", "grade": {"$gte": 50.0}}, "taskid") is None
+        assert self.rollups.count({"courseid": "test", "submitted_on": {"$gte": datetime(2024, 1, 1, 10, 30),
+                                                                        "$lte": datetime(2024, 1, 1, 10, 50)}},
+                                  "taskid") is None
+        assert self.rollups_collection.pipelines == []
+
+    def test_whole_hours(self):
+        counts = self.rollups.count({"courseid": "test", "submitted_on": {"$gte": datetime(2024, 1, 1, 10),
+                                                                          "$lt": datetime(2024, 1, 2)}}, "taskid")
+        assert counts == {"task1": [3, 1]}
+        assert self.rollups_collection.pipelines[0][0]["$match"] == {
+            "courseid": "test", "hour": {"$gte": datetime(2024, 1, 1, 10), "$lt": datetime(2024, 1, 2)}}
+        assert self.submissions_collection.pipelines == []
+
+    def test_fringes(self):
+        start = datetime(2024, 1, 1, 11, 30, tzinfo=timezone.utc)
+        end = datetime(2024, 1, 1, 15, 0, tzinfo=timezone.utc)
+        counts = self.rollups.count({"courseid": "test", "username": {"$in": ["a"]},
+                                     "submitted_on": {"$gte": start, "$lte": end}}, "taskid")
+        assert counts == {"task1": [5, 3]}
+        assert self.rollups_collection.pipelines[0][0]["$match"] == {
+            "courseid": "test", "username": {"$in": ["a"]},
+            "hour": {"$gte": datetime(2024, 1, 1, 12), "$lt": datetime(2024, 1, 1, 15)}}
+        fringes = [pipeline[0]["$match"]["submitted_on"] for pipeline in self.submissions_collection.pipelines]
+        assert fringes == [{"$gte": start, "$lt": datetime(2024, 1, 1, 12)}, {"$gte": datetime(2024, 1, 1, 15),
+                                                                              "$lte": end}]
+
+    def test_users(self):
+        self.rollups.count({"courseid": "test"}, "username")
+        assert {"$unwind": "$username"} in self.rollups_collection.pipelines[0]
@@ -0,0 +1,272 @@
+# -*- coding: utf-8 -*-
+#
+# This file is part of INGInious. See the LICENSE and the COPYRIGHTS files for
+# more information about the licensing of this file.
+
+from datetime import datetime, timezone
+
+import pytest
+from bson import ObjectId
+from pymongo import UpdateOne
+from pymongo.errors import BulkWriteError
+
+from inginious.frontend import submission_writer
+from inginious.frontend.courses import Course
+from inginious.frontend.models import Submission, UserTask
+from inginious.frontend.models.user_task import MAX_COUNTED_SUBMISSIONS
+from inginious.frontend.submission_writer import SubmissionResultWriter
+from inginious.frontend.user_manager import UserManager
+
+
+class FakeSubmission(dict):
+    """ A submission document, readable as a dict and through attributes """
+
+    def __getattr__(self, name):
+        return self.get(name)
+
+
+class FakeSubmissions(object):
+    """ Stands for the Submission document class and its collection, without submissions to recover """
+
+    def __init__(self, events, submissions):
+        self._events = events
+        self._submissions = {sub.id: sub for sub in submissions}
+
+    def _get_collection(self):
+        return self
+
+    def objects(self, id__in):
+        return [self._submissions[subid] for subid in id__in if subid in self._submissions]
+
+    def find_one_and_update(self, filter, update, return_document):
+        return None
+
+    def bulk_write(self, operations, ordered=True):
+        self._events.append(("submissions", operations))
+
+    def update_one(self, filter, update):
+        self._events.append(("submission", filter, update))
+
+    def update_many(self, filter, update):
+        self._events.append(("unset", filter["_id"]["$in"], update))
+
+
+class FakeUserTasks(object):
+    """ Stands for the UserTask document class and its collection. The operations on the user tasks of the users in
+        failing fail. """
+
+    def __init__(self, events, failing=()):
+        self._events = events
+        self._failing = failing
+
+    def _get_collection(self):
+        return self
+
+    def bulk_write(self, operations, ordered=True):
+        for index, operation in enumerate(operations):
+            if operation._filter["username"] in self._failing:
+                raise BulkWriteError({"writeErrors": [{"index": index, "code": 11000}]})
+        self._events.append(("user_tasks", operations))
+
+
+class FakeUserManager(object):
+    def __init__(self, events):
+        self._events = events
+
+    def update_user_stats(self, username, course, task, submission, result_str, grade, state, newsub, task_dispenser):
+        self._events.append(("user_stats", submission.id, username, newsub))
+
+    def refresh_course_progress(self, course, usernames):
+        self._events.append(("progress", course.get_id(), sorted(usernames)))
+
+
+class FakeObject(object):
+    def __init__(self, id):
+        self._id = id
+
+    def get_id(self):
+        return self._id
+
+    def get_task(self, taskid):
+        return FakeObject(taskid)
+
+    def get_task_dispenser(self):
+        return FakeTaskDispenser()
+
+
+class FakeTaskDispenser(object):
+    def get_evaluation_mode(self, taskid):
+        return "best"
+
+
+class FakePluginManager(object):
+    def __init__(self, events):
+        self._events = events
+
+    def call_hook(self, name, submission, archive, newsub):
+        self._events.append((name, submission.id, newsub))
+
+
+class TestSubmissionResultWriter(object):
+    def setup_method(self):
+        self.events = []
+        self.submissions = [FakeSubmission(id=i, username=["user%d" % i], courseid="test", taskid="task1")
+                            for i in range(3)]
+
+    def make_writer(self, monkeypatch, failing=(), batch_delay=0.005):
+        monkeypatch.setattr(submission_writer, "Submission", FakeSubmissions(self.events, self.submissions))
+        monkeypatch.setattr(submission_writer, "UserTask", FakeUserTasks(self.events, failing))
+        monkeypatch.setattr(submission_writer, "plugin_manager", FakePluginManager(self.events))
+        monkeypatch.setattr(Course, "get", classmethod(lambda cls, courseid: FakeObject(courseid)))
+        return SubmissionResultWriter(FakeUserManager(self.events), {}, batch_delay=batch_delay)
+
+    def add(self, writer, submissionid, newsub=True):
+        writer.add(submissionid, FakeObject("test"), FakeObject("task1"), ("success", "ok"), 100, {}, {}, {}, "",
+                   None, "", "", FakeTaskDispenser(), newsub)
+
+    def stop(self, writer):
+        writer.stop()
+        writer.join(5)
+        assert not writer.is_alive()
+
+    def of_kind(self, kind):
+        return [event for event in self.events if event[0] == kind]
+
+    def test_batching(self, monkeypatch):
+        writer = self.make_writer(monkeypatch, batch_delay=5)
+        for submissionid in range(3):
+            self.add(writer, submissionid)
+        self.stop(writer)
+
+        assert len(self.of_kind("submissions")) == 1
+        assert len(self.of_kind("submissions")[0][1]) == 3
+        assert len(self.of_kind("user_tasks")) == 1
+        assert len(self.of_kind("user_tasks")[0][1]) == 9
+        assert self.of_kind("progress") == [("progress", "test", ["user0", "user1", "user2"])]
+        assert self.of_kind("unset") == [("unset", [0, 1, 2], {"$unset": {"stats_pending": "", "stats_newsub": "",
+                                                                         "stats_claimed_on": ""}})]
+        assert self.of_kind("submission_done") == [("submission_done", i, True) for i in range(3)]
+
+    def test_write_ordering(self, monkeypatch):
+        writer = self.make_writer(monkeypatch)
+        self.stop(writer)
+        writer._write([submission_writer.JobResult(1, FakeObject("test"), FakeObject("task1"), ("success", "ok"), 80,
+                                                   {}, {}, {}, "", None, "", "", FakeTaskDispenser(), True)])
+
+        # The result is flagged until the user task is written, then the hooks are called
+        assert [event[0] for event in self.events] == ["submissions", "user_tasks", "progress", "unset",
+                                                       "submission_done"]
+        update = self.events[0][1][0]._doc
+        assert update["$set"]["grade"] == 80.0 and update["$set"]["stats_pending"] and update["$set"]["stats_newsub"]
+
+        match_filter = {"username": "user1", "courseid": "test", "taskid": "task1"}
+        assert self.events[1][1] == [
+            UpdateOne(match_filter, {"$setOnInsert": {"tried": 0, "succeeded": False, "grade": 0.0,
+                                                      "submissionid": None, "state": ""}}, upsert=True),
+            UpdateOne(dict(match_filter, counted_submissions={"$ne": 1}), {
+                "$inc": {"tried": 1, "tokens.amount": 1},
+                "$push": {"counted_submissions": {"$each": [1], "$slice": -MAX_COUNTED_SUBMISSIONS}}}),
+            UpdateOne(dict(match_filter, grade={"$lte": 80.0}), {"$set": {"succeeded": True, "grade": 80.0,
+                                                                          "state": "", "submissionid": 1}})]
+
+    def test_replay(self, monkeypatch):
+        writer = self.make_writer(monkeypatch, batch_delay=5)
+        self.add(writer, 0)
+        self.add(writer, 1, newsub=False)
+        self.stop(writer)
+
+        assert len(self.of_kind("user_tasks")[0][1]) == 3
+        assert self.of_kind("user_stats") == [("user_stats", 1, "user1", False)]
+        assert self.of_kind("unset")[0][1] == [0, 1]
+
+    def test_user_task_failure(self, monkeypatch):
+        # The user task of the second job cannot be written: the first job is written, the others are retried alone
+        writer = self.make_writer(monkeypatch, failing=["user1"], batch_delay=5)
+        for submissionid in range(3):
+            self.add(writer, submissionid)
+        self.stop(writer)
+
+        assert [len(event[1]) for event in self.of_kind("user_tasks")] == [3]
+        assert self.of_kind("progress") == [("progress", "test", ["user0", "user2"])]
+        assert self.of_kind("unset")[0][1] == [0, 2]
+        assert self.of_kind("submission_done") == [("submission_done", i, True) for i in range(3)]
+
+
+class TestUserTasksRecovery(object):
+    """ Updates of the user tasks written several times, against the database """
+
+    @pytest.fixture(autouse=True)
+    def setup(self, database, course, monkeypatch):
+        self.course = course
+        self.user_manager = UserManager([])
+        monkeypatch.setattr(Course, "get", classmethod(lambda cls, courseid: course))
+
+    def add_submission(self, username, **fields):
+        document = dict(courseid="test", taskid="task1", username=[username], status="done", result="success",
+                        grade=100.0, state="", submitted_on=datetime.now(tz=timezone.utc), **fields)
+        return Submission._get_collection().insert_one(document).inserted_id
+
+    def get_user_task(self, username):
+        return UserTask.objects.get(username=username, courseid="test", taskid="task1")
+
+    def test_written_twice(self):
+        submissionid = self.add_submission("alice")
+        writer = SubmissionResultWriter(self.user_manager, {})
+        self.stop(writer)
+
+        job = submission_writer.JobResult(submissionid, self.course, self.course.get_task("task1"),
+                                          ("success", "ok"), 100.0, {}, {}, {}, "", None, "", "",
+                                          self.course.get_task_dispenser(), True)
+        submissions = {submissionid: Submission.objects.get(id=submissionid)}
+        assert writer._write_user_tasks([job], submissions) == set()
+        assert writer._write_user_tasks([job], submissions) == set()
+
+        user_task = self.get_user_task("alice")
+        assert user_task.tried == 1 and user_task.tokens.amount == 1 and user_task.submissionid == submissionid
+
+    def test_recover(self):
+        # The user task of alice was written before the webapp stopped, the one of bob was not, and the submission of
+        # carol is being recovered by another webapp
+        counted = self.add_submission("alice", stats_pending=True, stats_newsub=True)
+        UserTask(username="alice", courseid="test", taskid="task1", tried=1, grade=100.0, succeeded=True,
+                 submissionid=counted, counted_submissions=[counted]).save()
+        self.add_submission("bob", stats_pending=True, stats_newsub=True)
+        claimed = self.add_submission("carol", stats_pending=True, stats_newsub=True,
+                                      stats_claimed_on=datetime.now(tz=timezone.utc))
+
+        writer = SubmissionResultWriter(self.user_manager, {})
+        self.stop(writer)
+
+        assert self.get_user_task("alice").tried == 1
+        assert self.get_user_task("bob").tried == 1 and self.get_user_task("bob").grade == 100.0
+        assert UserTask.objects(username="carol").first() is None
+        assert list(Submission.objects(stats_pending=True).scalar("id")) == [claimed]
+
+    def stop(self, writer):
+        writer.stop()
+        writer.join(5)
+        assert not writer.is_alive()
+
+
+class TestArchives(object):
+    """ References of the archives of the results, against the database """
+
+    def test_deleted_submission(self, mongodb_server, course, monkeypatch):
+        monkeypatch.setattr(Course, "get", classmethod(lambda cls, courseid: course))
+        monkeypatch.setattr(submission_writer, "plugin_manager", FakePluginManager([]))
+        submissionid = Submission._get_collection().insert_one(dict(
+            courseid="test", taskid="task1", username=["alice"], status="waiting",
+            submitted_on=datetime.now(tz=timezone.utc))).inserted_id
+        deleted_id = ObjectId()
+
+        writer = SubmissionResultWriter(UserManager([]), {})
+        writer.stop()
+        writer.join(5)
+        writer._write([submission_writer.JobResult(subid, course, course.get_task("task1"), ("success", "ok"), 100.0,
+                                                   {}, {}, {}, "", b"archive", "", "", course.get_task_dispenser(),
+                                                   True) for subid in (submissionid, deleted_id)])
+
+        # Both results stored the same content-addressed archive, the reference of the deleted one is released
+        archive_id = Submission.objects.get(id=submissionid).archive.grid_id
+        archive = mongodb_server["fs.files"].find_one({"_id": archive_id})
+        assert archive["refcount"] == 1 and "released_on" in archive
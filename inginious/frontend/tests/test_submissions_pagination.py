@@ -0,0 +1,70 @@
+# -*- coding: utf-8 -*-
+#
+# This file is part of INGInious. See the LICENSE and the COPYRIGHTS files for
+# more information about the licensing of this file.
+
+from datetime import datetime, timezone
+
+from bson import ObjectId
+
+from inginious.frontend.models import Submission
+from inginious.frontend.pages.course_admin.submissions import get_keyset_query, is_sorted_after, \
+    encode_page_cursor, decode_page_cursor
+
+ids = [ObjectId("65a000000000000000000001"), ObjectId("65a000000000000000000002"), ObjectId("65a000000000000000000003")]
+
+
+def submission(submissionid, grade=None, submitted_on=None):
+    return Submission(id=submissionid, grade=grade, submitted_on=submitted_on, taskid="task1")
+
+
+class TestKeysetQuery(object):
+    def test_ascending(self):
+        assert get_keyset_query("grade", True, (50.0, ids[0])) == {
+            "$or": [{"grade": {"$gt": 50.0}}, {"grade": 50.0, "_id": {"$gt": ids[0]}}]}
+
+    def test_descending(self):
+        assert get_keyset_query("grade", False, (50.0, ids[0])) == {
+            "$or": [{"grade": {"$lt": 50.0}}, {"grade": 50.0, "_id": {"$lt": ids[0]}}, {"grade": None}]}
+
+    def test_missing_value(self):
+        assert get_keyset_query("grade", True, (None, ids[0])) == {
+            "$or": [{"grade": {"$ne": None}}, {"grade": None, "_id": {"$gt": ids[0]}}]}
+        assert get_keyset_query("grade", False, (None, ids[0])) == {"grade": None, "_id": {"$lt": ids[0]}}
+
+    def test_sorted_after(self):
+        assert is_sorted_after(submission(ids[1], 50.0), "grade", True, (50.0, ids[0]))
+        assert not is_sorted_after(submission(ids[0], 50.0), "grade", True, (50.0, ids[0]))
+        assert is_sorted_after(submission(ids[0], 20.0), "grade", False, (50.0, ids[2]))
+        assert is_sorted_after(submission(ids[0], 20.0), "grade", True, (None, ids[2]))
+
+    def test_sorted_after_dates(self):
+        aware = datetime(2024, 1, 1, 12, tzinfo=timezone.utc)
+        assert is_sorted_after(submission(ids[0], submitted_on=aware), "submitted_on", True,
+                               (datetime(2024, 1, 1, 11), ids[2]))
+
+
+class TestPageCursor(object):
+    def test_round_trip(self):
+        page = [submission(ids[2], 80.0), submission(ids[0], 50.0)]
+        cursor = decode_page_cursor(encode_page_cursor(3, page, ("grade", False)), ("grade", False))
+        assert cursor["page"] == 3
+        assert cursor["first"] == [80.0, ids[2]]
+        assert cursor["last"] == [50.0, ids[0]]
+
+    def test_other_sort(self):
+        cursor = encode_page_cursor(3, [submission(ids[0], 50.0)], ("grade", False))
+        assert decode_page_cursor(cursor, ("grade", True)) is None
+        assert decode_page_cursor(cursor, ("taskid", False)) is None
+
+    def test_usernames(self):
+        assert encode_page_cursor(1, [submission(ids[0])], ("username", True)) == ""
+
+    def test_invalid(self):
+        assert decode_page_cursor("", ("grade", True)) is None
+        assert decode_page_cursor("not json", ("grade", True)) is None
+        assert decode_page_cursor('{"page": 2, "column": "grade", "ascending": true, "first": [{"$ne": null}, '
+                                  '{"$oid": "65a000000000000000000001"}], "last": [1, {"$oid": "65a000000000000000000001"}]}',
+                                  ("grade", True)) is None
+        assert decode_page_cursor('{"page": 2, "column": "grade", "ascending": true, "first": [1, "a"], '
+                                  '"last": [1, {"$oid": "bad"}]}', ("grade", True)) is None
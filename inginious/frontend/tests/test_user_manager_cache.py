@@ -0,0 +1,81 @@
+# -*- coding: utf-8 -*-
+#
+# This file is part of INGInious. See the LICENSE and the COPYRIGHTS files for
+# more information about the licensing of this file.
+
+import flask
+import pytest
+
+from inginious.frontend.models import CourseClass
+from inginious.frontend.user_manager import UserManager
+
+
+class Counter(object):
+    def __init__(self):
+        self.calls = 0
+
+    def __call__(self):
+        self.calls += 1
+        return self.calls
+
+
+class FakeCourse(object):
+    def __init__(self, staff):
+        self.get_staff = staff
+
+    def get_id(self):
+        return "test"
+
+
+class TestRequestCache(object):
+    def setup_method(self):
+        self.app = flask.Flask(__name__)
+        self.user_manager = UserManager([])
+
+    def test_memoized_during_request(self):
+        compute = Counter()
+        with self.app.test_request_context():
+            assert self.user_manager._request_cached(("registered", "test", "a"), compute) == 1
+            assert self.user_manager._request_cached(("registered", "test", "a"), compute) == 1
+            assert self.user_manager._request_cached(("registered", "test", "b"), compute) == 2
+        with self.app.test_request_context():
+            assert self.user_manager._request_cached(("registered", "test", "a"), compute) == 3
+
+    def test_not_memoized_outside_request(self):
+        compute = Counter()
+        assert self.user_manager._request_cached(("registered", "test", "a"), compute) == 1
+        assert self.user_manager._request_cached(("registered", "test", "a"), compute) == 2
+
+    def test_clear_course(self):
+        compute = Counter()
+        with self.app.test_request_context():
+            self.user_manager._request_cached(("group", "test", "a"), compute)
+            self.user_manager._request_cached(("group", "other", "a"), compute)
+            self.user_manager.clear_request_cache("test")
+            assert self.user_manager._request_cached(("group", "test", "a"), compute) == 3
+            assert self.user_manager._request_cached(("group", "other", "a"), compute) == 2
+            self.user_manager.clear_request_cache()
+            assert self.user_manager._request_cached(("group", "other", "a"), compute) == 4
+
+    def test_staff_rights(self):
+        calls = Counter()
+        course = FakeCourse(lambda: ["a"] if calls() else [])
+        with self.app.test_request_context():
+            assert self.user_manager.has_staff_rights_on_course(course, "a")
+            assert self.user_manager.has_staff_rights_on_course(course, "a")
+        assert calls.calls == 1
+
+
+class TestQueryCounter(object):
+    def test_registration_queries(self, assert_max_queries, course):
+        CourseClass(id="test", students=["a"]).save()
+        user_manager = UserManager([])
+        with flask.Flask(__name__).test_request_context():
+            with assert_max_queries(1):
+                assert user_manager.course_is_user_registered(course, "a")
+                assert user_manager.course_is_user_registered(course, "a")
+
+        with pytest.raises(AssertionError):
+            with assert_max_queries(1):
+                user_manager.course_is_user_registered(course, "a")
+                user_manager.course_is_user_registered(course, "a")
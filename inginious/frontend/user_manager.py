@@ -8,6 +8,7 @@ import os
 import re
 import logging
 import hashlib
+import json
 import flask
 
 from typing import Dict, Optional
@@ -16,12 +17,15 @@ from abc import ABCMeta, abstractmethod
 from functools import reduce
 from natsort import natsorted
 from collections import OrderedDict, namedtuple
+from datetime import datetime, timezone
 from binascii import hexlify
 from argon2 import PasswordHasher
 from argon2.exceptions import VerifyMismatchError
 from mongoengine import Q
+from pymongo import UpdateOne
 
-from inginious.frontend.models import User, Group, Audience, CourseClass, UserTask, Submission
+from inginious.frontend.models import User, Group, Audience, CourseClass, UserTask, Submission, UserCourseProgress
+from inginious.frontend.models.user_task import count_submission_update, counted_submissions_filter
 
 class AuthInvalidInputException(Exception):
     pass
@@ -85,6 +89,37 @@ class UserManager:
         self._auth_methods = OrderedDict()
         self._logger = logging.getLogger("inginious.webapp.users")
 
+    ##############################################
+    #               Request cache                #
+    ##############################################
+
+    def _request_cached(self, key, compute):
+        """
+        Returns compute(), memoized in flask.g for the duration of the current request. Outside of a request, compute()
+        is called each time.
+        :param key: a tuple (kind, courseid, ...) identifying the value
+        """
+        if not flask.has_request_context():
+            return compute()
+        cache = flask.g.setdefault("user_manager_cache", {})
+        if key not in cache:
+            cache[key] = compute()
+        return cache[key]
+
+    def clear_request_cache(self, courseid=None):
+        """
+        Drops the values memoized during the current request. Must be called after changing the registrations,
+        groups or audiences of a course.
+        :param courseid: only drops the values related to this course. If None, drops everything.
+        """
+        if not flask.has_request_context() or "user_manager_cache" not in flask.g:
+            return
+        if courseid is None:
+            flask.g.user_manager_cache.clear()
+        else:
+            flask.g.user_manager_cache = {key: value for key, value in flask.g.user_manager_cache.items()
+                                          if key[1] != courseid}
+
     @classmethod
     def sanitize_email(cls, email: str) -> str:
         """
@@ -485,11 +520,13 @@ class UserManager:
             msg = _("You must set a password before removing all bindings.")
         return error, msg
 
-    def delete_user(self, username, confirmation_email=None):
+    def delete_user(self, username, confirmation_email=None, submission_manager=None):
         """
         Delete a user based on username
         :param username: the username of the user
         :param confirmation_email: An email to confirm suppression. May be None
+        :param submission_manager: the WebAppSubmissionManager deleting the submissions of the user, including the ones
+               of the cold tier, and their files. The one of the app by default.
         :return a boolean if a user was deleted
         """
         query = {"username": username, "email": confirmation_email} \
@@ -498,8 +535,9 @@ class UserManager:
         if not result:
             return False
         else:
-            Submission.objects(username=username).delete()
+            (submission_manager or flask.current_app.submission_manager).delete_submissions(username=username)
             UserTask.objects(username=username).delete()
+            UserCourseProgress.objects(username=username).delete()
             user_courses = CourseClass.objects(students=username)
             for elem in user_courses: self.course_unregister_user(elem.id, username)
         return True
@@ -551,46 +589,118 @@ class UserManager:
                 {"username": {"task_tried": 0, "total_tries": 0, "task_succeeded": 0, "task_grades":{"task_1": 100.0, "task_2": 0.0, ...}}}
 
             Note that only the task already seen at least one time will be present in the dict task_grades.
-        """
-
-        match = {"courseid": course.get_id()}
-        if usernames is not None:
-            match["username"] = {"$in": usernames}
-
-        taskids = course.get_readable_tasks()
-        match["taskid"] = {"$in": list(taskids)}
-
-        user_tasks = UserTask.objects(**match)
-        data = user_tasks.aggregate([{
-            "$group":
-                {
-                    "_id": "$username",
-                    "task_tried": {"$sum": {"$cond": [{"$ne": ["$tried", 0]}, 1, 0]}},
-                    "total_tries": {"$sum": "$tried"},
-                    "task_succeeded": {"$addToSet": {"$cond": ["$succeeded", "$taskid", False]}},
-                    "task_grades": {"$addToSet": {"taskid": "$taskid", "grade": "$grade"}}
-                }
-        }])
 
+            The data is read from the user_course_progress collection. The progress of users that is missing or stale
+            (the task list or the task dispenser configuration changed, or a task became accessible) is recomputed.
+        """
         if usernames is None:
             usernames = self.get_course_registered_users(course=course, with_admins=False)
 
-        retval = {username: {"task_succeeded": 0, "task_grades": [], "grade": 0} for username in usernames}
-
-        users_tasks_list = course.get_task_dispenser().get_user_task_list(usernames)
-        users_grade = course.get_task_dispenser().get_course_grades(user_tasks, usernames)
-
-        for result in data:
-            username = result["_id"]
-            visible_tasks = users_tasks_list.get(username, [])
-            result["task_succeeded"] = len(set(result["task_succeeded"]).intersection(visible_tasks))
-            result["task_grades"] = {dg["taskid"]: dg["grade"] for dg in result["task_grades"] if
-                                     dg["taskid"] in visible_tasks}
+        readable_tasks = set(course.get_readable_tasks())
+        version = self._get_course_version(course, readable_tasks)
+        now = datetime.now(tz=timezone.utc)
+
+        progresses = {progress.username: progress for progress in
+                      UserCourseProgress.objects(courseid=course.get_id(), username__in=usernames)}
+        stale = [username for username in usernames if username not in progresses
+                 or progresses[username].course_version != version
+                 or (progresses[username].valid_until is not None and progresses[username].valid_until <= now)]
+        if stale:
+            progresses.update(self.refresh_course_progress(course, stale))
+
+        retval = {}
+        for username in usernames:
+            progress = progresses[username]
+            if readable_tasks.intersection(progress.tasks):
+                retval[username] = {"_id": username, "task_tried": progress.task_tried,
+                                    "total_tries": progress.total_tries, "task_succeeded": progress.task_succeeded,
+                                    "task_grades": dict(progress.task_grades), "grade": progress.grade}
+            else:
+                retval[username] = {"task_succeeded": 0, "task_grades": [], "grade": 0}
+        return retval
 
-            result["grade"] = users_grade[username]
-            retval[username] = result
+    def refresh_course_progress(self, course, usernames=None):
+        """
+        Recomputes the progress of users in a course, as returned by get_course_caches, from their user tasks.
+        :param course: A Course object
+        :param usernames: List of usernames, or None for all the users registered to the course
+        :return: a dict {username: UserCourseProgress}
+        """
+        if usernames is None:
+            usernames = self.get_course_registered_users(course=course, with_admins=False)
+        if not usernames:
+            return {}
+
+        readable_tasks = set(course.get_readable_tasks())
+        version = self._get_course_version(course, readable_tasks)
+        task_dispenser = course.get_task_dispenser()
+        now = datetime.now(tz=timezone.utc)
+
+        user_tasks = list(UserTask.objects(courseid=course.get_id(), username__in=usernames, taskid__in=list(readable_tasks))
+                          .only("username", "taskid", "tried", "succeeded", "grade"))
+        users_tasks_list = task_dispenser.get_user_task_list(usernames)
+        users_grade = task_dispenser.get_course_grades(user_tasks, usernames)
+        accessibilities = task_dispenser.get_accessibilities(list(readable_tasks), usernames)
+
+        progresses = {username: UserCourseProgress(courseid=course.get_id(), username=username, tasks={},
+                                                   task_grades={}, course_version=version) for username in usernames}
+        for user_task in user_tasks:
+            progress = progresses[user_task.username]
+            progress.tasks[user_task.taskid] = {"tried": user_task.tried, "succeeded": user_task.succeeded,
+                                                "grade": user_task.grade}
+            progress.task_tried += 1 if user_task.tried != 0 else 0
+            progress.total_tries += user_task.tried
+            if user_task.taskid in users_tasks_list.get(user_task.username, []):
+                progress.task_succeeded += 1 if user_task.succeeded else 0
+                progress.task_grades[user_task.taskid] = user_task.grade
+
+        operations = []
+        for username, progress in progresses.items():
+            progress.grade = users_grade[username]
+            # The progress must be recomputed when the next task becomes accessible
+            next_starts = [accessibility.get_start_date() for accessibility in accessibilities[username].values()
+                           if accessibility.before_start(now) and accessibility.get_start_date() != accessibility.date_max]
+            progress.valid_until = min(next_starts) if next_starts else None
+
+            document = progress.to_mongo().to_dict()
+            document.pop("_id", None)
+            operations.append(UpdateOne({"courseid": course.get_id(), "username": username},
+                                        {"$set": document} if progress.valid_until else
+                                        {"$set": document, "$unset": {"valid_until": ""}}, upsert=True))
+        UserCourseProgress._get_collection().bulk_write(operations, ordered=False)
+        return progresses
+
+    def refresh_stale_course_progress(self, course, usernames):
+        """
+        Recomputes the progress of users in a course that is missing or stale, so that the user_course_progress
+        collection can be queried directly, for example to sort users on their grade.
+        :param course: A Course object
+        :param usernames: List of usernames
+        """
+        readable_tasks = set(course.get_readable_tasks())
+        version = self._get_course_version(course, readable_tasks)
+        now = datetime.now(tz=timezone.utc)
+
+        fresh = set(UserCourseProgress.objects(courseid=course.get_id(), username__in=usernames, course_version=version)
+                    .filter(Q(valid_until=None) | Q(valid_until__gt=now)).scalar("username"))
+        stale = [username for username in usernames if username not in fresh]
+        if stale:
+            self.refresh_course_progress(course, stale)
+
+    def invalidate_course_progress(self, courseid, usernames=None):
+        """ Marks the progress of users in a course as stale. It is recomputed the next time it is read.
+            :param usernames: List of usernames, or None for all the users """
+        query = {"courseid": courseid}
+        if usernames is not None:
+            query["username__in"] = usernames
+        UserCourseProgress.objects(**query).update(unset__course_version=True)
 
-        return retval
+    def _get_course_version(self, course, readable_tasks):
+        """ Returns a hash of the task list and the task dispenser configuration of a course, on which the progress of
+            users depends """
+        descriptor = course.get_descriptor()
+        content = [descriptor.get("task_dispenser", "toc"), descriptor.get("dispenser_data", {}), sorted(readable_tasks)]
+        return hashlib.sha1(json.dumps(content, sort_keys=True, default=str).encode("utf-8")).hexdigest()
 
     def get_task_cache(self, username, courseid, taskid):
         """
@@ -631,7 +741,7 @@ class UserManager:
 
     def user_saw_task(self, username, courseid, taskid):
         """ Set in the database that the user has viewed this task """
-        UserTask.objects(username=username, courseid=courseid, taskid=taskid).update_one(
+        result = UserTask.objects(username=username, courseid=courseid, taskid=taskid).update_one(
             set_on_insert__username=username,
             set_on_insert__courseid=courseid,
             set_on_insert__taskid=taskid,
@@ -640,8 +750,11 @@ class UserManager:
             set_on_insert__grade=0.0,
             set_on_insert__submissionid=None,
             set_on_insert__state="",
-            upsert=True
+            upsert=True,
+            full_result=True
         )
+        if result.upserted_id is not None:
+            self.invalidate_course_progress(courseid, [username])
 
     def update_user_stats(self, username, course, task, submission, result_str, grade, state, newsub, task_dispenser):
         """ Update stats with a new submission """
@@ -650,7 +763,10 @@ class UserManager:
         eval_mode = task_dispenser.get_evaluation_mode(task.get_id())
         match_filter = {"username": username, "courseid": submission["courseid"], "taskid": submission["taskid"]}
         if newsub:
-            old_submission = UserTask.objects(**match_filter).modify(inc__tried=1, inc__tokens__amount=1, new=True)
+            # Results written again (see SubmissionResultWriter) must not be counted twice
+            UserTask._get_collection().update_one(dict(match_filter, **counted_submissions_filter(submission.id)),
+                                                  count_submission_update(submission.id))
+            old_submission = UserTask.objects.get(**match_filter)
 
             # Update if the submission should be the default one
             if eval_mode == 'last' or (eval_mode == 'best' and old_submission.grade <= grade):
@@ -677,6 +793,8 @@ class UserManager:
                 old_submission.state = submission["state"]
                 old_submission.save()
 
+        self.refresh_course_progress(course, [username])
+
     def task_is_visible_by_user(self, course, task, username=None, lti=None):
         """ Returns true if the task is visible and can be accessed by the user
 
@@ -719,7 +837,7 @@ class UserManager:
 
         # Check for group
         is_group_task = course.get_task_dispenser().get_group_submission(task.get_id())
-        group = Group.objects(courseid=course.get_id(), students=self.session_username()).first()
+        group = self.get_course_user_group(course, self.session_username())
         group_filter = 'groups' in checks and group if is_group_task else True
 
         # Check for tokens
@@ -737,6 +855,17 @@ class UserManager:
         """ Returns a list of the course audiences"""
         return natsorted(list(Audience.objects(courseid=course.get_id())), key=lambda x: x["description"])
 
+    def get_course_user_audiences(self, course, username=None):
+        """ Returns the list of the audiences of the course the user belongs to
+        :param course: a Course object
+        :param username: The username of the user. If None, uses self.session_username()
+        """
+        if username is None:
+            username = self.session_username()
+
+        return self._request_cached(("audiences", course.get_id(), username),
+                                    lambda: list(Audience.objects(courseid=course.get_id(), students=username)))
+
     def get_course_audiences_per_student(self, course):
         """ Returns a dictionnary mapping student -> list of audiences it belongs to, for a given course """
         course_audiences = self.get_course_audiences(course)
@@ -761,7 +890,8 @@ class UserManager:
         if username is None:
             username = self.session_username()
 
-        return Group.objects(courseid=course.get_id(), students=username).first()
+        return self._request_cached(("group", course.get_id(), username),
+                                    lambda: Group.objects(courseid=course.get_id(), students=username).first())
 
     def course_register_user(self, course, username=None, password=None, force=False):
         """ Register a user to the course
@@ -792,6 +922,7 @@ class UserManager:
             return False  # already registered?
 
         CourseClass.objects(id=course.get_id()).update(push__students=username, upsert=True)
+        self.clear_request_cache(course.get_id())
 
         self._logger.info("User %s registered to course %s", username, course.get_id())
         return True
@@ -812,6 +943,7 @@ class UserManager:
         Group.objects(courseid=course_id, students=username).update(pull_students=username)
 
         CourseClass.objects(id=course_id).update(pull__students=username)
+        self.clear_request_cache(course_id)
 
         self._logger.info("User %s unregistered from course %s", username, course_id)
 
@@ -879,7 +1011,9 @@ class UserManager:
         if self.has_staff_rights_on_course(course, username):
             return True
 
-        return CourseClass.objects(id=course.get_id(), students=username).first() is not None
+        return self._request_cached(
+            ("registered", course.get_id(), username),
+            lambda: CourseClass.objects(id=course.get_id(), students=username).first() is not None)
 
     def get_course_registered_users(self, course, with_admins=True):
         """
@@ -934,7 +1068,10 @@ class UserManager:
         if username is None:
             username = self.session_username()
 
-        return (username in course.get_staff()) or (include_superadmins and self.user_is_superadmin(username))
+        # The course object is part of the key: it is replaced when the course descriptor changes
+        return self._request_cached(
+            ("staff", course.get_id(), course, username, include_superadmins),
+            lambda: (username in course.get_staff()) or (include_superadmins and self.user_is_superadmin(username)))
 
     @classmethod
     def generate_api_key(cls):
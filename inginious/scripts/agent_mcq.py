@@ -32,6 +32,8 @@ def main():
     parser = argparse.ArgumentParser()
     parser.add_argument("backend", help="Address to the backend, in the form protocol://host:port. For example, tcp://127.0.0.1:2000", type=str)
     parser.add_argument("--friendly-name", help="Friendly name to help identify agent.", default="", type=str)
+    parser.add_argument("--concurrency", help="Maximal number of jobs that can be graded concurrently on this agent. If greater than 1, "
+                                              "jobs are graded in a pool of processes. Defaults to 1.", default=1, type=int)
 
     parser.add_argument("-v", "--verbose", help="increase output verbosity",
                         action="store_true")
@@ -74,7 +76,7 @@ def main():
         context = Context()
 
         # Create agent
-        agent = MCQAgent(context, args.backend, args.friendly_name, 1)
+        agent = MCQAgent(context, args.backend, args.friendly_name, max(1, args.concurrency))
 
         # Run!
         try:
@@ -0,0 +1,78 @@
+#! /usr/bin/env python
+# -*- coding: utf-8 -*-
+#
+# This file is part of INGInious. See the LICENSE and the COPYRIGHTS files for
+# more information about the licensing of this file.
+
+""" Moves old submissions to the cold tier """
+import argparse
+import logging
+from datetime import datetime, timedelta, timezone
+
+from pymongo import MongoClient
+
+from inginious.common.base import loads_json_or_yaml
+from inginious.common.entrypoints import filesystem_from_config_dict
+from inginious.common.filesystems.local import LocalFSProvider
+from inginious.frontend.submission_cold_storage import SubmissionColdStorage
+from inginious.scripts.database_update import get_config
+
+
+def get_archived_courses(config, courseids):
+    """ Returns the ids of the courses, among courseids, that are archives """
+    if "fs" in config:
+        fs_provider = filesystem_from_config_dict(config["fs"])
+    else:
+        fs_provider = LocalFSProvider(config["tasks_directory"])
+
+    archived = []
+    for courseid in courseids:
+        course_fs = fs_provider.from_subfolder(courseid)
+        if course_fs.exists("course.yaml"):
+            descriptor = loads_json_or_yaml("course.yaml", course_fs.get("course.yaml"))
+            if descriptor.get("archived", False):
+                archived.append(courseid)
+    return archived
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Moves old submissions, or the submissions of archived courses, "
+                                                 "to compressed bundles. They can still be read from the webapp.")
+    parser.add_argument("-c", "--config", help="Configuration file", default="")
+    parser.add_argument("--older-than", help="Move the submissions older than this number of months", type=int)
+    parser.add_argument("--archived-courses", help="Move the submissions of the archived courses", action="store_true")
+    parser.add_argument("--course", help="Only move the submissions of this course", default=None)
+    parser.add_argument("--bundle-size", help="Number of submissions per bundle", type=int, default=500)
+    parser.add_argument("-v", "--verbose", help="Display more output", action="store_true")
+    args = parser.parse_args()
+
+    if args.older_than is None and not args.archived_courses:
+        parser.error("At least one of --older-than and --archived-courses is required")
+
+    logging.basicConfig(level=logging.INFO if args.verbose else logging.WARNING)
+    config = get_config(args.config)
+
+    mongo_client = MongoClient(host=config.get('mongo_opt', {}).get('host', 'localhost'))
+    database = mongo_client[config.get('mongo_opt', {}).get('database', 'INGInious')]
+    storage = SubmissionColdStorage(database)
+    storage.ensure_indexes()
+
+    base_query = {"courseid": args.course} if args.course else {}
+    moved = 0
+
+    if args.archived_courses:
+        courseids = database.submissions.distinct("courseid", base_query)
+        for courseid in get_archived_courses(config, courseids):
+            print("Moving the submissions of archived course {}".format(courseid))
+            moved += storage.archive(dict(base_query, courseid=courseid), args.bundle_size)
+
+    if args.older_than is not None:
+        limit = datetime.now(tz=timezone.utc) - timedelta(days=30 * args.older_than)
+        print("Moving the submissions older than {}".format(limit.isoformat()))
+        moved += storage.archive(dict(base_query, submitted_on={"$lt": limit}), args.bundle_size)
+
+    print("{} submissions moved".format(moved))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,71 @@
+#! /usr/bin/env python
+# -*- coding: utf-8 -*-
+#
+# This file is part of INGInious. See the LICENSE and the COPYRIGHTS files for
+# more information about the licensing of this file.
+
+""" Compiles the course and task descriptors into sidecars """
+import argparse
+import logging
+
+from inginious.common.entrypoints import filesystem_from_config_dict
+from inginious.common.filesystems.local import LocalFSProvider
+from inginious.common.sidecars import write_sidecar, delete_sidecar
+from inginious.scripts.database_update import get_config
+
+
+def get_descriptors(fs_provider, courseids=None):
+    """ Yields the (FileSystemProvider, path) of the course and task descriptors """
+    if courseids is None:
+        courseids = [f[0:len(f) - 1] for f in fs_provider.list(folders=True, files=False, recursive=False)]
+    for courseid in courseids:
+        course_fs = fs_provider.from_subfolder(courseid)
+        if not course_fs.exists("course.yaml"):
+            continue
+        yield course_fs, "course.yaml"
+        for taskid in course_fs.list(folders=True, files=False, recursive=False):
+            task_fs = course_fs.from_subfolder(taskid[0:len(taskid) - 1])
+            if task_fs.exists("task.yaml"):
+                yield task_fs, "task.yaml"
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Compiles the course and task descriptors into sidecars, that are "
+                                                 "loaded by the webapp instead of the YAML files when the "
+                                                 "tasks_sidecars_directory option is set.")
+    parser.add_argument("-c", "--config", help="Configuration file", default="")
+    parser.add_argument("--course", help="Only compile the descriptors of this course", action="append")
+    parser.add_argument("--clean", help="Delete the sidecars instead of writing them", action="store_true")
+    parser.add_argument("-v", "--verbose", help="Display more output", action="store_true")
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.DEBUG if args.verbose else logging.WARNING)
+    config = get_config(args.config)
+    directory = config.get("tasks_sidecars_directory", None)
+    if not directory:
+        parser.error("tasks_sidecars_directory is not set in the configuration")
+
+    if "fs" in config:
+        fs_provider = filesystem_from_config_dict(config["fs"])
+    else:
+        fs_provider = LocalFSProvider(config["tasks_directory"])
+
+    done, skipped = 0, 0
+    for fs, path in get_descriptors(fs_provider, args.course):
+        try:
+            if args.clean:
+                delete_sidecar(directory, fs, path)
+            elif not write_sidecar(directory, fs, path):
+                print("Cannot compile {}{}: it contains values that cannot be stored, or the sidecar cannot be written".format(fs.prefix, path))
+                skipped += 1
+                continue
+            done += 1
+        except Exception as e:
+            print("Cannot compile {}{}: {}".format(fs.prefix, path, e))
+            skipped += 1
+
+    print("{} descriptors {}, {} skipped".format(done, "cleaned" if args.clean else "compiled", skipped))
+
+
+if __name__ == "__main__":
+    main()
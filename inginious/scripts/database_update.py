@@ -18,6 +18,8 @@ from pymongo import MongoClient
 from gridfs import GridFS
 
 from inginious.common.base import load_json_or_yaml
+from inginious.frontend.submission_files import ensure_blob_index, put_blob, release_blobs, split_input
+from inginious.frontend.submission_rollups import SubmissionRollups
 
 
 def get_config(configfile):
@@ -32,6 +34,49 @@ def get_config(configfile):
     return load_json_or_yaml(configfile)
 
 
+def update_submission_files(database, gridfs):
+    """ Stores the uploaded files and the archives of the submissions in content-addressed files (db_version 19).
+        Submissions are converted in batches, in the order of their ids: an interrupted update can be restarted. """
+    ensure_blob_index(database)
+    query = {"input_blobs": {"$exists": False}}
+    length = database.submissions.count_documents(query)
+    index = 0
+    last_id = None
+    while True:
+        batch_query = dict(query, _id={"$gt": last_id}) if last_id is not None else query
+        batch = list(database.submissions.find(batch_query, {"_id": 1, "input": 1, "archive": 1})
+                     .sort("_id", pymongo.ASCENDING).limit(1000))
+        if not batch:
+            break
+        for item in batch:
+            last_id = item["_id"]
+            index += 1
+            if not index % 1000:
+                print("...{}/{}".format(index, length))
+            try:
+                inp = bson.BSON(gridfs.get(item["input"]).read()).decode()
+                inp, blob_ids = split_input(database, inp)
+                update = {"input_blobs": blob_ids}
+                if blob_ids:
+                    update["input"] = gridfs.put(bson.BSON.encode(inp))
+
+                old_archive = item.get("archive")
+                if old_archive is not None and not database["fs.files"].find_one({"_id": old_archive,
+                                                                                    "sha256": {"$exists": True}}):
+                    update["archive"] = put_blob(database, gridfs.get(old_archive).read())
+
+                if not database.submissions.update_one({"_id": item["_id"]}, {"$set": update}).matched_count:
+                    # Deleted in the meantime
+                    release_blobs(database, blob_ids + ([update["archive"]] if "archive" in update else []))
+                    continue
+                if blob_ids:
+                    gridfs.delete(item["input"])
+                if "archive" in update:
+                    gridfs.delete(old_archive)
+            except Exception as ex:
+                print("!!! Exception for submission id {} : {}".format(item["_id"], str(ex)))
+
+
 def main():
     parser = argparse.ArgumentParser()
     parser.add_argument("-c", "--config", help="Configuration file", default="")
@@ -143,6 +188,35 @@ def main():
         database.old_submissions.drop()
         db_version = 18
 
+    if db_version < 19:
+        print("Updating database to db_version 19")
+        update_submission_files(database, gridfs)
+        db_version = 19
+
+    if db_version < 20:
+        print("Updating database to db_version 20")
+        # Expired sessions are now deleted by a TTL index
+        if "expiration_1" in database.sessions.index_information():
+            database.sessions.drop_index("expiration_1")
+        database.sessions.create_index([("expiration", pymongo.ASCENDING)], expireAfterSeconds=0)
+        db_version = 20
+
+    if db_version < 21:
+        print("Updating database to db_version 21")
+        # The course statistics are computed from hourly rollups of the submissions
+        rollups = SubmissionRollups(database)
+        rollups.ensure_indexes()
+        print("...{} rollups created".format(rollups.rebuild()))
+        db_version = 21
+
+    if db_version < 22:
+        print("Updating database to db_version 22")
+        # The submissions of a course are paginated on (sort column, _id)
+        for column in ["submitted_on", "grade", "taskid"]:
+            database.submissions.create_index([("courseid", pymongo.ASCENDING), (column, pymongo.ASCENDING),
+                                               ("_id", pymongo.ASCENDING)])
+        db_version = 22
+
     database.db_version.update_one({}, {"$set": {"db_version": db_version}}, upsert=True)
         
     print("Database up to date")
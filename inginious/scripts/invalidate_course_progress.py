@@ -0,0 +1,40 @@
+#! /usr/bin/env python
+# -*- coding: utf-8 -*-
+#
+# This file is part of INGInious. See the LICENSE and the COPYRIGHTS files for
+# more information about the licensing of this file.
+
+""" Invalidates the materialized progress of users in courses, so that it is recomputed from the user tasks """
+import argparse
+
+from pymongo import MongoClient
+
+from inginious.scripts.database_update import get_config
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Invalidates the progress of users in courses after manual edits of "
+                                                 "the user_tasks collection. The progress is not recomputed by this "
+                                                 "command, but by the webapp the next time it is displayed.")
+    parser.add_argument("-c", "--config", help="Configuration file", default="")
+    parser.add_argument("--course", help="Only invalidate the progress in this course", default=None)
+    parser.add_argument("--user", help="Only invalidate the progress of this user", default=None)
+    args = parser.parse_args()
+
+    config = get_config(args.config)
+    mongo_client = MongoClient(host=config.get('mongo_opt', {}).get('host', 'localhost'))
+    database = mongo_client[config.get('mongo_opt', {}).get('database', 'INGInious')]
+
+    query = {}
+    if args.course:
+        query["courseid"] = args.course
+    if args.user:
+        query["username"] = args.user
+
+    # Same as UserManager.invalidate_course_progress: progress without a course version is stale
+    result = database.user_course_progress.update_many(query, {"$unset": {"course_version": ""}})
+    print("{} progress entries invalidated, they will be recomputed when displayed".format(result.matched_count))
+
+
+if __name__ == "__main__":
+    main()
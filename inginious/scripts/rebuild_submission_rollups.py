@@ -0,0 +1,34 @@
+#! /usr/bin/env python
+# -*- coding: utf-8 -*-
+#
+# This file is part of INGInious. See the LICENSE and the COPYRIGHTS files for
+# more information about the licensing of this file.
+
+""" Recomputes the hourly rollups of the submissions, used by the course statistics """
+import argparse
+
+from pymongo import MongoClient
+
+from inginious.frontend.submission_rollups import SubmissionRollups
+from inginious.scripts.database_update import get_config
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Recomputes the hourly rollups of the submissions, used by the course "
+                                                 "statistics, from the submissions collection. Submissions made while "
+                                                 "the command runs may be counted twice or not at all.")
+    parser.add_argument("-c", "--config", help="Configuration file", default="")
+    parser.add_argument("--course", help="Only recompute the rollups of this course", default=None)
+    args = parser.parse_args()
+
+    config = get_config(args.config)
+    mongo_client = MongoClient(host=config.get('mongo_opt', {}).get('host', 'localhost'))
+    database = mongo_client[config.get('mongo_opt', {}).get('database', 'INGInious')]
+
+    rollups = SubmissionRollups(database)
+    rollups.ensure_indexes()
+    print("{} rollups created".format(rollups.rebuild(args.course)))
+
+
+if __name__ == "__main__":
+    main()